@@ -0,0 +1,229 @@
+"""Fake Docker daemon for benchmarks.
+
+An in-process HTTP/1.1 server on a UNIX domain socket, implementing the
+subset of Docker Remote API used by the benchmarks with canned responses.
+Request latency and response sizes are configurable, so client performance
+can be measured reproducibly without a real daemon.
+"""
+
+import json
+import os
+import re
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+
+class FakeDaemon(object):
+    """Fake Docker daemon on a UNIX domain socket.
+
+    Each connection is served on its own thread, with keep-alive.
+
+    Arguments:
+      latency: Seconds to wait before sending each response.
+      containers: Number of containers in /containers/json response.
+      images: Number of images in /images/json response.
+      inspect_size: Approximate size in bytes of inspect responses.
+      pull_lines: Number of progress lines in pull output.
+      build_lines: Number of output lines in build output.
+      api_version: Docker Remote API version reported.
+    """
+
+    def __init__(self, latency=0.0, containers=100, images=50,
+                 inspect_size=4096, pull_lines=1000, build_lines=100,
+                 api_version='1.22'):
+        self.latency = latency
+        self.requests = 0
+        self.connections = 0
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+        self._routes = [
+            ('GET', r'/version', self._version),
+            ('GET', r'/_ping', self._ping),
+            ('GET', r'/containers/json', self._containers),
+            ('GET', r'/images/json', self._images),
+            ('GET', r'/images/[^/]+/json', self._image_inspect),
+            ('POST', r'/containers/create', self._container_create),
+            ('POST', r'/containers/[^/]+/start', self._no_content),
+            ('POST', r'/containers/[^/]+/stop', self._no_content),
+            ('POST', r'/build', self._build),
+            ('POST', r'/images/create', self._pull),
+        ]
+        # Paths are matched with and without API version prefix (/vX.Y)
+        self._routes = [(method, re.compile(r'(?:/v[0-9]+\.[0-9]+)?' +
+                                            path + '$'), handler)
+                        for method, path, handler in self._routes]
+        self._version_body = json.dumps({
+            'ApiVersion': api_version, 'Version': '1.10.3',
+            'GitCommit': '20f81dd', 'GoVersion': 'go1.5.3'}).encode()
+        self._containers_body = json.dumps([{
+            'Id': '{:064x}'.format(i),
+            'Names': ['/bench{}'.format(i)],
+            'Image': 'busybox:latest',
+            'ImageID': '{:064x}'.format(i % 7),
+            'Command': 'sleep 3600',
+            'Created': 1467982024,
+            'Status': 'Up 2 hours',
+            'Ports': [{'PrivatePort': 80, 'Type': 'tcp'}],
+            'Labels': {'bench': str(i)},
+            'SizeRw': 12288,
+            'SizeRootFs': 0} for i in range(containers)]).encode()
+        self._images_body = json.dumps([{
+            'Id': 'sha256:{:064x}'.format(i),
+            'RepoTags': ['bench{}:latest'.format(i)],
+            'Created': 1467982024,
+            'Size': 1093484,
+            'VirtualSize': 1093484,
+            'Labels': {}} for i in range(images)]).encode()
+        self._image_body = json.dumps({
+            'Id': 'sha256:' + '0' * 64,
+            'RepoTags': ['busybox:latest'],
+            'Created': '2016-06-23T23:23:37.198943461Z',
+            'Os': 'linux', 'Architecture': 'amd64',
+            'DockerVersion': '1.10.3', 'Author': '',
+            'Size': 1093484, 'VirtualSize': 1093484,
+            'Comment': 'x' * max(0, inspect_size - 300)}).encode()
+        self._create_body = json.dumps({
+            'Id': 'e90e34656806', 'Warnings': []}).encode()
+        self._pull_body = b''.join(json.dumps({
+            'status': 'Downloading',
+            'progressDetail': {'current': i * 1024,
+                               'total': pull_lines * 1024},
+            'progress': '[=>   ] {}kB/{}kB'.format(i, pull_lines),
+            'id': '8ddc19f16526'}).encode() + b'\r\n'
+            for i in range(pull_lines)) + json.dumps({
+                'status': 'Status: Downloaded newer image for busybox:latest'
+            }).encode() + b'\r\n'
+        self._build_body = b''.join(json.dumps({
+            'stream': 'Step {} : RUN echo {}\n'.format(i, 'x' * 40)
+        }).encode() + b'\r\n' for i in range(build_lines)) + json.dumps({
+            'stream': 'Successfully built e4d9194b48f8\n'}).encode() + b'\r\n'
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'docker.sock')
+        self.url = 'unix://' + self.path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(128)
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            with self._lock:
+                self.connections += 1
+            threading.Thread(target=self._connection, args=(conn,),
+                             daemon=True).start()
+
+    def _connection(self, conn):
+        buf = bytearray(256 * 1024)
+        view = memoryview(buf)
+        with conn, conn.makefile('rb') as rfile:
+            try:
+                while self._handle(conn, rfile, view):
+                    pass
+            except OSError:
+                pass
+
+    def _handle(self, conn, rfile, view):
+        line = rfile.readline()
+        if not line:
+            return False
+        method, target, _ = line.decode('latin-1').split(' ', 2)
+        path = target.split('?', 1)[0]
+        length = 0
+        chunked = False
+        keep_alive = True
+        while True:
+            header = rfile.readline()
+            if header in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = header.partition(b':')
+            name = name.strip().lower()
+            value = value.strip().lower()
+            if name == b'content-length':
+                length = int(value)
+            elif name == b'transfer-encoding' and b'chunked' in value:
+                chunked = True
+            elif name == b'connection' and value == b'close':
+                keep_alive = False
+        received = self._discard_body(rfile, view, length, chunked)
+        with self._lock:
+            self.requests += 1
+            self.bytes_received += received
+        if self.latency:
+            time.sleep(self.latency)
+        for route_method, pattern, handler in self._routes:
+            if route_method == method and pattern.match(path):
+                status, body = handler()
+                break
+        else:
+            status, body = '404 Not Found', b'page not found'
+        conn.sendall(b'HTTP/1.1 ' + status.encode() +
+                     b'\r\nContent-Type: application/json'
+                     b'\r\nContent-Length: ' + str(len(body)).encode() +
+                     b'\r\n\r\n' + body)
+        return keep_alive
+
+    @staticmethod
+    def _discard_body(rfile, view, length, chunked):
+        received = 0
+        if chunked:
+            while True:
+                size = int(rfile.readline().split(b';')[0], 16)
+                if size == 0:
+                    rfile.readline()
+                    return received
+                received += FakeDaemon._discard_body(rfile, view, size,
+                                                     False)
+                rfile.readline()
+        while length:
+            n = rfile.readinto(view[:min(length, len(view))])
+            if not n:
+                break
+            length -= n
+            received += n
+        return received
+
+    def _version(self):
+        return '200 OK', self._version_body
+
+    def _ping(self):
+        return '200 OK', b'OK'
+
+    def _containers(self):
+        return '200 OK', self._containers_body
+
+    def _images(self):
+        return '200 OK', self._images_body
+
+    def _image_inspect(self):
+        return '200 OK', self._image_body
+
+    def _container_create(self):
+        return '201 Created', self._create_body
+
+    def _no_content(self):
+        return '204 No Content', b''
+
+    def _build(self):
+        return '200 OK', self._build_body
+
+    def _pull(self):
+        return '200 OK', self._pull_body
+
+    def close(self):
+        """Stop serving, and remove socket."""
+        self.sock.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
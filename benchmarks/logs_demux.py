@@ -0,0 +1,77 @@
+"""Benchmark demultiplexing of container log streams.
+
+A synthetic multiplexed stdout/stderr stream (as returned by the logs, attach
+and exec endpoints for containers without a TTY) is parsed by the memoryview
+based demux_frames(), and by a naive reference parser concatenating and
+slicing bytes objects.
+"""
+
+import argparse
+import random
+import struct
+import time
+
+from xd.docker.stream import IterStream, demux_frames
+
+
+def synthetic_stream(size, chunk_size, seed=42):
+    rnd = random.Random(seed)
+    frames = []
+    total = 0
+    line = b'x' * 4096
+    while total < size:
+        length = rnd.randint(20, 200)
+        frames.append(struct.pack('>BxxxL', rnd.choice((1, 2)), length))
+        frames.append(line[:length])
+        total += 8 + length
+    data = b''.join(frames)
+    return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+
+def naive_demux(chunks):
+    buf = b''
+    for chunk in chunks:
+        buf += chunk
+        while len(buf) >= 8:
+            stream, length = struct.unpack('>BxxxL', buf[:8])
+            if len(buf) < 8 + length:
+                break
+            yield stream, buf[8:8 + length]
+            buf = buf[8 + length:]
+
+
+def run(name, func, chunks, size, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        frames = 0
+        for _ in func(chunks):
+            frames += 1
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print('{:24} {:10.1f} MiB/s {:12.0f} frames/s'.format(
+        name, size / best / 1024 / 1024, frames / best))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=64,
+                        help='stream size in MiB (default: 64)')
+    parser.add_argument('--chunk-size', type=int, default=32768,
+                        help='size of chunks read from daemon '
+                        '(default: 32768)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs per parser (default: 3)')
+    args = parser.parse_args()
+
+    size = args.size * 1024 * 1024
+    chunks = synthetic_stream(size, args.chunk_size)
+    run('naive', naive_demux, chunks, size, args.repeat)
+    run('demux_frames', lambda chunks: demux_frames(
+        IterStream(chunks).readinto), chunks, size, args.repeat)
+    run('demux_frames(copy=False)', lambda chunks: demux_frames(
+        IterStream(chunks).readinto, copy=False), chunks, size, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
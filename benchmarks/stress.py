@@ -0,0 +1,186 @@
+"""Multi-threaded stress benchmark for a shared DockerClient.
+
+A single DockerClient is shared by an increasing number of threads, all
+calling a mix of operations against the in-process fake daemon in
+fakedaemon.py.  For each thread count, throughput, latency and the number
+of connections opened are reported, together with the speedup over a
+single thread.
+
+The results of all calls are checked, and the number of requests received
+by the fake daemon is compared with the number of calls made, so races in
+the client (fx. in API version negotiation or the connection pool) show up
+as errors instead of just as numbers.
+
+With a fake daemon latency (default 1 ms, as a stand-in for the work done
+by a real daemon), throughput should scale with the number of threads
+until the client becomes CPU bound.
+
+Example:
+
+  python benchmarks/stress.py
+  python benchmarks/stress.py --threads 1,4,16,64 --transport requests
+  python benchmarks/stress.py --min-speedup 3.0
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakedaemon import FakeDaemon  # noqa: E402
+from suite import percentile  # noqa: E402
+from xd.docker.client import DockerClient  # noqa: E402
+
+
+def op_ping(client):
+    client.ping()
+
+
+def op_containers(client):
+    if len(client.containers(only_running=False)) != 20:
+        raise AssertionError('wrong number of containers')
+
+
+def op_image_inspect(client):
+    if client.image_inspect('busybox').id != 'sha256:' + '0' * 64:
+        raise AssertionError('wrong image id')
+
+
+OPERATIONS = [
+    ('ping', op_ping),
+    ('containers', op_containers),
+    ('image_inspect', op_image_inspect),
+]
+
+
+def stress(daemon, transport, threads, duration, operations, limiter=False):
+    """Run operations on one shared client from threads, returning result."""
+    client = DockerClient(daemon.url, transport=transport, limiter=limiter)
+    requests_before = daemon.requests
+    connections_before = daemon.connections
+    start_event = threading.Event()
+    stop_time = [None]
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(index):
+        own = []
+        start_event.wait()
+        i = index
+        try:
+            while time.perf_counter() < stop_time[0]:
+                func = operations[i % len(operations)]
+                i += 1
+                t = time.perf_counter()
+                func(client)
+                own.append(time.perf_counter() - t)
+        except Exception as e:
+            errors.append(e)
+        with lock:
+            latencies.extend(own)
+
+    workers = [threading.Thread(target=worker, args=(i,))
+               for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    start = time.perf_counter()
+    stop_time[0] = start + duration
+    start_event.set()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    client.close()
+
+    if errors:
+        raise errors[0]
+    # One extra request for API version negotiation
+    requests = daemon.requests - requests_before
+    if requests != len(latencies) + 1:
+        raise AssertionError('{} calls made, but daemon received {} requests'
+                             .format(len(latencies), requests))
+    result = {
+        'threads': threads,
+        'calls': len(latencies),
+        'elapsed': elapsed,
+        'ops_per_second': len(latencies) / elapsed,
+        'latency_p50': percentile(latencies, 0.50),
+        'latency_p99': percentile(latencies, 0.99),
+        'connections': daemon.connections - connections_before,
+    }
+    if client.limiter is not None:
+        result['limit'] = client.limiter.light.limit
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--threads', default='1,2,4,8,16',
+                        help='comma separated thread counts '
+                        '(default: 1,2,4,8,16)')
+    parser.add_argument('--duration', type=float, default=2.0,
+                        help='seconds per thread count (default: 2.0)')
+    parser.add_argument('--latency', type=float, default=1.0,
+                        help='fake daemon latency in ms (default: 1.0)')
+    parser.add_argument('--transport', default='socket',
+                        choices=('requests', 'socket'),
+                        help='transport to use (default: socket)')
+    parser.add_argument('--only', action='append', metavar='NAME',
+                        choices=[name for name, _ in OPERATIONS],
+                        help='call only named operation (repeatable)')
+    parser.add_argument('--limiter', action='store_true',
+                        help='limit concurrent requests with an adaptive '
+                        'concurrency limiter')
+    parser.add_argument('--output', metavar='FILE',
+                        help='write results as JSON to FILE')
+    parser.add_argument('--min-speedup', type=float, metavar='FACTOR',
+                        help='exit with status 1 if throughput with most '
+                        'threads is less than FACTOR times throughput '
+                        'with fewest threads')
+    args = parser.parse_args()
+
+    thread_counts = sorted(int(n) for n in args.threads.split(','))
+    operations = [func for name, func in OPERATIONS
+                  if not args.only or name in args.only]
+    results = []
+    with FakeDaemon(latency=args.latency / 1000.0, containers=20) as daemon:
+        for threads in thread_counts:
+            result = stress(daemon, args.transport, threads, args.duration,
+                            operations, args.limiter)
+            result['speedup'] = (result['ops_per_second'] /
+                                 (results or [result])[0]['ops_per_second'])
+            results.append(result)
+            print('{:4} threads {:10.1f} ops/s  x{:5.2f}  p50 {:8.3f} ms  '
+                  'p99 {:8.3f} ms  {:4} connections'.format(
+                      threads, result['ops_per_second'], result['speedup'],
+                      result['latency_p50'] * 1000,
+                      result['latency_p99'] * 1000, result['connections'])
+                  + ('  limit {}'.format(result['limit'])
+                     if 'limit' in result else ''))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'time': time.time(),
+                'parameters': vars(args),
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.min_speedup is not None and \
+            results[-1]['speedup'] < args.min_speedup:
+        print('Speedup x{:.2f} with {} threads is less than x{:.2f}'.format(
+            results[-1]['speedup'], results[-1]['threads'], args.min_speedup))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
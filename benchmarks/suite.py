@@ -0,0 +1,277 @@
+"""Benchmark suite for DockerClient against a fake Docker daemon.
+
+Measures throughput and latency of common client operations against the
+in-process fake daemon in fakedaemon.py, so results are reproducible and
+independent of a real Docker daemon.  Results can be stored as JSON, and
+compared against a stored baseline to catch regressions.
+
+Traffic can be recorded to a cassette file, and the benchmarks can be run
+by replaying a cassette (fx. recorded against a real daemon) instead of
+against the fake daemon.
+
+Example:
+
+  python benchmarks/suite.py --output baseline.json
+  python benchmarks/suite.py --compare baseline.json
+  python benchmarks/suite.py --record bench.jsonl.gz
+  python benchmarks/suite.py --replay bench.jsonl.gz --time-scale 0
+
+Per-call overhead of the transports can be compared by running the suite
+with each of them:
+
+  python benchmarks/suite.py --transport requests --output requests.json
+  python benchmarks/suite.py --transport socket --compare requests.json
+"""
+
+import argparse
+import concurrent.futures
+import io
+import json
+import os
+import platform
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakedaemon import FakeDaemon  # noqa: E402
+from xd.docker.client import DockerClient  # noqa: E402
+from xd.docker.parameters import ContainerConfig  # noqa: E402
+from xd.docker.transport import TRANSPORTS  # noqa: E402
+from xd.docker.cassette import RecordingTransport, \
+    ReplayTransport  # noqa: E402
+
+
+def bench_ping(client, context):
+    client.ping()
+
+
+def bench_containers(client, context):
+    client.containers(only_running=False)
+
+
+def bench_images(client, context):
+    client.images()
+
+
+def bench_image_inspect(client, context):
+    client.image_inspect('busybox:latest')
+
+
+def bench_create_start_stop(client, context):
+    container = client.container_create(ContainerConfig('busybox'),
+                                        pull=False)
+    client.container_start(container)
+    client.container_stop(container)
+
+
+def bench_build_context(client, context):
+    with open(context['archive'], 'rb') as f:
+        client.image_build(f, output=())
+
+
+def bench_pull_progress(client, context):
+    client.image_pull('busybox:latest', output=())
+
+
+BENCHMARKS = (
+    ('ping', bench_ping),
+    ('containers', bench_containers),
+    ('images', bench_images),
+    ('image_inspect', bench_image_inspect),
+    ('create_start_stop', bench_create_start_stop),
+    ('build_context', bench_build_context),
+    ('pull_progress', bench_pull_progress),
+)
+
+
+def build_context(path, size):
+    # Write tar archive with a Dockerfile and size bytes of random data
+    with tarfile.open(path, 'w') as tar:
+        dockerfile = b'FROM busybox\nCOPY data /\n'
+        info = tarfile.TarInfo('Dockerfile')
+        info.size = len(dockerfile)
+        tar.addfile(info, io.BytesIO(dockerfile))
+        info = tarfile.TarInfo('data')
+        info.size = size
+        tar.addfile(info, io.BytesIO(os.urandom(size)))
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(q * (len(values) - 1)))))
+    return values[index]
+
+
+def run(func, client, context, iterations, concurrency, warmup):
+    """Run benchmark, returning result dict."""
+    for _ in range(warmup):
+        func(client, context)
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(iterations))
+
+    def worker():
+        own = []
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    break
+            start = time.perf_counter()
+            func(client, context)
+            own.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(own)
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        worker()
+    else:
+        with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+            for future in [pool.submit(worker) for _ in range(concurrency)]:
+                future.result()
+    elapsed = time.perf_counter() - start
+    return {
+        'iterations': len(latencies),
+        'concurrency': concurrency,
+        'elapsed': elapsed,
+        'ops_per_second': len(latencies) / elapsed,
+        'latency_mean': sum(latencies) / len(latencies),
+        'latency_p50': percentile(latencies, 0.50),
+        'latency_p90': percentile(latencies, 0.90),
+        'latency_p99': percentile(latencies, 0.99),
+        'latency_max': max(latencies),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print comparison with baseline, returning names of regressions."""
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        change = result['ops_per_second'] / base['ops_per_second'] - 1.0
+        regressed = change < -tolerance
+        if regressed:
+            regressions.append(name)
+        print('{:20} {:10.1f} ops/s  baseline {:10.1f} ops/s  {:+6.1%}{}'
+              .format(name, result['ops_per_second'],
+                      base['ops_per_second'], change,
+                      '  REGRESSION' if regressed else ''))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=500,
+                        help='calls per benchmark (default: 500)')
+    parser.add_argument('--warmup', type=int, default=10,
+                        help='warmup calls per benchmark (default: 10)')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='number of concurrent callers (default: 1)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='fake daemon latency in ms (default: 0)')
+    parser.add_argument('--containers', type=int, default=100,
+                        help='containers listed (default: 100)')
+    parser.add_argument('--images', type=int, default=50,
+                        help='images listed (default: 50)')
+    parser.add_argument('--inspect-size', type=int, default=4096,
+                        help='inspect response size (default: 4096)')
+    parser.add_argument('--pull-lines', type=int, default=1000,
+                        help='pull progress lines (default: 1000)')
+    parser.add_argument('--build-lines', type=int, default=100,
+                        help='build output lines (default: 100)')
+    parser.add_argument('--context-size', type=int, default=1024,
+                        help='build context size in KiB (default: 1024)')
+    parser.add_argument('--only', action='append', metavar='NAME',
+                        choices=[name for name, _ in BENCHMARKS],
+                        help='run only named benchmark (repeatable)')
+    parser.add_argument('--transport', default='requests',
+                        choices=('requests', 'socket'),
+                        help='transport to use (default: requests)')
+    parser.add_argument('--record', metavar='FILE',
+                        help='record traffic to cassette FILE')
+    parser.add_argument('--replay', metavar='FILE',
+                        help='replay traffic from cassette FILE instead of '
+                        'using the fake daemon')
+    parser.add_argument('--time-scale', type=float, default=1.0,
+                        help='factor to scale replayed timing with '
+                        '(default: 1.0)')
+    parser.add_argument('--output', metavar='FILE',
+                        help='write results as JSON to FILE')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare with JSON results in FILE, exiting '
+                        'with status 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='relative throughput decrease counted as '
+                        'regression (default: 0.10)')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    archive = os.path.join(tmpdir, 'context.tar')
+    build_context(archive, args.context_size * 1024)
+    context = {'archive': archive}
+    daemon = None
+    if args.replay:
+        url = 'unix:///nonexistent'
+        transport = ReplayTransport(args.replay, time_scale=args.time_scale,
+                                    loop=True)
+    else:
+        daemon = FakeDaemon(latency=args.latency / 1000.0,
+                            containers=args.containers, images=args.images,
+                            inspect_size=args.inspect_size,
+                            pull_lines=args.pull_lines,
+                            build_lines=args.build_lines)
+        url = daemon.url
+        transport = args.transport
+        if args.record:
+            transport = RecordingTransport(
+                args.record, TRANSPORTS[args.transport]())
+    results = {}
+    try:
+        client = DockerClient(url, transport=transport)
+        for name, func in BENCHMARKS:
+            if args.only and name not in args.only:
+                continue
+            result = run(func, client, context, args.iterations,
+                         args.concurrency, args.warmup)
+            results[name] = result
+            print('{:20} {:10.1f} ops/s  p50 {:8.3f} ms  p99 {:8.3f} ms'
+                  .format(name, result['ops_per_second'],
+                          result['latency_p50'] * 1000,
+                          result['latency_p99'] * 1000))
+    finally:
+        client.close()
+        if daemon is not None:
+            daemon.close()
+        os.unlink(archive)
+        os.rmdir(tmpdir)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'time': time.time(),
+                'parameters': vars(args),
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        print()
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Benchmark container_upload() throughput with and without sendfile(2).
+
+A sink server on a UNIX domain socket answers /version and discards request
+bodies, so the measured throughput is dominated by the client side copying.
+"""
+
+import argparse
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from xd.docker.client import DockerClient
+
+
+VERSION = json.dumps({'ApiVersion': '1.22', 'Version': '1.10.3'}).encode()
+
+
+def serve(sock):
+    buf = bytearray(1024 * 1024)
+    view = memoryview(buf)
+    while True:
+        try:
+            conn, _ = sock.accept()
+        except OSError:
+            return
+        with conn, conn.makefile('rb') as rfile:
+            while True:
+                line = rfile.readline()
+                if not line:
+                    break
+                length = 0
+                while True:
+                    header = rfile.readline()
+                    if header in (b'\r\n', b''):
+                        break
+                    name, _, value = header.partition(b':')
+                    if name.strip().lower() == b'content-length':
+                        length = int(value)
+                while length:
+                    n = rfile.readinto(view[:min(length, len(buf))])
+                    if not n:
+                        break
+                    length -= n
+                if line.startswith(b'GET /version'):
+                    body = VERSION
+                else:
+                    body = b''
+                conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n'
+                             % len(body) + body)
+
+
+def run(client, path, size, repeat):
+    best = None
+    for _ in range(repeat):
+        with open(path, 'rb') as f:
+            start = time.perf_counter()
+            client.container_upload('bench', f, '/')
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return size / best / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=256,
+                        help='archive size in MiB (default: 256)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of uploads per mode (default: 5)')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    sock_path = os.path.join(tmpdir, 'docker.sock')
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(sock_path)
+    sock.listen(8)
+    threading.Thread(target=serve, args=(sock,), daemon=True).start()
+
+    archive = os.path.join(tmpdir, 'archive.tar')
+    with open(archive, 'wb') as f:
+        chunk = os.urandom(1024 * 1024)
+        for _ in range(args.size):
+            f.write(chunk)
+    size = os.path.getsize(archive)
+
+    try:
+        for sendfile in (False, True):
+            client = DockerClient('unix://' + sock_path, sendfile=sendfile)
+            throughput = run(client, archive, size, args.repeat)
+            print('sendfile={!s:5}  {:10.1f} MiB/s'.format(
+                sendfile, throughput))
+    finally:
+        sock.close()
+        os.unlink(archive)
+        os.unlink(sock_path)
+        os.rmdir(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+import unittest
+import os
+import re
+import json
+import gzip
+import shutil
+import tempfile
+import time
+
+import socket_server
+
+from xd.docker.cassette import *
+from xd.docker.client import DockerClient, HTTPError
+from xd.docker.transport import Transport
+from xd.docker.exceptions import *
+
+
+VERSION = (b'{"ApiVersion": "1.22", "Version": "1.10.3", '
+           b'"GitCommit": "20f81dd", "GoVersion": "go1.5.3"}')
+
+PULL = (b'{"status": "Pulling from library/busybox", "id": "latest"}\r\n'
+        b'{"status": "Status: Downloaded newer image for busybox:latest"}'
+        b'\r\n')
+
+
+def respond(request):
+    request.path = re.sub(r'^/v[0-9.]+/', '/', request.path)
+    if request.path.startswith('/version'):
+        body = VERSION
+    elif request.path.startswith('/images/create'):
+        return (b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n' +
+                b''.join('{:x}\r\n'.format(len(line)).encode() + line +
+                         b'\r\n' for line in PULL.splitlines(True)) +
+                b'0\r\n\r\n')
+    elif request.path.startswith('/containers/json'):
+        body = (b'[{"Id": "e90e34656806", "Names": ["/foo"], '
+                b'"Image": "busybox"}]')
+    elif request.path.startswith('/images/busybox/json'):
+        body = b'{"Id": "sha256:' + b'0' * 64 + b'"}'
+    else:
+        return b'HTTP/1.1 404 Not Found\r\nContent-Length: 3\r\n\r\nfoo'
+    return (b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+            b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' +
+            body)
+
+
+class cassette_tests(unittest.case.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.server = socket_server.Server(respond=respond)
+        self.addCleanup(self.server.close)
+
+    def record(self, path, func):
+        recorder = RecordingTransport(path)
+        client = DockerClient(self.server.url, transport=recorder)
+        try:
+            func(client)
+        finally:
+            recorder.close()
+        return recorder
+
+    def test_record(self):
+        path = os.path.join(self.dir, 'cassette.jsonl')
+        recorder = self.record(path, lambda client: client.containers())
+        self.assertEqual(recorder.recorded, 2)
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(lines[0]['cassette'], 1)
+        self.assertEqual(lines[1]['url'], '/version')
+        self.assertEqual(lines[2]['method'], 'GET')
+        self.assertEqual(lines[2]['url'], '/v1.22/containers/json')
+        self.assertEqual(lines[2]['status_code'], 200)
+        self.assertEqual(lines[2]['response_headers']['Content-Type'],
+                         'application/json')
+        self.assertEqual(len(lines[2]['chunks']), 1)
+
+    def test_record_gzip(self):
+        path = os.path.join(self.dir, 'cassette.jsonl.gz')
+        self.record(path, lambda client: client.containers())
+        with gzip.open(path, 'rt') as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+    def test_record_redacted(self):
+        path = os.path.join(self.dir, 'cassette.jsonl')
+        secret = 'c2VjcmV0'
+        self.record(path, lambda client: client.image_pull(
+            'busybox', output=(), registry_auth={'password': secret}))
+        with open(path) as f:
+            text = f.read()
+        self.assertNotIn(secret, text)
+        self.assertIn('<redacted>', text)
+
+    def test_record_stream(self):
+        path = os.path.join(self.dir, 'cassette.jsonl')
+        self.record(path, lambda client: client.image_pull('busybox',
+                                                           output=()))
+        with open(path) as f:
+            pull = [json.loads(line) for line in f][-1]
+        self.assertEqual(pull['url'], '/v1.22/images/create')
+        self.assertEqual(pull['params'], {'fromImage': 'busybox'})
+        self.assertGreaterEqual(len(pull['chunks']), 1)
+
+    def test_replay(self):
+        path = os.path.join(self.dir, 'cassette.jsonl.gz')
+
+        def func(client):
+            client.containers()
+            client.image_inspect('busybox')
+            client.image_pull('busybox', output=())
+        self.record(path, func)
+        replay = ReplayTransport(path, time_scale=0)
+        self.assertEqual(replay.remaining, 4)
+        client = DockerClient('unix:///nonexistent', transport=replay)
+        self.assertEqual(client.api_version, (1, 22))
+        containers = client.containers()
+        self.assertEqual(containers[0].id, 'e90e34656806')
+        image = client.image_inspect('busybox')
+        self.assertEqual(image.id, 'sha256:' + '0' * 64)
+        self.assertTrue(client.image_pull('busybox', output=()))
+        self.assertEqual(replay.remaining, 0)
+        with self.assertRaises(CassetteError):
+            client.containers()
+
+    def test_replay_loop(self):
+        path = os.path.join(self.dir, 'cassette.jsonl')
+        self.record(path, lambda client: client.containers())
+        client = DockerClient('unix:///nonexistent',
+                              transport=ReplayTransport(path, time_scale=0,
+                                                        loop=True))
+        for _ in range(3):
+            self.assertEqual(len(client.containers()), 1)
+
+    def test_replay_not_recorded(self):
+        path = os.path.join(self.dir, 'cassette.jsonl')
+        self.record(path, lambda client: client.containers())
+        client = DockerClient('unix:///nonexistent',
+                              transport=ReplayTransport(path, time_scale=0))
+        with self.assertRaises(CassetteError):
+            client.containers(only_running=False)
+
+    def test_replay_error_status(self):
+        path = os.path.join(self.dir, 'cassette.jsonl')
+
+        def func(client):
+            with self.assertRaises(HTTPError):
+                client.image_inspect('foobar')
+        self.record(path, func)
+        client = DockerClient('unix:///nonexistent',
+                              transport=ReplayTransport(path, time_scale=0))
+        with self.assertRaises(HTTPError):
+            client.image_inspect('foobar')
+
+    def test_invalid_cassette(self):
+        path = os.path.join(self.dir, 'cassette.jsonl')
+        with open(path, 'w') as f:
+            f.write('foobar\n')
+        with self.assertRaises(CassetteError):
+            ReplayTransport(path)
+        with open(path, 'w') as f:
+            f.write('{"cassette": 42}\n')
+        with self.assertRaises(CassetteError):
+            ReplayTransport(path)
+        with self.assertRaises(CassetteError):
+            ReplayTransport(os.path.join(self.dir, 'nonexistent'))
+
+    def test_replay_hijack(self):
+        path = os.path.join(self.dir, 'cassette.jsonl')
+        with open(path, 'w') as f:
+            f.write('{"cassette": 1}\n')
+        with self.assertRaises(CassetteError):
+            ReplayTransport(path).send('POST', '/containers/foo/attach',
+                                       hijack=True)
+
+    def test_replay_consumes_body(self):
+        path = os.path.join(self.dir, 'cassette.jsonl')
+        with open(path, 'w') as f:
+            f.write('{"cassette": 1}\n')
+            f.write(json.dumps({
+                'method': 'POST', 'url': '/build', 'params': {},
+                'headers': {}, 'request_bytes': 6, 'status_code': 200,
+                'reason': 'OK', 'response_headers': {}, 'head_time': 0.0,
+                'chunks': []}) + '\n')
+        consumed = []
+
+        def body():
+            for chunk in (b'foo', b'bar'):
+                consumed.append(chunk)
+                yield chunk
+        ReplayTransport(path, time_scale=0).send('POST', '/build',
+                                                 data=body())
+        self.assertEqual(consumed, [b'foo', b'bar'])
+
+    def test_transport_base(self):
+        transport = Transport()
+        transport.bind('http+unix://foo', sendfile=False)
+        self.assertEqual(transport.base_url, 'http+unix://foo')
+        self.assertFalse(transport.sendfile)
+        with self.assertRaises(NotImplementedError):
+            transport.send('GET', '/version')
+        transport.close()
+
+
+class replay_response_tests(unittest.case.TestCase):
+
+    def response(self, chunks, time_scale=0.0, start=None):
+        if start is None:
+            start = time.monotonic()
+        return ReplayResponse(200, 'OK', {'Content-Type': 'application/json'},
+                              chunks, start, time_scale)
+
+    def test_headers(self):
+        r = self.response([])
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.reason, 'OK')
+        self.assertEqual(r.headers['content-type'], 'application/json')
+
+    def test_content(self):
+        r = self.response([(0.0, b'{"foo":'), (0.0, b' 42}')])
+        self.assertEqual(r.content, b'{"foo": 42}')
+        self.assertEqual(r.text, '{"foo": 42}')
+        self.assertEqual(r.json(), {'foo': 42})
+
+    def test_iter_content(self):
+        r = self.response([(0.0, b'foobar'), (0.0, b'x')])
+        self.assertEqual(list(r.iter_content(4)), [b'foob', b'ar', b'x'])
+
+    def test_iter_lines(self):
+        r = self.response([(0.0, b'foo\r\nba'), (0.0, b'r\r\nx')])
+        self.assertEqual(list(r.iter_lines()), [b'foo', b'bar', b'x'])
+
+    def test_readinto(self):
+        r = self.response([(0.0, b'foobar'), (0.0, b'x')])
+        buf = bytearray(4)
+        self.assertEqual(r.readinto(buf), 4)
+        self.assertEqual(buf, b'foob')
+        self.assertEqual(r.readinto(buf), 2)
+        self.assertEqual(buf[:2], b'ar')
+        self.assertEqual(r.readinto(buf), 1)
+        self.assertEqual(r.readinto(buf), 0)
+
+    def test_close(self):
+        r = self.response([(0.0, b'foobar')])
+        r.close()
+        self.assertEqual(r.content, b'')
+
+    def test_timing(self):
+        start = time.monotonic()
+        r = self.response([(0.0, b'foo'), (0.1, b'bar')], time_scale=0.5,
+                          start=start)
+        self.assertEqual(r.content, b'foobar')
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
@@ -11,15 +11,30 @@ import json
 import copy
 import subprocess
 import tarfile
+import base64
+import gzip
+import struct
+import threading
+import time
 
 import requests
 import requests_mock
+import socket_server
 
 from xd.docker.client import *
 from xd.docker.container import *
 from xd.docker.image import *
 from xd.docker.parameters import *
 from xd.docker.exceptions import *
+from xd.docker.exec import *
+from xd.docker.observer import *
+from xd.docker.metrics import *
+from xd.docker.tracing import *
+from xd.docker.debug import *
+from xd.docker.versioncache import *
+from xd.docker.limiter import *
+from xd.docker.scheduler import *
+from xd.docker.retry import *
 
 
 class init_tests(unittest.case.TestCase):
@@ -60,6 +75,8 @@ class SimpleClientTestCase(unittest.case.TestCase):
         self.client = DockerClient()
         requests.get = mock.MagicMock(
             return_value=requests_mock.version_response("1.22", "1.10.3"))
+        # Negotiate API version (for the /vX.Y URL prefix)
+        self.assertEqual(self.client.api_version, (1, 22))
 
 
 class ContextClientTestCase(unittest.case.TestCase):
@@ -68,6 +85,7 @@ class ContextClientTestCase(unittest.case.TestCase):
         self.client = DockerClient()
         requests.get = mock.MagicMock(
             return_value=requests_mock.version_response("1.22", "1.10.3"))
+        self.assertEqual(self.client.api_version, (1, 22))
         self.context = tempfile.mkdtemp()
 
     def tearDown(self):
@@ -123,6 +141,199 @@ class version_tests(SimpleClientTestCase):
             self.client.version()
 
 
+class api_version_tests(unittest.case.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.cache = VersionCache(os.path.join(self.dir, 'versions.json'))
+
+    @mock.patch('requests.get')
+    def test_negotiated(self, get_mock):
+        get_mock.return_value = requests_mock.version_response(
+            "1.22", "1.10.3")
+        client = DockerClient()
+        self.assertEqual(client.api_version, (1, 22))
+        self.assertEqual(client.api_version, (1, 22))
+        self.assertEqual(get_mock.call_count, 1)
+
+    @mock.patch('requests.get')
+    def test_per_instance(self, get_mock):
+        get_mock.side_effect = [
+            requests_mock.version_response("1.22", "1.10.3"),
+            requests_mock.version_response("1.19", "1.7.1")]
+        client1 = DockerClient()
+        client2 = DockerClient()
+        self.assertEqual(client1.api_version, (1, 22))
+        self.assertEqual(client2.api_version, (1, 19))
+        self.assertEqual(client1.api_version, (1, 22))
+        self.assertEqual(get_mock.call_count, 2)
+
+    @mock.patch('requests.get')
+    def test_explicit(self, get_mock):
+        client = DockerClient(api_version='1.20')
+        self.assertEqual(client.api_version, (1, 20))
+        client = DockerClient(api_version=(1, 21))
+        self.assertEqual(client.api_version, (1, 21))
+        self.assertFalse(get_mock.called)
+
+    def test_explicit_invalid(self):
+        with self.assertRaises(ValueError):
+            DockerClient(api_version='1')
+
+    @mock.patch('requests.get')
+    def test_cache(self, get_mock):
+        get_mock.return_value = requests_mock.version_response(
+            "1.22", "1.10.3")
+        client = DockerClient('tcp://127.0.0.1:2375',
+                              version_cache=self.cache)
+        self.assertEqual(client.api_version, (1, 22))
+        client = DockerClient('tcp://127.0.0.1:2375',
+                              version_cache=self.cache.path)
+        self.assertEqual(client.api_version, (1, 22))
+        self.assertEqual(get_mock.call_count, 1)
+
+    @mock.patch('requests.get')
+    def test_cache_other_host(self, get_mock):
+        get_mock.return_value = requests_mock.version_response(
+            "1.22", "1.10.3")
+        DockerClient('tcp://127.0.0.1:2375',
+                     version_cache=self.cache).api_version
+        DockerClient('tcp://127.0.0.2:2375',
+                     version_cache=self.cache).api_version
+        self.assertEqual(get_mock.call_count, 2)
+
+    @mock.patch('requests.get')
+    def test_refresh(self, get_mock):
+        get_mock.side_effect = [
+            requests_mock.version_response("1.19", "1.7.1"),
+            requests_mock.version_response("1.22", "1.10.3")]
+        client = DockerClient('tcp://127.0.0.1:2375',
+                              version_cache=self.cache)
+        self.assertEqual(client.api_version, (1, 19))
+        self.assertEqual(client.refresh_api_version(), (1, 22))
+        self.assertEqual(client.api_version, (1, 22))
+        self.assertEqual(self.cache.get('http://127.0.0.1:2375'), (1, 22))
+
+    @mock.patch('requests.get')
+    def test_refresh_stale_cache(self, get_mock):
+        self.cache.set('http://127.0.0.1:2375', (1, 14))
+        get_mock.return_value = requests_mock.version_response(
+            "1.22", "1.10.3")
+        client = DockerClient('tcp://127.0.0.1:2375',
+                              version_cache=self.cache)
+        self.assertEqual(client.api_version, (1, 14))
+        client._require_api_version((1, 15), 'foo')
+        self.assertEqual(client.api_version, (1, 22))
+        self.assertEqual(get_mock.call_count, 1)
+
+    @mock.patch('requests.get')
+    def test_incompatible_after_refresh(self, get_mock):
+        self.cache.set('http://127.0.0.1:2375', (1, 14))
+        get_mock.return_value = requests_mock.version_response(
+            "1.14", "1.2.0")
+        client = DockerClient('tcp://127.0.0.1:2375',
+                              version_cache=self.cache)
+        with self.assertRaises(IncompatibleRemoteAPI):
+            client._require_api_version((1, 15), 'foo')
+        with self.assertRaises(IncompatibleRemoteAPI):
+            client._require_api_version((1, 15), 'foo')
+        self.assertEqual(get_mock.call_count, 1)
+
+    @mock.patch('requests.get')
+    def test_downgraded_daemon(self, get_mock):
+        self.cache.set('http://127.0.0.1:2375', (1, 24))
+        get_mock.side_effect = [
+            requests_mock.Response(
+                '{"message": "client version 1.24 is too new. Maximum '
+                'supported API version is 1.22"}', 400),
+            requests_mock.version_response("1.22", "1.10.3"),
+            requests_mock.Response('[]', 200)]
+        client = DockerClient('tcp://127.0.0.1:2375',
+                              version_cache=self.cache)
+        self.assertEqual(client.containers(), [])
+        self.assertEqual(client.api_version, (1, 22))
+        self.assertEqual(self.cache.get('http://127.0.0.1:2375'), (1, 22))
+        self.assertEqual(get_mock.call_args[0][0],
+                         client.base_url + '/v1.22/containers/json')
+
+    @mock.patch('requests.get')
+    def test_bad_request_not_renegotiated(self, get_mock):
+        self.cache.set('http://127.0.0.1:2375', (1, 22))
+        get_mock.return_value = requests_mock.Response(
+            '{"message": "invalid filter"}', 400)
+        client = DockerClient('tcp://127.0.0.1:2375',
+                              version_cache=self.cache)
+        with self.assertRaises(ClientError):
+            client.containers()
+        self.assertEqual(get_mock.call_count, 1)
+
+    @mock.patch('requests.get')
+    def test_explicit_too_new_not_renegotiated(self, get_mock):
+        get_mock.return_value = requests_mock.Response(
+            '{"message": "client version 1.24 is too new. Maximum '
+            'supported API version is 1.22"}', 400)
+        client = DockerClient(api_version='1.24')
+        with self.assertRaises(ClientError):
+            client.containers()
+        self.assertEqual(get_mock.call_count, 1)
+
+    @mock.patch('requests.get')
+    def test_explicit_not_refreshed(self, get_mock):
+        client = DockerClient(api_version='1.14')
+        with self.assertRaises(IncompatibleRemoteAPI):
+            client._require_api_version((1, 15), 'foo')
+        self.assertFalse(get_mock.called)
+
+    @mock.patch('requests.get')
+    def test_url_prefix(self, get_mock):
+        get_mock.side_effect = [
+            requests_mock.version_response("1.22", "1.10.3"),
+            requests_mock.Response('[]', 200),
+            requests_mock.Response('OK\n', 200)]
+        client = DockerClient()
+        client.containers()
+        client.ping()
+        urls = [args[0] for args, kwargs in get_mock.call_args_list]
+        self.assertEqual(urls, [client.base_url + '/version',
+                                client.base_url + '/v1.22/containers/json',
+                                client.base_url + '/_ping'])
+
+    @mock.patch('requests.get')
+    def test_set_lower_version(self, get_mock):
+        get_mock.side_effect = [
+            requests_mock.version_response("1.22", "1.10.3"),
+            requests_mock.Response('[]', 200)]
+        client = DockerClient()
+        self.assertEqual(client.api_version, (1, 22))
+        client.api_version = '1.20'
+        self.assertEqual(client.api_version, (1, 20))
+        client.containers()
+        self.assertEqual(get_mock.call_args[0][0],
+                         client.base_url + '/v1.20/containers/json')
+        with self.assertRaises(IncompatibleRemoteAPI):
+            client._require_api_version((1, 21), 'foo')
+        self.assertEqual(get_mock.call_count, 2)
+
+    @mock.patch('requests.get')
+    def test_concurrent_negotiation(self, get_mock):
+        def slow_version(*args, **kwargs):
+            time.sleep(0.05)
+            return requests_mock.version_response("1.22", "1.10.3")
+        get_mock.side_effect = slow_version
+        client = DockerClient()
+        versions = []
+        threads = [threading.Thread(
+            target=lambda: versions.append(client.api_version))
+            for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(versions, [(1, 22)] * 8)
+        self.assertEqual(get_mock.call_count, 1)
+
+
 class ping_tests(SimpleClientTestCase):
 
     @mock.patch('requests.get')
@@ -956,6 +1167,139 @@ class image_tag_tests(ContextClientTestCase):
             self.client.image_tag('busybox:latest', 'myrepo')
 
 
+class image_save_tests(ContextClientTestCase):
+
+    archive = b'foobar' * 10000
+
+    @mock.patch('requests.get')
+    def test_iterator(self, get_mock):
+        get_mock.return_value = requests_mock.Response(
+            None, 200, content=self.archive)
+        chunks = self.client.image_save('busybox', chunk_size=1000)
+        self.assertEqual(b''.join(chunks), self.archive)
+        assert get_mock.call_args[0][0].endswith('/images/get')
+        assert get_mock.call_args[1]['params'] == {'names': ['busybox']}
+        assert get_mock.call_args[1]['stream'] is True
+
+    @mock.patch('requests.get')
+    def test_iterator_dropped(self, get_mock):
+        get_mock.return_value = requests_mock.Response(
+            None, 200, content=self.archive)
+        scheduler = PriorityScheduler()
+        self.client.add_observer(scheduler)
+        chunks = self.client.image_save('busybox')
+        self.assertEqual(scheduler.in_flight[BULK], 1)
+        del chunks
+        self.assertEqual(scheduler.in_flight[BULK], 0)
+        chunks = self.client.image_save('busybox', chunk_size=1000)
+        next(chunks)
+        chunks.close()
+        self.assertEqual(scheduler.in_flight[BULK], 0)
+
+    @mock.patch('requests.get')
+    def test_fileobj(self, get_mock):
+        get_mock.return_value = requests_mock.Response(
+            None, 200, content=self.archive)
+        out = io.BytesIO()
+        self.client.image_save(['busybox', 'debian:jessie'], out)
+        self.assertEqual(out.getvalue(), self.archive)
+        assert get_mock.call_args[1]['params'] == {
+            'names': ['busybox', 'debian:jessie']}
+
+    @mock.patch('requests.get')
+    def test_path(self, get_mock):
+        get_mock.return_value = requests_mock.Response(
+            None, 200, content=self.archive)
+        path = os.path.join(self.context, 'busybox.tar')
+        self.client.image_save('busybox', path)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.archive)
+
+    @mock.patch('requests.get')
+    def test_compress(self, get_mock):
+        get_mock.return_value = requests_mock.Response(
+            None, 200, content=self.archive)
+        out = io.BytesIO()
+        self.client.image_save('busybox', out, compress=True)
+        self.assertEqual(gzip.decompress(out.getvalue()), self.archive)
+
+    @mock.patch('requests.get')
+    def test_progress(self, get_mock):
+        get_mock.return_value = requests_mock.Response(
+            None, 200, content=self.archive)
+        progress = []
+        self.client.image_save('busybox', io.BytesIO(),
+                               progress=progress.append, chunk_size=10000)
+        self.assertEqual(progress, list(range(10000, 60001, 10000)))
+
+    @mock.patch('requests.get')
+    def test_not_found(self, get_mock):
+        get_mock.return_value = requests_mock.Response('not found', 404)
+        with self.assertRaises(ClientError):
+            self.client.image_save('busybox')
+
+
+class image_load_tests(ContextClientTestCase):
+
+    archive = b'foobar' * 10000
+    response = '{"stream":"Loaded image: busybox:latest\\n"}\n'
+
+    @mock.patch('requests.post')
+    def test_fileobj(self, post_mock):
+        post_mock.return_value = requests_mock.Response(self.response, 200)
+        source = io.BytesIO(self.archive)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.assertTrue(self.client.image_load(source))
+        self.assertEqual(out.getvalue(), 'Loaded image: busybox:latest\n')
+        assert post_mock.call_args[0][0].endswith('/images/load')
+        self.assertIs(post_mock.call_args[1]['data'], source)
+        self.assertEqual(post_mock.call_args[1]['headers'],
+                         {'content-type': 'application/x-tar'})
+
+    @mock.patch('requests.post')
+    def test_path(self, post_mock):
+        path = os.path.join(self.context, 'busybox.tar')
+        with open(path, 'wb') as f:
+            f.write(self.archive)
+        data = []
+        post_mock.side_effect = lambda *args, **kwargs: (
+            data.append(kwargs['data'].read()) or
+            requests_mock.Response(self.response, 200))
+        self.client.sendfile = False
+        self.assertTrue(self.client.image_load(path, output=()))
+        self.assertEqual(data, [self.archive])
+
+    @mock.patch('requests.post')
+    def test_iterator(self, post_mock):
+        data = []
+        post_mock.side_effect = lambda *args, **kwargs: (
+            data.append(b''.join(kwargs['data'])) or
+            requests_mock.Response(self.response, 200))
+        self.client.image_load(iter([b'foo', b'bar']), output=())
+        self.assertEqual(data, [b'foobar'])
+
+    @mock.patch('requests.post')
+    def test_compress_progress(self, post_mock):
+        data = []
+        post_mock.side_effect = lambda *args, **kwargs: (
+            data.append(b''.join(kwargs['data'])) or
+            requests_mock.Response(self.response, 200))
+        progress = []
+        self.client.image_load(io.BytesIO(self.archive), compress=True,
+                               progress=progress.append, chunk_size=20000,
+                               output=())
+        self.assertEqual(gzip.decompress(data[0]), self.archive)
+        self.assertEqual(progress, [20000, 40000, 60000])
+
+    @mock.patch('requests.post')
+    def test_error(self, post_mock):
+        post_mock.return_value = requests_mock.Response(
+            '{"error":"invalid tar header"}\n', 200)
+        self.assertFalse(self.client.image_load(io.BytesIO(b'foo'),
+                                                output=()))
+
+
 class container_create_tests(ContextClientTestCase):
 
     simple_success_response = requests_mock.Response(json.dumps({
@@ -1072,7 +1416,6 @@ class container_create_tests(ContextClientTestCase):
     def test_container_create_pull_needed(self, post_mock, get_mock):
         post_mock.return_value = self.simple_success_response
         get_mock.side_effect = [
-            requests_mock.version_response("1.22", "1.10.3"),
             requests_mock.Response('404 no such image\n', 404)]
         self.client.container_create(
             ContainerConfig('busybox:latest'), pull=True)
@@ -1085,7 +1428,6 @@ class container_create_tests(ContextClientTestCase):
     def test_container_create_pull_not_needed(self, post_mock, get_mock):
         post_mock.return_value = self.simple_success_response
         get_mock.side_effect = [
-            requests_mock.version_response("1.22", "1.10.3"),
             requests_mock.Response(json.dumps(
                 image_inspect_tests.response), 200)]
         self.client.container_create(
@@ -1099,7 +1441,6 @@ class container_create_tests(ContextClientTestCase):
     def test_container_create_nopull_needed(self, post_mock, get_mock):
         post_mock.return_value = self.simple_success_response
         get_mock.side_effect = [
-            requests_mock.version_response("1.22", "1.10.3"),
             requests_mock.Response('404 no such image\n', 404)]
         self.client.container_create(
             ContainerConfig('busybox:latest'), pull=False)
@@ -1112,7 +1453,6 @@ class container_create_tests(ContextClientTestCase):
     def test_container_create_nopull_not_needed(self, post_mock, get_mock):
         post_mock.return_value = self.simple_success_response
         get_mock.side_effect = [
-            requests_mock.version_response("1.22", "1.10.3"),
             requests_mock.Response(json.dumps(
                 image_inspect_tests.response), 200)]
         self.client.container_create(
@@ -1448,10 +1788,148 @@ class container_upload_tests(ContextClientTestCase):
     def test_incompatible_remote_api(self, put_mock):
         requests.get = mock.MagicMock(
             return_value=requests_mock.version_response("1.19", "1.7.1"))
+        self.client = DockerClient()
         with pytest.raises(IncompatibleRemoteAPI):
             self.client.container_upload('foo', self.tar_file, 'bar')
 
 
+class container_upload_sendfile_tests(ContextClientTestCase):
+
+    def setUp(self):
+        super(container_upload_sendfile_tests, self).setUp()
+        self.server = socket_server.Server()
+        self.tar_file = tempfile.TemporaryFile()
+        with tarfile.open(fileobj=self.tar_file, mode='w') as tar:
+            info = tarfile.TarInfo('foo')
+            info.size = 8
+            tar.addfile(info, io.BytesIO(b'foobarx\n'))
+        self.tar_file.seek(0)
+        self.archive = self.tar_file.read()
+        self.tar_file.seek(0)
+
+    def tearDown(self):
+        self.tar_file.close()
+        self.server.close()
+        super(container_upload_sendfile_tests, self).tearDown()
+
+    @mock.patch('requests.put')
+    def test_sendfile(self, put_mock):
+        self.server.responses.append(
+            b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n')
+        client = DockerClient(self.server.url)
+        client.container_upload('foo', self.tar_file, '/bar')
+        self.assertFalse(put_mock.called)
+        request = self.server.requests[0]
+        self.assertEqual(request.method, 'PUT')
+        self.assertEqual(request.path,
+                         '/v1.22/containers/foo/archive?path=%2Fbar')
+        self.assertEqual(request.headers['content-type'], 'application/x-tar')
+        self.assertEqual(request.body, self.archive)
+
+    @mock.patch('requests.put')
+    def test_sendfile_readonly(self, put_mock):
+        self.server.responses.append(
+            b'HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\n\r\n')
+        client = DockerClient(self.server.url)
+        with pytest.raises(PermissionDenied):
+            client.container_upload('foo', self.tar_file, '/bar')
+
+    @mock.patch('requests.put')
+    def test_sendfile_disabled(self, put_mock):
+        put_mock.return_value = requests_mock.Response(None, 200)
+        client = DockerClient(self.server.url, sendfile=False)
+        client.container_upload('foo', self.tar_file, '/bar')
+        self.assertTrue(put_mock.called)
+        self.assertIs(put_mock.call_args[1]['data'], self.tar_file)
+        self.assertEqual(self.server.requests, [])
+
+    @mock.patch('requests.post')
+    def test_image_build_fileobj(self, post_mock):
+        body = b'{"stream":"Successfully built e4d9194b48f8\\n"}\n'
+        self.server.responses.append(
+            b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n' +
+            '{:x}\r\n'.format(len(body)).encode('ascii') + body +
+            b'\r\n0\r\n\r\n')
+        client = DockerClient(self.server.url)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.assertEqual(client.image_build(self.tar_file), 'e4d9194b48f8')
+        self.assertFalse(post_mock.called)
+        self.assertEqual(self.server.requests[0].path, '/v1.22/build')
+        self.assertEqual(self.server.requests[0].body, self.archive)
+
+
+class container_logs_tests(ContextClientTestCase):
+
+    @staticmethod
+    def frame(stream, data):
+        return struct.pack('>BxxxL', stream, len(data)) + data
+
+    def setUp(self):
+        super(container_logs_tests, self).setUp()
+        self.assertEqual(self.client.api_version, (1, 22))
+        self.content = (self.frame(1, b'foo\n') + self.frame(2, b'bar\n') +
+                        self.frame(1, b'baz\n'))
+
+    @mock.patch('requests.get')
+    def test_multiplexed(self, get_mock):
+        get_mock.return_value = requests_mock.Response(
+            None, 200, content=self.content)
+        frames = list(self.client.container_logs('foo', tty=False))
+        self.assertEqual(frames, [(1, b'foo\n'), (2, b'bar\n'),
+                                  (1, b'baz\n')])
+        assert get_mock.call_args[0][0].endswith('/containers/foo/logs')
+        assert get_mock.call_args[1]['stream'] is True
+        self.assertEqual(get_mock.call_args[1]['params'], {
+            'follow': False, 'stdout': True, 'stderr': True,
+            'timestamps': False})
+
+    @mock.patch('requests.get')
+    def test_tty(self, get_mock):
+        get_mock.return_value = requests_mock.Response(
+            None, 200, content=b'foo\nbar\n')
+        frames = list(self.client.container_logs(ContainerName('foo'),
+                                                 tty=True))
+        self.assertEqual(b''.join(data for stream, data in frames),
+                         b'foo\nbar\n')
+        self.assertTrue(all(stream == 1 for stream, data in frames))
+
+    @mock.patch('requests.get')
+    def test_inspect_tty(self, get_mock):
+        get_mock.side_effect = [
+            requests_mock.Response('{"Config": {"Tty": false}}', 200),
+            requests_mock.Response(None, 200, content=self.content)]
+        frames = list(self.client.container_logs(
+            Container(self.client, name='foo')))
+        self.assertEqual(len(frames), 3)
+        assert get_mock.call_args_list[0][0][0].endswith(
+            '/containers/foo/json')
+
+    @mock.patch('requests.get')
+    def test_params(self, get_mock):
+        get_mock.return_value = requests_mock.Response(
+            None, 200, content=b'')
+        self.client.container_logs('foo', follow=True, since=1472467123,
+                                   tail=10, timestamps=True, stderr=False,
+                                   tty=False)
+        self.assertEqual(get_mock.call_args[1]['params'], {
+            'follow': True, 'stdout': True, 'stderr': False,
+            'since': 1472467123, 'timestamps': True, 'tail': 10})
+
+    @mock.patch('requests.get')
+    def test_no_such_container(self, get_mock):
+        get_mock.return_value = requests_mock.Response('no such id', 404)
+        with self.assertRaises(ClientError):
+            self.client.container_logs('foo', tty=False)
+
+    def test_since_not_supported(self):
+        requests.get = mock.MagicMock(
+            return_value=requests_mock.version_response("1.18", "1.6.2"))
+        self.client = DockerClient()
+        with self.assertRaises(ValueError):
+            self.client.container_logs('foo', since=1472467123, tty=False)
+
+
 class commit_tests(ContextClientTestCase):
 
     @mock.patch('requests.post')
@@ -1533,3 +2011,1104 @@ class commit_tests(ContextClientTestCase):
         params = post_mock.call_args[1]['params']
         assert 'pause' in params
         assert params['pause'] == False
+
+
+class container_download_tests(ContextClientTestCase):
+
+    stat = {'name': 'foo', 'size': 8, 'mode': 420,
+            'mtime': '2016-08-30T11:02:04.5+02:00', 'linkTarget': ''}
+
+    def setUp(self):
+        super(container_download_tests, self).setUp()
+        tar_buf = io.BytesIO()
+        with tarfile.open(fileobj=tar_buf, mode='w') as tar:
+            info = tarfile.TarInfo('foo')
+            info.size = 8
+            tar.addfile(info, io.BytesIO(b'foobarx\n'))
+        self.archive = tar_buf.getvalue()
+        self.headers = {'X-Docker-Container-Path-Stat': base64.b64encode(
+            json.dumps(self.stat).encode('utf-8')).decode('ascii')}
+        self.assertEqual(self.client.api_version, (1, 22))
+
+    def response(self, status_code=200):
+        return requests_mock.Response(None, status_code, headers=self.headers,
+                                      content=self.archive)
+
+    def test_fileobj(self):
+        out = io.BytesIO()
+        with mock.patch('requests.get') as get_mock:
+            get_mock.return_value = self.response()
+            stat = self.client.container_download('foo', '/foo', fileobj=out)
+        self.assertEqual(out.getvalue(), self.archive)
+        self.assertIsInstance(stat, PathStat)
+        self.assertEqual(stat.name, 'foo')
+        assert get_mock.call_args[0][0].endswith('/containers/foo/archive')
+        assert get_mock.call_args[1]['params'] == {'path': '/foo'}
+        assert get_mock.call_args[1]['stream'] is True
+
+    def test_callback(self):
+        chunks = []
+        with mock.patch('requests.get') as get_mock:
+            get_mock.return_value = self.response()
+            self.client.container_download(ContainerName('foo'), '/foo',
+                                           callback=chunks.append,
+                                           chunk_size=1000)
+        self.assertEqual(b''.join(chunks), self.archive)
+        self.assertTrue(all(len(chunk) <= 1000 for chunk in chunks))
+
+    def test_directory(self):
+        with mock.patch('requests.get') as get_mock:
+            get_mock.return_value = self.response()
+            self.client.container_download(
+                Container(self.client, name='foo'), '/foo',
+                directory=self.context, chunk_size=512)
+        with open(os.path.join(self.context, 'foo'), 'rb') as f:
+            self.assertEqual(f.read(), b'foobarx\n')
+
+    def test_directory_unsafe(self):
+        tar_buf = io.BytesIO()
+        with tarfile.open(fileobj=tar_buf, mode='w') as tar:
+            info = tarfile.TarInfo('../foo')
+            info.size = 0
+            tar.addfile(info, io.BytesIO(b''))
+        self.archive = tar_buf.getvalue()
+        with mock.patch('requests.get') as get_mock:
+            get_mock.return_value = self.response()
+            with self.assertRaises(ValueError):
+                self.client.container_download('foo', '/foo',
+                                               directory=self.context)
+
+    def unsafe_link_archive(self, *links):
+        tar_buf = io.BytesIO()
+        with tarfile.open(fileobj=tar_buf, mode='w') as tar:
+            for name, type, linkname in links:
+                info = tarfile.TarInfo(name)
+                info.type = type
+                info.linkname = linkname
+                tar.addfile(info)
+            info = tarfile.TarInfo('bar/foo')
+            info.size = 3
+            tar.addfile(info, io.BytesIO(b'bar'))
+        return tar_buf.getvalue()
+
+    def test_directory_unsafe_links_no_filter(self):
+        # Without tarfile extraction filters (Python < 3.12 and older
+        # maintenance releases), links are checked by container_download
+        directory = os.path.join(self.context, 'out')
+        os.mkdir(directory)
+        for links in ([('bar', tarfile.SYMTYPE, '/tmp')],
+                      [('bar', tarfile.SYMTYPE, '..')],
+                      [('a', tarfile.DIRTYPE, ''),
+                       ('a/l', tarfile.SYMTYPE, '..'),
+                       ('bar', tarfile.SYMTYPE, 'a/l/..')],
+                      [('bar', tarfile.LNKTYPE, '../foo')]):
+            self.archive = self.unsafe_link_archive(*links)
+            with mock.patch('requests.get') as get_mock, \
+                    mock.patch.object(tarfile, 'tar_filter', create=True):
+                del tarfile.tar_filter
+                get_mock.return_value = self.response()
+                with self.assertRaises(ValueError):
+                    self.client.container_download('foo', '/foo',
+                                                   directory=directory)
+            self.assertFalse(os.path.exists(os.path.join(self.context,
+                                                         'foo')))
+
+    def test_directory_safe_links_no_filter(self):
+        self.archive = self.unsafe_link_archive(
+            ('a', tarfile.DIRTYPE, ''), ('bar', tarfile.SYMTYPE, 'a'))
+        with mock.patch('requests.get') as get_mock, \
+                mock.patch.object(tarfile, 'tar_filter', create=True):
+            del tarfile.tar_filter
+            get_mock.return_value = self.response()
+            self.client.container_download('foo', '/foo',
+                                           directory=self.context)
+        with open(os.path.join(self.context, 'a', 'foo'), 'rb') as f:
+            self.assertEqual(f.read(), b'bar')
+
+    def test_no_output(self):
+        with self.assertRaises(ValueError):
+            self.client.container_download('foo', '/foo')
+
+    def test_two_outputs(self):
+        with self.assertRaises(ValueError):
+            self.client.container_download('foo', '/foo',
+                                           fileobj=io.BytesIO(),
+                                           directory=self.context)
+
+    def test_no_such_path(self):
+        with mock.patch('requests.get') as get_mock:
+            get_mock.return_value = requests_mock.Response(
+                'no such file\n', 404)
+            with self.assertRaises(ClientError):
+                self.client.container_download('foo', '/foo',
+                                               fileobj=io.BytesIO())
+
+    def test_incompatible_remote_api(self):
+        requests.get = mock.MagicMock(
+            return_value=requests_mock.version_response("1.19", "1.7.1"))
+        self.client = DockerClient()
+        with pytest.raises(IncompatibleRemoteAPI):
+            self.client.container_download('foo', '/foo',
+                                           fileobj=io.BytesIO())
+
+
+class container_path_stat_tests(ContextClientTestCase):
+
+    @mock.patch('requests.head')
+    def test_stat(self, head_mock):
+        stat = container_download_tests.stat
+        head_mock.return_value = requests_mock.Response(None, 200, headers={
+            'X-Docker-Container-Path-Stat': base64.b64encode(
+                json.dumps(stat).encode('utf-8'))})
+        stat = self.client.container_path_stat('foo', '/foo')
+        self.assertIsInstance(stat, PathStat)
+        self.assertEqual(stat.size, 8)
+        assert head_mock.call_args[0][0].endswith('/containers/foo/archive')
+        assert head_mock.call_args[1]['params'] == {'path': '/foo'}
+
+    @mock.patch('requests.head')
+    def test_no_such_path(self, head_mock):
+        head_mock.return_value = requests_mock.Response(None, 404)
+        with self.assertRaises(ClientError):
+            self.client.container_path_stat('foo', '/foo')
+
+
+STATS_SAMPLE = {
+    'read': '2016-09-01T10:00:01.123456789Z',
+    'precpu_stats': {'cpu_usage': {'total_usage': 1000000000},
+                     'system_cpu_usage': 100000000000},
+    'cpu_stats': {'cpu_usage': {'total_usage': 1500000000,
+                                'percpu_usage': [1, 2, 3, 4]},
+                  'system_cpu_usage': 102000000000},
+    'memory_stats': {'usage': 3000000, 'limit': 8000000,
+                     'stats': {'cache': 1000000}},
+    'networks': {'eth0': {'rx_bytes': 100, 'tx_bytes': 200},
+                 'eth1': {'rx_bytes': 10, 'tx_bytes': 20}},
+    'blkio_stats': {'io_service_bytes_recursive': [
+        {'major': 8, 'minor': 0, 'op': 'Read', 'value': 4096},
+        {'major': 8, 'minor': 0, 'op': 'Write', 'value': 8192},
+        {'major': 8, 'minor': 0, 'op': 'Total', 'value': 12288}]},
+    }
+
+
+class container_stats_tests(ContextClientTestCase):
+
+    def setUp(self):
+        super(container_stats_tests, self).setUp()
+        self.assertEqual(self.client.api_version, (1, 22))
+
+    @mock.patch('requests.get')
+    def test_stream(self, get_mock):
+        sample = json.dumps(STATS_SAMPLE)
+        get_mock.return_value = requests_mock.Response(
+            sample + '\n' + sample + '\n', 200)
+        samples = list(self.client.container_stats('foo'))
+        self.assertEqual(len(samples), 2)
+        self.assertEqual(samples[0].cpu_percent, 100.0)
+        self.assertEqual(samples[1].memory_usage, 2000000)
+        assert get_mock.call_args[0][0].endswith('/containers/foo/stats')
+        assert get_mock.call_args[1]['stream'] is True
+        self.assertEqual(get_mock.call_args[1]['params'], {})
+
+    @mock.patch('requests.get')
+    def test_no_stream(self, get_mock):
+        get_mock.return_value = requests_mock.Response(
+            json.dumps(STATS_SAMPLE), 200)
+        stats = self.client.container_stats(
+            Container(self.client, id='foo'), stream=False)
+        self.assertEqual(stats.network_rx, 110)
+        self.assertEqual(get_mock.call_args[1]['params'], {'stream': False})
+
+    @mock.patch('requests.get')
+    def test_no_such_container(self, get_mock):
+        get_mock.return_value = requests_mock.Response('no such id', 404)
+        with self.assertRaises(ClientError):
+            self.client.container_stats(ContainerName('foo'))
+
+    def test_no_stream_remote_api_1_18(self):
+        requests.get = mock.MagicMock(
+            return_value=requests_mock.version_response("1.18", "1.6.2"))
+        self.client = DockerClient()
+        with pytest.raises(IncompatibleRemoteAPI):
+            self.client.container_stats('foo', stream=False)
+        self.assertEqual(requests.get.call_count, 1)
+
+    def test_incompatible_remote_api(self):
+        requests.get = mock.MagicMock(
+            return_value=requests_mock.version_response("1.16", "1.4.1"))
+        self.client = DockerClient()
+        with pytest.raises(IncompatibleRemoteAPI):
+            self.client.container_stats('foo')
+
+
+class exec_tests(ContextClientTestCase):
+
+    @staticmethod
+    def frame(stream, data):
+        return struct.pack('>BxxxL', stream, len(data)) + data
+
+    def setUp(self):
+        super(exec_tests, self).setUp()
+        self.assertEqual(self.client.api_version, (1, 22))
+
+    @mock.patch('requests.post')
+    def test_create(self, post_mock):
+        post_mock.return_value = requests_mock.Response(
+            '{"Id": "e1"}', 201)
+        exec_instance = self.client.exec_create(
+            ContainerName('foo'), ['echo', 'bar'], user='nobody')
+        self.assertIsInstance(exec_instance, Exec)
+        self.assertEqual(exec_instance.id, 'e1')
+        self.assertEqual(exec_instance.container, 'foo')
+        assert post_mock.call_args[0][0].endswith('/containers/foo/exec')
+        self.assertEqual(json.loads(post_mock.call_args[1]['data']), {
+            'AttachStdin': False, 'AttachStdout': True,
+            'AttachStderr': True, 'Tty': False, 'Cmd': ['echo', 'bar'],
+            'User': 'nobody'})
+
+    @mock.patch('requests.post')
+    def test_create_str(self, post_mock):
+        post_mock.return_value = requests_mock.Response(
+            '{"Id": "e1"}', 201)
+        self.client.exec_create(Container(self.client, id='foo'), 'true')
+        self.assertEqual(json.loads(post_mock.call_args[1]['data'])['Cmd'],
+                         ['true'])
+
+    @mock.patch('requests.post')
+    def test_create_no_such_container(self, post_mock):
+        post_mock.return_value = requests_mock.Response('no such id', 404)
+        with self.assertRaises(ClientError):
+            self.client.exec_create('foo', 'true')
+
+    def test_create_incompatible_remote_api(self):
+        requests.get = mock.MagicMock(
+            return_value=requests_mock.version_response("1.14", "1.2.0"))
+        self.client = DockerClient()
+        with pytest.raises(IncompatibleRemoteAPI):
+            self.client.exec_create('foo', 'true')
+
+    def test_create_user_remote_api_1_18(self):
+        requests.get = mock.MagicMock(
+            return_value=requests_mock.version_response("1.18", "1.6.2"))
+        self.client = DockerClient()
+        with pytest.raises(ValueError):
+            self.client.exec_create('foo', 'true', user='nobody')
+
+    @mock.patch('requests.post')
+    def test_start(self, post_mock):
+        post_mock.return_value = requests_mock.Response(
+            None, 200, content=self.frame(1, b'foo\n') +
+            self.frame(2, b'bar\n'))
+        frames = list(self.client.exec_start(Exec(self.client, 'e1')))
+        self.assertEqual(frames, [(1, b'foo\n'), (2, b'bar\n')])
+        assert post_mock.call_args[0][0].endswith('/exec/e1/start')
+        assert post_mock.call_args[1]['stream'] is True
+        self.assertEqual(json.loads(post_mock.call_args[1]['data']),
+                         {'Detach': False, 'Tty': False})
+
+    @mock.patch('requests.post')
+    def test_start_tty(self, post_mock):
+        post_mock.return_value = requests_mock.Response(
+            None, 200, content=b'foo\r\n')
+        frames = list(self.client.exec_start('e1', tty=True))
+        self.assertEqual(frames, [(1, b'foo\r\n')])
+
+    @mock.patch('requests.post')
+    def test_start_detach(self, post_mock):
+        post_mock.return_value = requests_mock.Response(None, 200)
+        self.assertIsNone(self.client.exec_start('e1', detach=True))
+        assert post_mock.call_args[1]['stream'] is False
+
+    @mock.patch('requests.post')
+    def test_start_no_such_exec(self, post_mock):
+        post_mock.return_value = requests_mock.Response('no such exec', 404)
+        with self.assertRaises(ClientError):
+            self.client.exec_start('e1')
+
+    @mock.patch('requests.get')
+    def test_inspect(self, get_mock):
+        get_mock.return_value = requests_mock.Response(json.dumps({
+            'ID': 'e1', 'Running': False, 'ExitCode': 2, 'Pid': 42,
+            'ContainerID': 'c1', 'ProcessConfig': {'entrypoint': 'false'}}),
+            200)
+        exec_instance = self.client.exec_inspect(Exec(self.client, 'e1'))
+        self.assertEqual(exec_instance.exit_code, 2)
+        self.assertEqual(exec_instance.container, 'c1')
+        assert get_mock.call_args[0][0].endswith('/exec/e1/json')
+
+
+class exec_many_tests(ContextClientTestCase):
+
+    def setUp(self):
+        super(exec_many_tests, self).setUp()
+        self.assertEqual(self.client.api_version, (1, 22))
+        self.output = {
+            'c1': exec_tests.frame(1, b'foo\n'),
+            'c2': exec_tests.frame(1, b'x' * 100) +
+            exec_tests.frame(2, b'bar\n'),
+            }
+
+    def post(self, url, data=None, **kwargs):
+        m = re.search('/containers/([^/]+)/exec$', url)
+        if m:
+            if m.group(1) not in self.output:
+                return requests_mock.Response('no such id', 404)
+            return requests_mock.Response(
+                json.dumps({'Id': 'e-' + m.group(1)}), 201)
+        container = re.search('/exec/e-([^/]+)/start$', url).group(1)
+        return requests_mock.Response(
+            None, 200, content=self.output[container])
+
+    def get(self, url, **kwargs):
+        container = re.search('/exec/e-([^/]+)/json$', url).group(1)
+        return requests_mock.Response(json.dumps({
+            'ExitCode': int(container[1:]), 'Running': False}), 200)
+
+    def test_exec_run(self):
+        with mock.patch('requests.post', side_effect=self.post), \
+                mock.patch('requests.get', side_effect=self.get):
+            result = self.client.exec_run('c2', 'true', max_output=10)
+        self.assertEqual(result.exit_code, 2)
+        self.assertEqual(result.stdout, b'x' * 10)
+        self.assertEqual(result.stderr, b'bar\n')
+        self.assertTrue(result.truncated)
+        self.assertFalse(result.ok)
+
+    def test_exec_many(self):
+        with mock.patch('requests.post', side_effect=self.post), \
+                mock.patch('requests.get', side_effect=self.get):
+            results = self.client.exec_many(
+                ['c1', ContainerName('c2'), Container(self.client, id='c3')],
+                ['echo', 'foo'], max_concurrency=2)
+        self.assertEqual([r.container for r in results], ['c1', 'c2', 'c3'])
+        self.assertEqual(results[0].exit_code, 1)
+        self.assertEqual(results[0].stdout, b'foo\n')
+        self.assertFalse(results[0].truncated)
+        self.assertEqual(results[1].stderr, b'bar\n')
+        self.assertIsNone(results[2].exit_code)
+        self.assertIsInstance(results[2].error, ClientError)
+
+
+class container_attach_tests(ContextClientTestCase):
+
+    def setUp(self):
+        super(container_attach_tests, self).setUp()
+        self.server = socket_server.Server()
+        self.client = DockerClient(self.server.url)
+        self.assertEqual(self.client.api_version, (1, 22))
+
+    def tearDown(self):
+        self.server.close()
+        super(container_attach_tests, self).tearDown()
+
+    def test_attach(self):
+        def respond(conn):
+            conn.sendall(b'HTTP/1.1 101 UPGRADED\r\n'
+                         b'Connection: Upgrade\r\nUpgrade: tcp\r\n\r\n')
+            data = b''.join(iter(lambda: conn.recv(4096), b''))
+            conn.sendall(struct.pack('>BxxxL', 1, len(data)) + data)
+        self.server.responses.append(respond)
+        with self.client.container_attach(ContainerName('foo'),
+                                          logs=True) as sock:
+            sock.sendall(memoryview(b'foobar'))
+            sock.close_write()
+            self.assertEqual(list(sock.frames()), [(1, b'foobar')])
+        request = self.server.requests[0]
+        self.assertEqual(request.method, 'POST')
+        self.assertTrue(request.path.startswith(
+            '/v1.22/containers/foo/attach?'))
+        for param in ('stream=True', 'stdin=True', 'stdout=True',
+                      'stderr=True', 'logs=True'):
+            self.assertIn(param, request.path)
+
+    def test_cached_version_bad_request(self):
+        cache = VersionCache(os.path.join(self.context, 'versions.json'))
+        cache.set(daemon_key(self.client.base_url), (1, 24))
+        client = DockerClient(self.server.url, version_cache=cache)
+        self.assertEqual(client.api_version, (1, 24))
+        body = b'{"message": "client version 1.24 is too new"}'
+        self.server.responses.append(
+            b'HTTP/1.1 400 Bad Request\r\nContent-Length: ' +
+            str(len(body)).encode('ascii') + b'\r\n\r\n' + body)
+        with self.assertRaises(ClientError):
+            client.container_attach('foo')
+
+    def test_no_upgrade(self):
+        self.server.responses.append(
+            b'HTTP/1.1 200 OK\r\n'
+            b'Content-Type: application/vnd.docker.raw-stream\r\n'
+            b'Connection: close\r\n\r\n'
+            b'foo')
+        with self.client.container_attach('foo', stdin=False) as sock:
+            self.assertEqual(list(sock.frames(tty=True)), [(1, b'foo')])
+
+    def test_no_such_container(self):
+        self.server.responses.append(
+            b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n')
+        with self.assertRaises(ClientError):
+            self.client.container_attach(Container(self.client, id='foo'))
+
+    def test_detach_keys_remote_api_1_22(self):
+        with self.assertRaises(ValueError):
+            self.client.container_attach('foo', detach_keys='ctrl-p')
+
+
+class RecordingObserver(Observer):
+
+    def __init__(self):
+        self.events = []
+        self.operations = []
+
+    def operation_start(self, info):
+        self.operations.append(('start', info.name))
+
+    def operation_end(self, info):
+        self.operations.append(('end', info.name))
+        self.operation = info
+
+    def request_start(self, info):
+        self.events.append(('start', info.endpoint, info.status_code))
+
+    def request_end(self, info):
+        self.events.append(('end', info.endpoint, info.status_code))
+        self.info = info
+
+
+class observer_tests(ContextClientTestCase):
+
+    def setUp(self):
+        super(observer_tests, self).setUp()
+        self.assertEqual(self.client.api_version, (1, 22))
+        self.observer = RecordingObserver()
+        self.client.add_observer(self.observer)
+
+    @mock.patch('requests.post')
+    def test_request(self, post_mock):
+        post_mock.return_value = requests_mock.Response(None, 204)
+        self.client.container_start(ContainerName('foo'))
+        self.assertEqual(self.observer.events, [
+            ('start', '/containers/{id}/start', None),
+            ('end', '/containers/{id}/start', 204)])
+        info = self.observer.info
+        self.assertEqual(info.method, 'POST')
+        self.assertEqual(info.url, '/v1.22/containers/foo/start')
+        self.assertEqual(info.path, {'id': 'foo'})
+        self.assertEqual(info.request_bytes, 0)
+        self.assertIsNone(info.connect_time)
+        self.assertGreaterEqual(info.first_byte_time, 0.0)
+        self.assertGreaterEqual(info.total_time, info.first_byte_time)
+        self.assertIsNone(info.exception)
+
+    @mock.patch('requests.get')
+    def test_response_bytes(self, get_mock):
+        get_mock.return_value = requests_mock.Response(
+            '{"Config": {"Tty": true}}', 200)
+        self.client._container_tty('foo')
+        self.assertEqual(self.observer.info.response_bytes, 25)
+
+    @mock.patch('requests.post')
+    def test_client_error(self, post_mock):
+        post_mock.return_value = requests_mock.Response('no such id', 404)
+        with self.assertRaises(ClientError):
+            self.client.container_start('foo')
+        self.assertEqual(self.observer.info.status_code, 404)
+        self.assertIsInstance(self.observer.info.exception, ClientError)
+        self.assertIsNotNone(self.observer.info.total_time)
+
+    @mock.patch('requests.post')
+    def test_connection_error(self, post_mock):
+        post_mock.side_effect = requests.exceptions.ConnectionError()
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.client.container_start('foo')
+        self.assertIsNone(self.observer.info.status_code)
+        self.assertIsInstance(self.observer.info.exception,
+                              requests.exceptions.ConnectionError)
+
+    @mock.patch('requests.get')
+    def test_stream(self, get_mock):
+        get_mock.return_value = requests_mock.Response(
+            None, 200, content=b'x' * 1000)
+        out = io.BytesIO()
+        self.client.image_save('foo', out, chunk_size=300)
+        self.assertEqual(self.observer.events, [
+            ('start', '/images/get', None), ('end', '/images/get', 200)])
+        self.assertEqual(self.observer.info.response_bytes, 1000)
+        self.assertTrue(self.observer.info.stream)
+
+    @mock.patch('requests.post')
+    def test_observer_error(self, post_mock):
+        class FailingObserver(Observer):
+            def request_start(self, info):
+                raise KeyError()
+        self.client.add_observer(FailingObserver())
+        post_mock.return_value = requests_mock.Response(None, 204)
+        self.client.container_start('foo')
+        self.assertEqual(len(self.observer.events), 2)
+
+    @mock.patch('requests.post')
+    def test_remove_observer(self, post_mock):
+        post_mock.return_value = requests_mock.Response(None, 204)
+        self.client.remove_observer(self.observer)
+        self.client.container_start('foo')
+        self.assertEqual(self.observer.events, [])
+
+    def test_init(self):
+        client = DockerClient(observers=[self.observer])
+        self.assertEqual(client._observers, (self.observer,))
+        self.assertIsNone(client.metrics)
+
+    @mock.patch('requests.post')
+    def test_operation(self, post_mock):
+        post_mock.return_value = requests_mock.Response(None, 204)
+        self.client.container_start('foo')
+        self.assertEqual(self.observer.operations, [
+            ('start', 'container_start'), ('end', 'container_start')])
+        self.assertEqual(self.observer.info.operation.name,
+                         'container_start')
+        self.assertGreaterEqual(self.observer.operation.duration, 0.0)
+        self.assertIsNone(self.observer.operation.exception)
+        self.assertIsNone(current_operation())
+
+    @mock.patch('requests.get')
+    def test_nested_operation(self, get_mock):
+        get_mock.return_value = requests_mock.Response(
+            '{"Id": "sha256:abc"}', 200)
+        self.client.image_inspect('foo')
+        self.assertEqual(self.observer.operations, [
+            ('start', 'image_inspect'), ('start', 'image_inspect_raw'),
+            ('end', 'image_inspect_raw'), ('end', 'image_inspect')])
+        operation = self.observer.info.operation
+        self.assertEqual(operation.name, 'image_inspect_raw')
+        self.assertEqual(operation.parent.name, 'image_inspect')
+
+    @mock.patch('requests.post')
+    def test_operation_error(self, post_mock):
+        post_mock.return_value = requests_mock.Response('no such id', 404)
+        with self.assertRaises(ClientError):
+            self.client.container_start('foo')
+        self.assertIsInstance(self.observer.operation.exception, ClientError)
+        self.assertIsNone(current_operation())
+
+    def test_partial_observer(self):
+        class PingObserver(object):
+            def request_end(self, info):
+                self.info = info
+        observer = PingObserver()
+        self.client.add_observer(observer)
+        with mock.patch('requests.get') as get_mock:
+            get_mock.return_value = requests_mock.Response('OK', 200)
+            self.client.ping()
+        self.assertEqual(observer.info.endpoint, '/_ping')
+
+
+class metrics_tests(ContextClientTestCase):
+
+    def setUp(self):
+        super(metrics_tests, self).setUp()
+        self.client = DockerClient(metrics=True)
+        self.assertEqual(self.client.api_version, (1, 22))
+
+    def test_registry(self):
+        registry = MetricsRegistry()
+        client = DockerClient(metrics=registry)
+        self.assertIs(client.metrics, registry)
+        self.assertIsInstance(self.client.metrics, MetricsRegistry)
+
+    @mock.patch('requests.post')
+    def test_operation(self, post_mock):
+        post_mock.return_value = requests_mock.Response(None, 204)
+        self.client.container_start('foo')
+        self.client.container_start('bar')
+        metrics = self.client.metrics
+        self.assertEqual(metrics.get('xd_docker_operations_total').value(
+            ('container_start',)), 2)
+        self.assertEqual(metrics.get('xd_docker_requests_total').value(
+            ('POST', '/containers/{id}/start', '204')), 2)
+        self.assertEqual(metrics.get(
+            'xd_docker_operation_duration_seconds').value(
+                ('container_start',))[0], 2)
+        self.assertEqual(metrics.get('xd_docker_operations_in_flight').value(
+            ('container_start',)), 0)
+        self.assertEqual(
+            metrics.get('xd_docker_requests_in_flight').value(), 0)
+
+    @mock.patch('requests.post')
+    def test_error(self, post_mock):
+        post_mock.return_value = requests_mock.Response('no such id', 404)
+        with self.assertRaises(ClientError):
+            self.client.container_start('foo')
+        self.assertEqual(self.client.metrics.get(
+            'xd_docker_operation_errors_total').value(
+                ('container_start', 'ClientError', '404')), 1)
+        self.assertIn('xd_docker_operation_errors_total{'
+                      'operation="container_start",error="ClientError",'
+                      'code="404"} 1\n', self.client.metrics.exposition())
+
+    def test_pull_bytes(self):
+        output = b'{"status": "Pulling foo"}\n{"status": "Done"}\n'
+        server = socket_server.Server()
+        self.addCleanup(server.close)
+        server.responses.append(
+            b'HTTP/1.1 200 OK\r\nContent-Length: ' +
+            str(len(output)).encode() + b'\r\n\r\n' + output)
+        client = DockerClient(server.url, metrics=self.client.metrics)
+        client.image_pull('foo')
+        self.assertEqual(self.client.metrics.get(
+            'xd_docker_response_bytes_total').value(('image_pull',)),
+            len(output))
+
+
+class limiter_tests(ContextClientTestCase):
+
+    def setUp(self):
+        super(limiter_tests, self).setUp()
+        self.client = DockerClient(limiter=True)
+        self.assertEqual(self.client.api_version, (1, 22))
+
+    def test_limiter(self):
+        limiter = ConcurrencyLimiter()
+        client = DockerClient(limiter=limiter)
+        self.assertIs(client.limiter, limiter)
+        self.assertIn(limiter, client._observers)
+        self.assertIsInstance(self.client.limiter, ConcurrencyLimiter)
+        self.assertIsNone(DockerClient().limiter)
+
+    @mock.patch('requests.post')
+    def test_request(self, post_mock):
+        post_mock.return_value = requests_mock.Response(None, 204)
+        self.client.container_start('foo')
+        light = self.client.limiter.light
+        self.assertEqual(light.in_flight, 0)
+        self.assertIsNotNone(light.min_latency)
+
+    def test_stream(self):
+        server = socket_server.Server()
+        self.addCleanup(server.close)
+        server.responses.append(
+            b'HTTP/1.1 200 OK\r\nContent-Length: 6\r\n\r\nfoobar')
+        client = DockerClient(server.url, transport='socket',
+                              api_version='1.22',
+                              limiter=self.client.limiter)
+        r = client._get('/images/get', stream=True)
+        heavy = self.client.limiter.heavy
+        self.assertEqual(heavy.in_flight, 1)
+        self.assertEqual(b''.join(r.iter_content()), b'foobar')
+        self.assertEqual(heavy.in_flight, 0)
+
+    def test_connection_error(self):
+        client = DockerClient('unix:///nonexistent', transport='socket',
+                              api_version='1.22',
+                              limiter=self.client.limiter)
+        with self.assertRaises(OSError):
+            client.containers()
+        light = self.client.limiter.light
+        self.assertEqual(light.in_flight, 0)
+        self.assertEqual(light.limit, 6)
+
+
+class scheduler_tests(ContextClientTestCase):
+
+    def test_scheduler(self):
+        scheduler = PriorityScheduler()
+        client = DockerClient(scheduler=scheduler)
+        self.assertIs(client.scheduler, scheduler)
+        self.assertIn(scheduler, client._observers)
+        self.assertIsNone(DockerClient().scheduler)
+
+    def test_metrics(self):
+        client = DockerClient(metrics=True, scheduler=True)
+        self.assertIs(client.scheduler.metrics, client.metrics)
+
+    @mock.patch('requests.post')
+    def test_request(self, post_mock):
+        post_mock.return_value = requests_mock.Response(None, 204)
+        client = DockerClient(api_version='1.22', scheduler=True)
+        client.container_start('foo')
+        with priority(BULK):
+            client.container_start('foo')
+        wait = client.scheduler.metrics.get(
+            'xd_docker_scheduler_queue_wait_seconds')
+        self.assertEqual(wait.value((INTERACTIVE,))[0], 1)
+        self.assertEqual(wait.value((BULK,))[0], 1)
+        self.assertEqual(client.scheduler.in_flight,
+                         {INTERACTIVE: 0, NORMAL: 0, BULK: 0})
+
+
+OK = b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}'
+UNAVAILABLE = (b'HTTP/1.1 503 Service Unavailable\r\n'
+               b'Content-Length: 0\r\n\r\n')
+
+
+class retry_tests(unittest.case.TestCase):
+
+    def setUp(self):
+        self.server = socket_server.Server()
+        self.addCleanup(self.server.close)
+        self.policy = RetryPolicy(backoff=0.001)
+        self.client = DockerClient(self.server.url, transport='socket',
+                                   api_version='1.22', retry=self.policy,
+                                   metrics=True)
+        self.addCleanup(self.client.close)
+
+    def retries(self, method, endpoint):
+        retries = self.client.metrics.get('xd_docker_request_retries_total')
+        return retries.value((method, endpoint))
+
+    def test_retry(self):
+        self.assertIsNone(DockerClient().retry)
+        self.assertIsInstance(DockerClient(retry=True).retry, RetryPolicy)
+
+    def test_server_error(self):
+        self.server.responses += [UNAVAILABLE, OK]
+        self.assertEqual(self.client._get('/info').json(), {})
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.retries('GET', '/info'), 1)
+
+    def test_attempts(self):
+        self.server.responses += [UNAVAILABLE] * 4
+        with self.assertRaises(ServerError):
+            self.client._get('/info')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_client_error(self):
+        self.server.responses += [
+            b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n', OK]
+        with self.assertRaises(ClientError):
+            self.client._get('/info')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_not_idempotent(self):
+        self.server.responses += [UNAVAILABLE, OK]
+        with self.assertRaises(ServerError):
+            self.client._post('/containers/{id}/start', id='foo')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_timeout(self):
+        self.server.responses += [lambda conn: time.sleep(0.5), OK]
+        with self.client.options(timeout=0.05):
+            self.assertEqual(self.client._get('/info').json(), {})
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_budget(self):
+        self.policy.budget = RetryBudget(ratio=0.0, burst=1)
+        self.server.responses += [UNAVAILABLE, UNAVAILABLE, UNAVAILABLE]
+        with self.assertRaises(ServerError):
+            self.client._get('/info')
+        self.assertEqual(len(self.server.requests), 2)
+        with self.assertRaises(ServerError):
+            self.client._get('/info')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_container_changes(self):
+        self.policy.container_changes = True
+        self.server.responses += [
+            UNAVAILABLE,
+            b'HTTP/1.1 304 Not Modified\r\nContent-Length: 0\r\n\r\n']
+        self.assertTrue(self.client.container_stop('foo'))
+        self.assertEqual(len(self.server.requests), 2)
+        self.server.responses += [
+            UNAVAILABLE,
+            b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n']
+        self.client.container_remove('foo')
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_options(self):
+        self.server.responses += [UNAVAILABLE, OK]
+        with self.client.options(retry=False):
+            with self.assertRaises(ServerError):
+                self.client._get('/info')
+            self.assertIsNone(self.client._local.retry)
+        self.assertFalse(hasattr(self.client._local, 'retry'))
+        self.assertEqual(self.client._get('/info').json(), {})
+
+    def test_bind_options(self):
+        results = []
+
+        def func():
+            results.append(self.client._local.retry)
+        with self.client.options(retry=None):
+            func = self.client._bind_options(func)
+        thread = threading.Thread(target=func)
+        thread.start()
+        thread.join()
+        self.assertEqual(results, [None])
+        self.assertFalse(hasattr(self.client._local, 'retry'))
+
+
+class timeout_tests(ContextClientTestCase):
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            DockerClient(timeout=0)
+        with self.assertRaises(ValueError):
+            DockerClient(timeout=(1.0, 2.0, 3.0))
+
+    @mock.patch('requests.get')
+    def test_timeout(self, get_mock):
+        get_mock.return_value = requests_mock.Response(json.dumps(
+            {'Id': 'foo'}), 200)
+        client = DockerClient(api_version='1.22', timeout=(1.0, 10.0))
+        self.assertEqual(client.timeout, (1.0, 10.0))
+        client._get('/containers/{id}/json', id='foo')
+        self.assertEqual(get_mock.call_args[1]['timeout'], (1.0, 10.0))
+        client._get('/containers/{id}/logs', id='foo')
+        self.assertEqual(get_mock.call_args[1]['timeout'], (1.0, None))
+        with client.options(timeout=5):
+            client._get('/containers/{id}/json', id='foo')
+        self.assertEqual(get_mock.call_args[1]['timeout'], (5, 5))
+        with client.options(timeout=None):
+            client._get('/containers/{id}/json', id='foo')
+        self.assertNotIn('timeout', get_mock.call_args[1])
+
+
+class observer_connection_tests(ContextClientTestCase):
+
+    def setUp(self):
+        super(observer_connection_tests, self).setUp()
+        self.server = socket_server.Server()
+        self.observer = RecordingObserver()
+        self.client = DockerClient(self.server.url,
+                                   observers=[self.observer])
+        self.assertEqual(self.client.api_version, (1, 22))
+
+    def tearDown(self):
+        self.server.close()
+        super(observer_connection_tests, self).tearDown()
+
+    def test_sendfile(self):
+        self.server.responses.append(
+            b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n')
+        with tempfile.TemporaryFile() as f:
+            f.write(b'x' * 4096)
+            f.seek(0)
+            self.client.container_upload('foo', f, '/bar')
+        info = self.observer.info
+        self.assertEqual(info.endpoint, '/containers/{id}/archive')
+        self.assertEqual(info.request_bytes, 4096)
+        self.assertEqual(info.response_bytes, 0)
+        self.assertGreaterEqual(info.first_byte_time, info.connect_time)
+
+    def test_attach(self):
+        self.server.responses.append(
+            b'HTTP/1.1 101 UPGRADED\r\n'
+            b'Connection: Upgrade\r\nUpgrade: tcp\r\n\r\n')
+        self.client.container_attach('foo').close()
+        self.assertEqual(self.observer.events[-2:], [
+            ('start', '/containers/{id}/attach', None),
+            ('end', '/containers/{id}/attach', 101)])
+        self.assertIsNotNone(self.observer.info.connect_time)
+
+
+class tracing_tests(ContextClientTestCase):
+
+    def setUp(self):
+        super(tracing_tests, self).setUp()
+        self.exporter = InMemoryExporter()
+        self.client = DockerClient(tracing=self.exporter)
+        self.assertEqual(self.client.api_version, (1, 22))
+        self.exporter.clear()
+
+    def names(self, span):
+        return [s.name for s in self.exporter.children(span)]
+
+    @mock.patch('requests.post')
+    @mock.patch('requests.get')
+    def test_container_create_pull(self, get_mock, post_mock):
+        get_mock.return_value = requests_mock.Response('no such image', 404)
+        post_mock.side_effect = [
+            requests_mock.Response('{"status": "Done"}\n', 200),
+            requests_mock.Response('{"Id": "e90e34656806"}', 201)]
+        self.client.container_create(ContainerConfig('busybox'))
+        root, = self.exporter.find('container_create')
+        self.assertIsNone(root.parent_id)
+        self.assertEqual(root.kind, 'operation')
+        self.assertTrue(root.ok)
+        self.assertEqual(self.names(root), [
+            'image_inspect_raw', 'image_pull', 'POST /containers/create'])
+        inspect, pull, create = self.exporter.children(root)
+        self.assertFalse(inspect.ok)
+        self.assertEqual(inspect.attributes['error'], 'ClientError')
+        self.assertEqual(self.names(pull), ['POST /images/create', 'decode'])
+        self.assertEqual(create.attributes['http.status_code'], 201)
+        self.assertEqual(create.attributes['http.target'],
+                         '/v1.22/containers/create')
+        self.assertTrue(all(span.trace_id == root.trace_id
+                            for span in self.exporter.spans))
+        self.assertTrue(all(root.start <= span.start <= span.end <= root.end
+                            for span in self.exporter.spans
+                            if span is not root))
+
+    @mock.patch('requests.post')
+    def test_image_build(self, post_mock):
+        with open(os.path.join(self.context, 'Dockerfile'), 'w') as f:
+            f.write('FROM busybox\n')
+        post_mock.return_value = requests_mock.Response(
+            '{"stream":"Successfully built e4d9194b48f8\\n"}\n', 200)
+        self.client.image_build(self.context, output=())
+        root, = self.exporter.find('image_build')
+        self.assertEqual(self.names(root), ['tar', 'POST /build', 'decode'])
+        tar = self.exporter.children(root)[0]
+        self.assertEqual(tar.kind, 'phase')
+        self.assertAlmostEqual(tar.attributes['busy_time'], tar.duration,
+                               places=5)
+
+    @mock.patch('requests.post')
+    def test_image_load_compress(self, post_mock):
+        def post(url, data=None, **kwargs):
+            self.assertEqual(gzip.decompress(b''.join(data)), b'x' * 10000)
+            return requests_mock.Response('{"stream": "Loaded"}\n', 200)
+        post_mock.side_effect = post
+        self.client.image_load(io.BytesIO(b'x' * 10000), compress=True,
+                               chunk_size=1000)
+        root, = self.exporter.find('image_load')
+        self.assertEqual(self.names(root),
+                         ['POST /images/load', 'compress', 'decode'])
+        compress, = self.exporter.find('compress')
+        self.assertLessEqual(compress.attributes['busy_time'],
+                             compress.duration)
+
+    @mock.patch('requests.post')
+    def test_error(self, post_mock):
+        post_mock.return_value = requests_mock.Response('no such id', 500)
+        with self.assertRaises(ServerError):
+            self.client.container_start('foo')
+        root, = self.exporter.find('container_start')
+        request, = self.exporter.children(root)
+        self.assertIsInstance(root.exception, ServerError)
+        self.assertEqual(request.attributes['error'], 'ServerError')
+        self.assertEqual(request.attributes['http.status_code'], 500)
+
+
+class debug_tests(ContextClientTestCase):
+
+    def setUp(self):
+        super(debug_tests, self).setUp()
+        self.assertEqual(self.client.api_version, (1, 22))
+
+    @mock.patch('requests.post')
+    def test_slow_operation(self, post_mock):
+        post_mock.return_value = requests_mock.Response(None, 204)
+        slow = self.client.enable_debug(threshold=0.0)
+        self.assertIs(self.client.slow_calls, slow)
+        self.assertIsNone(self.client.profiler)
+        with self.assertLogs('xd.docker.debug', 'WARNING'):
+            self.client.container_start('foo')
+        call, = slow.records
+        self.assertEqual(call.name, 'container_start')
+        self.assertEqual(call.timings[0]['url'],
+                         '/v1.22/containers/foo/start')
+        self.assertEqual(call.timings[0]['status_code'], 204)
+        self.assertIn('test_slow_operation', ''.join(call.stack))
+
+    @mock.patch('requests.post')
+    def test_redacted(self, post_mock):
+        post_mock.return_value = requests_mock.Response(
+            '{"status": "Downloaded newer image for busybox:latest"}\n', 200)
+        slow = self.client.enable_debug(threshold=0.0)
+        with self.assertLogs('xd.docker.debug', 'WARNING') as logs:
+            self.client.image_pull('busybox:latest', registry_auth={
+                'username': 'user', 'password': 'secret'}, output=())
+        call, = slow.records
+        self.assertEqual(call.name, 'image_pull')
+        request, = [t for t in call.timings if 'url' in t]
+        self.assertEqual(request['params'], {'fromImage': 'busybox:latest'})
+        self.assertEqual(request['headers'], {
+            'content-type': 'application/json',
+            'X-Registry-Auth': '<redacted>'})
+        secret = post_mock.call_args[1]['headers']['X-Registry-Auth']
+        self.assertNotIn(secret.decode('ascii'), ''.join(logs.output))
+        self.assertNotIn(secret.decode('ascii'), slow.report())
+        self.assertIn('fromImage', slow.report())
+
+    @mock.patch('requests.post')
+    def test_profile(self, post_mock):
+        post_mock.return_value = requests_mock.Response(None, 204)
+        self.client.enable_debug(threshold=10.0, profile='cprofile',
+                                 sample_rate=1.0)
+        self.client.container_start('foo')
+        self.assertEqual(self.client.profiler.samples, 1)
+        self.assertIn('container_start', self.client.profiler.report())
+
+    @mock.patch('requests.post')
+    def test_disable(self, post_mock):
+        post_mock.return_value = requests_mock.Response(None, 204)
+        slow = self.client.enable_debug(threshold=0.0, profile='cprofile')
+        self.client.disable_debug()
+        self.assertEqual(self.client._observers, ())
+        self.client.container_start('foo')
+        self.assertEqual(slow.records, [])
+        self.assertIs(self.client.slow_calls, slow)
+
+
+class thread_safety_tests(unittest.case.TestCase):
+
+    VERSION = (b'{"ApiVersion": "1.22", "Version": "1.10.3", '
+               b'"GitCommit": "20f81dd", "GoVersion": "go1.5.3"}')
+
+    def respond(self, request):
+        if request.path == '/version':
+            body = self.VERSION
+        else:
+            body = b'[]'
+        return (b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                b'Content-Length: ' + str(len(body)).encode() +
+                b'\r\n\r\n' + body)
+
+    def run_threads(self, target, count=8):
+        errors = []
+
+        def run():
+            try:
+                target()
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=run) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_shared_client(self):
+        server = socket_server.Server(respond=self.respond)
+        self.addCleanup(server.close)
+        client = DockerClient(server.url, transport='socket', metrics=True)
+        self.addCleanup(client.close)
+
+        def run():
+            for _ in range(25):
+                self.assertEqual(client.containers(), [])
+        self.run_threads(run)
+        paths = [request.path.split('?')[0] for request in server.requests]
+        self.assertEqual(paths.count('/version'), 1)
+        self.assertEqual(paths.count('/v1.22/containers/json'), 200)
+        self.assertLessEqual(server.connections, 8)
+        requests = client.metrics.get('xd_docker_requests_total')
+        self.assertEqual(sum(requests.collect().values()), 201)
+
+    def test_add_remove_observers(self):
+        client = DockerClient(api_version='1.22')
+        observers = [RecordingObserver() for _ in range(8)]
+        self.run_threads(lambda: client.add_observer(observers.pop()))
+        self.assertEqual(len(client._observers), 8)
+        for observer in client._observers:
+            client.remove_observer(observer)
+        self.assertEqual(client._observers, ())
+
+    @mock.patch('requests.get')
+    def test_observers_snapshot(self, get_mock):
+        client = DockerClient(api_version='1.22')
+        late = RecordingObserver()
+
+        class AddingObserver(Observer):
+            def request_start(self, info):
+                client.add_observer(late)
+        client.add_observer(AddingObserver())
+        get_mock.return_value = requests_mock.Response('[]', 200)
+        client.containers()
+        # Added during the request, so only notified about the next one
+        self.assertEqual(late.events, [])
+        client.containers()
+        self.assertEqual(late.events, [
+            ('start', '/containers/json', None),
+            ('end', '/containers/json', 200)])
@@ -0,0 +1,174 @@
+import unittest
+import re
+import json
+
+import socket_server
+
+from xd.docker.cluster import *
+from xd.docker.client import DockerClient
+from xd.docker.parameters import ContainerConfig
+from xd.docker.exceptions import *
+from xd.docker.observer import Observer
+from xd.docker.scheduler import PriorityScheduler, priority, BULK
+
+
+def daemon(names, memory=1000):
+    # Respond to requests like a daemon running containers with names
+    def respond(request):
+        path = re.sub(r'^/v[0-9.]+/', '/', request.path).split('?')[0]
+        status = '200 OK'
+        if path == '/containers/json':
+            body = [{'Id': name + '-id', 'Names': ['/' + name],
+                     'Image': 'busybox'} for name in names]
+        elif path == '/images/json':
+            body = [{'Id': 'sha256:' + '0' * 64,
+                     'RepoTags': ['busybox:latest']}]
+        elif re.match(r'/containers/[^/]*/stats$', path):
+            body = {'read': '2016-08-28T10:00:00.000000000Z',
+                    'memory_stats': {'usage': memory}}
+        elif re.match(r'/images/[^/]*/json$', path):
+            body = {'Id': 'sha256:' + '0' * 64}
+        elif path == '/containers/create':
+            status = '201 Created'
+            body = {'Id': 'new-id'}
+            names.append('new')
+        else:
+            return (b'HTTP/1.1 404 Not Found\r\n'
+                    b'Content-Length: 0\r\n\r\n')
+        body = json.dumps(body).encode()
+        return ('HTTP/1.1 {}\r\nContent-Type: application/json\r\n'
+                'Content-Length: {}\r\n\r\n'.format(
+                    status, len(body)).encode() + body)
+    return respond
+
+
+class ClusterTestCase(unittest.case.TestCase):
+
+    def setUp(self):
+        self.names = {'a': ['foo', 'bar'], 'b': ['baz']}
+        self.servers = {}
+        for host, names in self.names.items():
+            server = socket_server.Server(respond=daemon(names))
+            self.addCleanup(server.close)
+            self.servers[host] = server
+
+    def cluster(self, broken=False, **kwargs):
+        hosts = {host: self.servers[host].url for host in sorted(
+            self.servers)}
+        if broken:
+            hosts['c'] = 'unix:///nonexistent'
+        cluster = DockerCluster(hosts, transport='socket',
+                                api_version='1.22', **kwargs)
+        self.addCleanup(cluster.close)
+        return cluster
+
+
+class cluster_tests(ClusterTestCase):
+
+    def test_init(self):
+        cluster = self.cluster()
+        self.assertEqual(cluster.hosts, ['a', 'b'])
+        self.assertEqual(len(cluster), 2)
+        self.assertIsInstance(cluster['a'], DockerClient)
+        self.assertIsInstance(cluster.placement, LeastContainers)
+
+    def test_init_urls(self):
+        client = DockerClient(self.servers['b'].url)
+        with DockerCluster([self.servers['a'].url, client]) as cluster:
+            self.assertIs(cluster[client.base_url], client)
+            self.assertEqual(len(cluster), 2)
+
+    def test_init_invalid(self):
+        with self.assertRaises(ValueError):
+            DockerCluster([])
+        with self.assertRaises(ValueError):
+            DockerCluster([self.servers['a'].url] * 2)
+
+    def test_containers(self):
+        containers = self.cluster().containers()
+        self.assertTrue(containers.complete)
+        self.assertEqual([(c.host, c.name) for c in containers],
+                         [('a', '/foo'), ('a', '/bar'), ('b', '/baz')])
+        self.assertEqual(list(containers.by_host()), ['a', 'b'])
+        self.assertEqual(len(containers.by_host()['a']), 2)
+
+    def test_images(self):
+        images = self.cluster().images()
+        self.assertEqual([image.host for image in images], ['a', 'b'])
+
+    def test_partial_failure(self):
+        cluster = self.cluster(broken=True)
+        containers = cluster.containers()
+        self.assertFalse(containers.complete)
+        self.assertEqual(len(containers), 3)
+        self.assertEqual(list(containers.errors), ['c'])
+        self.assertIsInstance(containers.errors['c'], OSError)
+        with self.assertRaises(ClusterError) as cm:
+            cluster.containers(strict=True)
+        self.assertEqual(list(cm.exception.errors), ['c'])
+
+    def test_total_failure(self):
+        cluster = DockerCluster(['unix:///nonexistent'], transport='socket',
+                                api_version='1.22')
+        self.addCleanup(cluster.close)
+        with self.assertRaises(ClusterError):
+            cluster.images()
+
+    def test_scatter(self):
+        results, errors = self.cluster(broken=True).scatter(
+            lambda client: len(client.containers()))
+        self.assertEqual(dict(results), {'a': 2, 'b': 1})
+        self.assertEqual(list(errors), ['c'])
+
+
+class cluster_priority_tests(ClusterTestCase):
+
+    def test_priority(self):
+        classes = []
+        scheduler = PriorityScheduler()
+
+        class Recorder(Observer):
+            def request_start(self, info):
+                classes.append(scheduler.classify(info))
+        cluster = self.cluster(observers=[Recorder()])
+        with priority(BULK):
+            cluster.containers()
+        self.assertEqual(classes, [BULK, BULK])
+
+
+class placement_tests(ClusterTestCase):
+
+    def test_least_containers(self):
+        cluster = self.cluster(broken=True)
+        self.assertEqual(cluster.placement.select(cluster), 'b')
+        container = cluster.container_create(ContainerConfig('busybox'))
+        self.assertEqual(container.host, 'b')
+        self.assertEqual(container.id, 'new-id')
+        self.assertEqual(self.names['b'], ['baz', 'new'])
+
+    def test_host(self):
+        cluster = self.cluster()
+        container = cluster.container_create('busybox', host='a')
+        self.assertEqual(container.host, 'a')
+        self.assertEqual(self.names['a'], ['foo', 'bar', 'new'])
+
+    def test_least_loaded(self):
+        self.names['b'].extend(['qux', 'quux'])
+        cluster = self.cluster(placement=LeastLoaded('memory_usage'))
+        self.assertEqual(cluster.placement.select(cluster), 'a')
+        self.assertEqual(len(cluster.placement._samplers), 2)
+
+    def test_least_loaded_invalid(self):
+        with self.assertRaises(ValueError):
+            LeastLoaded('foo')
+
+    def test_no_host(self):
+        cluster = DockerCluster(['unix:///nonexistent'], transport='socket',
+                                api_version='1.22')
+        self.addCleanup(cluster.close)
+        with self.assertRaises(ClusterError):
+            cluster.container_create(ContainerConfig('busybox'))
+
+    def test_base(self):
+        with self.assertRaises(NotImplementedError):
+            Placement().select(self.cluster())
@@ -0,0 +1,420 @@
+import unittest
+import io
+import os
+import tempfile
+import http.client
+import struct
+
+import socket_server
+
+from xd.docker.connection import *
+
+
+class is_regular_file_tests(unittest.case.TestCase):
+
+    def test_bytes(self):
+        self.assertFalse(is_regular_file(b'foobar'))
+
+    def test_bytesio(self):
+        self.assertFalse(is_regular_file(io.BytesIO(b'foobar')))
+
+    def test_none(self):
+        self.assertFalse(is_regular_file(None))
+
+    def test_file(self):
+        with tempfile.TemporaryFile() as f:
+            self.assertTrue(is_regular_file(f))
+
+    def test_pipe(self):
+        r, w = os.pipe()
+        with open(r, 'rb') as rf, open(w, 'wb'):
+            self.assertFalse(is_regular_file(rf))
+
+
+class ConnectionTestCase(unittest.case.TestCase):
+
+    def setUp(self):
+        self.server = socket_server.Server()
+        self.conn = Connection('http+unix://' + self.server.path.replace(
+            '/', '%2F'))
+
+    def tearDown(self):
+        self.conn.close()
+        self.server.close()
+
+
+class init_tests(unittest.case.TestCase):
+
+    def test_unix(self):
+        conn = Connection('http+unix://%2Fvar%2Frun%2Fdocker.sock')
+        self.assertEqual(conn.address, '/var/run/docker.sock')
+
+    def test_tcp(self):
+        conn = Connection('http://127.0.0.1:2375')
+        self.assertEqual(conn.address, ('127.0.0.1', 2375))
+        self.assertEqual(conn.host, '127.0.0.1:2375')
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            Connection('https://127.0.0.1:2376')
+
+
+class request_tests(ConnectionTestCase):
+
+    def test_get(self):
+        self.server.responses.append(
+            b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\nfoo')
+        self.conn.request('GET', '/foo', params={'bar': 42})
+        r = self.conn.getresponse()
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.reason, 'OK')
+        self.assertEqual(r.content, b'foo')
+        self.assertEqual(self.server.requests[0].method, 'GET')
+        self.assertEqual(self.server.requests[0].path, '/foo?bar=42')
+
+    def test_post_bytes(self):
+        self.server.responses.append(
+            b'HTTP/1.1 201 Created\r\nContent-Length: 2\r\n\r\n{}')
+        self.conn.request('POST', '/foo', data=b'foobar',
+                          headers={'X-Foo': b'bar'})
+        r = self.conn.getresponse()
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(r.json(), {})
+        self.assertEqual(self.server.requests[0].body, b'foobar')
+        self.assertEqual(self.server.requests[0].headers['X-Foo'], 'bar')
+
+    def test_put_file(self):
+        self.server.responses.append(
+            b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n')
+        data = os.urandom(1024 * 1024)
+        with tempfile.TemporaryFile() as f:
+            f.write(data)
+            f.seek(1000)
+            self.conn.request('PUT', '/foo', data=f)
+            r = self.conn.getresponse('PUT')
+        self.assertEqual(r.content, b'')
+        self.assertEqual(self.server.requests[0].body, data[1000:])
+
+    def test_unsupported_body(self):
+        with self.assertRaises(TypeError):
+            self.conn.request('POST', '/foo', data=42)
+
+    def test_post_str(self):
+        self.server.responses.append(
+            b'HTTP/1.1 201 Created\r\nContent-Length: 2\r\n\r\n{}')
+        self.conn.request('POST', '/foo', data='{"foo": "bar"}')
+        self.conn.getresponse('POST').content
+        self.assertEqual(self.server.requests[0].body, b'{"foo": "bar"}')
+
+    def test_post_iterator(self):
+        self.server.responses.append(
+            b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n')
+        self.conn.request('POST', '/foo',
+                          data=iter([b'foo', b'', memoryview(b'bar')]))
+        self.conn.getresponse('POST').content
+        request = self.server.requests[0]
+        self.assertEqual(request.headers['Transfer-Encoding'], 'chunked')
+        self.assertEqual(request.body, b'foobar')
+
+    def test_post_bytesio(self):
+        self.server.responses.append(
+            b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n')
+        data = os.urandom(200000)
+        self.conn.request('POST', '/foo', data=io.BytesIO(data))
+        self.conn.getresponse('POST').content
+        self.assertEqual(self.server.requests[0].body, data)
+
+    def test_post_large_bytes(self):
+        self.server.responses.append(
+            b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n')
+        data = os.urandom(100000)
+        self.conn.request('POST', '/foo', data=data)
+        self.conn.getresponse('POST').content
+        self.assertEqual(self.server.requests[0].body, data)
+
+    def test_params_none(self):
+        self.server.responses.append(
+            b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n')
+        self.conn.request('GET', '/foo', params={'bar': None, 'baz': 1})
+        self.conn.getresponse().content
+        self.assertEqual(self.server.requests[0].path, '/foo?baz=1')
+
+    def test_head(self):
+        self.server.responses.append(
+            b'HTTP/1.1 200 OK\r\nContent-Length: 42\r\nX-Foo: bar\r\n\r\n')
+        self.conn.request('HEAD', '/foo')
+        r = self.conn.getresponse('HEAD')
+        self.assertEqual(r.headers['x-foo'], 'bar')
+        self.assertEqual(r.content, b'')
+
+
+class response_tests(ConnectionTestCase):
+
+    def response(self, raw):
+        self.server.responses.append(raw)
+        self.conn.request('GET', '/foo')
+        return self.conn.getresponse()
+
+    def test_chunked(self):
+        r = self.response(b'HTTP/1.1 200 OK\r\n'
+                          b'Transfer-Encoding: chunked\r\n\r\n'
+                          b'4\r\nfoo\n\r\n'
+                          b'6;ext=1\r\nbar\nba\r\n'
+                          b'2\r\nz\n\r\n'
+                          b'0\r\n\r\n')
+        self.assertEqual(list(r.iter_lines()), [b'foo', b'bar', b'baz'])
+
+    def test_until_close(self):
+        r = self.response(b'HTTP/1.1 200 OK\r\nConnection: close\r\n\r\n'
+                          b'foobar')
+        self.assertEqual(r.text, 'foobar')
+
+    def test_iter_content(self):
+        r = self.response(b'HTTP/1.1 200 OK\r\nContent-Length: 6\r\n\r\n'
+                          b'foobar')
+        chunks = list(r.iter_content(4))
+        self.assertEqual(b''.join(chunks), b'foobar')
+        self.assertTrue(all(len(chunk) <= 4 for chunk in chunks))
+
+    def test_no_content(self):
+        r = self.response(b'HTTP/1.1 204 No Content\r\n\r\n')
+        self.assertEqual(r.status_code, 204)
+        self.assertEqual(r.content, b'')
+
+    def test_bad_status_line(self):
+        with self.assertRaises(http.client.BadStatusLine):
+            self.response(b'FOO/1.0 200 OK\r\n\r\n')
+
+    def test_readinto_chunked(self):
+        r = self.response(b'HTTP/1.1 200 OK\r\n'
+                          b'Transfer-Encoding: chunked\r\n\r\n'
+                          b'3\r\nfoo\r\n'
+                          b'3\r\nbar\r\n'
+                          b'0\r\n\r\n')
+        buf = bytearray(16)
+        self.assertEqual(r.readinto(buf), 3)
+        self.assertEqual(buf[:3], b'foo')
+        self.assertEqual(r.readinto(buf), 3)
+        self.assertEqual(buf[:3], b'bar')
+        self.assertEqual(r.readinto(buf), 0)
+
+    def test_read1_length(self):
+        r = self.response(b'HTTP/1.1 200 OK\r\nContent-Length: 6\r\n\r\n'
+                          b'foobar')
+        self.assertEqual(r.read1(4), b'foob')
+        self.assertEqual(r.read1(4), b'ar')
+        self.assertEqual(r.read1(4), b'')
+
+    def test_incomplete(self):
+        r = self.response(b'HTTP/1.1 200 OK\r\nContent-Length: 42\r\n'
+                          b'Connection: close\r\n\r\nfoobar')
+        with self.assertRaises(http.client.IncompleteRead):
+            r.content
+
+
+class release_tests(ConnectionTestCase):
+
+    def response(self, raw, method='GET'):
+        self.released = []
+        self.server.responses.append(raw)
+        self.conn.request(method, '/foo')
+        return self.conn.getresponse(method, release=self.released.append)
+
+    def test_length(self):
+        r = self.response(b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\n'
+                          b'foo')
+        self.assertEqual(self.released, [])
+        self.assertEqual(r.content, b'foo')
+        self.assertEqual(self.released, [self.conn])
+        r.close()
+        self.assertIsNotNone(self.conn.sock)
+
+    def test_chunked(self):
+        r = self.response(b'HTTP/1.1 200 OK\r\n'
+                          b'Transfer-Encoding: chunked\r\n\r\n'
+                          b'3\r\nfoo\r\n0\r\n\r\n')
+        self.assertEqual(r.content, b'foo')
+        self.assertEqual(self.released, [self.conn])
+
+    def test_no_content(self):
+        self.response(b'HTTP/1.1 204 No Content\r\n\r\n')
+        self.assertEqual(self.released, [self.conn])
+
+    def test_reuse(self):
+        r = self.response(b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\n'
+                          b'foo')
+        self.assertEqual(r.content, b'foo')
+        self.server.responses.append(
+            b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\nbar')
+        self.conn.request('GET', '/bar')
+        self.assertEqual(self.conn.getresponse().content, b'bar')
+
+    def test_connection_close(self):
+        r = self.response(b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n'
+                          b'Connection: close\r\n\r\nfoo')
+        self.assertEqual(r.content, b'foo')
+        self.assertEqual(self.released, [])
+        self.assertIsNone(self.conn.sock)
+
+    def test_until_close(self):
+        r = self.response(b'HTTP/1.1 200 OK\r\nConnection: close\r\n\r\n'
+                          b'foobar')
+        self.assertEqual(r.content, b'foobar')
+        self.assertEqual(self.released, [])
+
+    def test_http10(self):
+        r = self.response(b'HTTP/1.0 200 OK\r\nContent-Length: 3\r\n\r\n'
+                          b'foo')
+        self.assertEqual(r.content, b'foo')
+        self.assertEqual(self.released, [])
+
+    def test_partial_close(self):
+        r = self.response(b'HTTP/1.1 200 OK\r\nContent-Length: 6\r\n\r\n'
+                          b'foobar')
+        r.read1(3)
+        r.close()
+        self.assertEqual(self.released, [])
+        self.assertIsNone(self.conn.sock)
+
+
+class response_parser_tests(unittest.case.TestCase):
+
+    def parse(self, raw, step=None, method='GET'):
+        parser = ResponseParser(method)
+        body = []
+        step = step or len(raw)
+        for i in range(0, len(raw), step):
+            body.extend(bytes(piece) for piece in parser.feed(raw[i:i + step]))
+        return parser, b''.join(body)
+
+    def test_length(self):
+        parser, body = self.parse(b'HTTP/1.1 200 OK\r\nContent-Length: 6\r\n'
+                                  b'X-Foo: bar\r\n\r\nfoobar')
+        self.assertEqual(parser.status_code, 200)
+        self.assertEqual(parser.headers['X-Foo'], 'bar')
+        self.assertEqual(body, b'foobar')
+        self.assertTrue(parser.done)
+
+    def test_chunked(self):
+        raw = (b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+               b'3\r\nfoo\r\n6;ext=1\r\nbarbaz\r\n0\r\nX-Trailer: 1\r\n\r\n')
+        for step in (1, 2, 7, len(raw)):
+            parser, body = self.parse(raw, step)
+            self.assertEqual(body, b'foobarbaz')
+            self.assertTrue(parser.done)
+
+    def test_chunked_incomplete(self):
+        parser, body = self.parse(b'HTTP/1.1 200 OK\r\n'
+                                  b'Transfer-Encoding: chunked\r\n\r\n'
+                                  b'6\r\nfoo')
+        self.assertEqual(body, b'foo')
+        self.assertFalse(parser.done)
+        with self.assertRaises(http.client.IncompleteRead):
+            parser.eof()
+
+    def test_until_close(self):
+        parser, body = self.parse(b'HTTP/1.0 200 OK\r\n\r\nfoobar', 3)
+        self.assertEqual(body, b'foobar')
+        self.assertFalse(parser.done)
+        parser.eof()
+        self.assertTrue(parser.done)
+
+    def test_head_incomplete(self):
+        parser, body = self.parse(b'HTTP/1.1 200 OK\r\nContent-Len')
+        self.assertIsNone(parser.headers)
+        with self.assertRaises(http.client.IncompleteRead):
+            parser.eof()
+
+    def test_no_content(self):
+        parser, body = self.parse(b'HTTP/1.1 204 No Content\r\n\r\n')
+        self.assertTrue(parser.done)
+
+    def test_bad_status_line(self):
+        with self.assertRaises(http.client.BadStatusLine):
+            self.parse(b'FOO\r\n\r\n')
+
+
+class hijack_tests(ConnectionTestCase):
+
+    UPGRADED = (b'HTTP/1.1 101 UPGRADED\r\n'
+                b'Content-Type: application/vnd.docker.raw-stream\r\n'
+                b'Connection: Upgrade\r\nUpgrade: tcp\r\n\r\n')
+
+    @staticmethod
+    def echo(conn):
+        # Echo data back until end of input
+        while True:
+            data = conn.recv(4096)
+            if not data:
+                break
+            conn.sendall(data)
+
+    def test_upgrade(self):
+        def respond(conn):
+            conn.sendall(self.UPGRADED + b'foo')
+            self.echo(conn)
+        self.server.responses.append(respond)
+        with self.conn.hijack('POST', '/attach',
+                              params={'stream': 1}) as sock:
+            self.assertEqual(sock.status_code, 101)
+            self.assertEqual(sock.headers['Upgrade'], 'tcp')
+            sock.sendall(memoryview(b'barbaz')[:3])
+            self.assertEqual(sock.write(b'baz'), 3)
+            sock.close_write()
+            buf = bytearray(2)
+            data = b''
+            while True:
+                n = sock.readinto(buf)
+                if not n:
+                    break
+                data += buf[:n]
+            self.assertEqual(data, b'foobarbaz')
+        request = self.server.requests[0]
+        self.assertEqual(request.path, '/attach?stream=1')
+        self.assertEqual(request.headers['Connection'], 'Upgrade')
+        self.assertEqual(request.headers['Upgrade'], 'tcp')
+
+    def test_split_head(self):
+        def respond(conn):
+            for i in range(0, len(self.UPGRADED), 5):
+                conn.sendall(self.UPGRADED[i:i + 5])
+            conn.sendall(b'foo')
+        self.server.responses.append(respond)
+        with self.conn.hijack('POST', '/attach') as sock:
+            self.assertEqual(sock.status_code, 101)
+            self.assertEqual(sock.read(2), b'fo')
+            self.assertEqual(sock.read(), b'o')
+            self.assertEqual(sock.read(), b'')
+
+    def test_frames(self):
+        frames = struct.pack('>BxxxL', 1, 3) + b'foo' + \
+            struct.pack('>BxxxL', 2, 3) + b'bar'
+        self.server.responses.append(
+            lambda conn: conn.sendall(self.UPGRADED + frames))
+        with self.conn.hijack('POST', '/attach') as sock:
+            self.assertEqual(list(sock.frames()), [(1, b'foo'), (2, b'bar')])
+
+    def test_send_from(self):
+        self.server.responses.append(
+            lambda conn: (conn.sendall(self.UPGRADED), self.echo(conn)))
+        data = os.urandom(100000)
+        with tempfile.TemporaryFile() as f:
+            f.write(data)
+            f.seek(10)
+            with self.conn.hijack('POST', '/attach') as sock:
+                self.assertEqual(sock.send_from(f), len(data) - 10)
+                self.assertEqual(sock.send_from(io.BytesIO(b'foo'), 2), 3)
+                sock.close_write()
+                received = b''.join(iter(sock.read, b''))
+        self.assertEqual(received, data[10:] + b'foo')
+
+    def test_not_found(self):
+        self.server.responses.append(
+            b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n')
+        with self.conn.hijack('POST', '/attach') as sock:
+            self.assertEqual(sock.status_code, 404)
+
+    def test_disconnected(self):
+        self.server.responses.append(lambda conn: None)
+        with self.assertRaises(http.client.RemoteDisconnected):
+            self.conn.hijack('POST', '/attach')
@@ -240,3 +240,36 @@ class tests(unittest.case.TestCase):
                 ]
             })
         self.assertIsNotNone(container, Container)
+
+
+class path_stat_tests(unittest.case.TestCase):
+
+    def test_file(self):
+        stat = PathStat({'name': 'hosts', 'size': 174, 'mode': 0o644,
+                         'mtime': '2016-08-30T11:02:04.5+02:00',
+                         'linkTarget': ''})
+        self.assertEqual(stat.name, 'hosts')
+        self.assertEqual(stat.size, 174)
+        self.assertEqual(stat.mode, 0o644)
+        self.assertEqual(stat.link_target, '')
+        self.assertFalse(stat.is_dir)
+        self.assertFalse(stat.is_symlink)
+
+    def test_dir(self):
+        stat = PathStat({'name': 'etc', 'size': 4096,
+                         'mode': (1 << 31) | 0o755})
+        self.assertTrue(stat.is_dir)
+        self.assertFalse(stat.is_symlink)
+
+    def test_symlink(self):
+        stat = PathStat({'name': 'sh', 'size': 4, 'mode': (1 << 27) | 0o777,
+                         'linkTarget': '/bin/busybox'})
+        self.assertFalse(stat.is_dir)
+        self.assertTrue(stat.is_symlink)
+        self.assertEqual(stat.link_target, '/bin/busybox')
+
+    def test_no_mode(self):
+        stat = PathStat({'name': 'foo'})
+        self.assertIsNone(stat.mode)
+        self.assertFalse(stat.is_dir)
+        self.assertFalse(stat.is_symlink)
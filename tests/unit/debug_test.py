@@ -0,0 +1,181 @@
+import unittest
+import os
+import tempfile
+import pstats
+import tracemalloc
+
+from xd.docker.debug import *
+from xd.docker.observer import OperationInfo, PhaseInfo, RequestInfo
+
+
+def work():
+    return [bytearray(1000) for i in range(100)]
+
+
+class redact_headers_tests(unittest.case.TestCase):
+
+    def test_redact(self):
+        self.assertEqual(redact_headers({
+            'content-type': 'application/json',
+            'X-Registry-Auth': b'c2VjcmV0',
+            'x-registry-config': b'c2VjcmV0'}), {
+                'content-type': 'application/json',
+                'X-Registry-Auth': '<redacted>',
+                'x-registry-config': '<redacted>'})
+
+    def test_none(self):
+        self.assertIsNone(redact_headers(None))
+
+
+class slow_call_detector_tests(unittest.case.TestCase):
+
+    def setUp(self):
+        self.detector = SlowCallDetector(threshold=0.1, log_level=None)
+
+    def operation(self, name, duration, parent=None):
+        info = OperationInfo(name, parent)
+        self.detector.operation_start(info)
+        return info
+
+    def end_operation(self, info, duration):
+        info.duration = duration
+        self.detector.operation_end(info)
+
+    def request(self, operation, total_time, stream=False, headers=None):
+        info = RequestInfo('POST', '/images/create', '/images/create',
+                           params={'fromImage': 'busybox'}, stream=stream,
+                           headers=headers)
+        info.operation = operation
+        info.status_code = 200
+        info.first_byte_time = 0.01
+        info.total_time = total_time
+        self.detector.request_end(info)
+
+    def test_fast(self):
+        info = self.operation('ping', 0.01)
+        self.request(info, 0.01)
+        self.end_operation(info, 0.01)
+        self.assertEqual(self.detector.records, [])
+
+    def test_slow_operation(self):
+        parent = self.operation('container_create', 0.5)
+        info = self.operation('image_pull', 0.5, parent)
+        self.request(info, 0.5)
+        phase = PhaseInfo('decode', info)
+        phase.duration = phase.busy_time = 0.4
+        self.detector.phase_end(phase)
+        self.end_operation(info, 0.5)
+        self.end_operation(parent, 0.6)
+        pull, create = self.detector.records
+        self.assertEqual(pull.name, 'image_pull')
+        self.assertEqual(pull.kind, 'operation')
+        self.assertEqual(create.duration, 0.6)
+        self.assertEqual([t.get('url') for t in create.timings],
+                         ['/images/create', None])
+        self.assertEqual(create.timings[1]['phase'], 'decode')
+        self.assertIn('test_slow_operation', ''.join(create.stack))
+        text = create.format()
+        self.assertIn('operation container_create took 0.600s', text)
+        self.assertIn('url=/images/create', text)
+        self.assertIn('phase=decode', text)
+
+    def test_slow_request(self):
+        headers = {'X-Registry-Auth': b'c2VjcmV0'}
+        self.request(None, 0.5, headers=headers)
+        call, = self.detector.records
+        self.assertEqual(call.kind, 'request')
+        self.assertEqual(call.name, 'POST /images/create')
+        self.assertEqual(call.params, {'fromImage': 'busybox'})
+        self.assertEqual(call.headers, {'X-Registry-Auth': '<redacted>'})
+        self.assertNotIn('c2VjcmV0', self.detector.report())
+
+    def test_stream(self):
+        self.request(None, 10.0, stream=True)
+        self.assertEqual(self.detector.records, [])
+
+    def test_max_records(self):
+        detector = SlowCallDetector(threshold=0.0, max_records=2,
+                                    log_level=None)
+        for i in range(3):
+            info = OperationInfo('ping')
+            detector.operation_start(info)
+            info.duration = 0.1
+            detector.operation_end(info)
+        self.assertEqual(len(detector.records), 2)
+        detector.clear()
+        self.assertEqual(detector.records, [])
+
+    def test_log(self):
+        detector = SlowCallDetector(threshold=0.0)
+        info = OperationInfo('ping')
+        detector.operation_start(info)
+        info.duration = 0.1
+        with self.assertLogs('xd.docker.debug', 'WARNING'):
+            detector.operation_end(info)
+
+
+class profiler_tests(unittest.case.TestCase):
+
+    def run_operation(self, profiler, name='image_build', parent=None):
+        info = OperationInfo(name, parent)
+        profiler.operation_start(info)
+        self.data = work()
+        info.duration = info.elapsed()
+        profiler.operation_end(info)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            Profiler('perf')
+        with self.assertRaises(ValueError):
+            Profiler(sample_rate=2.0)
+
+    def test_cprofile(self):
+        profiler = Profiler('cprofile', sample_rate=1.0)
+        self.run_operation(profiler)
+        self.run_operation(profiler)
+        self.assertEqual(profiler.samples, 2)
+        self.assertIsInstance(profiler.stats, pstats.Stats)
+        report = profiler.report()
+        self.assertIn('2 samples (cprofile)', report)
+        self.assertIn('work', report)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'profile')
+            profiler.dump(path)
+            self.assertIn('work', str(pstats.Stats(path).stats))
+        profiler.reset()
+        self.assertIsNone(profiler.stats)
+        self.assertEqual(profiler.samples, 0)
+
+    def test_not_sampled(self):
+        profiler = Profiler('cprofile', sample_rate=0.0)
+        self.run_operation(profiler)
+        self.assertEqual(profiler.samples, 0)
+        self.assertEqual(profiler.report(), '0 samples (cprofile)\n')
+
+    def test_filter(self):
+        profiler = Profiler('cprofile', sample_rate=1.0,
+                            operations=['image_pull'])
+        self.run_operation(profiler)
+        self.run_operation(profiler, 'image_pull',
+                           parent=OperationInfo('container_create'))
+        self.assertEqual(profiler.samples, 0)
+        self.run_operation(profiler, 'image_pull')
+        self.assertEqual(profiler.samples, 1)
+
+    @unittest.skipIf(tracemalloc.is_tracing(), 'tracemalloc already active')
+    def test_tracemalloc(self):
+        profiler = Profiler('tracemalloc', sample_rate=1.0)
+        try:
+            self.run_operation(profiler)
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            profiler.close()
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual(profiler.samples, 1)
+        report = profiler.report()
+        self.assertIn('debug_test.py', report)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'profile.txt')
+            profiler.dump(path)
+            with open(path) as f:
+                self.assertEqual(f.read(), report)
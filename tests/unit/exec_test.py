@@ -0,0 +1,65 @@
+import unittest
+
+from xd.docker.exec import *
+from xd.docker.exec import _Tail
+
+
+class exec_tests(unittest.case.TestCase):
+
+    def test_init(self):
+        exec_instance = Exec(None, 'e1', container='foo')
+        self.assertEqual(exec_instance.id, 'e1')
+        self.assertEqual(exec_instance.container, 'foo')
+        self.assertIsNone(exec_instance.exit_code)
+        self.assertIn('e1', repr(exec_instance))
+
+    def test_inspect_response(self):
+        exec_instance = Exec(None, 'e1', inspect_response={
+            'ID': 'e1', 'Running': True, 'ExitCode': None, 'Pid': 42,
+            'ContainerID': 'c1', 'ProcessConfig': {'tty': False}})
+        self.assertTrue(exec_instance.running)
+        self.assertEqual(exec_instance.pid, 42)
+        self.assertEqual(exec_instance.container, 'c1')
+        self.assertEqual(exec_instance.process_config, {'tty': False})
+
+    def test_inspect_response_api_1_15(self):
+        exec_instance = Exec(None, 'e1', inspect_response={
+            'ID': 'e1', 'Running': False, 'ExitCode': 0,
+            'Container': {'ID': 'c1'}})
+        self.assertEqual(exec_instance.container, 'c1')
+        self.assertEqual(exec_instance.exit_code, 0)
+
+
+class exec_result_tests(unittest.case.TestCase):
+
+    def test_ok(self):
+        self.assertTrue(ExecResult('foo', 0).ok)
+        self.assertFalse(ExecResult('foo', 1).ok)
+        self.assertFalse(ExecResult('foo', error=KeyError()).ok)
+
+    def test_repr(self):
+        self.assertIn('exit_code=1', repr(ExecResult('foo', 1)))
+
+
+class tail_tests(unittest.case.TestCase):
+
+    def test_short(self):
+        tail = _Tail(8)
+        tail.write(b'foo')
+        tail.write(memoryview(b'bar'))
+        self.assertEqual(tail.getvalue(), b'foobar')
+        self.assertFalse(tail.truncated)
+
+    def test_truncated(self):
+        tail = _Tail(4)
+        for i in range(10):
+            tail.write(b'%d' % i)
+            self.assertLessEqual(len(tail.buf), 8)
+        self.assertEqual(tail.getvalue(), b'6789')
+        self.assertTrue(tail.truncated)
+
+    def test_just_over(self):
+        tail = _Tail(4)
+        tail.write(b'12345')
+        self.assertEqual(tail.getvalue(), b'2345')
+        self.assertTrue(tail.truncated)
@@ -0,0 +1,206 @@
+import unittest
+import re
+import time
+
+import socket_server
+
+from xd.docker.health import *
+from xd.docker.client import DockerClient, ServerError, ClientError
+from xd.docker.cluster import DockerCluster
+from xd.docker.exceptions import *
+
+
+class Host(object):
+    # Docker host responding with 503 while down
+
+    def __init__(self):
+        self.down = False
+        self.server = socket_server.Server(respond=self.respond)
+
+    def respond(self, request):
+        path = re.sub(r'^/v[0-9.]+/', '/', request.path)
+        if self.down:
+            return (b'HTTP/1.1 503 Service Unavailable\r\n'
+                    b'Content-Length: 0\r\n\r\n')
+        if path == '/_ping':
+            return b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nOK'
+        return b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}'
+
+
+def wait_for(func, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not func():
+        if time.monotonic() > deadline:
+            raise AssertionError('timeout')
+        time.sleep(0.01)
+
+
+class circuit_breaker_tests(unittest.case.TestCase):
+
+    def test_init(self):
+        breaker = CircuitBreaker()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.healthy)
+        self.assertEqual(breaker.events, [])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            CircuitBreaker(failure_rate=0.0)
+        with self.assertRaises(ValueError):
+            CircuitBreaker(window=4, min_requests=5)
+        with self.assertRaises(ValueError):
+            CircuitBreaker(trial_requests=0)
+
+    def test_failed(self):
+        self.assertFalse(CircuitBreaker.failed(None))
+        self.assertTrue(CircuitBreaker.failed(ConnectionRefusedError()))
+        self.assertTrue(CircuitBreaker.failed(ServerError('/foo', 503)))
+        self.assertFalse(CircuitBreaker.failed(ClientError('/foo', 404)))
+        self.assertFalse(CircuitBreaker.failed(ValueError()))
+
+    def test_failure_rate(self):
+        breaker = CircuitBreaker(window=4, min_requests=4,
+                                 failure_rate=0.5)
+        events = []
+        breaker.add_listener(events.append)
+        for failed in (False, True, False):
+            breaker.record(failed)
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.admit()
+        breaker.record(True)
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.healthy)
+        self.assertEqual(len(events), 1)
+        self.assertEqual((events[0].old, events[0].new), (CLOSED, OPEN))
+        self.assertEqual(breaker.events, events)
+        with self.assertRaises(CircuitOpenError):
+            breaker.admit()
+
+    def test_listener_error(self):
+        breaker = CircuitBreaker(window=1, min_requests=1)
+
+        def listener(event):
+            raise ValueError()
+        breaker.add_listener(listener)
+        breaker.record(True)
+        self.assertEqual(breaker.state, OPEN)
+
+
+class client_breaker_tests(unittest.case.TestCase):
+
+    def setUp(self):
+        self.host = Host()
+        self.addCleanup(self.host.server.close)
+        self.breaker = CircuitBreaker(window=4, min_requests=2,
+                                      probe_interval=0.02, trial_requests=2)
+        self.client = DockerClient(self.host.server.url, transport='socket',
+                                   api_version='1.22', metrics=True,
+                                   breaker=self.breaker)
+        self.addCleanup(self.client.close)
+
+    def metric(self, name, labels):
+        return self.client.metrics.get(name).value(labels)
+
+    def test_breaker(self):
+        self.assertIs(self.client.breaker, self.breaker)
+        self.assertIs(self.breaker.client, self.client)
+        self.assertIn(self.breaker, self.client._observers)
+        self.assertEqual(self.breaker.name, self.client.base_url)
+        self.assertIsNone(DockerClient().breaker)
+        client = DockerClient(breaker=True)
+        self.assertIsInstance(client.breaker, CircuitBreaker)
+        self.assertIsNotNone(client.breaker.metrics)
+
+    def test_open(self):
+        self.host.down = True
+        for _ in range(2):
+            with self.assertRaises(ServerError):
+                self.client._get('/info')
+        self.assertEqual(self.breaker.state, OPEN)
+        requests = len(self.host.server.requests)
+        with self.assertRaises(CircuitOpenError):
+            self.client._get('/info')
+        name = self.breaker.name
+        self.assertEqual(self.metric('xd_docker_host_rejected_total',
+                                     (name,)), 1)
+        self.assertEqual(self.metric('xd_docker_host_state', (name, OPEN)),
+                         1)
+        self.assertEqual(self.metric('xd_docker_host_state',
+                                     (name, CLOSED)), 0)
+        # Only probes are sent while open
+        time.sleep(0.1)
+        for request in self.host.server.requests[requests:]:
+            self.assertTrue(request.path.endswith('/_ping'))
+
+    def test_recover(self):
+        self.host.down = True
+        for _ in range(2):
+            with self.assertRaises(ServerError):
+                self.client._get('/info')
+        self.host.down = False
+        wait_for(lambda: self.breaker.state == HALF_OPEN)
+        self.client._get('/info')
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.client._get('/info')
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual([(e.old, e.new) for e in self.breaker.events],
+                         [(CLOSED, OPEN), (OPEN, HALF_OPEN),
+                          (HALF_OPEN, CLOSED)])
+        self.assertEqual(self.metric('xd_docker_host_transitions_total',
+                                     (self.breaker.name, CLOSED)), 1)
+
+    def test_trial_failure(self):
+        self.host.down = True
+        self.assertFalse(self.breaker.check())
+        self.assertEqual(self.breaker.state, OPEN)
+        self.host.down = False
+        wait_for(lambda: self.breaker.state == HALF_OPEN)
+        self.host.down = True
+        with self.assertRaises(ServerError):
+            self.client._get('/info')
+        self.assertEqual(self.breaker.state, OPEN)
+        self.host.down = False
+        wait_for(lambda: self.breaker.state == HALF_OPEN)
+
+    def test_check(self):
+        self.assertTrue(self.breaker.check())
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.events, [])
+
+    def test_connection_error(self):
+        client = DockerClient('unix:///nonexistent', transport='socket',
+                              api_version='1.22',
+                              breaker=CircuitBreaker(min_requests=1,
+                                                     probe_interval=60))
+        self.addCleanup(client.close)
+        with self.assertRaises(OSError):
+            client.containers()
+        start = time.monotonic()
+        with self.assertRaises(CircuitOpenError):
+            client.containers()
+        self.assertLess(time.monotonic() - start, 1.0)
+
+
+class cluster_health_tests(unittest.case.TestCase):
+
+    def test_health(self):
+        host = Host()
+        self.addCleanup(host.server.close)
+        cluster = DockerCluster({'a': host.server.url,
+                                 'b': 'unix:///nonexistent'},
+                                transport='socket', api_version='1.22',
+                                breaker=True)
+        self.addCleanup(cluster.close)
+        self.assertEqual(cluster['a'].breaker.name, 'a')
+        self.assertIsNot(cluster['a'].breaker, cluster['b'].breaker)
+        for _ in range(5):
+            containers = cluster.containers()
+        self.assertEqual(cluster.health(), {'a': CLOSED, 'b': OPEN})
+        containers = cluster.containers()
+        self.assertIsInstance(containers.errors['b'], CircuitOpenError)
+        self.assertEqual(cluster.placement.select(cluster), 'a')
+
+    def test_no_breaker(self):
+        cluster = DockerCluster(['unix:///nonexistent'])
+        self.addCleanup(cluster.close)
+        self.assertEqual(list(cluster.health().values()), [None])
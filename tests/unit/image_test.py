@@ -13,7 +13,7 @@ from xd.docker.client import *
 class tests(unittest.case.TestCase):
 
     def setUp(self):
-        self.client = DockerClient()
+        self.client = DockerClient(api_version='1.22')
 
     def test_init_noargs(self):
         image = Image(self.client)
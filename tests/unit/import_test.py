@@ -0,0 +1,72 @@
+import unittest
+import os
+import sys
+import subprocess
+
+
+# Budget for cumulative import time of xd.docker.client, in microseconds
+# (as reported by python -X importtime).  Measured at about 75 ms, with a
+# margin for noise, but below the 90-120 ms of importing requests alone
+# (which xd.docker.client used to do).  Can be overridden with the
+# XD_DOCKER_IMPORT_BUDGET environment variable, for slow machines.
+IMPORT_TIME_BUDGET = int(os.environ.get('XD_DOCKER_IMPORT_BUDGET', 110000))
+
+# Modules that should not be imported by importing xd.docker.client
+LAZY_MODULES = ('requests', 'requests_unixsocket', 'tarfile', 'cProfile',
+                'pstats', 'tracemalloc', 'concurrent.futures', 'numpy',
+                'http.client', 'ssl', 'xd.docker.stats',
+                'xd.docker.metrics', 'xd.docker.tracing', 'xd.docker.debug',
+                'xd.docker.scheduler', 'xd.docker.health')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+
+def run_python(*args):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [p for p in env.get('PYTHONPATH', '').split(os.pathsep)
+                  if p])
+    return subprocess.run([sys.executable] + list(args), env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True)
+
+
+class import_tests(unittest.case.TestCase):
+
+    def test_lazy_modules(self):
+        result = run_python('-c', 'import sys, xd.docker.client; '
+                            'print(" ".join(sys.modules))')
+        modules = result.stdout.split()
+        for name in LAZY_MODULES:
+            self.assertNotIn(name, modules)
+
+    def test_lazy_patterns(self):
+        result = run_python('-c', 'import xd.docker.parameters as p; '
+                            'print(p.Repository.NAME_RE._regex)')
+        self.assertEqual(result.stdout.strip(), 'None')
+
+    @staticmethod
+    def import_time(statement, module, runs=5):
+        # Cumulative import time of module in microseconds, best of a few
+        # runs to reduce noise
+        times = []
+        for _ in range(runs):
+            result = run_python('-X', 'importtime', '-c', statement)
+            for line in result.stderr.splitlines():
+                fields = line.split('|')
+                if len(fields) == 3 and fields[2].strip() == module:
+                    times.append(int(fields[1]))
+        assert len(times) == runs
+        return min(times)
+
+    def test_import_time(self):
+        self.assertLess(self.import_time('import xd.docker.client',
+                                         'xd.docker.client'),
+                        IMPORT_TIME_BUDGET)
+
+    def test_requests_transport(self):
+        # requests is imported (and monkeypatched) on first use
+        from xd.docker.transport import _import_requests
+        requests = _import_requests()
+        self.assertIs(_import_requests(), requests)
@@ -0,0 +1,244 @@
+import unittest
+import threading
+import time
+
+from xd.docker.limiter import *
+from xd.docker.observer import RequestInfo
+
+
+class init_tests(unittest.case.TestCase):
+
+    def test_defaults(self):
+        limiter = AdaptiveLimiter()
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.in_flight, 0)
+        self.assertEqual(limiter.waiting, 0)
+
+    def test_invalid_limits(self):
+        with self.assertRaises(ValueError):
+            AdaptiveLimiter(initial=8, maximum=4)
+        with self.assertRaises(ValueError):
+            AdaptiveLimiter(minimum=0)
+
+    def test_invalid_backoff(self):
+        with self.assertRaises(ValueError):
+            AdaptiveLimiter(backoff=1.0)
+
+
+class acquire_tests(unittest.case.TestCase):
+
+    def test_limit(self):
+        limiter = AdaptiveLimiter(initial=2)
+        self.assertTrue(limiter.acquire())
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire(timeout=0.01))
+        self.assertEqual(limiter.in_flight, 2)
+        self.assertEqual(limiter.waiting, 0)
+        limiter.release()
+        self.assertTrue(limiter.acquire(timeout=0.01))
+
+    def test_fifo(self):
+        limiter = AdaptiveLimiter(initial=1)
+        limiter.acquire()
+        order = []
+
+        def worker(i):
+            limiter.acquire()
+            order.append(i)
+            limiter.release()
+
+        threads = []
+        for i in range(5):
+            thread = threading.Thread(target=worker, args=(i,))
+            thread.start()
+            threads.append(thread)
+            while limiter.waiting < i + 1:
+                time.sleep(0.001)
+        limiter.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, [0, 1, 2, 3, 4])
+
+
+class adapt_tests(unittest.case.TestCase):
+
+    def saturate(self, limiter, latency):
+        # Complete a call with all slots in use
+        for _ in range(limiter.limit):
+            limiter.acquire()
+        limiter.release(latency)
+        for _ in range(limiter.in_flight):
+            limiter.release()
+
+    def test_increase(self):
+        limiter = AdaptiveLimiter(initial=2, maximum=4, target_latency=0.1)
+        for _ in range(20):
+            self.saturate(limiter, 0.05)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_no_increase_when_idle(self):
+        limiter = AdaptiveLimiter(initial=2, target_latency=0.1)
+        for _ in range(20):
+            limiter.acquire()
+            limiter.release(0.05)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_decrease(self):
+        limiter = AdaptiveLimiter(initial=8, target_latency=0.1)
+        limiter.acquire()
+        limiter.release(0.5)
+        self.assertEqual(limiter.limit, 6)
+
+    def test_decrease_once_per_window(self):
+        limiter = AdaptiveLimiter(initial=8, tolerance=2.0)
+        limiter.acquire()
+        limiter.release(0.1)
+        for _ in range(3):
+            limiter.acquire()
+            limiter.release(0.5)
+        self.assertEqual(limiter.limit, 6)
+
+    def test_minimum(self):
+        limiter = AdaptiveLimiter(initial=2, minimum=2, target_latency=0.1)
+        limiter.acquire()
+        limiter.release(failed=True)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_observed_target(self):
+        limiter = AdaptiveLimiter(initial=8)
+        limiter.acquire()
+        limiter.release(0.01)
+        self.assertEqual(limiter.min_latency, 0.01)
+        limiter.acquire()
+        limiter.release(0.015)
+        self.assertEqual(limiter.limit, 8)
+        limiter.acquire()
+        limiter.release(0.03)
+        self.assertEqual(limiter.limit, 6)
+
+
+class slot_tests(unittest.case.TestCase):
+
+    def test_ok(self):
+        limiter = AdaptiveLimiter(initial=2)
+        with limiter.slot():
+            self.assertEqual(limiter.in_flight, 1)
+        self.assertEqual(limiter.in_flight, 0)
+        self.assertIsNotNone(limiter.min_latency)
+
+    def test_timeout(self):
+        limiter = AdaptiveLimiter(initial=4)
+        with self.assertRaises(TimeoutError):
+            with limiter.slot():
+                raise TimeoutError()
+        self.assertEqual(limiter.in_flight, 0)
+        self.assertEqual(limiter.limit, 3)
+
+    def test_other_error(self):
+        limiter = AdaptiveLimiter(initial=4)
+        with self.assertRaises(KeyError):
+            with limiter.slot():
+                raise KeyError()
+        self.assertEqual(limiter.in_flight, 0)
+        self.assertEqual(limiter.limit, 4)
+        self.assertIsNone(limiter.min_latency)
+
+
+def request(method, endpoint):
+    return RequestInfo(method, endpoint, endpoint)
+
+
+class concurrency_limiter_tests(unittest.case.TestCase):
+
+    def test_defaults(self):
+        limiter = ConcurrencyLimiter()
+        self.assertEqual(limiter.heavy.limit, 2)
+        self.assertEqual(limiter.light.limit, 8)
+
+    def test_classify(self):
+        limiter = ConcurrencyLimiter()
+        self.assertEqual(limiter.classify(request('POST', '/build')), HEAVY)
+        self.assertEqual(limiter.classify(
+            request('POST', '/containers/create')), HEAVY)
+        self.assertEqual(limiter.classify(
+            request('GET', '/containers/{id}/json')), LIGHT)
+        self.assertEqual(limiter.classify(
+            request('HEAD', '/containers/{id}/archive')), LIGHT)
+        self.assertIsNone(limiter.classify(
+            request('POST', '/containers/{id}/wait')))
+
+    def test_separate_limits(self):
+        limiter = ConcurrencyLimiter(heavy=AdaptiveLimiter(initial=1),
+                                     light=AdaptiveLimiter(initial=1))
+        limiter.request_start(request('POST', '/build'))
+        limiter.request_start(request('GET', '/_ping'))
+        self.assertEqual(limiter.heavy.in_flight, 1)
+        self.assertEqual(limiter.light.in_flight, 1)
+
+    def test_wait(self):
+        limiter = ConcurrencyLimiter(heavy=AdaptiveLimiter(initial=1))
+        first = request('POST', '/images/create')
+        limiter.request_start(first)
+        started = []
+
+        def second():
+            limiter.request_start(request('POST', '/images/create'))
+            started.append(True)
+        thread = threading.Thread(target=second)
+        thread.start()
+        time.sleep(0.02)
+        self.assertEqual(started, [])
+        self.assertEqual(limiter.heavy.waiting, 1)
+        first.first_byte_time = first.total_time = 0.01
+        limiter.request_end(first)
+        thread.join()
+        self.assertEqual(started, [True])
+
+    def test_unlimited(self):
+        limiter = ConcurrencyLimiter(light=AdaptiveLimiter(initial=1))
+        for _ in range(3):
+            info = request('GET', '/containers/{id}/logs')
+            limiter.request_start(info)
+        limiter.request_end(info)
+        self.assertEqual(limiter.light.in_flight, 0)
+
+    def test_latency(self):
+        limiter = ConcurrencyLimiter()
+        info = request('GET', '/_ping')
+        limiter.request_start(info)
+        info.first_byte_time = 0.01
+        info.total_time = 5.0
+        limiter.request_end(info)
+        self.assertEqual(limiter.light.in_flight, 0)
+        self.assertAlmostEqual(limiter.light.min_latency, 0.01, delta=0.005)
+
+    def test_wait_not_latency(self):
+        limiter = ConcurrencyLimiter(light=AdaptiveLimiter(initial=1))
+        first = request('GET', '/_ping')
+        limiter.request_start(first)
+        second = request('GET', '/_ping')
+        thread = threading.Thread(target=limiter.request_start,
+                                  args=(second,))
+        thread.start()
+        time.sleep(0.05)
+        first.first_byte_time = first.elapsed()
+        limiter.request_end(first)
+        thread.join()
+        second.first_byte_time = second.elapsed()
+        limiter.request_end(second)
+        self.assertLess(limiter.light.min_latency, 0.04)
+
+    def test_failed(self):
+        limiter = ConcurrencyLimiter()
+        info = request('GET', '/_ping')
+        limiter.request_start(info)
+        info.exception = ConnectionRefusedError()
+        info.total_time = 0.01
+        limiter.request_end(info)
+        self.assertEqual(limiter.light.in_flight, 0)
+        self.assertEqual(limiter.light.limit, 6)
+
+    def test_end_without_start(self):
+        limiter = ConcurrencyLimiter()
+        limiter.request_end(request('GET', '/_ping'))
+        self.assertEqual(limiter.light.in_flight, 0)
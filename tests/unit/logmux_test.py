@@ -0,0 +1,263 @@
+import unittest
+import struct
+import json
+import time
+import threading
+import re
+
+import socket_server
+
+from xd.docker.client import *
+from xd.docker.logmux import *
+from xd.docker.logmux import _TokenBucket
+from xd.docker.container import *
+from xd.docker.parameters import ContainerName
+from xd.docker.stream import STDOUT, STDERR
+from xd.docker.observer import Observer
+from xd.docker.scheduler import PriorityScheduler
+
+
+def frame(stream, data):
+    return struct.pack('>BxxxL', stream, len(data)) + data
+
+
+def chunk(data):
+    return b'%x\r\n' % len(data) + data + b'\r\n'
+
+
+def log_response(*chunks, content_type=b'application/vnd.docker.raw-stream',
+                 delay=0.0):
+    def respond(conn):
+        conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Type: ' + content_type +
+                     b'\r\nTransfer-Encoding: chunked\r\n\r\n')
+        for data in chunks:
+            if delay:
+                time.sleep(delay)
+            conn.sendall(chunk(data))
+        conn.sendall(b'0\r\n\r\n')
+    return respond
+
+
+class LogMuxTestCase(unittest.case.TestCase):
+
+    def setUp(self):
+        self.logs = {}
+        self.server = socket_server.Server(respond=self.respond)
+        self.client = DockerClient(self.server.url, api_version='1.22')
+
+    def tearDown(self):
+        self.server.close()
+
+    @staticmethod
+    def path(request):
+        # Request path without API version prefix
+        return re.sub(r'^/v[0-9.]+/', '/', request.path)
+
+    def respond(self, request):
+        name = self.path(request).split('/')[2].split('?')[0]
+        return self.logs.get(name, b'HTTP/1.1 404 Not Found\r\n'
+                             b'Content-Length: 0\r\n\r\n')
+
+
+class logmux_tests(LogMuxTestCase):
+
+    def test_multiplexed(self):
+        self.logs['foo'] = log_response(
+            frame(STDOUT, b'foo 1\n') + frame(STDERR, b'foo 2\n'),
+            frame(STDOUT, b'foo 3\nfoo'), frame(STDOUT, b' 4\n'))
+        self.logs['bar'] = log_response(frame(STDOUT, b'bar 1\nbar 2\n'))
+        with LogMux(self.client, ['foo', ContainerName('bar')]) as mux:
+            lines = list(mux)
+        self.assertEqual(
+            [(l.stream, l.data) for l in lines if l.container == 'foo'],
+            [(STDOUT, b'foo 1'), (STDERR, b'foo 2'), (STDOUT, b'foo 3'),
+             (STDOUT, b'foo 4')])
+        self.assertEqual(
+            [l.text for l in lines if l.container == 'bar'],
+            ['bar 1', 'bar 2'])
+        request = self.server.requests[0]
+        self.assertIn('follow=True', request.path)
+        self.assertIn('tail=all', request.path)
+
+    def test_multiplexed_content_type(self):
+        self.logs['foo'] = log_response(
+            frame(STDERR, b'x'), frame(STDERR, b'y\n'),
+            content_type=b'application/vnd.docker.multiplexed-stream')
+        with LogMux(self.client, ['foo']) as mux:
+            lines = list(mux)
+        self.assertEqual([(l.stream, l.data) for l in lines],
+                         [(STDERR, b'xy')])
+
+    def test_tty(self):
+        self.logs['foo'] = log_response(b'foo 1\r\nfo', b'o 2\n', b'foo 3')
+        with LogMux(self.client, [Container(self.client, id='foo')]) as mux:
+            lines = list(mux)
+        self.assertEqual([(l.stream, l.data) for l in lines],
+                         [(STDOUT, b'foo 1\r'), (STDOUT, b'foo 2'),
+                          (STDOUT, b'foo 3')])
+
+    def test_tty_short(self):
+        self.logs['foo'] = log_response(b'x\n')
+        with LogMux(self.client, ['foo']) as mux:
+            lines = list(mux)
+        self.assertEqual([l.data for l in lines], [b'x'])
+
+    def test_not_found(self):
+        with LogMux(self.client, ['foo']) as mux:
+            self.assertEqual(list(mux), [])
+            self.assertEqual(mux.containers, [])
+
+    def test_versioned(self):
+        self.logs['foo'] = log_response(frame(STDOUT, b'foo\n'))
+        with LogMux(self.client, ['foo']) as mux:
+            self.assertEqual([l.data for l in mux], [b'foo'])
+        self.assertTrue(self.server.requests[0].path.startswith(
+            '/v1.22/containers/foo/logs?'))
+
+    def test_observers(self):
+        class Recorder(Observer):
+            def __init__(self):
+                self.events = []
+
+            def request_start(self, info):
+                self.events.append(('start', info.endpoint, info.url))
+
+            def request_end(self, info):
+                self.events.append(('end', info.status_code,
+                                    type(info.exception).__name__))
+        recorder = Recorder()
+        self.client.add_observer(recorder)
+        self.logs['foo'] = log_response(frame(STDOUT, b'foo\n'))
+        with LogMux(self.client, ['foo', 'bar']) as mux:
+            self.assertEqual([l.data for l in mux], [b'foo'])
+        self.assertEqual(sorted(recorder.events), [
+            ('end', 200, 'NoneType'), ('end', 404, 'ClientError'),
+            ('start', '/containers/{id}/logs', '/v1.22/containers/bar/logs'),
+            ('start', '/containers/{id}/logs', '/v1.22/containers/foo/logs')])
+
+    def test_add_remove(self):
+        self.logs['foo'] = log_response(b'foo\n', delay=0.5)
+        self.logs['bar'] = log_response(b'bar\n')
+        with LogMux(self.client) as mux:
+            self.assertEqual(list(mux), [])
+            mux.add('foo')
+            mux.add('foo')
+            mux.add('bar')
+            self.assertEqual(sorted(mux.containers), ['bar', 'foo'])
+            mux.remove('foo')
+            mux.remove('foo')
+            self.assertEqual([l.data for l in mux], [b'bar'])
+
+    def test_timeout(self):
+        self.logs['foo'] = log_response(b'foo\n', delay=5)
+        with LogMux(self.client, ['foo']) as mux:
+            start = time.monotonic()
+            self.assertEqual(list(mux.lines(timeout=0.1)), [])
+            self.assertLess(time.monotonic() - start, 2)
+
+    def test_timestamps(self):
+        self.logs['foo'] = log_response(
+            b'2016-08-30T11:02:04.5Z foo\n'
+            b'2016-08-30T11:02:05.000000001Z bar\n'
+            b'2016-08-30T11:02:05Z baz\n')
+        with LogMux(self.client, ['foo'], timestamps=True) as mux:
+            lines = list(mux)
+        self.assertEqual([l.data for l in lines], [b'foo', b'bar', b'baz'])
+        self.assertEqual(lines[0].timestamp, 1472554924.5)
+        self.assertAlmostEqual(lines[1].timestamp, 1472554925.0)
+        self.assertEqual(lines[2].timestamp, 1472554925)
+        self.assertIn('timestamps=True', self.server.requests[0].path)
+
+    def test_merge(self):
+        self.logs['foo'] = log_response(
+            b'2016-08-30T11:02:02.0Z foo 2\n',
+            b'2016-08-30T11:02:04.0Z foo 4\n')
+        self.logs['bar'] = log_response(
+            b'2016-08-30T11:02:01.0Z bar 1\n',
+            b'2016-08-30T11:02:03.0Z bar 3\n', delay=0.05)
+        with LogMux(self.client, ['foo', 'bar'], timestamps=True,
+                    merge=True, merge_window=1.0) as mux:
+            lines = list(mux)
+        self.assertEqual([l.text for l in lines],
+                         ['bar 1', 'foo 2', 'bar 3', 'foo 4'])
+
+    def test_merge_requires_timestamps(self):
+        with self.assertRaises(ValueError):
+            LogMux(self.client, merge=True)
+
+    def test_rate_limit(self):
+        self.logs['foo'] = log_response(
+            *[frame(STDOUT, b'%d\n' % i) for i in range(10)], delay=0.01)
+        start = time.monotonic()
+        with LogMux(self.client, ['foo'], rate_limit=2, burst=2) as mux:
+            lines = list(mux)
+        self.assertEqual([l.data for l in lines],
+                         [b'%d' % i for i in range(10)])
+        # 2 lines in burst, and then reading paused for 0.5 s (by which time
+        # the rest is buffered in the socket)
+        self.assertGreater(time.monotonic() - start, 0.45)
+
+    def test_token_bucket(self):
+        bucket = _TokenBucket(10, 5)
+        bucket.consume(7, bucket.updated)
+        self.assertAlmostEqual(bucket.delay(), 0.3)
+        bucket.consume(0, bucket.updated + 0.31)
+        self.assertEqual(bucket.delay(), 0.0)
+
+
+class logmux_watch_tests(LogMuxTestCase):
+
+    def respond(self, request):
+        if self.path(request).startswith('/events'):
+            return self.events
+        return super(logmux_watch_tests, self).respond(request)
+
+    def events(self, conn):
+        conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                     b'Transfer-Encoding: chunked\r\n\r\n')
+        for event in ({'status': 'start', 'id': 'foo', 'time': 1472554924},
+                      {'Type': 'container', 'Action': 'start',
+                       'Actor': {'ID': '0123', 'Attributes': {'name': 'bar'}},
+                       'time': 1472554925},
+                      {'Type': 'container', 'Action': 'start',
+                       'Actor': {'ID': '4567',
+                                 'Attributes': {'name': 'ignored'}}}):
+            conn.sendall(chunk(json.dumps(event).encode('utf-8') + b'\n'))
+        self.done.wait(5)
+
+    def test_watch(self):
+        self.done = threading.Event()
+        self.logs['foo'] = log_response(b'foo\n')
+        self.logs['bar'] = log_response(b'bar\n')
+        self.logs['ignored'] = log_response(b'ignored\n')
+        lines = []
+        with LogMux(self.client,
+                    watch=lambda event: 'ignored' not in str(event)) as mux:
+            for line in mux:
+                lines.append(line)
+                if len(lines) == 2:
+                    break
+            self.done.set()
+        self.assertEqual(sorted((l.container, l.data) for l in lines),
+                         [('bar', b'bar'), ('foo', b'foo')])
+        paths = [r.path for r in self.server.requests]
+        self.assertIn('since=1472554924', paths[1] + paths[2])
+        self.assertFalse(any('ignored' in path for path in paths))
+
+    def test_watch_not_scheduled(self):
+        # Following events does not hold a scheduler slot
+        self.done = threading.Event()
+        self.addCleanup(self.done.set)
+        self.logs['json'] = b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n[]'
+        client = DockerClient(self.server.url, api_version='1.22',
+                              transport='socket',
+                              scheduler=PriorityScheduler(limit=1))
+        self.addCleanup(client.close)
+        result = []
+        with LogMux(client, watch=True):
+            self.assertEqual(sum(client.scheduler.in_flight.values()), 0)
+            thread = threading.Thread(
+                target=lambda: result.append(client.containers()))
+            thread.start()
+            thread.join(5)
+        self.assertEqual(result, [[]])
@@ -0,0 +1,224 @@
+import unittest
+import threading
+import gc
+
+from xd.docker.metrics import *
+from xd.docker.observer import OperationInfo, RequestInfo
+
+
+class counter_tests(unittest.case.TestCase):
+
+    def test_inc(self):
+        c = Counter('foo_total', 'Foo', ('code',))
+        c.inc(('200',))
+        c.inc(('200',), 2)
+        c.inc(('404',))
+        self.assertEqual(c.value(('200',)), 3)
+        self.assertEqual(c.value(('404',)), 1)
+        self.assertEqual(c.value(('500',)), 0)
+
+    def test_negative(self):
+        c = Counter('foo_total', 'Foo')
+        with self.assertRaises(ValueError):
+            c.inc(amount=-1)
+
+    def test_labels_mismatch(self):
+        c = Counter('foo_total', 'Foo', ('code',))
+        with self.assertRaises(ValueError):
+            c.inc(())
+
+    def test_invalid_name(self):
+        with self.assertRaises(ValueError):
+            Counter('foo-total', 'Foo')
+        with self.assertRaises(ValueError):
+            Counter('foo_total', 'Foo', ('__code',))
+
+    def test_threads(self):
+        c = Counter('foo_total', 'Foo', ('code',))
+
+        def work():
+            for i in range(1000):
+                c.inc(('200',))
+        threads = [threading.Thread(target=work) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        c.inc(('200',))
+        self.assertEqual(c.value(('200',)), 8001)
+
+    def test_retire(self):
+        c = Counter('foo_total', 'Foo')
+        t = threading.Thread(target=c.inc)
+        t.start()
+        t.join()
+        del t
+        gc.collect()
+        self.assertEqual(c._shards, [])
+        self.assertEqual(c.value(), 1)
+
+    def test_exposition(self):
+        c = Counter('foo_total', 'Foo\nbar', ('path',))
+        c.inc(('/a"b\\c',), 1.5)
+        self.assertEqual(c.exposition(),
+                         '# HELP foo_total Foo\\nbar\n'
+                         '# TYPE foo_total counter\n'
+                         'foo_total{path="/a\\"b\\\\c"} 1.5\n')
+
+
+class gauge_tests(unittest.case.TestCase):
+
+    def test_inc_dec(self):
+        g = Gauge('foo', 'Foo')
+        g.inc()
+        g.inc(amount=2)
+        g.dec()
+        self.assertEqual(g.value(), 2)
+        self.assertIn('# TYPE foo gauge\nfoo 2\n', g.exposition())
+
+    def test_threads(self):
+        g = Gauge('foo', 'Foo')
+        g.inc()
+        t = threading.Thread(target=g.dec)
+        t.start()
+        t.join()
+        self.assertEqual(g.value(), 0)
+
+
+class histogram_tests(unittest.case.TestCase):
+
+    def test_observe(self):
+        h = Histogram('foo_seconds', 'Foo', ('op',), buckets=(0.1, 1.0))
+        h.observe(0.05, ('a',))
+        h.observe(0.1, ('a',))
+        h.observe(0.5, ('a',))
+        h.observe(5, ('a',))
+        count, total = h.value(('a',))
+        self.assertEqual(count, 4)
+        self.assertAlmostEqual(total, 5.65)
+        self.assertEqual(h.value(('b',)), (0, 0.0))
+        text = h.exposition()
+        self.assertIn('foo_seconds_bucket{op="a",le="0.1"} 2\n', text)
+        self.assertIn('foo_seconds_bucket{op="a",le="1.0"} 3\n', text)
+        self.assertIn('foo_seconds_bucket{op="a",le="+Inf"} 4\n', text)
+        self.assertIn('foo_seconds_count{op="a"} 4\n', text)
+        self.assertIn('foo_seconds_sum{op="a"} 5.65\n', text)
+
+    def test_buckets(self):
+        h = Histogram('foo', 'Foo', buckets=(1, 0.5, float('inf')))
+        self.assertEqual(h.buckets, (0.5, 1.0))
+        with self.assertRaises(ValueError):
+            Histogram('foo', 'Foo', buckets=())
+        with self.assertRaises(ValueError):
+            Histogram('foo', 'Foo', ('le',))
+
+    def test_threads(self):
+        h = Histogram('foo', 'Foo')
+
+        def work():
+            for i in range(1000):
+                h.observe(0.01)
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(h.value()[0], 4000)
+
+
+class registry_tests(unittest.case.TestCase):
+
+    def test_get_or_create(self):
+        registry = MetricsRegistry()
+        c = registry.counter('foo_total', 'Foo', ('code',))
+        self.assertIs(registry.counter('foo_total', 'Foo', ('code',)), c)
+        self.assertIs(registry.get('foo_total'), c)
+        self.assertIsNone(registry.get('bar'))
+        self.assertEqual(list(registry), [c])
+
+    def test_conflict(self):
+        registry = MetricsRegistry()
+        registry.counter('foo', 'Foo')
+        with self.assertRaises(ValueError):
+            registry.gauge('foo', 'Foo')
+        with self.assertRaises(ValueError):
+            registry.counter('foo', 'Foo', ('code',))
+
+    def test_exposition(self):
+        registry = MetricsRegistry()
+        registry.counter('foo_total', 'Foo').inc()
+        registry.gauge('bar', 'Bar')
+        registry.histogram('baz', 'Baz', buckets=(1,)).observe(2)
+        self.assertEqual(registry.exposition(),
+                         '# HELP foo_total Foo\n'
+                         '# TYPE foo_total counter\n'
+                         'foo_total 1\n'
+                         '# HELP bar Bar\n'
+                         '# TYPE bar gauge\n'
+                         '# HELP baz Baz\n'
+                         '# TYPE baz histogram\n'
+                         'baz_bucket{le="1.0"} 0\n'
+                         'baz_bucket{le="+Inf"} 1\n'
+                         'baz_sum 2\n'
+                         'baz_count 1\n')
+
+
+class metrics_observer_tests(unittest.case.TestCase):
+
+    def setUp(self):
+        self.observer = MetricsObserver()
+        self.registry = self.observer.registry
+
+    def test_operation(self):
+        info = OperationInfo('image_build')
+        self.observer.operation_start(info)
+        self.assertEqual(self.observer.operations_in_flight.value(
+            ('image_build',)), 1)
+        info.duration = 0.2
+        self.observer.operation_end(info)
+        self.assertEqual(self.observer.operations_in_flight.value(
+            ('image_build',)), 0)
+        self.assertEqual(self.observer.operations.value(('image_build',)), 1)
+        self.assertEqual(self.observer.operation_duration.value(
+            ('image_build',)), (1, 0.2))
+
+    def test_operation_error(self):
+        info = OperationInfo('image_build')
+        self.observer.operation_start(info)
+        info.duration = 0.2
+        info.exception = OSError('Connection reset')
+        self.observer.operation_end(info)
+        self.assertEqual(self.observer.operation_errors.value(
+            ('image_build', 'OSError', '')), 1)
+
+    def test_request(self):
+        operation = OperationInfo('image_build')
+        info = RequestInfo('POST', '/build', '/build')
+        info.operation = operation
+        self.observer.request_start(info)
+        self.assertEqual(self.observer.requests_in_flight.value(), 1)
+        info.status_code = 200
+        info.request_bytes = 10240
+        info.response_bytes = 300
+        info.total_time = 1.5
+        self.observer.request_end(info)
+        self.assertEqual(self.observer.requests_in_flight.value(), 0)
+        self.assertEqual(self.observer.requests.value(
+            ('POST', '/build', '200')), 1)
+        self.assertEqual(self.observer.request_duration.value(
+            ('POST', '/build')), (1, 1.5))
+        self.assertEqual(self.observer.request_bytes.value(
+            ('image_build',)), 10240)
+        self.assertEqual(self.observer.response_bytes.value(
+            ('image_build',)), 300)
+
+    def test_request_error(self):
+        info = RequestInfo('GET', '/_ping', '/_ping')
+        self.observer.request_start(info)
+        self.observer.request_end(info)
+        self.assertEqual(self.observer.requests.value(
+            ('GET', '/_ping', '')), 1)
+
+    def test_shared_registry(self):
+        observer = MetricsObserver(self.registry)
+        self.assertIs(observer.operations, self.observer.operations)
@@ -0,0 +1,283 @@
+import unittest
+import io
+import tempfile
+import threading
+
+from xd.docker.observer import *
+from xd.docker.observer import _observe_body, _observe_response, \
+    _operation, _bind_operation, _phase, _phase_chunks
+
+
+class Response(object):
+
+    def __init__(self, chunks, readinto=False):
+        self.chunks = list(chunks)
+        self.closed = False
+        if readinto:
+            self.readinto = self._readinto
+
+    def iter_content(self, chunk_size=1):
+        for chunk in self.chunks:
+            yield chunk
+
+    def _readinto(self, buf):
+        if not self.chunks:
+            return 0
+        chunk = self.chunks.pop(0)
+        buf[:len(chunk)] = chunk
+        return len(chunk)
+
+    def close(self):
+        self.closed = True
+
+
+class request_info_tests(unittest.case.TestCase):
+
+    def test_init(self):
+        info = RequestInfo('GET', '/containers/{id}/json',
+                           '/containers/foo/json', {'id': 'foo'})
+        self.assertEqual(info.path, {'id': 'foo'})
+        self.assertIsNone(info.status_code)
+        self.assertIsNone(info.total_time)
+        self.assertGreaterEqual(info.elapsed(), 0.0)
+        self.assertIn('/containers/{id}/json', repr(info))
+
+
+class operation_info_tests(unittest.case.TestCase):
+
+    def test_init(self):
+        parent = OperationInfo('container_create')
+        info = OperationInfo('image_pull', parent)
+        self.assertIs(info.parent, parent)
+        self.assertIsNone(info.duration)
+        self.assertIsNone(info.exception)
+        self.assertGreaterEqual(info.elapsed(), 0.0)
+        self.assertIn('image_pull', repr(info))
+
+    def test_current_operation(self):
+        self.assertIsNone(current_operation())
+        self.assertIsNone(RequestInfo('GET', '/_ping', '/_ping').operation)
+
+
+class Recorder(object):
+
+    def __init__(self):
+        self.events = []
+
+    def phase_start(self, info):
+        self.events.append(('start', info.name))
+
+    def phase_end(self, info):
+        self.events.append(('end', info.name))
+        self.info = info
+
+
+class Client(object):
+    # Minimal stand-in for DockerClient observer support
+
+    def __init__(self, *observers):
+        self._observers = observers
+
+    def _notify(self, event, info, observers=None):
+        if observers is None:
+            observers = self._observers
+        handler = getattr(observers[0], event, None)
+        if handler is not None:
+            handler(info)
+
+    @_operation
+    def operation(self, func):
+        return func()
+
+
+class phase_tests(unittest.case.TestCase):
+
+    def test_phase(self):
+        recorder = Recorder()
+        client = Client(recorder)
+        with _phase(client, 'tar'):
+            pass
+        self.assertEqual(recorder.events, [('start', 'tar'), ('end', 'tar')])
+        self.assertEqual(recorder.info.busy_time, recorder.info.duration)
+
+    def test_phase_error(self):
+        recorder = Recorder()
+        with self.assertRaises(KeyError):
+            with _phase(Client(recorder), 'tar'):
+                raise KeyError()
+        self.assertIsInstance(recorder.info.exception, KeyError)
+
+    def test_phase_no_observers(self):
+        with _phase(Client(), 'tar'):
+            pass
+        chunks = iter([b'foo'])
+        self.assertIs(_phase_chunks(Client(), 'compress', chunks), chunks)
+
+    def test_phase_chunks(self):
+        recorder = Recorder()
+        chunks = _phase_chunks(Client(recorder), 'compress', [b'foo', b'bar'])
+        self.assertEqual(recorder.events, [])
+        self.assertEqual(list(chunks), [b'foo', b'bar'])
+        self.assertEqual(recorder.events,
+                         [('start', 'compress'), ('end', 'compress')])
+        self.assertLessEqual(recorder.info.busy_time, recorder.info.duration)
+
+    def test_phase_chunks_closed(self):
+        recorder = Recorder()
+        chunks = _phase_chunks(Client(recorder), 'compress', [b'foo', b'bar'])
+        next(chunks)
+        chunks.close()
+        self.assertEqual(recorder.events,
+                         [('start', 'compress'), ('end', 'compress')])
+
+    def test_phase_operation(self):
+        recorder = Recorder()
+        client = Client(recorder)
+
+        def func():
+            with _phase(client, 'tar'):
+                pass
+        client.operation(func)
+        self.assertEqual(recorder.info.operation.name, 'operation')
+
+
+class bind_operation_tests(unittest.case.TestCase):
+
+    def test_unbound(self):
+        func = lambda: None
+        self.assertIs(_bind_operation(func), func)
+
+    def test_thread(self):
+        result = []
+
+        def func():
+            def run():
+                result.append(current_operation())
+            t = threading.Thread(target=_bind_operation(run))
+            t.start()
+            t.join()
+            return current_operation()
+        operation = Client(Recorder()).operation(func)
+        self.assertEqual(result, [operation])
+        self.assertIsNone(current_operation())
+
+
+class observer_tests(unittest.case.TestCase):
+
+    def test_noop(self):
+        info = RequestInfo('GET', '/_ping', '/_ping')
+        Observer().request_start(info)
+        Observer().request_end(info)
+        info = OperationInfo('ping')
+        Observer().operation_start(info)
+        Observer().operation_end(info)
+
+
+class observe_body_tests(unittest.case.TestCase):
+
+    def info(self):
+        return RequestInfo('POST', '/build', '/build')
+
+    def test_none(self):
+        info = self.info()
+        self.assertIsNone(_observe_body(None, info))
+        self.assertEqual(info.request_bytes, 0)
+
+    def test_bytes(self):
+        info = self.info()
+        self.assertEqual(_observe_body(b'foo', info), b'foo')
+        self.assertEqual(info.request_bytes, 3)
+
+    def test_str(self):
+        info = self.info()
+        _observe_body('{"foo": 1}', info)
+        self.assertEqual(info.request_bytes, 10)
+
+    def test_memoryview(self):
+        info = self.info()
+        _observe_body(memoryview(b'foobar')[1:], info)
+        self.assertEqual(info.request_bytes, 5)
+
+    def test_file(self):
+        info = self.info()
+        with tempfile.TemporaryFile() as f:
+            f.write(b'foobar')
+            f.seek(2)
+            self.assertIs(_observe_body(f, info), f)
+        self.assertEqual(info.request_bytes, 4)
+
+    def test_iterator(self):
+        info = self.info()
+        chunks = _observe_body(iter([b'foo', b'bar']), info)
+        self.assertEqual(info.request_bytes, 0)
+        self.assertEqual(list(chunks), [b'foo', b'bar'])
+        self.assertEqual(info.request_bytes, 6)
+
+    def test_unknown(self):
+        info = self.info()
+        data = io.BytesIO(b'foo')
+        self.assertIs(_observe_body(data, info), data)
+        self.assertIsNone(info.request_bytes)
+
+
+class observe_response_tests(unittest.case.TestCase):
+
+    def setUp(self):
+        self.info = RequestInfo('GET', '/images/get', '/images/get',
+                                stream=True)
+        self.ended = []
+
+    def notify(self, event, info):
+        self.assertEqual(event, 'request_end')
+        self.ended.append(info.total_time)
+
+    def test_iter_content(self):
+        r = Response([b'foo', b'barbaz'])
+        _observe_response(r, self.info, self.notify)
+        self.assertEqual(self.info.response_bytes, 0)
+        self.assertEqual(list(r.iter_content(1024)), [b'foo', b'barbaz'])
+        self.assertEqual(self.info.response_bytes, 9)
+        self.assertEqual(len(self.ended), 1)
+        r.close()
+        self.assertTrue(r.closed)
+        self.assertEqual(len(self.ended), 1)
+
+    def test_close_early(self):
+        r = Response([b'foo', b'bar'])
+        _observe_response(r, self.info, self.notify)
+        next(r.iter_content())
+        self.assertEqual(self.ended, [])
+        r.close()
+        self.assertEqual(self.info.response_bytes, 3)
+        self.assertEqual(len(self.ended), 1)
+        self.assertIsNotNone(self.info.total_time)
+
+    def test_readinto(self):
+        r = Response([b'foo', b'ba'], readinto=True)
+        _observe_response(r, self.info, self.notify)
+        buf = bytearray(8)
+        while r.readinto(buf):
+            pass
+        self.assertEqual(self.info.response_bytes, 5)
+        self.assertEqual(len(self.ended), 1)
+
+    def test_no_readinto(self):
+        r = Response([])
+        _observe_response(r, self.info, self.notify)
+        self.assertFalse(hasattr(r, 'readinto'))
+
+    def test_error(self):
+        class Error(Exception):
+            pass
+
+        def iter_content(chunk_size=1):
+            yield b'foo'
+            raise Error()
+        r = Response([])
+        r.iter_content = iter_content
+        _observe_response(r, self.info, self.notify)
+        with self.assertRaises(Error):
+            list(r.iter_content())
+        self.assertIsInstance(self.info.exception, Error)
+        self.assertEqual(self.info.response_bytes, 3)
+        self.assertEqual(len(self.ended), 1)
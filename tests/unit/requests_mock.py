@@ -1,17 +1,35 @@
 import json
 
+from xd.docker.transport import _import_requests
+
+# Import (and monkeypatch) requests now, instead of on first request, where
+# the requests_unixsocket monkeypatch would replace functions mocked by the
+# test running first.
+_import_requests()
+
 
 class Response(object):
-    def __init__(self, text, status_code):
+    def __init__(self, text, status_code, headers=None, content=None):
         self.text = text
         self.status_code = status_code
+        self.headers = headers or {}
+        if content is None and text is not None:
+            content = text.encode('utf-8')
+        self.content = content
 
     def iter_lines(self):
         return [line.encode('utf-8') for line in self.text.split('\n')]
 
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
     def json(self):
         return json.loads(self.text)
 
+    def close(self):
+        pass
+
 
 def version_response(api, client, git = "20f81dd", go = "go1.5.3"):
     return Response(json.dumps({
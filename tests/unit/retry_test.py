@@ -0,0 +1,99 @@
+import unittest
+import threading
+
+from xd.docker.retry import *
+from xd.docker.client import ServerError, ClientError
+
+
+class retry_budget_tests(unittest.case.TestCase):
+
+    def test_burst(self):
+        budget = RetryBudget(ratio=0.5, burst=2)
+        self.assertEqual(budget.tokens, 2)
+        self.assertTrue(budget.withdraw())
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+
+    def test_deposit(self):
+        budget = RetryBudget(ratio=0.5, burst=2)
+        budget.withdraw()
+        budget.withdraw()
+        budget.deposit()
+        self.assertFalse(budget.withdraw())
+        budget.deposit()
+        self.assertTrue(budget.withdraw())
+        for _ in range(10):
+            budget.deposit()
+        self.assertEqual(budget.tokens, 2)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            RetryBudget(ratio=-1)
+        with self.assertRaises(ValueError):
+            RetryBudget(burst=0)
+
+    def test_threads(self):
+        budget = RetryBudget(ratio=0.0, burst=100)
+        withdrawn = []
+
+        def run():
+            withdrawn.append(sum(budget.withdraw() for _ in range(50)))
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(withdrawn), 100)
+
+
+class retry_policy_tests(unittest.case.TestCase):
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            RetryPolicy(attempts=0)
+
+    def test_retryable(self):
+        policy = RetryPolicy()
+        self.assertTrue(policy.retryable('GET', '/containers/json'))
+        self.assertTrue(policy.retryable('HEAD', '/containers/{id}/archive'))
+        self.assertFalse(policy.retryable('POST', '/containers/create'))
+        self.assertFalse(policy.retryable('POST', '/containers/{id}/stop'))
+
+    def test_retryable_data(self):
+        policy = RetryPolicy()
+        self.assertTrue(policy.retryable('GET', '/foo', b'bar'))
+        self.assertFalse(policy.retryable('GET', '/foo', iter([b'bar'])))
+
+    def test_container_changes(self):
+        policy = RetryPolicy(container_changes=True)
+        self.assertTrue(policy.retryable('POST', '/containers/{id}/stop'))
+        self.assertTrue(policy.retryable('DELETE', '/containers/{id}'))
+        self.assertFalse(policy.retryable('POST', '/containers/{id}/start'))
+        self.assertEqual(policy.done_status_codes(
+            'POST', '/containers/{id}/stop'), (304,))
+        self.assertEqual(policy.done_status_codes(
+            'GET', '/containers/json'), ())
+        self.assertEqual(RetryPolicy().done_status_codes(
+            'POST', '/containers/{id}/stop'), ())
+
+    def test_should_retry(self):
+        policy = RetryPolicy(attempts=3)
+        self.assertTrue(policy.should_retry(ConnectionRefusedError(), 1))
+        self.assertTrue(policy.should_retry(ServerError('/foo', 503), 2))
+        self.assertFalse(policy.should_retry(ServerError('/foo', 503), 3))
+        self.assertFalse(policy.should_retry(ServerError('/foo', 501), 1))
+        self.assertFalse(policy.should_retry(ClientError('/foo', 404), 1))
+        self.assertFalse(policy.should_retry(ValueError(), 1))
+
+    def test_should_retry_budget(self):
+        policy = RetryPolicy(budget=RetryBudget(ratio=0.0, burst=1))
+        self.assertTrue(policy.should_retry(OSError(), 1))
+        self.assertFalse(policy.should_retry(OSError(), 1))
+
+    def test_delay(self):
+        policy = RetryPolicy(backoff=0.1, max_backoff=0.3)
+        for _ in range(100):
+            self.assertLessEqual(policy.delay(1), 0.1)
+            self.assertLessEqual(policy.delay(2), 0.2)
+            self.assertLessEqual(policy.delay(5), 0.3)
+            self.assertGreaterEqual(policy.delay(5), 0.0)
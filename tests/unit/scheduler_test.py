@@ -0,0 +1,214 @@
+import unittest
+import threading
+import time
+
+from xd.docker.scheduler import *
+from xd.docker.observer import RequestInfo, OperationInfo, _bind_operation
+from xd.docker.metrics import MetricsRegistry
+
+
+def request(method='GET', endpoint='/containers/{id}/json',
+            operation=None):
+    info = RequestInfo(method, endpoint, endpoint)
+    info.operation = operation
+    return info
+
+
+class init_tests(unittest.case.TestCase):
+
+    def test_defaults(self):
+        scheduler = PriorityScheduler()
+        self.assertEqual(scheduler.limit, 16)
+        self.assertEqual(sorted(scheduler.classes),
+                         [BULK, INTERACTIVE, NORMAL])
+        self.assertEqual(scheduler.classes[BULK].limit, 4)
+        self.assertEqual(scheduler.default, NORMAL)
+        self.assertEqual(scheduler.in_flight,
+                         {INTERACTIVE: 0, NORMAL: 0, BULK: 0})
+
+    def test_invalid_limit(self):
+        with self.assertRaises(ValueError):
+            PriorityScheduler(limit=0)
+        with self.assertRaises(ValueError):
+            PriorityClass('foo', 0, limit=0)
+
+    def test_unknown_default(self):
+        with self.assertRaises(ValueError):
+            PriorityScheduler(default='foo')
+
+    def test_custom_classes(self):
+        scheduler = PriorityScheduler(
+            classes=[PriorityClass('high', 0), PriorityClass('low', 1)],
+            default='low', operation_classes={'container_start': 'high'})
+        self.assertEqual(scheduler.operation_classes,
+                         {'container_start': 'high'})
+
+
+class classify_tests(unittest.case.TestCase):
+
+    def setUp(self):
+        self.scheduler = PriorityScheduler()
+
+    def test_operation(self):
+        self.assertEqual(self.scheduler.classify(request(
+            operation=OperationInfo('container_start'))), INTERACTIVE)
+        self.assertEqual(self.scheduler.classify(request(
+            operation=OperationInfo('image_pull'))), BULK)
+
+    def test_outermost_operation(self):
+        pull = OperationInfo('image_pull', OperationInfo('container_create'))
+        self.assertEqual(self.scheduler.classify(request(operation=pull)),
+                         NORMAL)
+
+    def test_default(self):
+        self.assertEqual(self.scheduler.classify(request()), NORMAL)
+        self.assertEqual(self.scheduler.classify(request(
+            operation=OperationInfo('exec_create'))), NORMAL)
+
+    def test_priority(self):
+        with priority(BULK):
+            self.assertEqual(self.scheduler.classify(request(
+                operation=OperationInfo('container_start'))), BULK)
+        self.assertEqual(self.scheduler.classify(request(
+            operation=OperationInfo('container_start'))), INTERACTIVE)
+
+    def test_priority_thread(self):
+        # Priority class is passed on to worker threads
+        classes = []
+
+        def classify():
+            classes.append(self.scheduler.classify(request(
+                operation=OperationInfo('container_start'))))
+        with priority(BULK):
+            thread = threading.Thread(target=_bind_operation(classify))
+        thread.start()
+        thread.join()
+        self.assertEqual(classes, [BULK])
+
+    def test_unknown_priority(self):
+        with priority('foo'):
+            with self.assertLogs('xd.docker.scheduler', 'WARNING'):
+                self.assertEqual(self.scheduler.classify(request()), NORMAL)
+
+    def test_not_scheduled(self):
+        self.assertIsNone(self.scheduler.classify(
+            request('POST', '/containers/{id}/wait')))
+
+
+class schedule_tests(unittest.case.TestCase):
+
+    def start(self, scheduler, name, started):
+        # Start thread acquiring a slot, and wait until it is queued
+        queued = sum(scheduler.waiting.values())
+
+        def run():
+            scheduler.acquire(name)
+            started.append(name)
+        thread = threading.Thread(target=run)
+        thread.start()
+        while sum(scheduler.waiting.values()) == queued:
+            time.sleep(0.001)
+        return thread
+
+    def test_limit(self):
+        scheduler = PriorityScheduler(limit=2)
+        self.assertLess(scheduler.acquire(NORMAL), 0.01)
+        scheduler.acquire(NORMAL)
+        self.assertEqual(scheduler.in_flight[NORMAL], 2)
+        started = []
+        thread = self.start(scheduler, NORMAL, started)
+        self.assertEqual(scheduler.waiting[NORMAL], 1)
+        scheduler.release(NORMAL)
+        thread.join()
+        self.assertEqual(started, [NORMAL])
+
+    def test_priority_order(self):
+        scheduler = PriorityScheduler(limit=1)
+        scheduler.acquire(BULK)
+        started = []
+        threads = [self.start(scheduler, BULK, started),
+                   self.start(scheduler, NORMAL, started),
+                   self.start(scheduler, INTERACTIVE, started)]
+        holder = BULK
+        for i in range(len(threads)):
+            scheduler.release(holder)
+            while len(started) <= i:
+                time.sleep(0.001)
+            holder = started[-1]
+        scheduler.release(holder)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(started, [INTERACTIVE, NORMAL, BULK])
+
+    def test_fifo(self):
+        scheduler = PriorityScheduler(limit=1)
+        scheduler.acquire(NORMAL)
+        order = []
+        threads = []
+        for _ in range(3):
+            started = []
+            threads.append(self.start(scheduler, NORMAL, started))
+            order.append(started)
+        for i, started in enumerate(order):
+            scheduler.release(NORMAL)
+            while not started:
+                time.sleep(0.001)
+            self.assertTrue(all(order[j] for j in range(i + 1)))
+            self.assertFalse(any(order[j] for j in range(i + 1, 3)))
+        for thread in threads:
+            thread.join()
+
+    def test_class_limit(self):
+        scheduler = PriorityScheduler(limit=4, classes=[
+            PriorityClass(INTERACTIVE, 0, limit=1),
+            PriorityClass(BULK, 1)], default=BULK)
+        scheduler.acquire(INTERACTIVE)
+        started = []
+        thread = self.start(scheduler, INTERACTIVE, started)
+        # Interactive class is at its limit, so bulk is not held back
+        scheduler.acquire(BULK)
+        self.assertEqual(scheduler.in_flight, {INTERACTIVE: 1, BULK: 1})
+        scheduler.release(INTERACTIVE)
+        thread.join()
+        self.assertEqual(started, [INTERACTIVE])
+
+    def test_metrics(self):
+        registry = MetricsRegistry()
+        scheduler = PriorityScheduler(limit=1, metrics=registry)
+        scheduler.acquire(BULK)
+        started = []
+        thread = self.start(scheduler, INTERACTIVE, started)
+        self.assertEqual(registry.get('xd_docker_scheduler_queued').value(
+            (INTERACTIVE,)), 1)
+        time.sleep(0.01)
+        scheduler.release(BULK)
+        thread.join()
+        wait = registry.get('xd_docker_scheduler_queue_wait_seconds')
+        count, total = wait.value((INTERACTIVE,))
+        self.assertEqual(count, 1)
+        self.assertGreaterEqual(total, 0.01)
+        self.assertEqual(wait.value((BULK,))[0], 1)
+        self.assertEqual(registry.get('xd_docker_scheduler_queued').value(
+            (INTERACTIVE,)), 0)
+        self.assertEqual(registry.get('xd_docker_scheduler_in_flight').value(
+            (INTERACTIVE,)), 1)
+        self.assertEqual(registry.get('xd_docker_scheduler_in_flight').value(
+            (BULK,)), 0)
+
+
+class observer_tests(unittest.case.TestCase):
+
+    def test_request(self):
+        scheduler = PriorityScheduler()
+        info = request(operation=OperationInfo('image_pull'))
+        scheduler.request_start(info)
+        self.assertEqual(scheduler.in_flight[BULK], 1)
+        scheduler.request_end(info)
+        self.assertEqual(scheduler.in_flight[BULK], 0)
+
+    def test_not_scheduled(self):
+        scheduler = PriorityScheduler()
+        info = request('GET', '/containers/{id}/logs')
+        scheduler.request_start(info)
+        scheduler.request_end(info)
+        self.assertEqual(sum(scheduler.in_flight.values()), 0)
@@ -0,0 +1,96 @@
+import os
+import socket
+import tempfile
+import shutil
+import threading
+import http.client
+
+
+class Request(object):
+    def __init__(self, method, path, headers, body):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+
+class Server(object):
+    """HTTP server on a UNIX domain socket, serving canned responses.
+
+    Each connection is handled in a separate thread.  For each request
+    received, the request is recorded in `requests`, and a response is
+    sent.  If `respond` is given, it is called with the request to get the
+    response, otherwise the next response is taken from `responses`.
+
+    A response is either raw bytes to send, or a function called with the
+    connection socket (after which the connection is closed).
+    """
+
+    def __init__(self, responses=(), respond=None):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'docker.sock')
+        self.url = 'unix://' + self.path
+        self.responses = list(responses)
+        self.respond = respond
+        self.requests = []
+        self.connections = 0
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(64)
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._connection, args=(conn,),
+                             daemon=True).start()
+
+    def _connection(self, conn):
+        with conn:
+            rfile = conn.makefile('rb')
+            try:
+                while self._handle(conn, rfile):
+                    pass
+            except OSError:
+                pass
+            rfile.close()
+
+    def _handle(self, conn, rfile):
+        line = rfile.readline()
+        if not line:
+            return False
+        method, path, _ = line.decode('latin-1').split(' ', 2)
+        headers = http.client.parse_headers(rfile)
+        if 'chunked' in headers.get('Transfer-Encoding', ''):
+            body = b''
+            while True:
+                size = int(rfile.readline().split(b';')[0], 16)
+                if size == 0:
+                    rfile.readline()
+                    break
+                body += rfile.read(size)
+                rfile.readline()
+        else:
+            body = rfile.read(int(headers.get('Content-Length', 0)))
+        request = Request(method, path, headers, body)
+        self.requests.append(request)
+        if self.respond:
+            response = self.respond(request)
+        elif self.responses:
+            response = self.responses.pop(0)
+        else:
+            return False
+        if callable(response):
+            response(conn)
+            return False
+        conn.sendall(response)
+        return b'Connection: close' not in response
+
+    def close(self):
+        self.sock.close()
+        shutil.rmtree(self.dir)
@@ -0,0 +1,270 @@
+import unittest
+import copy
+import array
+import threading
+import time
+
+from xd.docker.stats import *
+from xd.docker.stats import _import_numpy
+from xd.docker.limiter import AdaptiveLimiter
+from xd.docker.container import Container
+from xd.docker.parameters import ContainerName
+
+numpy = _import_numpy()
+
+
+SAMPLE = {
+    'read': '2016-09-01T10:00:01.123456789Z',
+    'precpu_stats': {'cpu_usage': {'total_usage': 1000000000},
+                     'system_cpu_usage': 100000000000},
+    'cpu_stats': {'cpu_usage': {'total_usage': 1500000000,
+                                'percpu_usage': [1, 2, 3, 4]},
+                  'system_cpu_usage': 102000000000},
+    'memory_stats': {'usage': 3000000, 'limit': 8000000,
+                     'stats': {'cache': 1000000}},
+    'networks': {'eth0': {'rx_bytes': 100, 'tx_bytes': 200},
+                 'eth1': {'rx_bytes': 10, 'tx_bytes': 20}},
+    'blkio_stats': {'io_service_bytes_recursive': [
+        {'major': 8, 'minor': 0, 'op': 'Read', 'value': 4096},
+        {'major': 8, 'minor': 0, 'op': 'Write', 'value': 8192},
+        {'major': 8, 'minor': 0, 'op': 'Total', 'value': 12288}]},
+    }
+
+
+class stats_tests(unittest.case.TestCase):
+
+    def test_sample(self):
+        stats = Stats(SAMPLE)
+        self.assertAlmostEqual(stats.time, 1472724001.123456789)
+        # 0.5 s CPU time over 20 s system time (on 4 CPUs)
+        self.assertEqual(stats.cpu_percent, 100.0)
+        self.assertEqual(stats.memory_usage, 2000000)
+        self.assertEqual(stats.memory_limit, 8000000)
+        self.assertEqual(stats.network_rx, 110)
+        self.assertEqual(stats.network_tx, 220)
+        self.assertEqual(stats.block_read, 4096)
+        self.assertEqual(stats.block_write, 8192)
+
+    def test_online_cpus(self):
+        sample = copy.deepcopy(SAMPLE)
+        sample['cpu_stats']['online_cpus'] = 2
+        self.assertEqual(Stats(sample).cpu_percent, 50.0)
+
+    def test_first_sample(self):
+        # precpu_stats is empty for the first sample
+        sample = copy.deepcopy(SAMPLE)
+        sample['precpu_stats'] = {'cpu_usage': {'total_usage': 0}}
+        self.assertEqual(Stats(sample).cpu_percent, 0.0)
+
+    def test_inactive_file(self):
+        sample = copy.deepcopy(SAMPLE)
+        sample['memory_stats']['stats'] = {'inactive_file': 500000}
+        self.assertEqual(Stats(sample).memory_usage, 2500000)
+
+    def test_network_api_1_20(self):
+        sample = copy.deepcopy(SAMPLE)
+        del sample['networks']
+        sample['network'] = {'rx_bytes': 1, 'tx_bytes': 2}
+        stats = Stats(sample)
+        self.assertEqual((stats.network_rx, stats.network_tx), (1, 2))
+
+    def test_empty(self):
+        stats = Stats({})
+        self.assertIsNone(stats.time)
+        self.assertEqual(stats.cpu_percent, 0.0)
+        self.assertEqual(stats.memory_usage, 0)
+        self.assertEqual(stats.block_write, 0)
+
+    def test_repr(self):
+        self.assertIn('cpu_percent=100.0', repr(Stats(SAMPLE)))
+
+
+class StatsCollectorTests(object):
+
+    use_numpy = False
+
+    def sample(self, cpu_percent, memory_usage=0):
+        stats = Stats(SAMPLE)
+        stats.cpu_percent = cpu_percent
+        stats.memory_usage = memory_usage
+        return stats
+
+    def setUp(self):
+        self.collector = StatsCollector(size=4, use_numpy=self.use_numpy)
+
+    def test_empty(self):
+        self.assertEqual(self.collector.containers, [])
+        self.assertEqual(self.collector.count('foo'), 0)
+        with self.assertRaises(KeyError):
+            self.collector.mean('foo', 'cpu_percent')
+
+    def test_mean(self):
+        for value in (1.0, 2.0, 3.0):
+            self.collector.add('foo', self.sample(value))
+        self.assertEqual(self.collector.count('foo'), 3)
+        self.assertEqual(self.collector.mean('foo', 'cpu_percent'), 2.0)
+        self.assertEqual(self.collector.mean('foo', 'cpu_percent', 2), 2.5)
+        self.assertEqual(self.collector.mean('foo', 'cpu_percent', 0), None)
+
+    def test_wrap(self):
+        for value in range(10):
+            self.collector.add('foo', self.sample(float(value)))
+        self.assertEqual(self.collector.count('foo'), 4)
+        self.assertEqual(list(self.collector.values('foo', 'cpu_percent')),
+                         [6.0, 7.0, 8.0, 9.0])
+        self.assertEqual(
+            list(self.collector.values('foo', 'cpu_percent', 3)),
+            [7.0, 8.0, 9.0])
+        self.assertEqual(self.collector.mean('foo', 'cpu_percent'), 7.5)
+
+    def test_percentile(self):
+        for value in (40, 10, 30, 20):
+            self.collector.add('foo', self.sample(0.0, value))
+        self.assertEqual(
+            self.collector.percentile('foo', 'memory_usage', 0), 10)
+        self.assertEqual(
+            self.collector.percentile('foo', 'memory_usage', 50), 25)
+        self.assertEqual(
+            self.collector.percentile('foo', 'memory_usage', 100), 40)
+        self.assertEqual(
+            self.collector.percentile('foo', 'memory_usage', 50, 1), 20)
+        with self.assertRaises(ValueError):
+            self.collector.percentile('foo', 'memory_usage', 101)
+
+    def test_containers(self):
+        self.collector.add('foo', self.sample(1.0))
+        self.collector.add('bar', self.sample(2.0))
+        self.assertEqual(sorted(self.collector.containers), ['bar', 'foo'])
+        self.assertEqual(self.collector.mean('bar', 'cpu_percent'), 2.0)
+        self.collector.remove('foo')
+        self.collector.remove('foo')
+        self.assertEqual(self.collector.containers, ['bar'])
+
+    def test_invalid_field(self):
+        self.collector.add('foo', self.sample(1.0))
+        with self.assertRaises(ValueError):
+            self.collector.mean('foo', 'foo')
+
+    def test_missing_time(self):
+        self.collector.add('foo', Stats({}))
+        value = self.collector.values('foo', 'time')[0]
+        self.assertNotEqual(value, value)
+
+
+class stats_collector_array_tests(StatsCollectorTests,
+                                  unittest.case.TestCase):
+
+    def test_array(self):
+        self.collector.add('foo', self.sample(1.0))
+        self.assertIsInstance(self.collector.values('foo', 'cpu_percent'),
+                              array.array)
+
+    def test_invalid_size(self):
+        with self.assertRaises(ValueError):
+            StatsCollector(size=0)
+
+    @unittest.skipIf(numpy is not None, 'NumPy is installed')
+    def test_no_numpy(self):
+        self.assertFalse(StatsCollector().use_numpy)
+        with self.assertRaises(ValueError):
+            StatsCollector(use_numpy=True)
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class stats_collector_numpy_tests(StatsCollectorTests,
+                                  unittest.case.TestCase):
+
+    use_numpy = True
+
+
+class SamplerClient(object):
+    # Fake DockerClient with a sample per container
+
+    def __init__(self, samples, delay=0.0):
+        self.samples = samples
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.concurrent = 0
+        self.max_concurrent = 0
+
+    def containers(self):
+        return [Container(self, id=id) for id in sorted(self.samples)]
+
+    def container_stats(self, container, stream=True):
+        assert stream is False
+        with self.lock:
+            self.concurrent += 1
+            self.max_concurrent = max(self.max_concurrent, self.concurrent)
+        try:
+            time.sleep(self.delay)
+            sample = self.samples[container]
+            if isinstance(sample, Exception):
+                raise sample
+            return Stats(sample)
+        finally:
+            with self.lock:
+                self.concurrent -= 1
+
+
+class stats_sampler_tests(unittest.case.TestCase):
+
+    def setUp(self):
+        samples = {}
+        for i in range(8):
+            sample = copy.deepcopy(SAMPLE)
+            sample['memory_stats']['limit'] = i
+            samples['c%d' % i] = sample
+        self.client = SamplerClient(samples)
+
+    def test_sample(self):
+        with StatsSampler(self.client, use_numpy=False) as sampler:
+            sweep = sampler.sample()
+        self.assertEqual(len(sweep), 8)
+        self.assertEqual(sweep.ids, ['c%d' % i for i in range(8)])
+        self.assertEqual(list(sweep.columns['memory_limit']),
+                         [float(i) for i in range(8)])
+        self.assertEqual(sweep.row('c3')['memory_limit'], 3.0)
+        self.assertEqual(sweep.row('c3')['cpu_percent'], 100.0)
+        self.assertEqual(sweep.errors, {})
+        self.assertGreaterEqual(sweep.duration, 0.0)
+        self.assertEqual(list(sampler.durations), [sweep.duration])
+        with self.assertRaises(KeyError):
+            sweep.row('foo')
+
+    def test_containers(self):
+        with StatsSampler(self.client) as sampler:
+            sweep = sampler.sample(['c1', ContainerName('c2'),
+                                    Container(self.client, id='c3')])
+        self.assertEqual(sweep.ids, ['c1', 'c2', 'c3'])
+
+    def test_errors(self):
+        error = KeyError('no such container')
+        self.client.samples['c4'] = error
+        with StatsSampler(self.client) as sampler:
+            sweep = sampler.sample()
+        self.assertEqual(len(sweep), 7)
+        self.assertNotIn('c4', sweep.ids)
+        self.assertIs(sweep.errors['c4'], error)
+
+    def test_bounded(self):
+        self.client.delay = 0.02
+        limiter = AdaptiveLimiter(initial=2, maximum=3)
+        with StatsSampler(self.client, max_workers=3,
+                          limiter=limiter) as sampler:
+            sampler.sample()
+        self.assertLessEqual(self.client.max_concurrent, 3)
+        self.assertGreaterEqual(self.client.max_concurrent, 2)
+
+    def test_sweeps(self):
+        start = time.monotonic()
+        with StatsSampler(self.client) as sampler:
+            sweeps = list(sampler.sweeps(interval=0.05, count=3))
+        self.assertEqual(len(sweeps), 3)
+        self.assertEqual(len(sampler.durations), 3)
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_numpy(self):
+        with StatsSampler(self.client, use_numpy=True) as sampler:
+            sweep = sampler.sample()
+        self.assertEqual(sweep.columns['memory_limit'].sum(), 28.0)
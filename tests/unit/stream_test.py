@@ -0,0 +1,156 @@
+import unittest
+import io
+import tarfile
+import gzip
+import struct
+
+from xd.docker.stream import *
+
+
+class iterstream_tests(unittest.case.TestCase):
+
+    def test_read_all(self):
+        stream = IterStream([b'foo', b'', b'bar', b'42'])
+        self.assertEqual(stream.read(), b'foobar42')
+
+    def test_read_sizes(self):
+        stream = IterStream([b'foobar', b'42'])
+        self.assertEqual(stream.read(4), b'foob')
+        self.assertEqual(stream.read(4), b'ar')
+        self.assertEqual(stream.read(4), b'42')
+        self.assertEqual(stream.read(4), b'')
+
+    def test_empty(self):
+        stream = IterStream([])
+        self.assertEqual(stream.read(), b'')
+
+    def test_readinto(self):
+        stream = IterStream([b'foo', b'bar'])
+        buf = bytearray(5)
+        self.assertEqual(stream.readinto(buf), 3)
+        self.assertEqual(buf[:3], b'foo')
+
+    def test_tarfile(self):
+        tar_buf = io.BytesIO()
+        with tarfile.open(fileobj=tar_buf, mode='w') as tar:
+            data = b'x' * 100000
+            info = tarfile.TarInfo('foo')
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        archive = tar_buf.getvalue()
+        chunks = [archive[i:i + 1000] for i in range(0, len(archive), 1000)]
+        with tarfile.open(fileobj=IterStream(chunks), mode='r|') as tar:
+            member = tar.next()
+            self.assertEqual(member.name, 'foo')
+            self.assertEqual(tar.extractfile(member).read(), data)
+
+
+class iter_chunks_tests(unittest.case.TestCase):
+
+    def test_chunks(self):
+        chunks = list(iter_chunks(io.BytesIO(b'foobar42'), 3))
+        self.assertEqual(chunks, [b'foo', b'bar', b'42'])
+
+    def test_empty(self):
+        self.assertEqual(list(iter_chunks(io.BytesIO(b''))), [])
+
+
+class gzip_chunks_tests(unittest.case.TestCase):
+
+    def test_gzip(self):
+        data = [b'foobar' * 1000, b'', b'42' * 1000]
+        compressed = b''.join(gzip_chunks(data))
+        self.assertEqual(gzip.decompress(compressed), b''.join(data))
+
+    def test_empty(self):
+        self.assertEqual(gzip.decompress(b''.join(gzip_chunks([]))), b'')
+
+
+class progress_chunks_tests(unittest.case.TestCase):
+
+    def test_progress(self):
+        progress = []
+        chunks = list(progress_chunks([b'foo', b'bar', b'42'],
+                                      progress.append))
+        self.assertEqual(chunks, [b'foo', b'bar', b'42'])
+        self.assertEqual(progress, [3, 6, 8])
+
+
+def frame(stream, data):
+    return struct.pack('>BxxxL', stream, len(data)) + data
+
+
+class frame_demuxer_tests(unittest.case.TestCase):
+
+    def test_feed(self):
+        demuxer = FrameDemuxer()
+        demuxer.feed(frame(STDOUT, b'foo\n') + frame(STDERR, b'bar\n'))
+        frames = [(s, bytes(f)) for s, f in demuxer.frames()]
+        self.assertEqual(frames, [(STDOUT, b'foo\n'), (STDERR, b'bar\n')])
+        self.assertEqual(demuxer.pending, 0)
+
+    def test_partial(self):
+        demuxer = FrameDemuxer()
+        data = frame(STDOUT, b'foo\n') + frame(STDERR, b'bar\n')
+        frames = []
+        for i in range(len(data)):
+            demuxer.feed(data[i:i + 1])
+            frames.extend((s, bytes(f)) for s, f in demuxer.frames())
+        self.assertEqual(frames, [(STDOUT, b'foo\n'), (STDERR, b'bar\n')])
+
+    def test_memoryview(self):
+        demuxer = FrameDemuxer()
+        demuxer.feed(frame(STDOUT, b'foo\n'))
+        stream, data = next(demuxer.frames())
+        self.assertIsInstance(data, memoryview)
+
+    def test_empty_frame(self):
+        demuxer = FrameDemuxer()
+        demuxer.feed(frame(STDOUT, b''))
+        self.assertEqual([(s, bytes(f)) for s, f in demuxer.frames()],
+                         [(STDOUT, b'')])
+
+    def test_grow(self):
+        demuxer = FrameDemuxer(16)
+        data = b'x' * 1000
+        demuxer.feed(frame(STDERR, data))
+        self.assertEqual([(s, bytes(f)) for s, f in demuxer.frames()],
+                         [(STDERR, data)])
+
+    def test_wrap(self):
+        demuxer = FrameDemuxer(64)
+        frames = []
+        for i in range(100):
+            demuxer.feed(frame(STDOUT, b'%d\n' % i))
+            frames.extend(bytes(f) for s, f in demuxer.frames())
+        self.assertEqual(frames, [b'%d\n' % i for i in range(100)])
+
+
+class demux_frames_tests(unittest.case.TestCase):
+
+    def test_demux(self):
+        data = b''.join(frame(STDOUT if i % 3 else STDERR, b'%d\n' % i)
+                        for i in range(1000))
+        chunks = [data[i:i + 100] for i in range(0, len(data), 100)]
+        frames = list(demux_frames(IterStream(chunks).readinto, 256))
+        self.assertEqual(frames, [(STDOUT if i % 3 else STDERR, b'%d\n' % i)
+                                  for i in range(1000)])
+
+    def test_no_copy(self):
+        stream = IterStream([frame(STDOUT, b'foo'), frame(STDOUT, b'bar')])
+        frames = [bytes(f) for s, f in
+                  demux_frames(stream.readinto, copy=False)]
+        self.assertEqual(frames, [b'foo', b'bar'])
+
+    def test_truncated(self):
+        stream = IterStream([frame(STDOUT, b'foo'), frame(STDOUT, b'bar')[:6]])
+        self.assertEqual(list(demux_frames(stream.readinto)),
+                         [(STDOUT, b'foo')])
+
+
+class raw_frames_tests(unittest.case.TestCase):
+
+    def test_raw(self):
+        stream = IterStream([b'foo\n', b'bar\n'])
+        self.assertEqual(list(raw_frames(stream.readinto)),
+                         [(STDOUT, b'foo\n'), (STDOUT, b'bar\n')])
@@ -0,0 +1,104 @@
+import unittest
+
+from xd.docker.tracing import *
+from xd.docker.observer import OperationInfo, PhaseInfo, RequestInfo
+
+
+class span_tests(unittest.case.TestCase):
+
+    def test_root(self):
+        span = Span('container_create', 'operation', 1000.0)
+        self.assertIsNone(span.parent_id)
+        self.assertEqual(len(span.trace_id), 32)
+        self.assertEqual(len(span.span_id), 16)
+        self.assertIsNone(span.duration)
+        self.assertTrue(span.ok)
+        self.assertIn('container_create', repr(span))
+
+    def test_child(self):
+        parent = Span('container_create', 'operation', 1000.0)
+        span = Span('POST /containers/create', 'request', 1000.5, parent)
+        self.assertEqual(span.trace_id, parent.trace_id)
+        self.assertEqual(span.parent_id, parent.span_id)
+        self.assertNotEqual(span.span_id, parent.span_id)
+        span.end = 1001.0
+        self.assertEqual(span.duration, 0.5)
+
+
+class span_exporter_tests(unittest.case.TestCase):
+
+    def test_export(self):
+        with self.assertRaises(NotImplementedError):
+            SpanExporter().export(Span('ping', 'operation', 0.0))
+        SpanExporter().shutdown()
+
+
+class in_memory_exporter_tests(unittest.case.TestCase):
+
+    def test_export(self):
+        exporter = InMemoryExporter()
+        parent = Span('ping', 'operation', 0.0)
+        child = Span('GET /_ping', 'request', 0.0, parent)
+        exporter.export(child)
+        exporter.export(parent)
+        self.assertEqual(exporter.spans, [child, parent])
+        self.assertEqual(exporter.find('ping'), [parent])
+        self.assertEqual(exporter.children(parent), [child])
+        exporter.clear()
+        self.assertEqual(exporter.spans, [])
+
+    def test_max_spans(self):
+        exporter = InMemoryExporter(max_spans=2)
+        spans = [Span('ping', 'operation', float(i)) for i in range(3)]
+        for span in spans:
+            exporter.export(span)
+        self.assertEqual(exporter.spans, spans[1:])
+
+
+class tracing_observer_tests(unittest.case.TestCase):
+
+    def setUp(self):
+        self.exporter = InMemoryExporter()
+        self.observer = TracingObserver(self.exporter)
+
+    def test_nesting(self):
+        operation = OperationInfo('image_build')
+        self.observer.operation_start(operation)
+        phase = PhaseInfo('tar', operation)
+        self.observer.phase_start(phase)
+        phase.duration = phase.busy_time = 0.1
+        self.observer.phase_end(phase)
+        request = RequestInfo('POST', '/build', '/build')
+        request.operation = operation
+        self.observer.request_start(request)
+        request.status_code = 200
+        request.request_bytes = 10240
+        request.total_time = 0.5
+        self.observer.request_end(request)
+        operation.duration = 0.7
+        self.observer.operation_end(operation)
+        tar, build, root = self.exporter.spans
+        self.assertEqual(root.name, 'image_build')
+        self.assertAlmostEqual(root.duration, 0.7, places=5)
+        self.assertEqual(tar.parent_id, root.span_id)
+        self.assertEqual(tar.attributes, {'busy_time': 0.1})
+        self.assertEqual(build.name, 'POST /build')
+        self.assertEqual(build.parent_id, root.span_id)
+        self.assertEqual(build.attributes, {
+            'http.method': 'POST', 'http.target': '/build',
+            'http.status_code': 200, 'request_bytes': 10240})
+
+    def test_no_operation(self):
+        request = RequestInfo('GET', '/_ping', '/_ping')
+        self.observer.request_start(request)
+        request.exception = OSError('Connection refused')
+        request.total_time = 0.1
+        self.observer.request_end(request)
+        span, = self.exporter.spans
+        self.assertIsNone(span.parent_id)
+        self.assertFalse(span.ok)
+        self.assertEqual(span.attributes['error'], 'OSError')
+
+    def test_unknown_end(self):
+        self.observer.request_end(RequestInfo('GET', '/_ping', '/_ping'))
+        self.assertEqual(self.exporter.spans, [])
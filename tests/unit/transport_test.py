@@ -0,0 +1,249 @@
+import unittest
+import io
+import time
+import threading
+import mock
+
+import socket_server
+import requests_mock
+
+from xd.docker.transport import *
+from xd.docker.client import DockerClient, ClientError
+from xd.docker.observer import RequestInfo
+
+
+OK = b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}'
+
+
+class TransportTestCase(unittest.case.TestCase):
+
+    def setUp(self):
+        self.server = socket_server.Server()
+        self.addCleanup(self.server.close)
+        self.transport = SocketTransport()
+        self.transport.bind('http+unix://' + self.server.path.replace(
+            '/', '%2F'))
+        self.addCleanup(self.transport.close)
+
+
+class socket_transport_tests(TransportTestCase):
+
+    def test_get(self):
+        self.server.responses.append(OK)
+        r = self.transport.send('GET', '/foo', params={'bar': 42})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json(), {})
+        self.assertEqual(self.server.requests[0].path, '/foo?bar=42')
+
+    def test_keep_alive(self):
+        self.server.responses.extend([OK] * 3)
+        for _ in range(3):
+            self.assertEqual(self.transport.send('GET', '/foo').json(), {})
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_stream(self):
+        self.server.responses.extend([
+            b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+            b'4\r\nfoo\n\r\n4\r\nbar\n\r\n0\r\n\r\n', OK])
+        r = self.transport.send('GET', '/foo', stream=True)
+        self.assertEqual(list(r.iter_lines()), [b'foo', b'bar'])
+        self.transport.send('GET', '/foo')
+        self.assertEqual(self.server.connections, 1)
+
+    def test_stream_closed(self):
+        self.server.responses.extend([
+            b'HTTP/1.1 200 OK\r\nContent-Length: 6\r\n\r\nfoobar', OK])
+        r = self.transport.send('GET', '/foo', stream=True)
+        r.close()
+        self.transport.send('GET', '/foo')
+        self.assertEqual(self.server.connections, 2)
+
+    def test_concurrent_streams(self):
+        self.server.responses.extend([
+            b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\nfoo',
+            b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\nbar'])
+        r1 = self.transport.send('GET', '/foo', stream=True)
+        r2 = self.transport.send('GET', '/bar', stream=True)
+        self.assertEqual(r2.content, b'bar')
+        self.assertEqual(r1.content, b'foo')
+        self.assertEqual(self.server.connections, 2)
+
+    def test_chunked_body(self):
+        self.server.responses.append(OK)
+        self.transport.send('POST', '/build', data=iter([b'foo', b'bar']))
+        request = self.server.requests[0]
+        self.assertEqual(request.headers['Transfer-Encoding'], 'chunked')
+        self.assertEqual(request.body, b'foobar')
+
+    def test_file_body(self):
+        self.server.responses.append(OK)
+        self.transport.send('POST', '/build', data=io.BytesIO(b'foobar'))
+        self.assertEqual(self.server.requests[0].body, b'foobar')
+
+    def test_stale_connection(self):
+        def respond(conn):
+            conn.sendall(OK)
+        self.server.responses.extend([respond, OK])
+        self.transport.send('GET', '/foo')
+        # Wait for server to close connection
+        time.sleep(0.05)
+        self.assertEqual(self.transport.send('GET', '/foo').json(), {})
+        self.assertEqual(self.server.connections, 2)
+
+    def test_stale_connection_not_idempotent(self):
+        # Daemon receives request on reused connection, and closes it
+        # without responding.  The request may have been acted on, so it
+        # must not be sent again.
+        self.server.responses.extend([OK, lambda conn: None, OK])
+        self.transport.send('GET', '/foo')
+        with self.assertRaises(ConnectionError):
+            self.transport.send('POST', '/containers/create', data=b'{}')
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_stale_connection_idempotent(self):
+        self.server.responses.extend([OK, lambda conn: None, OK])
+        self.transport.send('GET', '/foo')
+        self.assertEqual(self.transport.send('GET', '/foo').json(), {})
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.server.connections, 2)
+
+    def test_pool_size(self):
+        self.transport.pool_size = 1
+        self.server.responses.extend([
+            b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\nfoo',
+            b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\nbar'])
+        r1 = self.transport.send('GET', '/foo', stream=True)
+        r2 = self.transport.send('GET', '/bar', stream=True)
+        r1.content
+        r2.content
+        self.assertEqual(len(self.transport._idle), 1)
+
+    def test_connect_time(self):
+        self.server.responses.append(OK)
+        info = RequestInfo('GET', '/foo', '/foo', {}, None, False)
+        self.transport.send('GET', '/foo', info=info)
+        self.assertIsNotNone(info.connect_time)
+
+    def test_close(self):
+        self.server.responses.append(OK)
+        self.transport.send('GET', '/foo')
+        self.transport.close()
+        self.assertEqual(len(self.transport._idle), 0)
+
+    def test_default_pool_size(self):
+        self.assertEqual(self.transport.pool_size, DEFAULT_POOL_SIZE)
+        self.assertGreaterEqual(DEFAULT_POOL_SIZE, 5)
+
+    def test_threads(self):
+        self.server.respond = lambda request: OK
+        errors = []
+
+        def run():
+            try:
+                for _ in range(50):
+                    self.assertEqual(self.transport.send('GET', '/foo')
+                                     .json(), {})
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.server.requests), 400)
+        # Connections are reused, with at most one per thread
+        self.assertLessEqual(self.server.connections, 8)
+        self.assertLessEqual(len(self.transport._idle), 8)
+
+
+class requests_transport_tests(unittest.case.TestCase):
+
+    def setUp(self):
+        self.transport = RequestsTransport()
+        self.transport.bind('http://127.0.0.1:2375')
+
+    def test_headers(self):
+        for method in ('GET', 'DELETE'):
+            with mock.patch('requests.' + method.lower()) as func:
+                func.return_value = requests_mock.Response('{}', 200)
+                self.transport.send(method, '/foo')
+                self.assertNotIn('headers', func.call_args[1])
+                self.transport.send(method, '/foo', headers={'foo': 'bar'})
+                self.assertEqual(func.call_args[1]['headers'],
+                                 {'foo': 'bar'})
+
+
+class client_socket_transport_tests(unittest.case.TestCase):
+
+    def setUp(self):
+        self.server = socket_server.Server()
+        self.addCleanup(self.server.close)
+
+    def test_by_name(self):
+        client = DockerClient(self.server.url, transport='socket')
+        self.assertIsInstance(client.transport, SocketTransport)
+        self.assertEqual(client.transport.base_url, client.base_url)
+
+    def test_invalid_name(self):
+        with self.assertRaises(ValueError):
+            DockerClient(self.server.url, transport='foobar')
+
+    def test_requests(self):
+        self.server.responses.extend([
+            b'HTTP/1.1 200 OK\r\nContent-Length: 37\r\n\r\n'
+            b'{"ApiVersion": "1.22", "Version": ""}',
+            b'HTTP/1.1 404 Not Found\r\nContent-Length: 3\r\n\r\nfoo',
+            b'HTTP/1.1 204 No Content\r\n\r\n'])
+        client = DockerClient(self.server.url, transport='socket')
+        self.assertEqual(client.api_version, (1, 22))
+        with self.assertRaises(ClientError):
+            client.image_inspect('foo')
+        client.container_start('foo')
+        self.assertEqual(self.server.connections, 1)
+        client.close()
+
+
+class timeout_tests(TransportTestCase):
+
+    def test_parse(self):
+        self.assertIsNone(parse_timeout(None))
+        self.assertIsNone(parse_timeout((None, None)))
+        self.assertEqual(parse_timeout(2), (2, 2))
+        self.assertEqual(parse_timeout((1.0, None)), (1.0, None))
+        for timeout in (0, -1, 'foo', (1, 2, 3), (1, 'foo')):
+            with self.assertRaises(ValueError):
+                parse_timeout(timeout)
+
+    def test_read_timeout(self):
+        self.server.responses += [lambda conn: time.sleep(0.5), OK]
+        with self.assertRaises(OSError):
+            self.transport.send('GET', '/foo', timeout=(1.0, 0.05))
+        self.assertEqual(self.transport.send('GET', '/foo').json(), {})
+
+    def test_pooled_timeout(self):
+        self.server.responses += [OK, lambda conn: time.sleep(0.5)]
+        self.transport.send('GET', '/foo')
+        with self.assertRaises(OSError):
+            self.transport.send('GET', '/foo', timeout=(1.0, 0.05))
+        self.assertEqual(self.server.connections, 1)
+
+    def test_requests_transport(self):
+        self.server.responses += [lambda conn: time.sleep(0.5)]
+        transport = RequestsTransport()
+        transport.bind('http+unix://' + self.server.path.replace(
+            '/', '%2F'))
+        with self.assertRaises(OSError):
+            transport.send('POST', '/foo', data=io.BytesIO(b'x'),
+                           timeout=(1.0, 0.05))
+
+    def test_pooled_checkout(self):
+        # Checking idle connections does not wait for the socket timeout
+        self.server.respond = lambda request: OK
+        self.transport.send('GET', '/foo', timeout=(1.0, 1.0))
+        start = time.monotonic()
+        self.transport.send('GET', '/foo', timeout=(1.0, 1.0))
+        self.transport.send('GET', '/foo')
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(self.server.connections, 1)
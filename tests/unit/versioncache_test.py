@@ -0,0 +1,132 @@
+import unittest
+import os
+import json
+import shutil
+import socket
+import tempfile
+import time
+import urllib.parse
+
+from xd.docker.versioncache import *
+
+
+class parse_api_version_tests(unittest.case.TestCase):
+
+    def test_str(self):
+        self.assertEqual(parse_api_version('1.22'), (1, 22))
+
+    def test_tuple(self):
+        self.assertEqual(parse_api_version((1, 22)), (1, 22))
+        self.assertEqual(parse_api_version(['1', '22']), (1, 22))
+
+    def test_invalid(self):
+        for version in ('1', '1.22.3', 'foo.bar', (1,)):
+            with self.assertRaises(ValueError):
+                parse_api_version(version)
+
+
+class daemon_key_tests(unittest.case.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'docker.sock')
+        self.url = 'http+unix://' + urllib.parse.quote_plus(self.path)
+
+    def test_tcp(self):
+        self.assertEqual(daemon_key('http://127.0.0.1:2375'),
+                         'http://127.0.0.1:2375')
+
+    def test_unix(self):
+        sock = socket.socket(socket.AF_UNIX)
+        self.addCleanup(sock.close)
+        sock.bind(self.path)
+        key = daemon_key(self.url)
+        self.assertIn(socket.gethostname(), key)
+        self.assertIn(self.path, key)
+        self.assertEqual(daemon_key(self.url), key)
+
+    def test_unix_restarted(self):
+        sock = socket.socket(socket.AF_UNIX)
+        sock.bind(self.path)
+        key = daemon_key(self.url)
+        sock.close()
+        os.unlink(self.path)
+        sock = socket.socket(socket.AF_UNIX)
+        self.addCleanup(sock.close)
+        sock.bind(self.path)
+        st = os.stat(self.path)
+        os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+        self.assertNotEqual(daemon_key(self.url), key)
+
+    def test_unix_missing(self):
+        self.assertIsNone(daemon_key(self.url))
+
+
+class version_cache_tests(unittest.case.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'cache', 'versions.json')
+        self.cache = VersionCache(self.path)
+
+    def test_default_path(self):
+        os.environ['XDG_CACHE_HOME'] = self.dir
+        try:
+            cache = VersionCache()
+        finally:
+            del os.environ['XDG_CACHE_HOME']
+        self.assertEqual(cache.path, os.path.join(
+            self.dir, 'xd-docker', 'api-versions.json'))
+
+    def test_set_get(self):
+        self.assertIsNone(self.cache.get('foo'))
+        self.cache.set('foo', (1, 22), {'Version': '1.10.3',
+                                        'GitCommit': '20f81dd'})
+        self.assertEqual(self.cache.get('foo'), (1, 22))
+        self.assertEqual(VersionCache(self.path).get('foo'), (1, 22))
+        with open(self.path) as f:
+            entry = json.load(f)['foo']
+        self.assertEqual(entry['api_version'], '1.22')
+        self.assertEqual(entry['Version'], '1.10.3')
+
+    def test_ttl(self):
+        self.cache.set('foo', (1, 22))
+        self.assertIsNone(VersionCache(self.path, ttl=0).get('foo'))
+
+    def test_expired_pruned(self):
+        self.cache.set('foo', (1, 22))
+        with open(self.path) as f:
+            entries = json.load(f)
+        entries['foo']['time'] = time.time() - 2 * self.cache.ttl
+        with open(self.path, 'w') as f:
+            json.dump(entries, f)
+        self.assertIsNone(self.cache.get('foo'))
+        self.cache.set('bar', (1, 21))
+        with open(self.path) as f:
+            self.assertEqual(list(json.load(f)), ['bar'])
+
+    def test_invalidate(self):
+        self.cache.set('foo', (1, 22))
+        self.cache.set('bar', (1, 21))
+        self.cache.invalidate('foo')
+        self.cache.invalidate('foobar')
+        self.assertIsNone(self.cache.get('foo'))
+        self.assertEqual(self.cache.get('bar'), (1, 21))
+
+    def test_corrupt(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as f:
+            f.write('foobar')
+        with self.assertLogs('xd.docker.versioncache', 'WARNING'):
+            self.assertIsNone(self.cache.get('foo'))
+        self.cache.set('foo', (1, 22))
+        self.assertEqual(self.cache.get('foo'), (1, 22))
+
+    def test_unwritable(self):
+        cache = VersionCache(os.path.join(self.dir, 'file', 'versions.json'))
+        open(os.path.join(self.dir, 'file'), 'w').close()
+        with self.assertLogs('xd.docker.versioncache', 'WARNING'):
+            cache.set('foo', (1, 22))
+        self.assertIsNone(cache.get('foo'))
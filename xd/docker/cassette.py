@@ -0,0 +1,423 @@
+"""Module containing record/replay transports for DockerClient.
+
+A RecordingTransport records requests and responses (including the timing
+of streamed response chunks) to a cassette file, which a ReplayTransport
+replays without a Docker daemon.  This allows benchmarking and testing
+client-side processing of realistic workloads (fx. build and pull output
+or large container lists) deterministically.
+"""
+
+import base64
+import collections
+import gzip
+import http.client
+import json
+import threading
+import time
+
+from typing import Optional, Dict, Iterator
+
+from xd.docker.transport import Transport, RequestsTransport
+from xd.docker.exceptions import CassetteError
+from xd.docker.observer import _observe_body
+from xd.docker.debug import redact_headers
+from xd.docker.stream import CHUNK_SIZE
+
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+__all__ = ['RecordingTransport', 'ReplayTransport', 'ReplayResponse']
+
+
+# Cassette file format version
+VERSION = 1
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _key(method, url, params):
+    # Key identifying a request, for matching replayed requests
+    params = {name: value for name, value in (params or {}).items()
+              if value is not None}
+    return '{} {} {}'.format(method, url,
+                             json.dumps(params, sort_keys=True, default=str))
+
+
+def _header_value(value):
+    if isinstance(value, bytes):
+        return value.decode('latin-1')
+    return str(value)
+
+
+class _Interaction(object):
+    # A recorded request and response
+
+    __slots__ = ('method', 'url', 'params', 'headers', 'request_bytes',
+                 'status_code', 'reason', 'response_headers', 'head_time',
+                 'chunks', 'start', 'done')
+
+    def __init__(self, method, url, params, headers):
+        self.method = method
+        self.url = url
+        self.params = params
+        self.headers = headers
+        self.request_bytes = None
+        self.status_code = None
+        self.reason = None
+        self.response_headers = None
+        self.head_time = None
+        self.chunks = []
+        self.start = time.monotonic()
+        self.done = False
+
+    def add_chunk(self, data):
+        self.chunks.append((time.monotonic() - self.start, bytes(data)))
+
+    def json(self):
+        params = {name: value for name, value in (self.params or {}).items()
+                  if value is not None}
+        headers = redact_headers(self.headers)
+        return json.dumps({
+            'method': self.method,
+            'url': self.url,
+            'params': params,
+            'headers': {name: _header_value(value)
+                        for name, value in (headers or {}).items()},
+            'request_bytes': self.request_bytes,
+            'status_code': self.status_code,
+            'reason': self.reason,
+            'response_headers': self.response_headers,
+            'head_time': round(self.head_time, 6),
+            'chunks': [[round(offset, 6),
+                        base64.b64encode(data).decode('ascii')]
+                       for offset, data in self.chunks],
+        }, separators=(',', ':'), default=str)
+
+
+class RecordingTransport(Transport):
+    """Transport recording requests and responses to a cassette file.
+
+    Requests are sent with another transport, and each request and its
+    response is appended to the cassette when the response has been read
+    (or closed).  Response bodies are recorded as the chunks read by the
+    client, with their time offsets from the start of the request.
+    Request bodies are not recorded, only their size.  Credentials in
+    request headers are redacted.
+
+    Hijacked connections (fx. `container_attach`) are not recorded.
+
+    The cassette is a JSON Lines file, gzip compressed if path ends with
+    '.gz'.
+
+    Arguments:
+      path: Path of cassette file to write.
+      transport: Transport to send requests with (default is
+        `xd.docker.transport.RequestsTransport`).
+
+    :Example:
+
+    >>> recorder = RecordingTransport('build.jsonl.gz')
+    >>> docker = DockerClient(transport=recorder)
+    >>> docker.image_build('context/')
+    >>> recorder.close()
+    """
+
+    def __init__(self, path: str, transport: Optional[Transport]=None):
+        super(RecordingTransport, self).__init__()
+        if transport is None:
+            transport = RequestsTransport()
+        self.transport = transport
+        self.path = path
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._file = _open(path, 'w')
+        self._file.write(json.dumps({'cassette': VERSION,
+                                     'created': time.time()}) + '\n')
+
+    def bind(self, base_url, sendfile=True):
+        super(RecordingTransport, self).bind(base_url, sendfile)
+        self.transport.bind(base_url, sendfile)
+
+    @property
+    def sendfile(self):
+        return self.transport.sendfile
+
+    @sendfile.setter
+    def sendfile(self, sendfile):
+        # Set on wrapped transport (once it is assigned in __init__)
+        transport = self.__dict__.get('transport')
+        if transport is not None:
+            transport.sendfile = sendfile
+
+    def send(self, method, url, params=None, headers=None, data=None,
+             stream=False, hijack=False, info=None, timeout=None):
+        if hijack:
+            return self.transport.send(method, url, params, headers, data,
+                                       stream, hijack, info, timeout)
+        interaction = _Interaction(method, url, params, headers)
+        data = _observe_body(data, interaction)
+        r = self.transport.send(method, url, params, headers, data, stream,
+                                hijack, info, timeout)
+        interaction.head_time = time.monotonic() - interaction.start
+        interaction.status_code = r.status_code
+        interaction.reason = getattr(r, 'reason', None)
+        interaction.response_headers = {
+            name: _header_value(value)
+            for name, value in getattr(r, 'headers', {}).items()}
+        if stream:
+            self._record_stream(r, interaction)
+        else:
+            content = r.content
+            if content:
+                interaction.add_chunk(content)
+            self._write(interaction)
+        return r
+
+    def _record_stream(self, r, interaction):
+        iter_content = r.iter_content
+
+        def recording_iter_content(*args, **kwargs):
+            try:
+                for chunk in iter_content(*args, **kwargs):
+                    interaction.add_chunk(chunk)
+                    yield chunk
+            finally:
+                self._write(interaction)
+
+        r.iter_content = recording_iter_content
+
+        readinto = getattr(r, 'readinto', None)
+        if readinto is not None:
+            def recording_readinto(buf):
+                size = readinto(buf)
+                if size:
+                    interaction.add_chunk(memoryview(buf)[:size])
+                else:
+                    self._write(interaction)
+                return size
+
+            r.readinto = recording_readinto
+
+        close = r.close
+
+        def recording_close():
+            close()
+            self._write(interaction)
+
+        r.close = recording_close
+
+    def _write(self, interaction):
+        with self._lock:
+            if interaction.done or self._file is None:
+                return
+            interaction.done = True
+            self._file.write(interaction.json() + '\n')
+            self.recorded += 1
+
+    def close(self) -> None:
+        """Close cassette file and wrapped transport."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        self.transport.close()
+
+
+class ReplayResponse(object):
+    """Response replayed from a cassette.
+
+    Provides the same subset of the `requests.Response` API as
+    `xd.docker.connection.Response`.  Body chunks are returned with their
+    recorded timing (scaled by time_scale).
+
+    Attributes:
+      status_code (int): HTTP status code.
+      reason (str): HTTP reason phrase.
+      headers: Response headers (case-insensitive mapping).
+    """
+
+    def __init__(self, status_code: int, reason: Optional[str],
+                 headers: Dict[str, str], chunks, start: float,
+                 time_scale: float=1.0):
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = http.client.HTTPMessage()
+        for name, value in headers.items():
+            self.headers[name] = value
+        self._chunks = collections.deque(chunks)
+        self._start = start
+        self._time_scale = time_scale
+        self._pending = memoryview(b'')
+        self._content = None
+
+    def _next_chunk(self):
+        if not self._chunks:
+            return None
+        offset, data = self._chunks.popleft()
+        if self._time_scale:
+            delay = self._start + offset * self._time_scale - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return data
+
+    def readinto(self, buf) -> int:
+        """Read response body into a pre-allocated buffer.
+
+        Returns:
+          Number of bytes read (0 at end of body).
+        """
+        if not self._pending:
+            data = self._next_chunk()
+            if data is None:
+                return 0
+            self._pending = memoryview(data)
+        size = min(len(buf), len(self._pending))
+        memoryview(buf)[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def iter_content(self, chunk_size: int=CHUNK_SIZE) -> Iterator[bytes]:
+        """Iterate over response body.
+
+        Arguments:
+          chunk_size: Maximum size of chunks.
+        """
+        if self._content is not None:
+            for i in range(0, len(self._content), chunk_size):
+                yield self._content[i:i + chunk_size]
+            return
+        if self._pending:
+            data, self._pending = bytes(self._pending), memoryview(b'')
+            for i in range(0, len(data), chunk_size):
+                yield data[i:i + chunk_size]
+        while True:
+            data = self._next_chunk()
+            if data is None:
+                return
+            for i in range(0, len(data), chunk_size):
+                yield data[i:i + chunk_size]
+
+    def iter_lines(self) -> Iterator[bytes]:
+        """Iterate over response body, one line at a time."""
+        pending = b''
+        for chunk in self.iter_content():
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line.rstrip(b'\r')
+        if pending:
+            yield pending
+
+    @property
+    def content(self) -> bytes:
+        if self._content is None:
+            self._content = b''.join(self.iter_content())
+        return self._content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.text)
+
+    def close(self):
+        self._chunks.clear()
+        self._pending = memoryview(b'')
+
+
+class ReplayTransport(Transport):
+    """Transport replaying responses from a cassette file.
+
+    Requests are matched with recorded requests on method, path and query
+    parameters.  Requests recorded more than once are replayed in recorded
+    order.  Request bodies are consumed (fx. iterators are read to the end)
+    like when sending them, but otherwise ignored.
+
+    Arguments:
+      path: Path of cassette file written by `RecordingTransport`.
+      time_scale: Factor to scale recorded timing with (fx. 0.5 to replay
+        at double speed).  With 0, responses are replayed without delay.
+      loop: Replay recorded responses again when all responses to a
+        request have been replayed (fx. for benchmarks).
+
+    Raises:
+      CassetteError: Invalid cassette file.
+
+    :Example:
+
+    >>> docker = DockerClient(transport=ReplayTransport('build.jsonl.gz',
+    ...                                                 time_scale=0))
+    >>> docker.image_build('context/')
+    """
+
+    def __init__(self, path: str, time_scale: float=1.0, loop: bool=False):
+        super(ReplayTransport, self).__init__()
+        self.path = path
+        self.time_scale = time_scale
+        self.loop = loop
+        self._lock = threading.Lock()
+        self._interactions = collections.defaultdict(collections.deque)
+        try:
+            with _open(path, 'r') as f:
+                header = json.loads(f.readline())
+                if header.get('cassette') != VERSION:
+                    raise CassetteError('unsupported cassette version: {}'
+                                        .format(header.get('cassette')))
+                for line in f:
+                    interaction = json.loads(line)
+                    key = _key(interaction['method'], interaction['url'],
+                               interaction['params'])
+                    self._interactions[key].append(interaction)
+        except (ValueError, KeyError, AttributeError, OSError) as e:
+            raise CassetteError('invalid cassette {}: {}'.format(path, e))
+
+    @property
+    def remaining(self) -> int:
+        """Number of recorded responses not yet replayed (without loop)."""
+        with self._lock:
+            return sum(len(q) for q in self._interactions.values())
+
+    def send(self, method, url, params=None, headers=None, data=None,
+             stream=False, hijack=False, info=None, timeout=None):
+        start = time.monotonic()
+        if hijack:
+            raise CassetteError('hijacked connections cannot be replayed')
+        key = _key(method, url, params)
+        with self._lock:
+            queue = self._interactions.get(key)
+            if not queue:
+                raise CassetteError('request not in cassette: {}'.format(key))
+            interaction = queue.popleft()
+            if self.loop:
+                queue.append(interaction)
+        self._consume(data)
+        chunks = [(offset, base64.b64decode(data))
+                  for offset, data in interaction['chunks']]
+        if self.time_scale:
+            delay = (start + interaction['head_time'] * self.time_scale -
+                     time.monotonic())
+            if delay > 0:
+                time.sleep(delay)
+        return ReplayResponse(interaction['status_code'],
+                              interaction.get('reason'),
+                              interaction['response_headers'], chunks,
+                              start, self.time_scale)
+
+    @staticmethod
+    def _consume(data):
+        if data is None or isinstance(data, (bytes, bytearray, str,
+                                             memoryview)):
+            return
+        if hasattr(data, 'read'):
+            while data.read(CHUNK_SIZE):
+                pass
+        else:
+            for _ in data:
+                pass
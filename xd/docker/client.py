@@ -2,34 +2,58 @@
 
 
 import urllib.parse
-import requests
-import requests_unixsocket
 import json
 import base64
+import threading
 import os
 import io
-import tarfile
 import re
+import time
+import contextlib
 import functools
 
-from typing import Optional, Union, Sequence, Dict, Tuple, List
+from typing import Optional, Union, Sequence, Dict, Tuple, List, Callable, \
+    BinaryIO, Iterable, Iterator, TYPE_CHECKING
 
-from xd.docker.container import Container
+from xd.docker.container import Container, PathStat
+from xd.docker.exec import Exec, ExecResult, _Tail
 from xd.docker.image import Image
 from xd.docker.parameters import ContainerConfig, HostConfig, ContainerName, \
-    Repository, RegistryAuthConfig, VolumeMount, Signal, json_update
+    Repository, RegistryAuthConfig, VolumeMount, Signal, ApiVersion, \
+    json_update
 from xd.docker.exceptions import IncompatibleRemoteAPI, PermissionDenied
+from xd.docker.stream import CHUNK_SIZE, IterStream, iter_chunks, \
+    gzip_chunks, progress_chunks, demux_frames, raw_frames, STDOUT, STDERR
+from xd.docker.connection import HijackedSocket
+from xd.docker.transport import Transport, RequestsTransport, TRANSPORTS, \
+    Timeout, parse_timeout
+from xd.docker.versioncache import VersionCache, daemon_key, \
+    parse_api_version
+from xd.docker.limiter import ConcurrencyLimiter, WAITING_ENDPOINTS
+from xd.docker.retry import RetryPolicy
+if TYPE_CHECKING:
+    # Imported on use (see DockerClient.__init__)
+    from xd.docker.stats import Stats
+    from xd.docker.metrics import MetricsRegistry
+    from xd.docker.tracing import SpanExporter
+    from xd.docker.debug import SlowCallDetector
+    from xd.docker.health import CircuitBreaker
+    from xd.docker.scheduler import PriorityScheduler
+from xd.docker.observer import Observer, RequestInfo, _operation, \
+    _bind_operation, _phase, _phase_chunks, _observe_body, _observe_response
 
 import logging
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
 
-requests_unixsocket.monkeypatch()
-
 
 __all__ = ['DockerClient', 'HTTPError', 'ClientError', 'ServerError']
 
 
+# Marker for options not set
+_UNSET = object()
+
+
 class HTTPError(Exception):
     def __init__(self, url, code):
         self.url = url
@@ -46,6 +70,37 @@ class ServerError(HTTPError):
         super(ServerError, self).__init__(url, code)
 
 
+class _StaleApiVersion(ClientError):
+    # Request rejected, as the cached API version is not supported by the
+    # daemon
+    pass
+
+
+class _ResponseChunks(object):
+    # Iterator of chunks read from streamed response, closing the response
+    # when closed or garbage collected, also if iteration was never started
+    # (where the finally clause of a generator would not run)
+
+    def __init__(self, chunks, r):
+        self._chunks = chunks
+        self._r = r
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def close(self):
+        r, self._r = self._r, None
+        if r is not None:
+            self._chunks.close()
+            r.close()
+
+    def __del__(self):
+        self.close()
+
+
 class DockerClient(object):
     """Docker client.
 
@@ -54,6 +109,71 @@ class DockerClient(object):
 
     Arguments:
       host: URL to Docker daemon socket to connect to.
+      sendfile: Send request bodies from regular files (fx. tar archives
+        given to `container_upload` or `image_build`) directly on the socket
+        using the sendfile(2) system call.
+      observers: Request observers (see `xd.docker.observer.Observer`).
+      metrics: Record operation and request metrics, in the given registry
+        or (if True) in a new registry.  The registry is available as the
+        `metrics` attribute (see `xd.docker.metrics.MetricsObserver`).
+      tracing: Record tracing spans of operations, requests and local
+        phases, exporting them to the given exporter (see
+        `xd.docker.tracing.TracingObserver`).
+      transport: Transport to send requests with, or name of transport
+        ('requests' or 'socket', see `xd.docker.transport.TRANSPORTS`).
+        Default is `xd.docker.transport.RequestsTransport`.
+      api_version: Docker Remote API version to use (fx. '1.22').  If not
+        given, the version is negotiated with Docker daemon on first use.
+        Requests are sent to the endpoints of this version (prefixed with
+        /vX.Y), so a version older than the daemon's can be given to test
+        compatibility with older daemons.
+      version_cache: Cache negotiated API version on disk, in the given
+        cache, file or (if True) default cache file (see
+        `xd.docker.versioncache.VersionCache`).  A cached version rejected
+        by the daemon as too new (fx. after a downgrade) is negotiated
+        again, and the request is resent.
+      limiter: Limit the number of concurrent requests to Docker daemon,
+        with the given limiter or (if True) a new limiter with separate
+        adaptive limits for heavy and light requests.  The limiter is
+        available as the `limiter` attribute (see
+        `xd.docker.limiter.ConcurrencyLimiter`).
+      scheduler: Schedule requests by priority class, with the given
+        scheduler or (if True) a new scheduler recording metrics in the
+        metrics registry (if enabled).  The scheduler is available as the
+        `scheduler` attribute (see `xd.docker.scheduler.PriorityScheduler`).
+      timeout: Timeout of requests in seconds, either for both connecting
+        and reading, or as a (connect, read) tuple.  The read timeout is
+        the maximum time to wait for the response head and for each read
+        of the response body.  Requests waiting for containers (fx.
+        `container_wait` and `container_stop`, and attaching to
+        containers) only get the connect timeout.  Default is no timeout.
+        Can be overridden for some calls with `options`.
+      retry: Retry failed idempotent requests, with the given policy or (if
+        True) a new policy with default settings (see
+        `xd.docker.retry.RetryPolicy`).  Can be overridden for some calls
+        with `options`.
+      breaker: Track health of Docker host, and fail fast while it is
+        unhealthy, with the given circuit breaker or (if True) a new
+        circuit breaker recording metrics in the metrics registry (if
+        enabled).  The breaker is available as the `breaker` attribute (see
+        `xd.docker.health.CircuitBreaker`).
+
+    A DockerClient is thread-safe, and a single instance can be shared by
+    many threads (fx. the workers of a ThreadPoolExecutor):
+
+    * All methods can be called concurrently.  Each call uses its own
+      connection (from the transport's pool of idle connections, see
+      `xd.docker.transport.SocketTransport`), and streamed responses and
+      hijacked connections belong to the calling thread.
+    * The API version is negotiated at most once, also when the first
+      calls are concurrent.  Reading the negotiated version (and the
+      registered observers) does not take any locks.
+    * Observers can be added and removed, and debug mode enabled and
+      disabled, while other threads are calling the client.  Calls in
+      progress use the observers registered when they started.
+    * Observers, metrics registries, tracing exporters and transports
+      shipped with xd-docker are thread-safe.  Custom observers and
+      transports are called concurrently, and must be thread-safe too.
 
     :Example:
 
@@ -66,7 +186,18 @@ class DockerClient(object):
     >>> docker = DockerClient('unix:///var/run/docker.sock')
     """
 
-    def __init__(self, host: Optional[str]=None):
+    def __init__(self, host: Optional[str]=None, sendfile: bool=True,
+                 observers: Iterable[Observer]=(),
+                 metrics: Union[bool, 'MetricsRegistry']=False,
+                 tracing: Optional['SpanExporter']=None,
+                 transport: Optional[Union[Transport, str]]=None,
+                 api_version: Optional[Union[ApiVersion, str]]=None,
+                 version_cache: Union[bool, str, VersionCache]=False,
+                 limiter: Union[bool, ConcurrencyLimiter]=False,
+                 scheduler: Union[bool, 'PriorityScheduler']=False,
+                 timeout: Optional[Timeout]=None,
+                 retry: Union[bool, RetryPolicy, None]=None,
+                 breaker: Union[bool, 'CircuitBreaker']=False):
         if host is None:
             host = os.environ.get('DOCKER_HOST', 'unix:///var/run/docker.sock')
         if host.startswith('unix://'):
@@ -76,6 +207,72 @@ class DockerClient(object):
         else:
             raise ValueError('Invalid host value: {}'.format(host))
         self.base_url = host
+        if transport is None:
+            transport = RequestsTransport()
+        elif isinstance(transport, str):
+            try:
+                transport = TRANSPORTS[transport]()
+            except KeyError:
+                raise ValueError('Invalid transport value: {}'.format(
+                    transport))
+        transport.bind(host, sendfile)
+        self.transport = transport
+        self._api_version = None
+        self._api_version_source = None
+        self._api_version_lock = threading.Lock()
+        if api_version is not None:
+            self._api_version = parse_api_version(api_version)
+            self._api_version_source = 'explicit'
+        if version_cache is True:
+            version_cache = VersionCache()
+        elif isinstance(version_cache, str):
+            version_cache = VersionCache(version_cache)
+        self.version_cache = version_cache or None
+        # Observers are replaced (never modified in place) under _lock, so
+        # they can be read without locking
+        self._lock = threading.RLock()
+        self._observers = tuple(observers)
+        # Modules of optional observers are imported only when enabled, to
+        # keep import of this module fast
+        self.metrics = None
+        if metrics:
+            from xd.docker.metrics import MetricsRegistry, MetricsObserver
+            if metrics is True:
+                metrics = MetricsRegistry()
+            self.metrics = metrics
+            self.add_observer(MetricsObserver(metrics))
+        if tracing is not None:
+            from xd.docker.tracing import TracingObserver
+            self.add_observer(TracingObserver(tracing))
+        self.scheduler = None
+        if scheduler:
+            if scheduler is True:
+                from xd.docker.scheduler import PriorityScheduler
+                scheduler = PriorityScheduler(metrics=self.metrics)
+            self.scheduler = scheduler
+            self.add_observer(scheduler)
+        self.limiter = None
+        if limiter:
+            if limiter is True:
+                limiter = ConcurrencyLimiter()
+            self.limiter = limiter
+            self.add_observer(limiter)
+        self.breaker = None
+        if breaker:
+            if breaker is True:
+                from xd.docker.health import CircuitBreaker
+                breaker = CircuitBreaker()
+            breaker.bind(self)
+            self.breaker = breaker
+            self.add_observer(breaker)
+        self.slow_calls = None
+        self.profiler = None
+        self.timeout = parse_timeout(timeout)
+        if retry is True:
+            retry = RetryPolicy()
+        self.retry = retry or None
+        # Options set with options() for the current thread
+        self._local = threading.local()
 
     @staticmethod
     def _check_http_status_code(url, status_code):
@@ -114,32 +311,329 @@ class DockerClient(object):
             else:
                 return True
 
-    def _get(self, url, params=None, headers=None, stream=False):
-        url = self.base_url + url
-        r = requests.get(url, params=params, headers=headers, stream=stream)
-        self._check_http_status_code(url, r.status_code)
-        return r
+    @property
+    def sendfile(self) -> bool:
+        """Send request bodies from regular files using sendfile(2)."""
+        return self.transport.sendfile
 
-    def _post(self, url, params=None, headers=None, data=None, stream=False):
-        url = self.base_url + url
-        r = requests.post(url, params=params, headers=headers, data=data,
-                          stream=stream)
-        self._check_http_status_code(url, r.status_code)
-        return r
+    @sendfile.setter
+    def sendfile(self, sendfile: bool) -> None:
+        self.transport.sendfile = sendfile
 
-    def _put(self, url, params=None, headers=None, data=None, stream=False):
-        url = self.base_url + url
-        r = requests.put(url, params=params, headers=headers, data=data,
-                         stream=stream)
-        self._check_http_status_code(url, r.status_code)
-        return r
+    def close(self) -> None:
+        """Close transport, releasing connections held by it."""
+        if self.breaker is not None:
+            self.breaker.close()
+        self.transport.close()
+
+    def add_observer(self, observer: Observer) -> None:
+        """Register a request observer.
+
+        Arguments:
+          observer: Observer instance, called around every request.
+        """
+        with self._lock:
+            self._observers = self._observers + (observer,)
+
+    def remove_observer(self, observer: Observer) -> None:
+        """Unregister a request observer.
+
+        Arguments:
+          observer: Observer instance to remove.
+        """
+        with self._lock:
+            self._observers = tuple(o for o in self._observers
+                                    if o is not observer)
+
+    def enable_debug(self, threshold: float=1.0,
+                     profile: Optional[str]=None,
+                     sample_rate: float=0.01) -> 'SlowCallDetector':
+        """Enable debug mode.
+
+        Calls slower than threshold are recorded in the `slow_calls`
+        detector.  Optionally, a sampled fraction of operations is profiled
+        by the `profiler`.  Debug mode can be enabled (and disabled) on a
+        running client.
+
+        Arguments:
+          threshold: Slow call threshold in seconds.
+          profile: Profiler mode ('cprofile' or 'tracemalloc'), or None to
+            not profile.
+          sample_rate: Fraction of operations to profile.
+
+        Returns:
+          Slow call detector (see `xd.docker.debug.SlowCallDetector`).
+
+        :Example:
+
+        >>> slow = docker.enable_debug(threshold=0.5, profile='cprofile')
+        >>> print(slow.report())
+        >>> print(docker.profiler.report())
+        """
+        from xd.docker.debug import SlowCallDetector, Profiler
+        profiler = None
+        if profile is not None:
+            profiler = Profiler(profile, sample_rate)
+        slow_calls = SlowCallDetector(threshold)
+        with self._lock:
+            self.disable_debug()
+            self.slow_calls = slow_calls
+            self.add_observer(slow_calls)
+            if profiler is not None:
+                self.profiler = profiler
+                self.add_observer(profiler)
+        return slow_calls
+
+    def disable_debug(self) -> None:
+        """Disable debug mode.
+
+        The slow call detector and profiler are kept in the `slow_calls`
+        and `profiler` attributes until debug mode is enabled again.
+        """
+        with self._lock:
+            for observer in (self.slow_calls, self.profiler):
+                if observer is not None:
+                    self.remove_observer(observer)
+            if self.profiler is not None:
+                self.profiler.close()
+
+    @contextlib.contextmanager
+    def options(self, timeout: Optional[Timeout]=_UNSET,
+                retry: Union[bool, RetryPolicy, None]=_UNSET) \
+            -> Iterator[None]:
+        """Context manager overriding request options.
+
+        Calls made by the current thread while the block runs use the given
+        options instead of those given to DockerClient.  Options not given
+        are not changed.
+
+        Arguments:
+          timeout: Timeout of requests (None for no timeout, see
+            DockerClient).
+          retry: Retry policy (None or False to not retry, see
+            DockerClient).
 
-    def _delete(self, url, params=None, stream=False):
-        url = self.base_url + url
-        r = requests.delete(url, params=params, stream=stream)
-        self._check_http_status_code(url, r.status_code)
+        :Example:
+
+        >>> with docker.options(timeout=(1.0, 5.0), retry=False):
+        ...     docker.container_inspect('web1')
+        """
+        saved = {name: getattr(self._local, name, _UNSET)
+                 for name in ('timeout', 'retry')}
+        if timeout is not _UNSET:
+            self._local.timeout = parse_timeout(timeout)
+        if retry is not _UNSET:
+            if retry is True:
+                retry = RetryPolicy()
+            self._local.retry = retry or None
+        try:
+            yield
+        finally:
+            for name, value in saved.items():
+                if value is _UNSET:
+                    self._local.__dict__.pop(name, None)
+                else:
+                    setattr(self._local, name, value)
+
+    def _bind_options(self, func):
+        # Bind func to the options of the current thread, so requests made
+        # by func when called on another thread use them.
+        options = dict(self._local.__dict__)
+        if not options:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            saved = dict(self._local.__dict__)
+            self._local.__dict__.update(options)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.__dict__.clear()
+                self._local.__dict__.update(saved)
+
+        return wrapper
+
+    def _notify(self, event, info, observers=None):
+        if observers is None:
+            observers = self._observers
+        for observer in observers:
+            handler = getattr(observer, event, None)
+            if handler is None:
+                continue
+            try:
+                handler(info)
+            except Exception:
+                log.exception('Observer %r failed', observer)
+
+    # Endpoints requested without API version prefix (/version is used for
+    # negotiating the API version)
+    UNVERSIONED_ENDPOINTS = frozenset(('/version', '/_ping'))
+
+    # Error message of daemon rejecting a request for a too new API version
+    API_VERSION_TOO_NEW = re.compile(
+        rb'client version \S+ is too new|client is newer than server')
+
+    def _url(self, endpoint, path=None):
+        # Get request path of endpoint (a template, with fields given in
+        # path), prefixed with the API version
+        url = endpoint.format(**path) if path else endpoint
+        if endpoint not in self.UNVERSIONED_ENDPOINTS:
+            url = '/v{}.{}'.format(*self.api_version) + url
+        return url
+
+    def _timeout(self, method, endpoint):
+        # Get (connect, read) timeout of request (or None), as set with
+        # options() or given to DockerClient
+        timeout = getattr(self._local, 'timeout', _UNSET)
+        if timeout is _UNSET:
+            timeout = self.timeout
+        if timeout is not None and (method, endpoint) in WAITING_ENDPOINTS:
+            timeout = (timeout[0], None)
+        return timeout
+
+    def _request(self, method, endpoint, params=None, headers=None,
+                 data=None, stream=False, hijack=False, **path):
+        # Send request to endpoint (a template, with fields given in path),
+        # and check response status.  With hijack, the connection is
+        # returned as a HijackedSocket.
+        url = self._url(endpoint, path)
+        timeout = self._timeout(method, endpoint)
+        try:
+            return self._send_attempts(method, endpoint, url, path, params,
+                                       headers, data, stream, hijack,
+                                       timeout)
+        except _StaleApiVersion:
+            # The cached API version is newer than the daemon supports (fx.
+            # a downgraded daemon behind an unchanged URL), so the request
+            # was rejected before it was acted on.  Negotiate again, and
+            # resend once (if the body can be sent again).
+            if not (data is None or isinstance(
+                    data, (bytes, bytearray, memoryview, str))):
+                self.refresh_api_version()
+                raise
+            log.info('Cached API version %s.%s not supported by %s, '
+                     'negotiating', *self.api_version, self.base_url)
+            self.refresh_api_version()
+        url = self._url(endpoint, path)
+        return self._send_attempts(method, endpoint, url, path, params,
+                                   headers, data, stream, hijack, timeout)
+
+    def _send_attempts(self, method, endpoint, url, path, params, headers,
+                       data, stream, hijack, timeout):
+        # Send request, retrying failed attempts as allowed by the retry
+        # policy
+        retry = getattr(self._local, 'retry', _UNSET)
+        if retry is _UNSET:
+            retry = self.retry
+        if retry is None or hijack or \
+                not retry.retryable(method, endpoint, data):
+            return self._send_request(method, endpoint, url, path, params,
+                                      headers, data, stream, hijack,
+                                      timeout)
+        retry.budget.deposit()
+        attempt = 1
+        accept = ()
+        while True:
+            try:
+                return self._send_request(method, endpoint, url, path,
+                                          params, headers, data, stream,
+                                          hijack, timeout, attempt, accept)
+            except Exception as e:
+                if not retry.should_retry(e, attempt):
+                    raise
+                delay = retry.delay(attempt)
+                log.debug('Retrying %s %s in %.3f seconds (attempt %d: %r)',
+                          method, url, delay, attempt, e)
+            time.sleep(delay)
+            attempt += 1
+            accept = retry.done_status_codes(method, endpoint)
+
+    def _send_request(self, method, endpoint, url, path, params, headers,
+                      data, stream, hijack, timeout, attempt=1, accept=()):
+        # Send a single request (attempt), notifying observers
+        if self.breaker is not None:
+            self.breaker.admit()
+        observers = self._observers
+        if not observers:
+            r = self.transport.send(method, url, params, headers, data,
+                                    stream, hijack, timeout=timeout)
+            self._check_response(r, url, accept)
+            return r
+
+        def notify(event, info):
+            self._notify(event, info, observers)
+        info = RequestInfo(method, endpoint, url, path, params, stream,
+                           headers)
+        info.attempt = attempt
+        data = _observe_body(data, info)
+        notify('request_start', info)
+        try:
+            r = self.transport.send(method, url, params, headers, data,
+                                    stream, hijack, info, timeout)
+            info.first_byte_time = info.elapsed()
+            info.status_code = r.status_code
+            self._check_response(r, url, accept)
+        except Exception as e:
+            info.exception = e
+            info.total_time = info.elapsed()
+            notify('request_end', info)
+            raise
+        if stream and not hijack:
+            _observe_response(r, info, notify)
+        else:
+            content = getattr(r, 'content', None)
+            if isinstance(content, (bytes, bytearray)):
+                info.response_bytes = len(content)
+            info.total_time = info.elapsed()
+            notify('request_end', info)
         return r
 
+    def _check_response(self, r, url, accept=()):
+        # Raise HTTPError for error status codes (other than those in
+        # accept)
+        if r.status_code == 101 or r.status_code in accept:
+            # Switching protocols (hijacked connection), or accepted
+            return
+        try:
+            self._check_http_status_code(self.base_url + url, r.status_code)
+        except HTTPError:
+            # The body of hijacked connections is not read
+            stale = r.status_code == 400 and \
+                self._api_version_source == 'cache' and \
+                not isinstance(r, HijackedSocket) and \
+                self.API_VERSION_TOO_NEW.search(r.content or b'') is not None
+            r.close()
+            if stale:
+                raise _StaleApiVersion(self.base_url + url, r.status_code)
+            raise
+
+    def _get(self, endpoint, params=None, headers=None, stream=False,
+             **path):
+        return self._request('GET', endpoint, params=params,
+                             headers=headers, stream=stream, **path)
+
+    def _head(self, endpoint, params=None, headers=None, **path):
+        return self._request('HEAD', endpoint, params=params,
+                             headers=headers, **path)
+
+    def _post(self, endpoint, params=None, headers=None, data=None,
+              stream=False, **path):
+        return self._request('POST', endpoint, params=params,
+                             headers=headers, data=data, stream=stream,
+                             **path)
+
+    def _put(self, endpoint, params=None, headers=None, data=None,
+             stream=False, **path):
+        return self._request('PUT', endpoint, params=params,
+                             headers=headers, data=data, stream=stream,
+                             **path)
+
+    def _delete(self, endpoint, params=None, stream=False, **path):
+        return self._request('DELETE', endpoint, params=params,
+                             stream=stream, **path)
+
+    @_operation
     def version(self) -> Tuple[int, int]:
         """Get Docker Remote API version.
 
@@ -153,11 +647,75 @@ class DockerClient(object):
         return r.json()
 
     @property
-    @functools.lru_cache(maxsize=1)
-    def api_version(self):
-        version = self.version()
-        return tuple([int(i) for i in version['ApiVersion'].split('.')])
+    def api_version(self) -> ApiVersion:
+        """Docker Remote API version used.
+
+        Unless given when creating the client (or set), the version is
+        taken from the version cache (if enabled), or negotiated with
+        Docker daemon on first use.  Negotiation is done only once, also
+        when the client is used by several threads concurrently.
+
+        Requests are sent to the endpoints of this API version (fx.
+        /v1.22/containers/json).  It can be set to a version older than the
+        daemon's, fx. for testing compatibility.
+        """
+        api_version = self._api_version
+        if api_version is None:
+            api_version = self._negotiate_api_version()
+        return api_version
+
+    @api_version.setter
+    def api_version(self, api_version: Union[ApiVersion, str]) -> None:
+        api_version = parse_api_version(api_version)
+        with self._api_version_lock:
+            self._api_version_source = 'explicit'
+            self._api_version = api_version
+
+    def _negotiate_api_version(self, refresh=False):
+        with self._api_version_lock:
+            if not refresh and self._api_version is not None:
+                # Negotiated by another thread while waiting for lock
+                return self._api_version
+            key = None
+            if self.version_cache is not None:
+                key = daemon_key(self.base_url)
+                if key is not None and not refresh:
+                    api_version = self.version_cache.get(key)
+                    if api_version is not None:
+                        self._api_version_source = 'cache'
+                        self._api_version = api_version
+                        return api_version
+            version = self.version()
+            api_version = parse_api_version(version['ApiVersion'])
+            if key is not None:
+                self.version_cache.set(key, api_version, version)
+            self._api_version_source = 'daemon'
+            self._api_version = api_version
+            return api_version
+
+    def refresh_api_version(self) -> ApiVersion:
+        """Negotiate Docker Remote API version with Docker daemon.
+
+        The version cache (if enabled) is bypassed, and updated with the
+        negotiated version.
+
+        Returns:
+          Negotiated API version.
+        """
+        return self._negotiate_api_version(refresh=True)
+
+    def _require_api_version(self, min_version, message):
+        # Raise IncompatibleRemoteAPI if API version is older than
+        # min_version.  A cached version might be stale (fx. if daemon was
+        # upgraded), so it is refreshed before giving up.
+        if self.api_version >= min_version:
+            return
+        if self._api_version_source == 'cache':
+            if self.refresh_api_version() >= min_version:
+                return
+        raise IncompatibleRemoteAPI(message)
 
+    @_operation
     def ping(self) -> None:
         """Ping the docker server.
 
@@ -166,6 +724,7 @@ class DockerClient(object):
         """
         self._get('/_ping')
 
+    @_operation
     def containers(self, only_running: bool = True) -> List[Container]:
         """Get list of containers.
 
@@ -187,6 +746,7 @@ class DockerClient(object):
         r = self._get('/containers/json', params=params)
         return [Container(self, list_response=c) for c in r.json()]
 
+    @_operation
     def images(self) -> List[Image]:
         """Get list of images.
 
@@ -203,10 +763,12 @@ class DockerClient(object):
         r = self._get('/images/json')
         return [Image(self, list_response=image) for image in r.json()]
 
+    @_operation
     def image_inspect_raw(self, name: str) -> Dict:
-        r = self._get('/images/{}/json'.format(name))
+        r = self._get('/images/{name}/json', name=name)
         return r.json()
 
+    @_operation
     def image_inspect(self, name: str) -> Image:
         """Get image with low-level information.
 
@@ -218,7 +780,8 @@ class DockerClient(object):
         """
         return Image(self, inspect_response=self.image_inspect_raw(name))
 
-    def image_build(self, context: str,
+    @_operation
+    def image_build(self, context: Union[str, BinaryIO],
                     output=('error', 'stream', 'status'),
                     dockerfile: Optional[str]=None,
                     tag: Optional[Union[Repository, str]]=None,
@@ -234,8 +797,9 @@ class DockerClient(object):
         Build image from a given context or stand-alone Dockerfile.
 
         Arguments:
-          context: path to directory containing build context, or path to a
-            stand-alone Dockerfile.
+          context: path to directory containing build context, path to a
+            stand-alone Dockerfile, or binary file object with a tar archive
+            of the build context.
           output: tuple/list of with type of output information to allow
             (Default: ('stream', 'status', 'error')).
           dockerfile: path to dockerfile in build context.
@@ -271,16 +835,24 @@ class DockerClient(object):
             headers['X-Registry-Config'] = base64.b64encode(registry_config)
 
         # Request body
-        if not os.path.exists(context):
-            raise ValueError('context argument does not exist: %s' % (context))
-        tar_buf = io.BytesIO()
-        tar = tarfile.TarFile(fileobj=tar_buf, mode='w', dereference=True)
-        if os.path.isfile(context):
-            tar.add(context, 'Dockerfile')
+        if hasattr(context, 'read'):
+            data = context
         else:
-            for f in os.listdir(context):
-                tar.add(os.path.join(context, f), f)
-        tar.close()
+            if not os.path.exists(context):
+                raise ValueError(
+                    'context argument does not exist: %s' % (context))
+            import tarfile
+            with _phase(self, 'tar'):
+                tar_buf = io.BytesIO()
+                tar = tarfile.TarFile(fileobj=tar_buf, mode='w',
+                                      dereference=True)
+                if os.path.isfile(context):
+                    tar.add(context, 'Dockerfile')
+                else:
+                    for f in os.listdir(context):
+                        tar.add(os.path.join(context, f), f)
+                tar.close()
+                data = tar_buf.getvalue()
 
         # Query parameters
         query_params = {}
@@ -310,16 +882,21 @@ class DockerClient(object):
             json_update(query_params, host_config, host_config_fields,
                         self.api_version)
 
-        r = self._post('/build', headers=headers, data=tar_buf.getvalue(),
+        r = self._post('/build', headers=headers, data=data,
                        params=query_params, stream=True)
-        false_or_last_line = self._process_response_output(
-            r, output, last_line=True)
+        try:
+            with _phase(self, 'decode'):
+                false_or_last_line = self._process_response_output(
+                    r, output, last_line=True)
+        finally:
+            r.close()
         if false_or_last_line is False:
             return None
         id_match = re.match('Successfully built ([0-9a-f]+)',
                             false_or_last_line['stream'])
         return id_match.group(1)
 
+    @_operation
     def image_pull(self, name, registry_auth=None,
                    output=('error', 'stream', 'status')):
         """Pull image.
@@ -341,8 +918,13 @@ class DockerClient(object):
             headers['X-Registry-Auth'] = base64.b64encode(registry_auth)
         r = self._post('/images/create', headers=headers, params=params,
                        stream=True)
-        return self._process_response_output(r, output)
+        try:
+            with _phase(self, 'decode'):
+                return self._process_response_output(r, output)
+        finally:
+            r.close()
 
+    @_operation
     def image_remove(self, name):
         """Remove an image.
 
@@ -351,9 +933,10 @@ class DockerClient(object):
         Arguments:
           name: name of the image to remove.
         """
-        r = self._delete('/images/{}'.format(name))
+        r = self._delete('/images/{name}', name=name)
         return r.json()
 
+    @_operation
     def image_tag(self, image,
                   tag: Optional[Union[Repository, str]]=None,
                   force: Optional[bool]=None):
@@ -378,8 +961,122 @@ class DockerClient(object):
             json_update(params, {'force': force},
                         (('force', 'force', (None, (1, 23))),),
                         self.api_version)
-        self._post('/images/{}/tag'.format(image), params=params)
+        self._post('/images/{name}/tag', params=params, name=image)
+
+    @staticmethod
+    def _iter_content(r, chunk_size=CHUNK_SIZE):
+        try:
+            for chunk in r.iter_content(chunk_size):
+                yield chunk
+        finally:
+            r.close()
+
+    @_operation
+    def image_save(self, names: Union[str, Sequence[str]],
+                   fileobj: Optional[Union[str, BinaryIO]]=None,
+                   compress: bool=False,
+                   progress: Optional[Callable[[int], None]]=None,
+                   chunk_size: int=CHUNK_SIZE) -> Optional[Iterator[bytes]]:
+        """Save images to tar archive.
+
+        Get a tar archive with one or more images (and their parent layers)
+        in the format used by `docker save`.  The archive is streamed from
+        Docker daemon and is never held in memory as a whole.
+
+        Arguments:
+          names: name(s) of image(s) to save.
+          fileobj: path or binary file object to write tar archive to.  If
+            not given, an iterator of tar archive chunks is returned.
+          compress: gzip compress tar archive.
+          progress: function called with the number of bytes received from
+            Docker daemon so far, after each chunk.
+          chunk_size: maximum size of chunks read from Docker daemon.
+
+        Raises:
+          ClientError: Image does not exist.
+          ServerError: Server error.
+
+        Returns:
+          Iterator of tar archive chunks, if fileobj is not given.  The
+          response is closed when the iterator is exhausted, closed or
+          garbage collected.
+        """
+
+        # Handle convenience argument types
+        if isinstance(names, str):
+            names = [names]
+
+        r = self._get('/images/get', params={'names': names}, stream=True)
+        chunks = self._iter_content(r, chunk_size)
+        if progress:
+            chunks = progress_chunks(chunks, progress)
+        if compress:
+            chunks = _phase_chunks(self, 'compress', gzip_chunks(chunks))
+        if fileobj is None:
+            return _ResponseChunks(chunks, r)
+        if isinstance(fileobj, str):
+            with open(fileobj, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        else:
+            for chunk in chunks:
+                fileobj.write(chunk)
+
+    @_operation
+    def image_load(self, source: Union[str, BinaryIO, Iterable[bytes]],
+                   compress: bool=False,
+                   progress: Optional[Callable[[int], None]]=None,
+                   output=('error', 'stream', 'status'),
+                   chunk_size: int=CHUNK_SIZE):
+        """Load images from tar archive.
 
+        Load a tar archive in the format created by `docker save` (or
+        `image_save`), optionally compressed.  The archive is streamed to
+        Docker daemon and is never held in memory as a whole.
+
+        Arguments:
+          source: path, binary file object or iterator of bytes with tar
+            archive.
+          compress: gzip compress tar archive before sending it.
+          progress: function called with the number of bytes read from
+            source so far, after each chunk.
+          output: tuple/list of with type of output information to allow
+            (Default: ('stream', 'status', 'error')).
+          chunk_size: maximum size of chunks read from source.
+
+        Returns:
+          True if images were loaded, False on error.
+        """
+
+        # Handle convenience argument types
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                return self.image_load(f, compress=compress,
+                                       progress=progress, output=output,
+                                       chunk_size=chunk_size)
+
+        headers = {'content-type': 'application/x-tar'}
+        if hasattr(source, 'read'):
+            if not (compress or progress):
+                data = source
+            else:
+                data = iter_chunks(source, chunk_size)
+        else:
+            data = iter(source)
+        if progress:
+            data = progress_chunks(data, progress)
+        if compress:
+            data = _phase_chunks(self, 'compress', gzip_chunks(data))
+
+        r = self._post('/images/load', headers=headers, data=data,
+                       stream=True)
+        try:
+            with _phase(self, 'decode'):
+                return self._process_response_output(r, output)
+        finally:
+            r.close()
+
+    @_operation
     def container_create(
             self,
             config: ContainerConfig,
@@ -436,6 +1133,7 @@ class DockerClient(object):
         response_json = response.json()
         return Container(self, id=response_json['Id'])
 
+    @_operation
     def container_remove(self, container: Union[Container, ContainerName, str],
                          force: Optional[bool]=None,
                          volumes: Optional[bool]=None):
@@ -463,9 +1161,10 @@ class DockerClient(object):
         if volumes is not None:
             query_params['v'] = volumes
 
-        self._delete('/containers/' + id_or_name, params=query_params)
+        self._delete('/containers/{id}', params=query_params, id=id_or_name)
         return
 
+    @_operation
     def container_start(self, container: Union[Container, ContainerName, str]):
         """Start a container.
 
@@ -486,13 +1185,14 @@ class DockerClient(object):
             id_or_name = container.id or container.name
 
         try:
-            self._post('/containers/{}/start'.format(id_or_name))
+            self._post('/containers/{id}/start', id=id_or_name)
         except HTTPError as e:
             if e.code == 304:
                 return False
             raise e
         return True
 
+    @_operation
     def container_wait(self,
                        container: Union[Container, ContainerName, str]) -> int:
         """Block until container stops.
@@ -514,9 +1214,10 @@ class DockerClient(object):
         else:
             id_or_name = container.id or container.name
 
-        r = self._post('/containers/{}/wait'.format(id_or_name))
+        r = self._post('/containers/{id}/wait', id=id_or_name)
         return r.json()['StatusCode']
 
+    @_operation
     def container_stop(self, container: Union[Container, ContainerName, str],
                        timeout: Optional[int]=None):
         """Stop container.
@@ -546,13 +1247,15 @@ class DockerClient(object):
             params['t'] = timeout
 
         try:
-            self._post('/containers/{}/stop'.format(id_or_name), params=params)
+            self._post('/containers/{id}/stop', params=params,
+                       id=id_or_name)
         except HTTPError as e:
             if e.code == 304:
                 return False
             raise e
         return True
 
+    @_operation
     def container_restart(self,
                           container: Union[Container, ContainerName, str],
                           timeout: Optional[int]=None):
@@ -578,9 +1281,9 @@ class DockerClient(object):
         if timeout is not None:
             params['t'] = timeout
 
-        self._post('/containers/{}/restart'.format(id_or_name),
-                   params=params)
+        self._post('/containers/{id}/restart', params=params, id=id_or_name)
 
+    @_operation
     def container_kill(self,
                        container: Union[Container, ContainerName, str],
                        signal: Optional[Signal]=None):
@@ -609,17 +1312,35 @@ class DockerClient(object):
         if signal is not None:
             params['signal'] = signal
 
-        self._post('/containers/{}/kill'.format(id_or_name), params=params)
+        self._post('/containers/{id}/kill', params=params, id=id_or_name)
 
+    @_operation
     def container_upload(self,
                          container: Union[Container, ContainerName, str],
-                         tar_archive: tarfile.TarFile,
+                         tar_archive: Union[bytes, BinaryIO],
                          directory: str,
                          overwrite_dir_non_dir: Optional[bool]=None):
+        """Upload tar archive to container.
 
-        if self.api_version < (1, 20):
-            raise IncompatibleRemoteAPI(
-                "Upload to container was added in API v1.20 (Docker v1.8)")
+        Upload a tar archive and extract it to a directory in the container's
+        filesystem.  When tar_archive is a file object backed by a regular
+        file, it is sent using sendfile(2) (see `DockerClient`).
+
+        Arguments:
+          container: The container to upload to (id or name).
+          tar_archive: Tar archive, either as bytes or a binary file object.
+          directory: Directory in container to extract archive to.
+          overwrite_dir_non_dir: Allow replacing a directory with a
+            non-directory and vice versa.
+
+        Raises:
+          PermissionDenied: Volume or container rootfs is read-only.
+          IncompatibleRemoteAPI: Docker Remote API older than v1.20.
+        """
+
+        self._require_api_version(
+            (1, 20),
+            "Upload to container was added in API v1.20 (Docker v1.8)")
 
         # Handle convenience argument types
         if isinstance(container, str):
@@ -634,16 +1355,586 @@ class DockerClient(object):
             params['OverwriteDirNonDir'] = overwrite_dir_non_dir
 
         try:
-            self._put('/containers/{}/archive'.format(id_or_name),
-                      headers={'content-type': 'application/x-tar'},
-                      params=params, data=tar_archive, stream=True)
+            r = self._put('/containers/{id}/archive',
+                          headers={'content-type': 'application/x-tar'},
+                          params=params, data=tar_archive, stream=True,
+                          id=id_or_name)
         except ClientError as exc:
-            print(dir(exc))
             if exc.code == 403:
                 raise PermissionDenied(
                     "Volume or container rootfs is marked as read-only") \
                     from exc
+        else:
+            r.close()
+
+    @staticmethod
+    def _path_stat(r) -> PathStat:
+        stat = r.headers.get('X-Docker-Container-Path-Stat')
+        if stat is None:
+            return None
+        return PathStat(json.loads(base64.b64decode(stat).decode('utf-8')))
+
+    @_operation
+    def container_path_stat(self,
+                            container: Union[Container, ContainerName, str],
+                            path: str) -> PathStat:
+        """Get information about a filesystem resource in a container.
+
+        Only the stat information is retrieved, no archive is transferred.
+
+        Arguments:
+          container: The container to get information from (id or name).
+          path: Resource in the container's filesystem.
+
+        Raises:
+          ClientError: Container or path does not exist.
+          IncompatibleRemoteAPI: Docker Remote API older than v1.20.
+
+        Returns:
+          Stat information of path.
+        """
+
+        self._require_api_version(
+            (1, 20),
+            "Archive download was added in API v1.20 (Docker v1.8)")
+
+        # Handle convenience argument types
+        if isinstance(container, str):
+            id_or_name = container
+        elif isinstance(container, ContainerName):
+            id_or_name = container.name
+        else:
+            id_or_name = container.id or container.name
+
+        r = self._head('/containers/{id}/archive', params={'path': path},
+                       id=id_or_name)
+        return self._path_stat(r)
+
+    @_operation
+    def container_download(self,
+                           container: Union[Container, ContainerName, str],
+                           path: str,
+                           fileobj: Optional[BinaryIO]=None,
+                           callback: Optional[Callable[[bytes], None]]=None,
+                           directory: Optional[str]=None,
+                           chunk_size: int=CHUNK_SIZE) -> PathStat:
+        """Download archive of filesystem resource from container.
+
+        The tar archive is streamed from Docker daemon, and written to a file
+        object, passed to a callback function, or extracted to a local
+        directory, one chunk at a time.  Exactly one of fileobj, callback and
+        directory must be given.
+
+        Arguments:
+          container: The container to download from (id or name).
+          path: Resource in the container's filesystem to download.
+          fileobj: Binary file object to write tar archive to.
+          callback: Function called with each chunk of tar archive data.
+          directory: Local directory to extract tar archive members to.
+          chunk_size: Maximum size of chunks read from Docker daemon.
+
+        Raises:
+          ClientError: Container or path does not exist.
+          IncompatibleRemoteAPI: Docker Remote API older than v1.20.
+          ValueError: Invalid combination of arguments, or unsafe member
+            name in tar archive.
+
+        Returns:
+          Stat information of path.
+        """
+
+        if len([arg for arg in (fileobj, callback, directory)
+                if arg is not None]) != 1:
+            raise ValueError(
+                'exactly one of fileobj, callback and directory is required')
+
+        self._require_api_version(
+            (1, 20),
+            "Archive download was added in API v1.20 (Docker v1.8)")
+
+        # Handle convenience argument types
+        if isinstance(container, str):
+            id_or_name = container
+        elif isinstance(container, ContainerName):
+            id_or_name = container.name
+        else:
+            id_or_name = container.id or container.name
+
+        r = self._get('/containers/{id}/archive', params={'path': path},
+                      stream=True, id=id_or_name)
+        try:
+            chunks = r.iter_content(chunk_size)
+            if fileobj is not None:
+                for chunk in chunks:
+                    fileobj.write(chunk)
+            elif callback is not None:
+                for chunk in chunks:
+                    callback(chunk)
+            else:
+                with _phase(self, 'untar'):
+                    self._extract_stream(IterStream(chunks), directory)
+        finally:
+            r.close()
+        return self._path_stat(r)
+
+    @staticmethod
+    def _extract_stream(stream, directory):
+        import tarfile
+        extract_args = {}
+        if hasattr(tarfile, 'tar_filter'):
+            extract_args['filter'] = 'tar'
+        root = os.path.realpath(directory)
+
+        def inside(path):
+            # Check if path (relative to directory, following links already
+            # extracted) is inside directory
+            path = os.path.realpath(os.path.join(root, path))
+            return os.path.commonpath([root, path]) == root
+        with tarfile.open(fileobj=stream, mode='r|') as tar:
+            for member in tar:
+                name = os.path.normpath(member.name)
+                if os.path.isabs(name) or name.split(os.sep)[0] == '..':
+                    raise ValueError(
+                        'unsafe tar archive member: %s' % member.name)
+                if not extract_args:
+                    # Without extraction filters, links pointing outside
+                    # directory are rejected here
+                    parent = os.path.dirname(name)
+                    if not inside(parent) or (
+                            member.issym() and not inside(
+                                os.path.join(parent, member.linkname))) or (
+                            member.islnk() and not inside(member.linkname)):
+                        raise ValueError(
+                            'unsafe tar archive member: %s' % member.name)
+                tar.extract(member, directory, **extract_args)
+
+    def _container_tty(self, id_or_name):
+        r = self._get('/containers/{id}/json', id=id_or_name)
+        return r.json()['Config']['Tty']
+
+    @staticmethod
+    def _iter_frames(r, tty, copy=True, chunk_size=CHUNK_SIZE):
+        readinto = getattr(r, 'readinto', None)
+        if readinto is None:
+            readinto = IterStream(r.iter_content(chunk_size)).readinto
+        frames = raw_frames if tty else demux_frames
+        try:
+            for frame in frames(readinto, chunk_size, copy=copy):
+                yield frame
+        finally:
+            r.close()
+
+    @_operation
+    def container_logs(self, container: Union[Container, ContainerName, str],
+                       follow: bool=False,
+                       since: Optional[int]=None,
+                       tail: Optional[Union[int, str]]=None,
+                       timestamps: bool=False,
+                       stdout: bool=True,
+                       stderr: bool=True,
+                       tty: Optional[bool]=None,
+                       copy: bool=True,
+                       chunk_size: int=CHUNK_SIZE
+                       ) -> Iterator[Tuple[int, bytes]]:
+        """Get container logs.
+
+        Get stdout and/or stderr logs from a container, as an iterator of
+        frames.  For containers without a TTY, the multiplexed stream is
+        split into stdout and stderr frames.  For containers with a TTY,
+        all output is returned as stdout frames.
+
+        Arguments:
+          container: The container to get logs from (id or name).
+          follow: Keep streaming new log output until container stops.
+          since: Only return logs since this UNIX timestamp.
+          tail: Only return this number of lines from the end of the logs
+            (or 'all').
+          timestamps: Prefix each log line with a timestamp.
+          stdout: Return logs from stdout.
+          stderr: Return logs from stderr.
+          tty: Container is using a TTY.  If not given, the container is
+            inspected to find out.
+          copy: Return frame data as bytes.  If False, frame data is returned
+            as memoryview, only valid until the next frame is requested.
+          chunk_size: Size of buffer used for reading from Docker daemon.
+
+        Raises:
+          ClientError: Container does not exist.
+          ServerError: Server error.
+
+        Returns:
+          Iterator of (stream, data) tuples, with stream being
+          `xd.docker.stream.STDOUT` or `xd.docker.stream.STDERR`.
+        """
+
+        # Handle convenience argument types
+        if isinstance(container, str):
+            id_or_name = container
+        elif isinstance(container, ContainerName):
+            id_or_name = container.name
+        else:
+            id_or_name = container.id or container.name
+
+        query_params = {}
+        arg_fields = (
+            ('follow', 'follow', None),
+            ('stdout', 'stdout', None),
+            ('stderr', 'stderr', None),
+            ('since', 'since', ((1, 19), None)),
+            ('timestamps', 'timestamps', None),
+            ('tail', 'tail', None),
+            )
+        json_update(query_params, locals(), arg_fields, self.api_version)
+
+        if tty is None:
+            tty = self._container_tty(id_or_name)
+
+        r = self._get('/containers/{id}/logs', params=query_params,
+                      stream=True, id=id_or_name)
+        return self._iter_frames(r, tty, copy, chunk_size)
+
+    @_operation
+    def container_stats(self, container: Union[Container, ContainerName, str],
+                        stream: bool=True
+                        ) -> Union['Stats', Iterator['Stats']]:
+        """Get container resource usage statistics.
+
+        Arguments:
+          container: The container to get statistics for (id or name).
+          stream: Keep streaming a new sample every second until the
+            container stops.  If False, a single sample is returned.
+
+        Raises:
+          ClientError: Container does not exist.
+          ServerError: Server error.
+          IncompatibleRemoteAPI: Docker Remote API older than v1.17 (or
+            v1.19 if stream is False).
+
+        Returns:
+          Stats instance, or iterator of Stats instances if stream is True.
+        """
+
+        # Handle convenience argument types
+        if isinstance(container, str):
+            id_or_name = container
+        elif isinstance(container, ContainerName):
+            id_or_name = container.name
+        else:
+            id_or_name = container.id or container.name
+
+        self._require_api_version(
+            (1, 17),
+            "Container stats was added in API v1.17 (Docker v1.5)")
+
+        query_params = {}
+        if not stream:
+            # Older daemons would ignore stream=False, and stream forever
+            self._require_api_version(
+                (1, 19),
+                "Non-streaming container stats was added in API v1.19 "
+                "(Docker v1.7)")
+            arg_fields = (('stream', 'stream', ((1, 19), None)),)
+            json_update(query_params, locals(), arg_fields, self.api_version)
+
+        from xd.docker.stats import Stats
+        r = self._get('/containers/{id}/stats', params=query_params,
+                      stream=stream, id=id_or_name)
+        if not stream:
+            return Stats(r.json())
+        return self._iter_stats(r)
+
+    @staticmethod
+    def _iter_stats(r):
+        from xd.docker.stats import Stats
+        decoder = json.JSONDecoder()
+        try:
+            for line in r.iter_lines():
+                line = line.decode('utf-8')
+                index = 0
+                while index < len(line):
+                    data, index = decoder.raw_decode(line, index)
+                    while index < len(line) and line[index].isspace():
+                        index += 1
+                    yield Stats(data)
+        finally:
+            r.close()
+
+    @_operation
+    def container_attach(self,
+                         container: Union[Container, ContainerName, str],
+                         stdin: bool=True,
+                         stdout: bool=True,
+                         stderr: bool=True,
+                         logs: bool=False,
+                         detach_keys: Optional[str]=None) -> HijackedSocket:
+        """Attach to a container.
+
+        The HTTP connection to Docker daemon is hijacked, and returned as a
+        raw duplex stream.  Data written to it is sent to stdin of the
+        container.  Output of the container is read from it, multiplexed as
+        stdout/stderr frames, unless the container has a TTY (use
+        `HijackedSocket.frames` to iterate over frames).
+
+        Arguments:
+          container: The container to attach to (id or name).
+          stdin: Attach to stdin.
+          stdout: Attach to stdout.
+          stderr: Attach to stderr.
+          logs: Replay existing logs before streaming new output.
+          detach_keys: Key sequence for detaching from container.
+
+        Raises:
+          ClientError: Container does not exist.
+          ServerError: Server error.
+
+        Returns:
+          HijackedSocket instance.
+
+        :Example:
+
+        >>> with docker.container_attach('cat') as sock:
+        ...     sock.sendall(b'foobar\\n')
+        ...     sock.close_write()
+        ...     for stream, data in sock.frames():
+        ...         print(data)
+        """
+
+        # Handle convenience argument types
+        if isinstance(container, str):
+            id_or_name = container
+        elif isinstance(container, ContainerName):
+            id_or_name = container.name
+        else:
+            id_or_name = container.id or container.name
+
+        stream = True
+        query_params = {}
+        arg_fields = (
+            ('stream', 'stream', None),
+            ('stdin', 'stdin', None),
+            ('stdout', 'stdout', None),
+            ('stderr', 'stderr', None),
+            ('logs', 'logs', None),
+            ('detachKeys', 'detach_keys', ((1, 23), None)),
+            )
+        json_update(query_params, locals(), arg_fields, self.api_version)
+
+        return self._request('POST', '/containers/{id}/attach',
+                             params=query_params, hijack=True, id=id_or_name)
+
+    @_operation
+    def exec_create(self, container: Union[Container, ContainerName, str],
+                    cmd: Union[str, Sequence[str]],
+                    stdin: bool=False,
+                    stdout: bool=True,
+                    stderr: bool=True,
+                    tty: bool=False,
+                    user: Optional[str]=None,
+                    privileged: Optional[bool]=None) -> Exec:
+        """Create an exec instance, for running a command in a container.
+
+        Arguments:
+          container: The container to run command in (id or name).
+          cmd: Command to run (string or list of strings).
+          stdin: Attach to stdin of command.
+          stdout: Attach to stdout of command.
+          stderr: Attach to stderr of command.
+          tty: Allocate a pseudo-TTY for command.
+          user: User to run command as.
+          privileged: Run command with extended privileges.
+
+        Raises:
+          ClientError: Container does not exist.
+          ServerError: Server error.
+          IncompatibleRemoteAPI: Docker Remote API older than v1.15.
+
+        Returns:
+          Exec instance.
+        """
+
+        self._require_api_version(
+            (1, 15),
+            "Exec was added in API v1.15 (Docker v1.3)")
+
+        # Handle convenience argument types
+        if isinstance(container, str):
+            id_or_name = container
+        elif isinstance(container, ContainerName):
+            id_or_name = container.name
+        else:
+            id_or_name = container.id or container.name
+        if isinstance(cmd, str):
+            cmd = [cmd]
+
+        json_params = {}
+        arg_fields = (
+            ('AttachStdin', 'stdin', None),
+            ('AttachStdout', 'stdout', None),
+            ('AttachStderr', 'stderr', None),
+            ('Tty', 'tty', None),
+            ('Cmd', 'cmd', None),
+            ('User', 'user', ((1, 19), None)),
+            ('Privileged', 'privileged', ((1, 19), None)),
+            )
+        json_update(json_params, locals(), arg_fields, self.api_version)
+
+        headers = {'content-type': 'application/json'}
+        r = self._post('/containers/{id}/exec', headers=headers,
+                       data=json.dumps(json_params), id=id_or_name)
+        return Exec(self, r.json()['Id'], container=id_or_name)
+
+    @_operation
+    def exec_start(self, exec_id: Union[Exec, str],
+                   detach: bool=False,
+                   tty: bool=False,
+                   copy: bool=True,
+                   chunk_size: int=CHUNK_SIZE
+                   ) -> Optional[Iterator[Tuple[int, bytes]]]:
+        """Start an exec instance.
+
+        Arguments:
+          exec_id: The exec instance to start (Exec or id).
+          detach: Detach from the command, returning immediately.
+          tty: Exec instance was created with a pseudo-TTY.
+          copy: Return frame data as bytes.  If False, frame data is returned
+            as memoryview, only valid until the next frame is requested.
+          chunk_size: Size of buffer used for reading from Docker daemon.
+
+        Raises:
+          ClientError: Exec instance does not exist.
+          ServerError: Server error.
+
+        Returns:
+          Iterator of (stream, data) tuples for the output of the command,
+          with stream being `xd.docker.stream.STDOUT` or
+          `xd.docker.stream.STDERR` (or None if detach is True).
+        """
+
+        # Handle convenience argument types
+        if isinstance(exec_id, Exec):
+            exec_id = exec_id.id
+
+        headers = {'content-type': 'application/json'}
+        r = self._post('/exec/{id}/start', headers=headers,
+                       data=json.dumps({'Detach': detach, 'Tty': tty}),
+                       stream=not detach, id=exec_id)
+        if detach:
+            return None
+        return self._iter_frames(r, tty, copy, chunk_size)
+
+    @_operation
+    def exec_inspect(self, exec_id: Union[Exec, str]) -> Exec:
+        """Get information about an exec instance.
+
+        Arguments:
+          exec_id: The exec instance to inspect (Exec or id).
+
+        Raises:
+          ClientError: Exec instance does not exist.
+          ServerError: Server error.
+
+        Returns:
+          Exec instance.
+        """
+
+        # Handle convenience argument types
+        if isinstance(exec_id, Exec):
+            exec_id = exec_id.id
+
+        r = self._get('/exec/{id}/json', id=exec_id)
+        return Exec(self, exec_id, inspect_response=r.json())
+
+    @_operation
+    def exec_run(self, container: Union[Container, ContainerName, str],
+                 cmd: Union[str, Sequence[str]],
+                 user: Optional[str]=None,
+                 max_output: int=CHUNK_SIZE) -> ExecResult:
+        """Run a command in a container, and wait for it to finish.
+
+        Output is kept in bounded memory: only the last max_output bytes of
+        stdout and stderr are returned.
+
+        Arguments:
+          container: The container to run command in (id or name).
+          cmd: Command to run (string or list of strings).
+          user: User to run command as.
+          max_output: Maximum number of bytes of stdout and stderr to keep.
+
+        Raises:
+          ClientError: Container does not exist.
+          ServerError: Server error.
+
+        Returns:
+          ExecResult instance.
+        """
+
+        # Handle convenience argument types
+        if isinstance(container, str):
+            id_or_name = container
+        elif isinstance(container, ContainerName):
+            id_or_name = container.name
+        else:
+            id_or_name = container.id or container.name
+
+        exec_instance = self.exec_create(id_or_name, cmd, user=user)
+        output = {STDOUT: _Tail(max_output), STDERR: _Tail(max_output)}
+        for stream, data in self.exec_start(exec_instance, copy=False):
+            output[stream].write(data)
+        exec_instance = self.exec_inspect(exec_instance)
+        stdout = output[STDOUT].getvalue()
+        stderr = output[STDERR].getvalue()
+        return ExecResult(id_or_name, exec_instance.exit_code, stdout, stderr,
+                          output[STDOUT].truncated or output[STDERR].truncated)
+
+    @_operation
+    def exec_many(self,
+                  containers: Iterable[Union[Container, ContainerName, str]],
+                  cmd: Union[str, Sequence[str]],
+                  user: Optional[str]=None,
+                  max_concurrency: int=8,
+                  max_output: int=CHUNK_SIZE) -> List[ExecResult]:
+        """Run a command in many containers.
+
+        The command is run concurrently in up to max_concurrency containers
+        at a time.  Errors are not raised, but returned in the error
+        attribute of the results.
+
+        Arguments:
+          containers: The containers to run command in (id or name).
+          cmd: Command to run (string or list of strings).
+          user: User to run command as.
+          max_concurrency: Maximum number of commands to run concurrently.
+          max_output: Maximum number of bytes of stdout and stderr to keep
+            for each container.
+
+        Returns:
+          List of ExecResult instances, in the order of containers.
+        """
+
+        def run(container):
+            try:
+                return self.exec_run(container, cmd, user=user,
+                                     max_output=max_output)
+            except Exception as e:
+                return ExecResult(container, error=e)
+
+        ids = []
+        for container in containers:
+
+            # Handle convenience argument types
+            if isinstance(container, str):
+                ids.append(container)
+            elif isinstance(container, ContainerName):
+                ids.append(container.name)
+            else:
+                ids.append(container.id or container.name)
+
+        import concurrent.futures
+        with concurrent.futures.ThreadPoolExecutor(max_concurrency) as pool:
+            return list(pool.map(_bind_operation(self._bind_options(run)),
+                                 ids))
 
+    @_operation
     def commit(self,
                container: Union[Container, ContainerName, str],
                repo: Optional[Union[Repository, str]]=None,
@@ -0,0 +1,367 @@
+"""Module containing DockerCluster, a pool of clients of many Docker hosts."""
+
+import collections
+import concurrent.futures
+import threading
+
+from typing import Optional, Union, Dict, List, Tuple, Iterable, Callable, \
+    Any
+
+from xd.docker.client import DockerClient
+from xd.docker.container import Container
+from xd.docker.parameters import ContainerConfig, ContainerName
+from xd.docker.exceptions import ClusterError
+from xd.docker.stats import Stats, StatsSampler
+from xd.docker.health import CircuitBreaker
+from xd.docker.observer import _bind_operation
+
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+__all__ = ['DockerCluster', 'ClusterResult', 'Placement',
+           'LeastContainers', 'LeastLoaded']
+
+
+class ClusterResult(list):
+    """Merged results of a scatter-gather call on the hosts of a cluster.
+
+    The result is a list of the items returned by all hosts that
+    responded, in the order of the hosts.  Each item is tagged with the
+    name of its host in its host attribute.
+
+    Attributes:
+      errors (Dict[str, Exception]): Hosts that failed, with the exception
+        raised.
+    """
+
+    def __init__(self, items: Iterable=(),
+                 errors: Optional[Dict[str, Exception]]=None):
+        super(ClusterResult, self).__init__(items)
+        self.errors = errors or {}
+
+    @property
+    def complete(self) -> bool:
+        """All hosts responded."""
+        return not self.errors
+
+    def by_host(self) -> Dict[str, List]:
+        """Get items grouped by host name."""
+        hosts = collections.OrderedDict()
+        for item in self:
+            hosts.setdefault(item.host, []).append(item)
+        return hosts
+
+
+class Placement(object):
+    """Base class for container placement policies of DockerCluster.
+
+    Subclasses override `select`, choosing the host to create a container
+    on.
+    """
+
+    def select(self, cluster: 'DockerCluster',
+               config: Optional[ContainerConfig]=None) -> str:
+        """Select host to create container on.
+
+        Arguments:
+          cluster: Cluster to select host in.
+          config: Configuration of container to create.
+
+        Raises:
+          ClusterError: No host available.
+
+        Returns:
+          Host name.
+        """
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        """Release resources held by placement policy."""
+        pass
+
+    @staticmethod
+    def _least(scores, errors):
+        # Get host with lowest score (first host on ties)
+        if not scores:
+            raise ClusterError('no host available', errors)
+        return min(scores, key=lambda host: scores[host])
+
+
+class LeastContainers(Placement):
+    """Place containers on the host with fewest running containers.
+
+    :Example:
+
+    >>> cluster = DockerCluster(hosts, placement=LeastContainers())
+    """
+
+    def select(self, cluster, config=None):
+        counts, errors = cluster.scatter(
+            lambda client: len(client.containers()))
+        return self._least(counts, errors)
+
+
+class LeastLoaded(Placement):
+    """Place containers on the least loaded host, by container statistics.
+
+    The load of a host is the sum of a `xd.docker.stats.Stats` field (fx.
+    'cpu_percent' or 'memory_usage') over its running containers, sampled
+    with a `xd.docker.stats.StatsSampler` for each host.
+
+    Arguments:
+      field: Stats field to sum.
+      max_workers: Maximum number of concurrent stats requests per host.
+
+    :Example:
+
+    >>> cluster = DockerCluster(hosts, placement=LeastLoaded('memory_usage'))
+    """
+
+    def __init__(self, field: str='cpu_percent', max_workers: int=8):
+        if field not in Stats.FIELDS:
+            raise ValueError('invalid stats field: {}'.format(field))
+        self.field = field
+        self.max_workers = max_workers
+        self._samplers = {}
+        self._lock = threading.Lock()
+
+    def _sampler(self, host, client):
+        # Samplers are created on first use, and cached per host
+        with self._lock:
+            sampler = self._samplers.get(host)
+            if sampler is None or sampler.client is not client:
+                if sampler is not None:
+                    sampler.close()
+                sampler = StatsSampler(client, max_workers=self.max_workers)
+                self._samplers[host] = sampler
+            return sampler
+
+    def select(self, cluster, config=None):
+        samplers = {id(client): self._sampler(host, client)
+                    for host, client in cluster.clients.items()}
+
+        def load(client):
+            sweep = samplers[id(client)].sample()
+            return sum(value for value in sweep.columns[self.field]
+                       if value == value)
+        loads, errors = cluster.scatter(load)
+        return self._least(loads, errors)
+
+    def close(self):
+        with self._lock:
+            for sampler in self._samplers.values():
+                sampler.close()
+            self._samplers.clear()
+
+
+class DockerCluster(object):
+    """Pool of DockerClient instances, one for each of many Docker hosts.
+
+    Listing calls (`containers` and `images`) are sent to all hosts
+    concurrently, and the results are merged in a `ClusterResult`, with
+    each container or image tagged with the name of its host.  Hosts
+    failing to respond are reported in the errors attribute of the result,
+    so one broken host does not hide the others.  Containers are created
+    on a host chosen by a pluggable `Placement` policy.
+
+    Arguments:
+      hosts: Docker hosts, as URLs (fx. 'tcp://10.0.0.1:2375') or
+        DockerClient instances, or a dict of such by host name.  Without
+        names, hosts are named by URL.
+      placement: Container placement policy (default: `LeastContainers`).
+      max_workers: Maximum number of concurrent requests (default: one per
+        host).
+      kwargs: Keyword arguments for DockerClient instances created from
+        URLs (fx. transport, timeout or retry).  With breaker=True, each
+        client gets its own circuit breaker, named by host, so hosts that
+        are down fail fast (and are reported in errors of results, and
+        skipped by placement policies).
+
+    Attributes:
+      clients (Dict[str, DockerClient]): Client of each host, by name.
+
+    Raises:
+      ValueError: No hosts, or duplicate host names.
+
+    :Example:
+
+    >>> with DockerCluster(['tcp://10.0.0.1:2375',
+    ...                     'tcp://10.0.0.2:2375'], timeout=5.0) as cluster:
+    ...     containers = cluster.containers()
+    ...     for container in containers:
+    ...         print(container.host, container.name)
+    ...     for host, error in containers.errors.items():
+    ...         print(host, 'failed:', error)
+    """
+
+    def __init__(self,
+                 hosts: Union[Iterable[Union[str, DockerClient]],
+                              Dict[str, Union[str, DockerClient]]],
+                 placement: Optional[Placement]=None,
+                 max_workers: Optional[int]=None,
+                 **kwargs):
+        if isinstance(hosts, dict):
+            hosts = list(hosts.items())
+        else:
+            hosts = [(host if isinstance(host, str) else host.base_url, host)
+                     for host in hosts]
+        if not hosts:
+            raise ValueError('no hosts')
+        self.clients = collections.OrderedDict()
+        for name, client in hosts:
+            if name in self.clients:
+                raise ValueError('duplicate host: {}'.format(name))
+            if isinstance(client, str):
+                if kwargs.get('breaker') is True:
+                    client = DockerClient(client, **dict(
+                        kwargs, breaker=CircuitBreaker(name=name)))
+                else:
+                    client = DockerClient(client, **kwargs)
+            self.clients[name] = client
+        if placement is None:
+            placement = LeastContainers()
+        self.placement = placement
+        if max_workers is None:
+            max_workers = len(self.clients)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.clients)
+
+    def __getitem__(self, host: str) -> DockerClient:
+        return self.clients[host]
+
+    @property
+    def hosts(self) -> List[str]:
+        """Host names."""
+        return list(self.clients)
+
+    def health(self) -> Dict[str, Optional[str]]:
+        """Get circuit breaker state of hosts.
+
+        Returns:
+          State of each host (see `xd.docker.health.CircuitBreaker`), or
+          None for hosts without circuit breaker, by host name.
+        """
+        return collections.OrderedDict(
+            (host, client.breaker.state if client.breaker else None)
+            for host, client in self.clients.items())
+
+    def close(self) -> None:
+        """Stop worker threads, and close clients and placement policy."""
+        self._executor.shutdown()
+        self.placement.close()
+        for client in self.clients.values():
+            client.close()
+
+    def scatter(self, func: Callable[[DockerClient], Any],
+                hosts: Optional[Iterable[str]]=None) \
+            -> Tuple[Dict[str, Any], Dict[str, Exception]]:
+        """Call function with the client of each host concurrently.
+
+        Arguments:
+          func: Function to call with each client.
+          hosts: Names of hosts to call function for (default: all hosts).
+
+        Returns:
+          Tuple of the results of the hosts that succeeded, and the
+          exceptions raised for the hosts that failed, as dicts by host
+          name (in the order of the hosts).
+        """
+        if hosts is None:
+            hosts = self.clients
+        func = _bind_operation(func)
+        futures = [(host, self._executor.submit(func, self.clients[host]))
+                   for host in hosts]
+        results, errors = collections.OrderedDict(), collections.OrderedDict()
+        for host, future in futures:
+            try:
+                results[host] = future.result()
+            except Exception as e:
+                log.debug('Failed on %s: %r', host, e)
+                errors[host] = e
+        return results, errors
+
+    def _gather(self, func, strict):
+        # Scatter func, and merge the lists returned into a ClusterResult
+        results, errors = self.scatter(func)
+        if errors and (strict or not results):
+            raise ClusterError('failed on {} of {} hosts: {}'.format(
+                len(errors), len(self.clients), ', '.join(errors)), errors)
+        merged = ClusterResult(errors=errors)
+        for host, items in results.items():
+            for item in items:
+                item.host = host
+            merged.extend(items)
+        return merged
+
+    def containers(self, only_running: bool=True,
+                   strict: bool=False) -> ClusterResult:
+        """Get list of containers of all hosts.
+
+        Arguments:
+          only_running: List only running containers (if True), or all
+            containers (if False).
+          strict: Fail if any host fails (otherwise only if all hosts
+            fail).
+
+        Raises:
+          ClusterError: Failed on all hosts (or any host, with strict).
+
+        Returns:
+          Containers, tagged with host name.
+        """
+        return self._gather(
+            lambda client: client.containers(only_running=only_running),
+            strict)
+
+    def images(self, strict: bool=False) -> ClusterResult:
+        """Get list of images of all hosts.
+
+        Arguments:
+          strict: Fail if any host fails (otherwise only if all hosts
+            fail).
+
+        Raises:
+          ClusterError: Failed on all hosts (or any host, with strict).
+
+        Returns:
+          Images, tagged with host name.
+        """
+        return self._gather(lambda client: client.images(), strict)
+
+    def container_create(self, config: ContainerConfig,
+                         name: Optional[Union[ContainerName, str]]=None,
+                         host: Optional[str]=None,
+                         **kwargs) -> Container:
+        """Create a new container on a host chosen by the placement policy.
+
+        Arguments:
+          config: ContainerConfig instance.
+          name: name to assign to container.
+          host: Name of host to create container on (default: chosen by
+            placement policy).
+          kwargs: Other arguments of `DockerClient.container_create`.
+
+        Raises:
+          ClusterError: No host available.
+
+        Returns:
+          Container, tagged with host name.
+        """
+        if isinstance(config, str):
+            config = ContainerConfig(config)
+        if host is None:
+            host = self.placement.select(self, config)
+        container = self.clients[host].container_create(config, name,
+                                                        **kwargs)
+        container.host = host
+        return container
@@ -0,0 +1,709 @@
+"""Module containing a minimal HTTP/1.1 client for talking to Docker daemon
+directly over a socket."""
+
+import socket
+import os
+import io
+import stat
+import json
+import collections.abc
+import urllib.parse
+
+from typing import Optional, Dict, Iterator, List, Tuple, Callable
+
+from xd.docker.stream import CHUNK_SIZE, iter_chunks, demux_frames, \
+    raw_frames
+
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+__all__ = ['Connection', 'Response', 'ResponseParser', 'HijackedSocket',
+           'is_regular_file']
+
+
+def _http_client():
+    # Import http.client on first use, as it imports email and ssl
+    import http.client
+    return http.client
+
+
+def is_regular_file(data) -> bool:
+    """Check if data is a file object backed by a regular file.
+
+    Data in regular files can be sent to a socket with the sendfile(2) system
+    call, without being copied through Python buffers.
+
+    Arguments:
+      data: Request body data.
+    """
+    try:
+        fd = data.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return False
+    return stat.S_ISREG(os.fstat(fd).st_mode)
+
+
+class Connection(object):
+    """HTTP/1.1 connection to Docker daemon.
+
+    A Connection instance is a thin wrapper around a socket connected to
+    Docker daemon, used for requests where direct access to the socket is
+    needed.
+
+    Arguments:
+      base_url: DockerClient base URL (fx. 'http+unix://%2Fvar%2Frun%2F...'
+        or 'http://127.0.0.1:2375').
+      timeout: Socket timeout in seconds.
+    """
+
+    def __init__(self, base_url: str, timeout: Optional[float]=None):
+        url = urllib.parse.urlsplit(base_url)
+        if url.scheme == 'http+unix':
+            self.family = socket.AF_UNIX
+            self.address = urllib.parse.unquote_plus(url.netloc)
+        elif url.scheme == 'http':
+            self.family = socket.AF_INET
+            self.address = (url.hostname, url.port or 80)
+        else:
+            raise ValueError('Invalid base_url value: {}'.format(base_url))
+        self.host = url.netloc if url.scheme == 'http' else 'docker'
+        self.timeout = timeout
+        self.sock = None
+        self.rfile = None
+
+    def connect(self):
+        if self.family == socket.AF_UNIX:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.address)
+            except OSError:
+                sock.close()
+                raise
+        else:
+            sock = socket.create_connection(self.address, self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = sock
+        self.rfile = sock.makefile('rb')
+
+    def settimeout(self, timeout: Optional[float]) -> None:
+        """Set socket timeout (also of connection to be made).
+
+        Arguments:
+          timeout: Socket timeout in seconds (None for no timeout).
+        """
+        self.timeout = timeout
+        if self.sock is not None:
+            self.sock.settimeout(timeout)
+
+    def close(self):
+        if self.rfile is not None:
+            self.rfile.close()
+            self.rfile = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def request(self, method: str, url: str,
+                params: Optional[Dict]=None,
+                headers: Optional[Dict[str, str]]=None,
+                data=None) -> None:
+        """Send request.
+
+        Arguments:
+          method: HTTP method.
+          url: Request path (without query string).
+          params: Query parameters (parameters with value None are left
+            out).
+          headers: Request headers.
+          data: Request body, either bytes, str, a binary file object or an
+            iterator of bytes.  Regular files are sent using sendfile(2)
+            when available.  Other file objects and iterators are sent with
+            chunked transfer encoding.
+        """
+        if self.sock is None:
+            self.connect()
+        if params:
+            params = [(name, value) for name, value in params.items()
+                      if value is not None]
+            if params:
+                url += '?' + urllib.parse.urlencode(params, doseq=True)
+        head = ['{} {} HTTP/1.1'.format(method, url),
+                'Host: {}'.format(self.host)]
+        if headers:
+            head.extend('{}: {}'.format(name, value.decode('ascii')
+                                        if isinstance(value, bytes)
+                                        else value)
+                        for name, value in headers.items())
+        chunks = None
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if data is None:
+            length = 0
+        elif isinstance(data, (bytes, bytearray)):
+            length = len(data)
+        elif isinstance(data, memoryview):
+            length = data.nbytes
+        elif is_regular_file(data):
+            length = os.fstat(data.fileno()).st_size - data.tell()
+        elif hasattr(data, 'read'):
+            chunks = iter_chunks(data)
+        elif isinstance(data, collections.abc.Iterable):
+            chunks = iter(data)
+        else:
+            raise TypeError('unsupported request body type: %s' % type(data))
+        if chunks is not None:
+            head.append('Transfer-Encoding: chunked')
+        elif length or method in ('POST', 'PUT'):
+            head.append('Content-Length: {}'.format(length))
+        head.append('\r\n')
+        head = '\r\n'.join(head).encode('latin-1')
+        if chunks is not None:
+            self._send_chunked(head, chunks)
+        elif not length:
+            self.sock.sendall(head)
+        elif isinstance(data, (bytes, bytearray, memoryview)):
+            if length <= self.SMALL_BODY_SIZE:
+                # Send head and body in a single segment
+                self.sock.sendall(head + data)
+            else:
+                self.sock.sendall(head)
+                self.sock.sendall(data)
+        else:
+            self.sock.sendall(head)
+            # socket.sendfile() uses os.sendfile() when possible, and falls
+            # back to read()/send() otherwise.
+            self.sock.sendfile(data, offset=data.tell(), count=length)
+
+    # Maximum size of request body sent together with the request head
+    SMALL_BODY_SIZE = 16384
+
+    def _send_chunked(self, head, chunks):
+        # Send body with chunked transfer encoding.  Chunk framing is sent
+        # together with the chunk data (and the first chunk together with
+        # the request head).
+        pending = head
+        for chunk in chunks:
+            if not chunk:
+                continue
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            size = len(chunk) if not isinstance(chunk, memoryview) \
+                else chunk.nbytes
+            self.sock.sendall(pending + b'%x\r\n' % size + chunk + b'\r\n')
+            pending = b''
+        self.sock.sendall(pending + b'0\r\n\r\n')
+
+    def getresponse(self, method: str='GET',
+                    release: Optional[Callable[['Connection'], None]]=None
+                    ) -> 'Response':
+        """Read response status line and headers.
+
+        Arguments:
+          method: HTTP method of the request.
+          release: Function called with the connection when the response
+            body has been read to the end, if the connection can be reused
+            for another request (instead of closing the connection).
+        """
+        return Response(self, method, release)
+
+    # Maximum size of response head of hijacked connection
+    MAX_HEAD_SIZE = 65536
+
+    def hijack(self, method: str, url: str,
+               params: Optional[Dict]=None,
+               headers: Optional[Dict[str, str]]=None,
+               data=None) -> 'HijackedSocket':
+        """Send request, and take over the connection as a raw stream.
+
+        The request asks Docker daemon to upgrade the connection to a raw
+        TCP stream (like the attach and exec start endpoints do).  The
+        response head is read directly from the socket, and any stream data
+        received with it is returned first by reads from the
+        HijackedSocket.
+
+        Arguments:
+          method: HTTP method.
+          url: Request path (without query string).
+          params: Query parameters.
+          headers: Request headers.
+          data: Request body.
+
+        Returns:
+          HijackedSocket instance.
+        """
+        headers = dict(headers or {})
+        headers.setdefault('Connection', 'Upgrade')
+        headers.setdefault('Upgrade', 'tcp')
+        self.request(method, url, params=params, headers=headers, data=data)
+        head = bytearray()
+        while True:
+            data = self.sock.recv(4096)
+            if not data:
+                raise _http_client().RemoteDisconnected(
+                    'Remote end closed connection without response')
+            start = max(0, len(head) - 3)
+            head += data
+            end = head.find(b'\r\n\r\n', start)
+            if end >= 0:
+                break
+            if len(head) > self.MAX_HEAD_SIZE:
+                raise _http_client().LineTooLong('response head')
+        parser = ResponseParser(method)
+        parser.feed(head[:end + 4])
+        return HijackedSocket(self, parser.status_code, parser.reason,
+                              parser.headers, head[end + 4:])
+
+
+class Response(object):
+    """HTTP response read from a Connection.
+
+    A Response instance provides the subset of the `requests.Response` API
+    used by DockerClient.  The body is read lazily, so streamed responses
+    can be consumed incrementally.
+
+    Arguments:
+      connection: Connection to read response from.
+      method: HTTP method of the request.
+      release: Function called with the connection when the body has been
+        read to the end, if the connection can be reused (see
+        `Connection.getresponse`).
+
+    Attributes:
+      status_code (int): HTTP status code.
+      reason (str): HTTP reason phrase.
+      headers: Response headers (case-insensitive mapping).
+    """
+
+    def __init__(self, connection: Connection, method: str='GET',
+                 release: Optional[Callable[[Connection], None]]=None):
+        self.connection = connection
+        rfile = connection.rfile
+        line = rfile.readline(65537)
+        if not line:
+            raise _http_client().RemoteDisconnected(
+                'Remote end closed connection without response')
+        try:
+            version, status, reason = (
+                line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+            self.status_code = int(status)
+        except ValueError:
+            raise _http_client().BadStatusLine(line)
+        if not version.startswith('HTTP/'):
+            raise _http_client().BadStatusLine(line)
+        self.reason = reason
+        self.headers = _http_client().parse_headers(rfile)
+        self.chunked = False
+        self.length = None
+        if (method == 'HEAD' or self.status_code in (204, 304) or
+                100 <= self.status_code < 200):
+            self.length = 0
+        elif 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            self.chunked = True
+        elif self.headers.get('Content-Length') is not None:
+            self.length = int(self.headers['Content-Length'])
+        # Number of body bytes left (in current chunk when chunked, and None
+        # when body is terminated by connection close)
+        self._left = 0 if self.chunked else self.length
+        self._eof = False
+        self._content = None
+        self._release = None
+        self._released = False
+        if (release is not None and version == 'HTTP/1.1' and
+                (self.chunked or self.length is not None) and
+                self.headers.get('Connection', '').lower() != 'close'):
+            self._release = release
+        if self.length == 0:
+            self._end()
+
+    def _end(self):
+        # End of body reached.  Hand the connection back for reuse, if
+        # possible.
+        self._eof = True
+        release, self._release = self._release, None
+        if release is not None:
+            self._released = True
+            release(self.connection)
+
+    def _readable(self, size: int) -> int:
+        # Return number of body bytes that can be read without crossing a
+        # chunk boundary, reading chunk size lines as needed.
+        if self._eof:
+            return 0
+        if self.chunked and self._left == 0:
+            rfile = self.connection.rfile
+            line = rfile.readline(65537)
+            if line in (b'\r\n', b'\n'):
+                # End of previous chunk
+                line = rfile.readline(65537)
+            try:
+                self._left = int(line.split(b';', 1)[0], 16)
+            except ValueError:
+                raise _http_client().IncompleteRead(line)
+            if self._left == 0:
+                # Skip trailer
+                while rfile.readline(65537) not in (b'\r\n', b'\n', b''):
+                    pass
+                self._end()
+                return 0
+        if self._left is None:
+            return size
+        return min(size, self._left)
+
+    def _consumed(self, size: int, expected: int):
+        if not size:
+            if self._left is not None:
+                raise _http_client().IncompleteRead(b'', expected)
+            self._eof = True
+        elif self._left is not None:
+            self._left -= size
+            if self._left == 0 and not self.chunked:
+                self._end()
+
+    def read1(self, size: int=CHUNK_SIZE) -> bytes:
+        """Read up to size bytes of response body.
+
+        At most one read is done on the underlying socket, so this returns
+        as soon as any data is available.  Returns empty bytes at end of
+        body.
+
+        Arguments:
+          size: Maximum number of bytes to read.
+        """
+        size = self._readable(size)
+        if not size:
+            return b''
+        data = self.connection.rfile.read1(size)
+        self._consumed(len(data), size)
+        return data
+
+    def readinto(self, buf) -> int:
+        """Read response body into a pre-allocated buffer.
+
+        Like `read1`, but reading directly into buf (fx. a bytearray or
+        memoryview), avoiding allocation of a new bytes object.
+
+        Arguments:
+          buf: Writable buffer.
+
+        Returns:
+          Number of bytes read (0 at end of body).
+        """
+        size = self._readable(len(buf))
+        if not size:
+            return 0
+        n = self.connection.rfile.readinto1(memoryview(buf)[:size])
+        self._consumed(n, size)
+        return n
+
+    def iter_content(self, chunk_size: int=CHUNK_SIZE) -> Iterator[bytes]:
+        """Iterate over response body.
+
+        Arguments:
+          chunk_size: Maximum size of chunks.
+        """
+        if self._content is not None:
+            for i in range(0, len(self._content), chunk_size):
+                yield self._content[i:i + chunk_size]
+            return
+        try:
+            while True:
+                chunk = self.read1(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            self.close()
+
+    def iter_lines(self) -> Iterator[bytes]:
+        """Iterate over response body, one line at a time."""
+        pending = b''
+        for chunk in self.iter_content():
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line.rstrip(b'\r')
+        if pending:
+            yield pending
+
+    @property
+    def content(self) -> bytes:
+        if self._content is None:
+            self._content = b''.join(self.iter_content())
+        return self._content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.text)
+
+    def close(self):
+        if not self._released:
+            self.connection.close()
+
+
+class ResponseParser(object):
+    """Incremental HTTP response parser.
+
+    A ResponseParser instance is fed with data as it is received from a
+    (typically non-blocking) socket, and returns the response body data
+    when the status line and headers have been parsed.  Chunked transfer
+    encoding is decoded.
+
+    Arguments:
+      method: HTTP method of the request.
+
+    Attributes:
+      status_code (int): HTTP status code (None until parsed).
+      headers: Response headers (None until parsed).
+      done (bool): Complete response has been parsed.
+    """
+
+    MAX_LINE_SIZE = 65536
+
+    def __init__(self, method: str='GET'):
+        self.method = method
+        self.status_code = None
+        self.reason = None
+        self.headers = None
+        self._state = 'head'
+        self._line = bytearray()
+        # Body bytes left (of current chunk when chunked, and None when body
+        # is terminated by connection close)
+        self._left = None
+
+    @property
+    def done(self) -> bool:
+        return self._state == 'done'
+
+    def feed(self, data: bytes) -> List[memoryview]:
+        """Feed received data to parser.
+
+        Arguments:
+          data: Data received from socket.
+
+        Returns:
+          List of response body data pieces (slices of data).
+        """
+        data = memoryview(data)
+        body = []
+        while data and self._state != 'done':
+            if self._state in ('body', 'data'):
+                size = len(data) if self._left is None \
+                    else min(len(data), self._left)
+                body.append(data[:size])
+                data = data[size:]
+                if self._left is not None:
+                    self._left -= size
+                    if self._left == 0:
+                        self._state = 'crlf' if self._state == 'data' \
+                            else 'done'
+                continue
+            # All other states are line based
+            end = bytes(data[:self.MAX_LINE_SIZE]).find(b'\n')
+            if end < 0:
+                self._line += data
+                data = data[len(data):]
+            else:
+                self._line += data[:end + 1]
+                data = data[end + 1:]
+            if len(self._line) > self.MAX_LINE_SIZE:
+                raise _http_client().LineTooLong(self._state)
+            if end >= 0:
+                line = bytes(self._line)
+                self._line = bytearray()
+                self._parse_line(line)
+        return body
+
+    def eof(self) -> None:
+        """Signal that connection was closed by Docker daemon.
+
+        Raises:
+          http.client.IncompleteRead: Response is not complete.
+        """
+        if self._state == 'body' and self._left is None:
+            self._state = 'done'
+        if self._state != 'done':
+            raise _http_client().IncompleteRead(b'')
+
+    def _parse_line(self, line):
+        if self._state == 'head':
+            if self.status_code is None:
+                self._parse_status_line(line)
+            elif line in (b'\r\n', b'\n'):
+                self._parse_headers()
+            else:
+                self._head.append(line)
+        elif self._state == 'size':
+            try:
+                self._left = int(line.split(b';', 1)[0], 16)
+            except ValueError:
+                raise _http_client().IncompleteRead(line)
+            self._state = 'data' if self._left else 'trailer'
+        elif self._state == 'crlf':
+            self._state = 'size'
+        elif self._state == 'trailer':
+            if line in (b'\r\n', b'\n'):
+                self._state = 'done'
+
+    def _parse_status_line(self, line):
+        try:
+            version, status, reason = (
+                line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+            self.status_code = int(status)
+        except ValueError:
+            raise _http_client().BadStatusLine(line)
+        if not version.startswith('HTTP/'):
+            raise _http_client().BadStatusLine(line)
+        self.reason = reason
+        self._head = []
+
+    def _parse_headers(self):
+        self.headers = _http_client().parse_headers(
+            io.BytesIO(b''.join(self._head)))
+        del self._head
+        if (self.method == 'HEAD' or self.status_code in (204, 304) or
+                100 <= self.status_code < 200):
+            self._state = 'done'
+        elif 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            self._state = 'size'
+        else:
+            if self.headers.get('Content-Length') is not None:
+                self._left = int(self.headers['Content-Length'])
+            self._state = 'body' if self._left != 0 else 'done'
+
+
+class HijackedSocket(object):
+    """Raw duplex stream on a hijacked connection to Docker daemon.
+
+    Reads go directly into caller supplied buffers (`readinto`), and
+    writes accept any bytes-like object (fx. memoryview slices of a
+    reused buffer), so data can be streamed without allocating memory per
+    chunk.
+
+    Arguments:
+      connection: The hijacked Connection.
+      status_code: HTTP status code of the response.
+      reason: HTTP reason phrase of the response.
+      headers: Response headers.
+      pending: Stream data received together with the response head.
+
+    Attributes:
+      status_code (int): HTTP status code (101 when upgraded).
+      reason (str): HTTP reason phrase.
+      headers: Response headers (case-insensitive mapping).
+    """
+
+    def __init__(self, connection: Connection, status_code: int,
+                 reason: str, headers, pending: bytes=b''):
+        self.connection = connection
+        self.sock = connection.sock
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self._pending = memoryview(bytes(pending))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    def settimeout(self, timeout: Optional[float]) -> None:
+        self.sock.settimeout(timeout)
+
+    def readinto(self, buf) -> int:
+        """Read data into a pre-allocated buffer.
+
+        Returns as soon as any data is available.
+
+        Arguments:
+          buf: Writable buffer (fx. a bytearray or memoryview).
+
+        Returns:
+          Number of bytes read (0 at end of stream).
+        """
+        if self._pending:
+            size = min(len(buf), len(self._pending))
+            memoryview(buf)[:size] = self._pending[:size]
+            self._pending = self._pending[size:]
+            return size
+        return self.sock.recv_into(buf)
+
+    def read(self, size: int=CHUNK_SIZE) -> bytes:
+        """Read up to size bytes (empty bytes at end of stream)."""
+        if self._pending:
+            data = bytes(self._pending[:size])
+            self._pending = self._pending[size:]
+            return data
+        return self.sock.recv(size)
+
+    def write(self, data) -> int:
+        """Write data, returning the number of bytes written.
+
+        Arguments:
+          data: Bytes-like object (fx. bytes or memoryview).
+        """
+        return self.sock.send(data)
+
+    def sendall(self, data) -> None:
+        """Write all of data.
+
+        Arguments:
+          data: Bytes-like object (fx. bytes or memoryview).
+        """
+        self.sock.sendall(data)
+
+    def send_from(self, fileobj, buffer_size: int=CHUNK_SIZE) -> int:
+        """Write all data from a binary file object.
+
+        Regular files are sent using sendfile(2).  Other file objects are
+        read into a single reused buffer.
+
+        Arguments:
+          fileobj: Binary file object to read data from.
+          buffer_size: Size of buffer.
+
+        Returns:
+          Number of bytes written.
+        """
+        if is_regular_file(fileobj):
+            return self.sock.sendfile(fileobj, offset=fileobj.tell())
+        view = memoryview(bytearray(buffer_size))
+        total = 0
+        while True:
+            size = fileobj.readinto(view)
+            if not size:
+                return total
+            self.sock.sendall(view[:size])
+            total += size
+
+    def close_write(self) -> None:
+        """Close the writing side of the stream (signalling end of stdin)."""
+        self.sock.shutdown(socket.SHUT_WR)
+
+    def frames(self, tty: bool=False, copy: bool=True,
+               buffer_size: int=CHUNK_SIZE) -> Iterator[Tuple[int, bytes]]:
+        """Iterate over frames read from the stream.
+
+        Arguments:
+          tty: Stream is a raw TTY stream (and not multiplexed).
+          copy: Return frame data as bytes.  If False, frame data is returned
+            as memoryview, only valid until the next frame is requested.
+          buffer_size: Size of buffer used for reading.
+
+        Returns:
+          Iterator of (stream, data) tuples.
+        """
+        frames = raw_frames if tty else demux_frames
+        return frames(self.readinto, buffer_size, copy=copy)
+
+    def close(self) -> None:
+        self.connection.close()
@@ -6,7 +6,7 @@ log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
 
 
-__all__ = ['Container']
+__all__ = ['Container', 'PathStat']
 
 
 class ContainerState(object):
@@ -27,6 +27,39 @@ class ContainerState(object):
         return (self.finished_at - self.started_at)
 
 
+class PathStat(object):
+    """Stat information for a filesystem resource in a container.
+
+    Arguments:
+      stat: JSON object from the X-Docker-Container-Path-Stat header.
+
+    Attributes:
+      name (str): Base name of the resource.
+      size (int): Size in bytes.
+      mode (int): File mode and permission bits (Go os.FileMode).
+      mtime (str): Modification time.
+      link_target (str): Target of symbolic link (or empty string).
+    """
+
+    MODE_DIR = 1 << 31
+    MODE_SYMLINK = 1 << 27
+
+    def __init__(self, stat):
+        self.name = stat.get('name')
+        self.size = stat.get('size')
+        self.mode = stat.get('mode')
+        self.mtime = stat.get('mtime')
+        self.link_target = stat.get('linkTarget')
+
+    @property
+    def is_dir(self):
+        return bool(self.mode and self.mode & self.MODE_DIR)
+
+    @property
+    def is_symlink(self):
+        return bool(self.mode and self.mode & self.MODE_SYMLINK)
+
+
 class Container(object):
     """Docker container."""
 
@@ -0,0 +1,406 @@
+"""Module containing slow call detector and sampling profiler."""
+
+import io
+import os
+import random
+import threading
+import traceback
+import collections
+
+from typing import Optional, Sequence, Dict, List, TYPE_CHECKING
+
+from xd.docker.observer import Observer, OperationInfo, PhaseInfo, \
+    RequestInfo
+
+if TYPE_CHECKING:
+    import pstats
+
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+__all__ = ['SlowCall', 'SlowCallDetector', 'Profiler', 'redact_headers']
+
+
+# Request headers carrying credentials (lower case)
+REDACTED_HEADERS = frozenset(('authorization', 'proxy-authorization',
+                              'x-registry-auth', 'x-registry-config'))
+
+REDACTED = '<redacted>'
+
+
+def redact_headers(headers: Optional[Dict]) -> Optional[Dict]:
+    """Get copy of request headers with credentials redacted.
+
+    Arguments:
+      headers: Request headers.
+
+    Returns:
+      Copy of headers, with values of headers carrying credentials (fx.
+      X-Registry-Auth) replaced.
+    """
+    if headers is None:
+        return None
+    return {name: REDACTED if name.lower() in REDACTED_HEADERS else value
+            for name, value in headers.items()}
+
+
+def _caller_stack():
+    # Get formatted stack, without the innermost frames in this package
+    package = os.path.dirname(os.path.abspath(__file__))
+    stack = traceback.extract_stack()
+    while stack and os.path.dirname(
+            os.path.abspath(stack[-1].filename)) == package:
+        stack.pop()
+    return traceback.format_list(stack)
+
+
+def _request_timings(info):
+    return {'method': info.method,
+            'url': info.url,
+            'status_code': info.status_code,
+            'connect_time': info.connect_time,
+            'first_byte_time': info.first_byte_time,
+            'total_time': info.total_time,
+            'request_bytes': info.request_bytes,
+            'response_bytes': info.response_bytes,
+            'params': info.params or None,
+            'headers': redact_headers(info.headers) or None}
+
+
+class SlowCall(object):
+    """Record of a call slower than the slow call threshold.
+
+    Attributes:
+      kind (str): 'operation' or 'request'.
+      name (str): Operation name, or request method and endpoint template.
+      start (float): UNIX timestamp of start of call.
+      duration (float): Seconds the call took (until the response head was
+        received, for streamed requests).
+      endpoint (str): Endpoint template (None for operations).
+      url (str): Request path (None for operations).
+      params (dict): Query parameters (None for operations).
+      headers (dict): Request headers, with credentials redacted (None for
+        operations).
+      timings (list): Timings breakdown.  For operations, a dict for each
+        request made (method, url, status_code, connect_time,
+        first_byte_time, total_time, request_bytes, response_bytes, params
+        and headers, with credentials redacted) and local phase (phase,
+        duration and busy_time), including those of nested operations.
+        For requests, a single dict.
+      stack (list): Python stack (formatted lines) of the caller, up to
+        where it called into xd.docker.
+      exception (Exception): Exception raised by the call (or None).
+    """
+
+    def __init__(self, kind: str, name: str, start: float, duration: float,
+                 timings: List[Dict], stack: List[str],
+                 exception: Optional[Exception]=None,
+                 endpoint: Optional[str]=None, url: Optional[str]=None,
+                 params: Optional[Dict]=None,
+                 headers: Optional[Dict]=None):
+        self.kind = kind
+        self.name = name
+        self.start = start
+        self.duration = duration
+        self.timings = timings
+        self.stack = stack
+        self.exception = exception
+        self.endpoint = endpoint
+        self.url = url
+        self.params = params
+        self.headers = headers
+
+    def format(self) -> str:
+        """Format slow call record as multi-line text."""
+        lines = ['{} {} took {:.3f}s'.format(self.kind, self.name,
+                                             self.duration)]
+        if self.url is not None:
+            lines.append('  url: {}'.format(self.url))
+        if self.params:
+            lines.append('  params: {!r}'.format(self.params))
+        if self.headers:
+            lines.append('  headers: {!r}'.format(self.headers))
+        if self.exception is not None:
+            lines.append('  exception: {!r}'.format(self.exception))
+        for timing in self.timings:
+            lines.append('  ' + ' '.join(
+                '{}={}'.format(k, _format_timing(v))
+                for k, v in timing.items() if v is not None))
+        lines.append('  stack:')
+        lines.extend('    ' + line for line in
+                     ''.join(self.stack).rstrip('\n').split('\n'))
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return 'SlowCall({!r}, {!r}, duration={:.3f})'.format(
+            self.kind, self.name, self.duration)
+
+
+def _format_timing(value):
+    if isinstance(value, float):
+        return '{:.6f}'.format(value)
+    return str(value)
+
+
+class SlowCallDetector(Observer):
+    """DockerClient observer recording calls slower than a threshold.
+
+    Operations (public DockerClient method calls) taking longer than
+    threshold are recorded with a timings breakdown of the requests and
+    local phases of the operation.  Requests made outside of operations
+    are recorded on their own.  Streamed requests are measured until the
+    response head is received, so long running streams (fx. following
+    logs) are not reported.
+
+    Slow calls are logged (at level given by log_level) and kept in
+    `records`.
+
+    Arguments:
+      threshold: Threshold in seconds.
+      max_records: Maximum number of slow calls kept (oldest are dropped).
+      log_level: Level to log slow calls at (or None to not log them).
+
+    :Example:
+
+    >>> slow = SlowCallDetector(threshold=0.5)
+    >>> docker.add_observer(slow)
+    >>> for call in slow.records:
+    ...     print(call.format())
+    """
+
+    def __init__(self, threshold: float=1.0, max_records: int=100,
+                 log_level: Optional[int]=logging.WARNING):
+        self.threshold = threshold
+        self.log_level = log_level
+        self._records = collections.deque(maxlen=max_records)
+        # Timings of running operations, by id of OperationInfo
+        self._timings = {}
+
+    @property
+    def records(self) -> List[SlowCall]:
+        """Slow calls recorded, oldest first."""
+        return list(self._records)
+
+    def clear(self) -> None:
+        """Drop all slow call records."""
+        self._records.clear()
+
+    def report(self) -> str:
+        """Get text report of recorded slow calls."""
+        return '\n'.join(call.format() for call in self.records)
+
+    def _record(self, call):
+        self._records.append(call)
+        if self.log_level is not None:
+            log.log(self.log_level, 'Slow call: %s', call.format())
+
+    def operation_start(self, info: OperationInfo) -> None:
+        self._timings[id(info)] = []
+
+    def operation_end(self, info: OperationInfo) -> None:
+        timings = self._timings.pop(id(info), None)
+        if timings is None or info.duration <= self.threshold:
+            return
+        self._record(SlowCall('operation', info.name, info.start,
+                              info.duration, timings, _caller_stack(),
+                              info.exception))
+
+    def _add_timings(self, operation, timings):
+        # Add timings to operation, and the operations it is nested in
+        while operation is not None:
+            operation_timings = self._timings.get(id(operation))
+            if operation_timings is not None:
+                operation_timings.append(timings)
+            operation = operation.parent
+
+    def phase_end(self, info: PhaseInfo) -> None:
+        self._add_timings(info.operation, {
+            'phase': info.name, 'duration': info.duration,
+            'busy_time': info.busy_time})
+
+    def request_end(self, info: RequestInfo) -> None:
+        if info.operation is not None:
+            self._add_timings(info.operation, _request_timings(info))
+            return
+        duration = info.total_time
+        if info.stream and info.first_byte_time is not None:
+            duration = info.first_byte_time
+        if duration is None or duration <= self.threshold:
+            return
+        self._record(SlowCall(
+            'request', '{} {}'.format(info.method, info.endpoint),
+            info.start, duration, [_request_timings(info)], _caller_stack(),
+            info.exception, endpoint=info.endpoint, url=info.url,
+            params=info.params, headers=redact_headers(info.headers)))
+
+
+class Profiler(Observer):
+    """DockerClient observer profiling a sampled fraction of operations.
+
+    With mode 'cprofile', sampled operations are run with cProfile, and
+    the profiles are aggregated.  Only one operation is profiled at a
+    time.
+
+    With mode 'tracemalloc', memory allocations of sampled operations are
+    traced, and the allocated size and count are aggregated per source
+    line.  Tracing is started when the first operation is sampled, and
+    stopped by `close` (if it was started by the profiler).  Note that
+    while tracing is active, all memory allocations are slower.
+    Allocations done concurrently by other threads are included.
+
+    Only top-level operations (not operations called by other operations)
+    are sampled.
+
+    Arguments:
+      mode: 'cprofile' or 'tracemalloc'.
+      sample_rate: Fraction of operations to profile (0.0 to 1.0).
+      operations: Names of operations to profile (default is all).
+      frames: Number of frames to store for each traced memory block
+        (for mode 'tracemalloc').
+
+    :Example:
+
+    >>> profiler = Profiler('cprofile', sample_rate=0.01)
+    >>> docker.add_observer(profiler)
+    >>> print(profiler.report())
+    """
+
+    MODES = ('cprofile', 'tracemalloc')
+
+    def __init__(self, mode: str='cprofile', sample_rate: float=0.01,
+                 operations: Optional[Sequence[str]]=None, frames: int=1):
+        if mode not in self.MODES:
+            raise ValueError('invalid profiler mode: {}'.format(mode))
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError('sample_rate must be between 0 and 1')
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.operations = None if operations is None else set(operations)
+        self.frames = frames
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._running = {}
+        self._stats = None
+        self._allocations = collections.Counter()
+        self._tracing = False
+
+    def _sampled(self, info):
+        if info.parent is not None:
+            return False
+        if self.operations is not None and info.name not in self.operations:
+            return False
+        return random.random() < self.sample_rate
+
+    def operation_start(self, info: OperationInfo) -> None:
+        if not self._sampled(info):
+            return
+        # Profiling modules are imported when needed, to keep import of
+        # this module fast
+        import cProfile
+        import tracemalloc
+        if self.mode == 'cprofile':
+            with self._lock:
+                if self._running:
+                    return
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError:
+                    # Another profiler is active
+                    return
+                self._running[id(info)] = profile
+        else:
+            with self._lock:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(self.frames)
+                    self._tracing = True
+            self._running[id(info)] = tracemalloc.take_snapshot()
+
+    def operation_end(self, info: OperationInfo) -> None:
+        state = self._running.pop(id(info), None)
+        if state is None:
+            return
+        import pstats
+        import tracemalloc
+        if self.mode == 'cprofile':
+            state.disable()
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(state)
+                else:
+                    self._stats.add(state)
+                self.samples += 1
+        else:
+            if not tracemalloc.is_tracing():
+                return
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__)))
+            diff = snapshot.compare_to(state, 'lineno')
+            with self._lock:
+                for stat in diff:
+                    if stat.size_diff > 0:
+                        key = str(stat.traceback[0])
+                        self._allocations[key] += stat.size_diff
+                self.samples += 1
+
+    @property
+    def stats(self) -> Optional['pstats.Stats']:
+        """Aggregated cProfile statistics (or None if nothing sampled)."""
+        return self._stats
+
+    def report(self, limit: int=30, sort: str='cumulative') -> str:
+        """Get text report of aggregated profile.
+
+        Arguments:
+          limit: Maximum number of functions or source lines to include.
+          sort: Sort key for cProfile statistics (see `pstats.Stats`).
+        """
+        header = '{} samples ({})\n'.format(self.samples, self.mode)
+        with self._lock:
+            if self.mode == 'cprofile':
+                if self._stats is None:
+                    return header
+                out = io.StringIO()
+                self._stats.stream = out
+                self._stats.sort_stats(sort).print_stats(limit)
+                return header + out.getvalue()
+            lines = ['{}: {:.1f} KiB'.format(line, size / 1024)
+                     for line, size in self._allocations.most_common(limit)]
+        return header + ''.join(line + '\n' for line in lines)
+
+    def dump(self, path: str) -> None:
+        """Dump aggregated profile to file.
+
+        With mode 'cprofile', statistics are dumped in the binary format
+        read by `pstats.Stats`.  Otherwise, the text report is written.
+
+        Arguments:
+          path: Path of file to write.
+        """
+        if self.mode == 'cprofile':
+            with self._lock:
+                if self._stats is not None:
+                    self._stats.dump_stats(path)
+                    return
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'w') as f:
+            f.write(self.report(limit=1000))
+        os.replace(tmp, path)
+
+    def reset(self) -> None:
+        """Drop aggregated profile."""
+        with self._lock:
+            self._stats = None
+            self._allocations.clear()
+            self.samples = 0
+
+    def close(self) -> None:
+        """Stop memory tracing, if it was started by the profiler."""
+        with self._lock:
+            if self._tracing:
+                import tracemalloc
+                tracemalloc.stop()
+                self._tracing = False
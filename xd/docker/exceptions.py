@@ -8,3 +8,19 @@ class IncompatibleRemoteAPI(DockerException):
 
 class PermissionDenied(DockerException):
     """Permission denied"""
+
+
+class CassetteError(DockerException):
+    """Request not recorded in cassette, or invalid cassette"""
+
+
+class ClusterError(DockerException):
+    """Request failed on hosts of DockerCluster, or no host available"""
+
+    def __init__(self, message, errors=None):
+        super(ClusterError, self).__init__(message)
+        self.errors = errors or {}
+
+
+class CircuitOpenError(DockerException):
+    """Request not sent, as Docker host is unhealthy (circuit breaker open)"""
@@ -0,0 +1,112 @@
+"""Module containing Exec and ExecResult classes."""
+
+from typing import Optional
+
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+__all__ = ['Exec', 'ExecResult']
+
+
+class Exec(object):
+    """Docker exec instance.
+
+    Arguments:
+      client: DockerClient instance.
+      id: Exec instance id.
+      container: Container (id or name) the exec instance belongs to.
+      inspect_response: JSON object from /exec/(id)/json endpoint.
+
+    Attributes:
+      running (bool): Command is running.
+      exit_code (int): Exit code of command (None while running).
+      pid (int): Process id of command.
+      process_config (dict): Command configuration (entrypoint, arguments,
+        user, tty and privileged).
+    """
+
+    def __init__(self, client, id: str, container: Optional[str]=None,
+                 inspect_response=None):
+        self.client = client
+        self.id = id
+        self.container = container
+        self.running = None
+        self.exit_code = None
+        self.pid = None
+        self.process_config = None
+        if inspect_response:
+            self._parse_inspect_response(inspect_response)
+
+    def _parse_inspect_response(self, response):
+        self.running = response.get('Running')
+        self.exit_code = response.get('ExitCode')
+        self.pid = response.get('Pid')
+        self.process_config = response.get('ProcessConfig')
+        container = response.get('ContainerID')
+        if container is None:
+            container = (response.get('Container') or {}).get('ID')
+        if container is not None:
+            self.container = container
+
+    def __repr__(self):
+        return 'Exec({!r}, container={!r})'.format(self.id, self.container)
+
+
+class _Tail(object):
+    # Bounded buffer, keeping the last size bytes written to it
+
+    def __init__(self, size):
+        self.size = size
+        self.buf = bytearray()
+        self.truncated = False
+
+    def write(self, data):
+        self.buf += data
+        if len(self.buf) > 2 * self.size:
+            del self.buf[:-self.size]
+            self.truncated = True
+
+    def getvalue(self):
+        if len(self.buf) > self.size:
+            self.truncated = True
+            return bytes(self.buf[-self.size:])
+        return bytes(self.buf)
+
+
+class ExecResult(object):
+    """Result of running a command in a container.
+
+    Attributes:
+      container (str): Container (id or name) the command was run in.
+      exit_code (int): Exit code of command (None if command failed to
+        run).
+      stdout (bytes): Output on stdout (only the end of it, if output was
+        truncated).
+      stderr (bytes): Output on stderr (only the end of it, if output was
+        truncated).
+      truncated (bool): Output exceeded the output limit and was truncated.
+      error (Exception): Exception raised when trying to run the command
+        (or None).
+    """
+
+    def __init__(self, container: str, exit_code: Optional[int]=None,
+                 stdout: bytes=b'', stderr: bytes=b'',
+                 truncated: bool=False,
+                 error: Optional[Exception]=None):
+        self.container = container
+        self.exit_code = exit_code
+        self.stdout = stdout
+        self.stderr = stderr
+        self.truncated = truncated
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        """Command was run and exited with exit code 0."""
+        return self.error is None and self.exit_code == 0
+
+    def __repr__(self):
+        return 'ExecResult({!r}, exit_code={!r}, error={!r})'.format(
+            self.container, self.exit_code, self.error)
@@ -0,0 +1,367 @@
+"""Module containing health tracking and circuit breaker for Docker hosts."""
+
+import collections
+import threading
+import time
+
+from typing import Optional, Callable, List
+
+from xd.docker.observer import Observer, RequestInfo
+from xd.docker.metrics import MetricsRegistry
+from xd.docker.exceptions import CircuitOpenError
+
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+__all__ = ['CircuitBreaker', 'HealthEvent', 'CLOSED', 'OPEN', 'HALF_OPEN']
+
+
+# Circuit breaker states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+# Trial request admitted by CircuitBreaker.admit on each thread, handed
+# over to request_start
+_context = threading.local()
+
+
+class HealthEvent(object):
+    """Health transition of a Docker host.
+
+    Attributes:
+      host (str): Host name.
+      old (str): Previous state (CLOSED, OPEN or HALF_OPEN).
+      new (str): New state.
+      reason (str): Reason of transition.
+      time (float): UNIX timestamp of transition.
+    """
+
+    __slots__ = ('host', 'old', 'new', 'reason', 'time')
+
+    def __init__(self, host: str, old: str, new: str, reason: str):
+        self.host = host
+        self.old = old
+        self.new = new
+        self.reason = reason
+        self.time = time.time()
+
+    def __repr__(self):
+        return '<HealthEvent {} {} -> {} ({})>'.format(
+            self.host, self.old, self.new, self.reason)
+
+
+class CircuitBreaker(Observer):
+    """Health tracking and circuit breaker for a Docker host.
+
+    The breaker tracks the outcome of the latest requests to the host.
+    Requests failing with a connection error or timeout (OSError) or a
+    server error (5xx) are failures.  While the breaker is CLOSED (the host
+    is healthy), requests are sent as usual.  When the failure rate of the
+    latest requests reaches failure_rate, or a health check fails, the
+    breaker is OPEN: requests fail fast with CircuitOpenError, instead of
+    waiting for timeouts of a dead host.
+
+    While OPEN, a background thread pings the host every probe_interval
+    seconds.  When a ping succeeds, the breaker is HALF_OPEN, and up to
+    trial_requests concurrent requests are let through.  When as many
+    requests have succeeded, the breaker is CLOSED again.  A failure while
+    HALF_OPEN opens the breaker again.
+
+    Health transitions are logged, kept in `events`, and passed to
+    listeners added with `add_listener`.  The following metrics are
+    registered:
+
+    - xd_docker_host_state{host,state} (1 for the current state)
+    - xd_docker_host_transitions_total{host,state}
+    - xd_docker_host_rejected_total{host}
+
+    The breaker is a request observer, and is normally enabled with the
+    breaker argument of DockerClient, which binds it to the client.
+
+    Arguments:
+      name: Host name, used in events and metrics (default: base URL of
+        client).
+      window: Number of latest requests to compute failure rate over.
+      min_requests: Minimum number of requests in window before opening on
+        failure rate.
+      failure_rate: Failure rate (0.0 to 1.0) opening breaker.
+      probe_interval: Seconds between pings while OPEN.
+      probe_timeout: Timeout of pings in seconds.
+      trial_requests: Number of requests let through (and succeeded)
+        while HALF_OPEN, before the breaker is CLOSED.
+      max_events: Maximum number of events kept (oldest are dropped).
+      metrics: Registry to register metrics in (default: the metrics
+        registry of the client, if enabled, otherwise a new registry).
+
+    Raises:
+      ValueError: Invalid argument.
+
+    :Example:
+
+    >>> docker = DockerClient('tcp://10.0.0.1:2375', breaker=True)
+    >>> docker.breaker.add_listener(print)
+    >>> if docker.breaker.healthy:
+    ...     docker.containers()
+    """
+
+    def __init__(self, name: Optional[str]=None, window: int=20,
+                 min_requests: int=5, failure_rate: float=0.5,
+                 probe_interval: float=5.0, probe_timeout: float=2.0,
+                 trial_requests: int=3, max_events: int=100,
+                 metrics: Optional[MetricsRegistry]=None):
+        if not 0.0 < failure_rate <= 1.0:
+            raise ValueError('invalid failure rate: {}'.format(failure_rate))
+        if min_requests < 1 or min_requests > window:
+            raise ValueError('invalid min_requests: {}'.format(min_requests))
+        if trial_requests < 1:
+            raise ValueError('invalid trial_requests: {}'.format(
+                trial_requests))
+        self.name = name
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.trial_requests = trial_requests
+        self.client = None
+        self.metrics = metrics
+        self._events = collections.deque(maxlen=max_events)
+        self._listeners = ()
+        self._outcomes = collections.deque(maxlen=window)
+        self._state = CLOSED
+        self._trials = 0
+        self._successes = 0
+        self._slots = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._prober = None
+
+    def bind(self, client) -> None:
+        """Bind breaker to client.
+
+        Called by DockerClient.
+
+        Arguments:
+          client: DockerClient of the host.
+        """
+        self.client = client
+        if self.name is None:
+            self.name = client.base_url
+        if self.metrics is None:
+            self.metrics = client.metrics or MetricsRegistry()
+        self.state_gauge = self.metrics.gauge(
+            'xd_docker_host_state',
+            'Circuit breaker state of Docker host.', ('host', 'state'))
+        self.transitions = self.metrics.counter(
+            'xd_docker_host_transitions_total',
+            'Circuit breaker state transitions of Docker host.',
+            ('host', 'state'))
+        self.rejected = self.metrics.counter(
+            'xd_docker_host_rejected_total',
+            'Requests rejected by open circuit breaker.', ('host',))
+        self.state_gauge.inc((self.name, self._state))
+
+    @property
+    def state(self) -> str:
+        """Current state (CLOSED, OPEN or HALF_OPEN)."""
+        return self._state
+
+    @property
+    def healthy(self) -> bool:
+        """Host is healthy (breaker is CLOSED)."""
+        return self._state == CLOSED
+
+    @property
+    def events(self) -> List[HealthEvent]:
+        """Latest health transitions, oldest first."""
+        return list(self._events)
+
+    def add_listener(self, listener: Callable[[HealthEvent], None]) -> None:
+        """Add listener called with each health transition.
+
+        Listeners are called on the thread causing the transition (which
+        may be the background probe thread), and must not block.
+
+        Arguments:
+          listener: Function called with HealthEvent.
+        """
+        with self._lock:
+            self._listeners = self._listeners + (listener,)
+
+    def close(self) -> None:
+        """Stop background probing."""
+        self._closed.set()
+        prober = self._prober
+        if prober is not None and prober is not threading.current_thread():
+            prober.join()
+
+    def _transition(self, new, reason):
+        # Change state (with _lock held), returning the event to publish
+        old = self._state
+        if old == new:
+            return None
+        self._state = new
+        self._trials = 0
+        self._successes = 0
+        self._outcomes.clear()
+        if self.client is not None:
+            self.state_gauge.dec((self.name, old))
+            self.state_gauge.inc((self.name, new))
+            self.transitions.inc((self.name, new))
+        if new == OPEN and not self._closed.is_set() and \
+                self.client is not None:
+            self._prober = threading.Thread(
+                target=self._probe_loop, daemon=True,
+                name='xd-docker-probe-{}'.format(self.name))
+            self._prober.start()
+        elif old == OPEN:
+            self._prober = None
+        return HealthEvent(self.name, old, new, reason)
+
+    def _publish(self, event):
+        if event is None:
+            return
+        if event.new == CLOSED:
+            log.info('Docker host %s is healthy (%s)', event.host,
+                     event.reason)
+        else:
+            log.warning('Docker host %s is %s (%s)', event.host, event.new,
+                        event.reason)
+        self._events.append(event)
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception:
+                log.exception('Health listener %r failed', listener)
+
+    def admit(self) -> None:
+        """Check if a request may be sent.
+
+        Called by DockerClient before each request.
+
+        Raises:
+          CircuitOpenError: Breaker is OPEN (or HALF_OPEN with all trial
+            requests in flight).
+        """
+        if self._state == CLOSED or getattr(_context, 'probing', False):
+            return
+        with self._lock:
+            if self._state == HALF_OPEN and \
+                    self._trials + self._successes < self.trial_requests:
+                self._trials += 1
+                _context.trial = True
+                return
+            state = self._state
+            if state == CLOSED:
+                return
+        if self.client is not None:
+            self.rejected.inc((self.name,))
+        raise CircuitOpenError('Docker host {} is {}'.format(
+            self.name, state))
+
+    @staticmethod
+    def failed(exception: Optional[Exception]) -> bool:
+        """Check if request failed with a host failure.
+
+        Arguments:
+          exception: Exception raised by request (or None).
+
+        Returns:
+          True for connection errors, timeouts and server errors.
+        """
+        if exception is None:
+            return False
+        if isinstance(exception, OSError):
+            return True
+        code = getattr(exception, 'code', None)
+        return isinstance(code, int) and code >= 500
+
+    def record(self, failed: bool, trial: bool=False) -> None:
+        """Record outcome of a request.
+
+        Arguments:
+          failed: Request failed (see `failed`).
+          trial: Request was admitted as trial request while HALF_OPEN.
+        """
+        with self._lock:
+            if trial and self._state == HALF_OPEN:
+                self._trials -= 1
+            if self._state == CLOSED:
+                self._outcomes.append(failed)
+                count = len(self._outcomes)
+                failures = sum(self._outcomes)
+                event = None
+                if count >= self.min_requests and \
+                        failures >= self.failure_rate * count:
+                    event = self._transition(OPEN, '{} of {} requests '
+                                             'failed'.format(failures,
+                                                             count))
+            elif self._state == HALF_OPEN and trial:
+                # Only trial requests count, not requests admitted before
+                # the breaker opened
+                if failed:
+                    event = self._transition(OPEN, 'trial request failed')
+                else:
+                    self._successes += 1
+                    event = None
+                    if self._successes >= self.trial_requests:
+                        event = self._transition(
+                            CLOSED, '{} trial requests succeeded'.format(
+                                self._successes))
+            else:
+                event = None
+        self._publish(event)
+
+    def check(self) -> bool:
+        """Check health of host now, by pinging it.
+
+        A failed ping opens the breaker, and a successful ping of an OPEN
+        breaker makes it HALF_OPEN.
+
+        Returns:
+          True if ping succeeded.
+        """
+        _context.probing = True
+        try:
+            with self.client.options(timeout=self.probe_timeout,
+                                     retry=False):
+                self.client.ping()
+        except Exception as e:
+            with self._lock:
+                event = self._transition(OPEN, 'ping failed: {!r}'.format(e))
+            self._publish(event)
+            return False
+        finally:
+            _context.probing = False
+        with self._lock:
+            event = None
+            if self._state == OPEN:
+                event = self._transition(HALF_OPEN, 'ping succeeded')
+        self._publish(event)
+        return True
+
+    def _probe_loop(self):
+        # Ping host until it answers (or the breaker is closed).  A new
+        # thread is started each time the breaker opens, so the loop ends
+        # when this thread is no longer the current prober.
+        thread = threading.current_thread()
+        while not self._closed.wait(self.probe_interval):
+            if self._prober is not thread or self.check():
+                return
+
+    def request_start(self, info: RequestInfo) -> None:
+        if getattr(_context, 'trial', False):
+            _context.trial = False
+            self._slots[id(info)] = True
+        elif getattr(_context, 'probing', False):
+            self._slots[id(info)] = None
+
+    def request_end(self, info: RequestInfo) -> None:
+        trial = self._slots.pop(id(info), False)
+        if trial is None:
+            # Pings made by check() are accounted for there
+            return
+        self.record(self.failed(info.exception), trial)
@@ -0,0 +1,311 @@
+"""Module containing adaptive concurrency limiters."""
+
+import threading
+import time
+import collections
+import contextlib
+
+from typing import Optional, Iterator
+
+from xd.docker.observer import Observer, RequestInfo
+
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+__all__ = ['AdaptiveLimiter', 'ConcurrencyLimiter', 'HEAVY', 'LIGHT',
+           'WAITING_ENDPOINTS']
+
+
+# Request classes of ConcurrencyLimiter
+HEAVY = 'heavy'
+LIGHT = 'light'
+
+# Requests waiting for containers (or events) rather than for Docker daemon,
+# as (method, endpoint) pairs.  Their latency says nothing about daemon load,
+# and they can take arbitrarily long.
+WAITING_ENDPOINTS = frozenset([
+    ('POST', '/containers/{id}/wait'),
+    ('POST', '/containers/{id}/stop'),
+    ('POST', '/containers/{id}/restart'),
+    ('GET', '/containers/{id}/logs'),
+    ('GET', '/containers/{id}/stats'),
+    ('POST', '/containers/{id}/attach'),
+    ('POST', '/exec/{id}/start'),
+    ('GET', '/events'),
+])
+
+
+class AdaptiveLimiter(object):
+    """Adaptive concurrency limiter.
+
+    Limits the number of concurrent calls, adapting the limit to the
+    observed latency using AIMD (additive increase, multiplicative
+    decrease).  While latency stays below the target, the limit grows by
+    about one per limit calls completed.  When a call is slower than the
+    target, or fails, the limit is multiplied by backoff.
+
+    Calls waiting for a slot are served in FIFO order.
+
+    Arguments:
+      initial: Initial concurrency limit.
+      minimum: Minimum concurrency limit.
+      maximum: Maximum concurrency limit.
+      target_latency: Latency (in seconds) above which the limit is
+        decreased.  If not given, tolerance times the lowest latency
+        observed is used.
+      tolerance: Factor applied to lowest observed latency to get target
+        latency (when target_latency is not given).  The lowest observed
+        latency slowly drifts upwards, so a few unusually fast calls do not
+        pin the target.
+      backoff: Factor to multiply limit with on decrease.
+
+    :Example:
+
+    >>> limiter = AdaptiveLimiter(initial=4, maximum=32)
+    >>> with limiter.slot():
+    ...     docker.container_inspect('web1')
+    """
+
+    # Lower bound for target latency derived from observed latency
+    MIN_TARGET_LATENCY = 0.001
+
+    # Relative upwards drift of lowest observed latency per call
+    MIN_LATENCY_DRIFT = 0.001
+
+    def __init__(self, initial: int=4, minimum: int=1, maximum: int=64,
+                 target_latency: Optional[float]=None,
+                 tolerance: float=2.0, backoff: float=0.75):
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError('invalid limits: {} <= {} <= {}'.format(
+                minimum, initial, maximum))
+        if not 0.0 < backoff < 1.0:
+            raise ValueError('backoff must be between 0 and 1')
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.min_latency = None
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._waiters = collections.deque()
+        self._cond = threading.Condition(threading.Lock())
+        self._last_decrease = 0.0
+
+    @property
+    def limit(self) -> int:
+        """Current concurrency limit."""
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        """Number of calls currently holding a slot."""
+        return self._in_flight
+
+    @property
+    def waiting(self) -> int:
+        """Number of calls waiting for a slot."""
+        return len(self._waiters)
+
+    def acquire(self, timeout: Optional[float]=None) -> bool:
+        """Acquire a slot, waiting for one to become available.
+
+        Arguments:
+          timeout: Maximum time in seconds to wait.
+
+        Returns:
+          True if a slot was acquired, False on timeout.
+        """
+        with self._cond:
+            if not self._waiters and self._in_flight < int(self._limit):
+                self._in_flight += 1
+                return True
+            ticket = object()
+            self._waiters.append(ticket)
+            deadline = None if timeout is None else \
+                time.monotonic() + timeout
+            try:
+                while (self._waiters[0] is not ticket or
+                       self._in_flight >= int(self._limit)):
+                    wait = None
+                    if deadline is not None:
+                        wait = deadline - time.monotonic()
+                        if wait <= 0:
+                            return False
+                    self._cond.wait(wait)
+                self._in_flight += 1
+                return True
+            finally:
+                self._waiters.remove(ticket)
+                self._cond.notify_all()
+
+    def release(self, latency: Optional[float]=None,
+                failed: bool=False) -> None:
+        """Release a slot, and adapt the limit.
+
+        Arguments:
+          latency: Latency of the call in seconds (or None to not adapt
+            the limit).
+          failed: The call failed because of overload (fx. a timeout),
+            and the limit should be decreased.
+        """
+        with self._cond:
+            self._in_flight -= 1
+            if failed:
+                self._decrease()
+            elif latency is not None:
+                self._adapt(latency)
+            self._cond.notify_all()
+
+    def _adapt(self, latency):
+        if self.min_latency is None:
+            self.min_latency = latency
+        else:
+            self.min_latency = min(
+                latency, self.min_latency * (1.0 + self.MIN_LATENCY_DRIFT))
+        target = self.target_latency
+        if target is None:
+            target = max(self.min_latency * self.tolerance,
+                         self.MIN_TARGET_LATENCY)
+        if latency > target:
+            self._decrease()
+        elif self._in_flight + 1 >= int(self._limit):
+            # Only increase when the limit is actually being used
+            self._limit = min(float(self.maximum),
+                              self._limit + 1.0 / self._limit)
+
+    def _decrease(self):
+        # Decrease at most once per latency window, as calls in flight
+        # all see the same overload
+        now = time.monotonic()
+        if self.min_latency is not None and \
+                now - self._last_decrease < self.min_latency:
+            return
+        self._last_decrease = now
+        limit = max(float(self.minimum), self._limit * self.backoff)
+        if int(limit) < int(self._limit):
+            log.debug('Decreasing concurrency limit to %d', int(limit))
+        self._limit = limit
+
+    @contextlib.contextmanager
+    def slot(self) -> Iterator[None]:
+        """Context manager holding a slot while the block runs.
+
+        The latency of the block is used to adapt the limit.  OSError
+        exceptions (timeouts and connection errors, including those raised
+        by requests) raised by the block are considered failures.
+        """
+        self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except OSError:
+            self.release(failed=True)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.release(time.monotonic() - start)
+
+
+class ConcurrencyLimiter(Observer):
+    """Concurrency limiter for DockerClient requests.
+
+    Protects Docker daemon against bursts of requests (fx. fanning out
+    thousands of operations on a thread pool), by limiting the number of
+    concurrent requests with two `AdaptiveLimiter` instances: one for heavy
+    requests (build, pull, commit, container create, and image and archive
+    transfers), and one for all other (light) requests.  Requests waiting
+    for a slot are served in FIFO order.
+
+    The limits adapt to the latency until the response head is received,
+    and are decreased on connection errors and timeouts (OSError).  A
+    streamed response holds its slot until it has been read to the end, or
+    closed.
+
+    Requests that wait for containers rather than for Docker daemon (fx.
+    `container_wait`, `container_stop`, following logs and stats, exec
+    start and attach) are not limited, as their latency says nothing about
+    daemon load, and as they could hold slots indefinitely.
+
+    The limiter is a request observer, and is normally enabled with the
+    limiter argument of DockerClient.  It can be shared by several
+    DockerClient instances talking to the same daemon.
+
+    Arguments:
+      heavy: Limiter for heavy requests (default: an AdaptiveLimiter with
+        initial limit 2 and maximum 8).
+      light: Limiter for light requests (default: an AdaptiveLimiter with
+        initial limit 8 and maximum 64).
+
+    :Example:
+
+    >>> docker = DockerClient(limiter=True)
+    >>> with ThreadPoolExecutor(100) as pool:
+    ...     pool.map(docker.container_inspect, names)
+    >>> print(docker.limiter.heavy.limit, docker.limiter.light.limit)
+    """
+
+    # Heavy requests, as (method, endpoint) pairs
+    HEAVY_ENDPOINTS = frozenset([
+        ('POST', '/build'),
+        ('POST', '/images/create'),
+        ('POST', '/commit'),
+        ('POST', '/containers/create'),
+        ('POST', '/images/load'),
+        ('GET', '/images/get'),
+        ('GET', '/containers/{id}/archive'),
+        ('PUT', '/containers/{id}/archive'),
+    ])
+
+    # Requests not limited, as (method, endpoint) pairs
+    UNLIMITED_ENDPOINTS = WAITING_ENDPOINTS
+
+    def __init__(self, heavy: Optional[AdaptiveLimiter]=None,
+                 light: Optional[AdaptiveLimiter]=None):
+        if heavy is None:
+            heavy = AdaptiveLimiter(initial=2, maximum=8)
+        if light is None:
+            light = AdaptiveLimiter(initial=8, maximum=64)
+        self.heavy = heavy
+        self.light = light
+        self._slots = {}
+
+    def classify(self, info: RequestInfo) -> Optional[str]:
+        """Get class of request.
+
+        Arguments:
+          info: Request information.
+
+        Returns:
+          HEAVY, LIGHT, or None if the request is not limited.
+        """
+        key = (info.method, info.endpoint)
+        if key in self.UNLIMITED_ENDPOINTS:
+            return None
+        if key in self.HEAVY_ENDPOINTS:
+            return HEAVY
+        return LIGHT
+
+    def request_start(self, info: RequestInfo) -> None:
+        request_class = self.classify(info)
+        if request_class is None:
+            return
+        limiter = self.heavy if request_class == HEAVY else self.light
+        limiter.acquire()
+        # Time spent waiting for the slot is not part of the latency
+        self._slots[id(info)] = (limiter, info.elapsed())
+
+    def request_end(self, info: RequestInfo) -> None:
+        limiter, acquired = self._slots.pop(id(info), (None, None))
+        if limiter is None:
+            return
+        if isinstance(info.exception, OSError):
+            limiter.release(failed=True)
+            return
+        latency = info.first_byte_time
+        if latency is None:
+            latency = info.total_time
+        limiter.release(max(0.0, latency - acquired))
@@ -0,0 +1,546 @@
+"""Module containing LogMux, for following logs of many containers on a
+single thread."""
+
+import selectors
+import time
+import calendar
+import heapq
+import json
+
+from typing import Optional, Union, Callable, Iterable, Iterator, List, Dict
+
+from xd.docker.container import Container
+from xd.docker.parameters import ContainerName
+from xd.docker.connection import Connection, ResponseParser
+from xd.docker.stream import CHUNK_SIZE, STDOUT, FrameDemuxer
+from xd.docker.observer import RequestInfo
+
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+__all__ = ['LogMux', 'LogLine']
+
+
+class LogLine(object):
+    """Log line from a container.
+
+    Attributes:
+      container (str): Container (id or name) the line is from.
+      stream (int): `xd.docker.stream.STDOUT` or `xd.docker.stream.STDERR`.
+      timestamp (float): UNIX timestamp of line (if timestamps are enabled).
+      data (bytes): Line content, without timestamp and newline.
+    """
+
+    __slots__ = ('container', 'stream', 'timestamp', 'data')
+
+    def __init__(self, container: str, stream: int, data: bytes,
+                 timestamp: Optional[float]=None):
+        self.container = container
+        self.stream = stream
+        self.data = data
+        self.timestamp = timestamp
+
+    @property
+    def text(self) -> str:
+        return self.data.decode('utf-8', 'replace')
+
+    def __repr__(self):
+        return 'LogLine({!r}, {}, {!r}, {!r})'.format(
+            self.container, self.stream, self.data, self.timestamp)
+
+
+class _TokenBucket(object):
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def consume(self, count, now):
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= count
+
+    def delay(self):
+        # Time until at least one token is available
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _Stream(object):
+    # Connection to a single streaming endpoint.  The request is made like
+    # DockerClient requests (to the versioned endpoint, with the connect
+    # timeout of the client, checked by its circuit breaker and observed by
+    # its observers), but the response is read from a non-blocking socket.
+
+    def __init__(self, mux, endpoint, params, **path):
+        client = mux.client
+        self.client = client
+        self.url = client._url(endpoint, path)
+        timeout = client._timeout('GET', endpoint)
+        if client.breaker is not None:
+            client.breaker.admit()
+        self.observers = client._observers
+        self.info = None
+        self.parser = ResponseParser('GET')
+        if self.observers:
+            self.info = RequestInfo('GET', endpoint, self.url, path, params,
+                                    True)
+            client._notify('request_start', self.info, self.observers)
+        self.conn = Connection(client.base_url, timeout and timeout[0])
+        try:
+            self.conn.request('GET', self.url, params=params)
+        except Exception as e:
+            self.conn.close()
+            self._end(e)
+            raise
+        if self.info is not None:
+            self.info.connect_time = self.info.elapsed()
+        self.sock = self.conn.sock
+        self.sock.setblocking(False)
+
+    def received(self):
+        # Called when data has been received
+        info = self.info
+        if info is not None and info.first_byte_time is None and \
+                self.parser.status_code is not None:
+            info.first_byte_time = info.elapsed()
+            info.status_code = self.parser.status_code
+
+    def _end(self, exception=None):
+        # Notify observers about end of request
+        info, self.info = self.info, None
+        if info is None:
+            return
+        if exception is None and info.status_code is not None:
+            try:
+                self.client._check_http_status_code(
+                    self.client.base_url + self.url, info.status_code)
+            except Exception as e:
+                exception = e
+        info.exception = exception
+        info.total_time = info.elapsed()
+        self.client._notify('request_end', info, self.observers)
+
+    def close(self):
+        self.conn.close()
+        self._end()
+
+
+class _LogStream(_Stream):
+
+    def __init__(self, mux, container, id_or_name, params, tty):
+        super(_LogStream, self).__init__(
+            mux, '/containers/{id}/logs', params, id=id_or_name)
+        self.container = container
+        self.tty = tty
+        self.demuxer = None
+        self.undecided = bytearray()
+        self.partial = {}
+        self.bucket = None
+        self.resume_at = None
+
+
+class _EventStream(_Stream):
+
+    def __init__(self, mux):
+        super(_EventStream, self).__init__(
+            mux, '/events', {'filters': json.dumps({'event': ['start']})})
+        self.partial = b''
+
+
+class LogMux(object):
+    """Follow logs from many containers on a single thread.
+
+    A LogMux instance follows the logs of a (dynamic) set of containers,
+    using one non-blocking connection to Docker daemon per container, all
+    handled by a single selector.  Output from all containers is split into
+    lines and returned interleaved, tagged with the container it came from.
+
+    Logs are read with the follow flag set, so the log stream for a
+    container ends (and the container is dropped) when the container stops.
+
+    Arguments:
+      client: DockerClient instance.
+      containers: Containers (id or name) to follow.
+      stdout: Follow stdout.
+      stderr: Follow stderr.
+      timestamps: Parse log line timestamps (see `LogLine.timestamp`).
+      tail: Number of lines to show from the end of the existing logs of
+        containers (or 'all').
+      since: Only show logs since this UNIX timestamp.
+      merge: Return lines ordered by timestamp across containers, holding
+        lines back for up to merge_window seconds.  Requires timestamps.
+      merge_window: Seconds to hold lines back for merging.
+      rate_limit: Maximum average number of lines per second read from each
+        container.  Reading from a container exceeding the limit is paused,
+        pushing back on Docker daemon instead of buffering.
+      burst: Number of lines allowed in a burst above rate_limit (default:
+        same as rate_limit).
+      watch: Watch Docker events, and follow containers as they are started.
+        Can be a function, called with the event (dict) to decide if the
+        started container should be followed.
+
+    :Example:
+
+    >>> with LogMux(docker, ['web1', 'web2'], timestamps=True,
+    ...             merge=True) as mux:
+    ...     for line in mux:
+    ...         print(line.container, line.text)
+    """
+
+    MERGE_LIMIT = 65536
+
+    def __init__(self, client, containers: Iterable[
+                     Union[Container, ContainerName, str]]=(),
+                 stdout: bool=True,
+                 stderr: bool=True,
+                 timestamps: bool=False,
+                 tail: Optional[Union[int, str]]='all',
+                 since: Optional[int]=None,
+                 merge: bool=False,
+                 merge_window: float=0.5,
+                 rate_limit: Optional[float]=None,
+                 burst: Optional[int]=None,
+                 watch: Union[bool, Callable[[Dict], bool]]=False):
+        if merge and not timestamps:
+            raise ValueError('merge requires timestamps')
+        self.client = client
+        self.stdout = stdout
+        self.stderr = stderr
+        self.timestamps = timestamps
+        self.tail = tail
+        self.since = since
+        self.merge = merge
+        self.merge_window = merge_window
+        self.rate_limit = rate_limit
+        self.burst = burst if burst is not None else rate_limit
+        self._selector = selectors.DefaultSelector()
+        self._streams = {}
+        self._paused = set()
+        self._heap = []
+        self._seq = 0
+        self._buf = bytearray(CHUNK_SIZE)
+        self._view = memoryview(self._buf)
+        self._ts_cache = (None, None)
+        self._events = None
+        self._watch = watch
+        if watch:
+            self._events = _EventStream(self)
+            self._selector.register(self._events.sock, selectors.EVENT_READ,
+                                    self._events)
+        for container in containers:
+            self.add(container)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self) -> Iterator[LogLine]:
+        return self.lines()
+
+    @property
+    def containers(self) -> List[str]:
+        """Containers currently followed."""
+        return list(self._streams)
+
+    def add(self, container: Union[Container, ContainerName, str],
+            tty: Optional[bool]=None,
+            since: Optional[int]=None,
+            tail: Optional[Union[int, str]]=None) -> None:
+        """Start following logs of a container.
+
+        Arguments:
+          container: The container to follow (id or name).
+          tty: Container is using a TTY.  If not given, it is detected from
+            the log stream.
+          since: Override since argument given to LogMux.
+          tail: Override tail argument given to LogMux.
+        """
+
+        # Handle convenience argument types
+        if isinstance(container, str):
+            id_or_name = container
+        elif isinstance(container, ContainerName):
+            id_or_name = container.name
+        else:
+            id_or_name = container.id or container.name
+
+        if id_or_name in self._streams:
+            return
+        params = {'follow': True, 'stdout': self.stdout,
+                  'stderr': self.stderr, 'timestamps': self.timestamps}
+        tail = tail if tail is not None else self.tail
+        if tail is not None:
+            params['tail'] = tail
+        since = since if since is not None else self.since
+        if since is not None:
+            params['since'] = since
+        stream = _LogStream(self, id_or_name, id_or_name, params, tty)
+        if self.rate_limit:
+            stream.bucket = _TokenBucket(self.rate_limit, self.burst)
+        self._streams[id_or_name] = stream
+        self._selector.register(stream.sock, selectors.EVENT_READ, stream)
+
+    def remove(self, container: Union[Container, ContainerName, str]) -> None:
+        """Stop following logs of a container.
+
+        Arguments:
+          container: The container to stop following (id or name).
+        """
+
+        # Handle convenience argument types
+        if isinstance(container, str):
+            id_or_name = container
+        elif isinstance(container, ContainerName):
+            id_or_name = container.name
+        else:
+            id_or_name = container.id or container.name
+
+        stream = self._streams.pop(id_or_name, None)
+        if stream is None:
+            return
+        if stream in self._paused:
+            self._paused.discard(stream)
+        else:
+            self._selector.unregister(stream.sock)
+        stream.close()
+
+    def close(self) -> None:
+        """Stop following all containers (and Docker events)."""
+        for container in list(self._streams):
+            self.remove(container)
+        if self._events:
+            self._selector.unregister(self._events.sock)
+            self._events.close()
+            self._events = None
+        self._selector.close()
+
+    def lines(self, timeout: Optional[float]=None) -> Iterator[LogLine]:
+        """Iterate over log lines.
+
+        Iteration stops when no containers are followed anymore (and Docker
+        events are not watched), or when no lines have been received for
+        timeout seconds.
+
+        Arguments:
+          timeout: Maximum time in seconds to wait for lines.
+        """
+        while self._streams or self._events or self._heap:
+            lines = self.poll(timeout)
+            if not lines and timeout is not None:
+                return
+            for line in lines:
+                yield line
+
+    def poll(self, timeout: Optional[float]=None) -> List[LogLine]:
+        """Wait for and read available log data.
+
+        Arguments:
+          timeout: Maximum time in seconds to wait.
+
+        Returns:
+          List of log lines (possibly empty).
+        """
+        lines = []
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            self._resume(now)
+            wait = self._wait_time(now, deadline)
+            if self._selector.get_map():
+                events = self._selector.select(wait)
+            else:
+                if wait is None:
+                    break
+                time.sleep(wait)
+                events = []
+            now = time.monotonic()
+            for key, _ in events:
+                if key.data is self._events:
+                    self._read_events()
+                else:
+                    self._read(key.data, lines, now)
+            if self.merge:
+                flush = not (self._streams or self._events)
+                lines = self._merge(lines, now, flush)
+            if lines or (deadline is not None and now >= deadline) or \
+                    not (self._streams or self._events or self._heap):
+                break
+        return lines
+
+    def _wait_time(self, now, deadline):
+        wait = None if deadline is None else max(0.0, deadline - now)
+        wakeups = [stream.resume_at for stream in self._paused]
+        if self._heap:
+            wakeups.append(self._heap[0][2] + self.merge_window)
+        if wakeups:
+            wakeup = max(0.0, min(wakeups) - now)
+            wait = wakeup if wait is None else min(wait, wakeup)
+        return wait
+
+    def _resume(self, now):
+        for stream in list(self._paused):
+            if stream.resume_at <= now:
+                self._paused.discard(stream)
+                stream.resume_at = None
+                self._selector.register(stream.sock, selectors.EVENT_READ,
+                                        stream)
+
+    def _merge(self, lines, now, flush=False):
+        heap = self._heap
+        for line in lines:
+            self._seq += 1
+            heapq.heappush(heap, (line.timestamp or 0.0, self._seq,
+                                  now, line))
+        lines = []
+        while heap and (flush or len(heap) > self.MERGE_LIMIT or
+                        heap[0][2] + self.merge_window <= now):
+            lines.append(heapq.heappop(heap)[3])
+        return lines
+
+    def _recv(self, stream):
+        # Returns list of body data pieces, or None at end of stream
+        try:
+            size = stream.sock.recv_into(self._buf)
+        except (BlockingIOError, InterruptedError):
+            return []
+        except OSError as e:
+            log.warning('Error reading from Docker daemon: %s', e)
+            size = 0
+        if not size:
+            try:
+                stream.parser.eof()
+            except Exception:
+                log.warning('Incomplete response from Docker daemon')
+            return None
+        body = stream.parser.feed(self._view[:size])
+        stream.received()
+        return body
+
+    def _read(self, stream, lines, now):
+        body = self._recv(stream)
+        if stream.parser.status_code not in (None, 200):
+            log.warning('Failed to follow logs of %s: HTTP status %d',
+                        stream.container, stream.parser.status_code)
+            self.remove(stream.container)
+            return
+        count = len(lines)
+        for data in body or ():
+            self._feed(stream, data, lines)
+        if body is None or stream.parser.done:
+            # End of log stream
+            if stream.undecided:
+                stream.tty = True
+                self._feed(stream, b'', lines)
+            for stream_type, partial in stream.partial.items():
+                if partial:
+                    lines.append(self._line(stream, stream_type,
+                                            bytes(partial)))
+            self.remove(stream.container)
+            return
+        if stream.bucket:
+            stream.bucket.consume(len(lines) - count, now)
+            if stream.bucket.tokens < 1:
+                self._selector.unregister(stream.sock)
+                stream.resume_at = now + stream.bucket.delay()
+                self._paused.add(stream)
+
+    def _feed(self, stream, data, lines):
+        if stream.tty is None:
+            # Detect multiplexed stream from content type or first bytes
+            content_type = stream.parser.headers.get('Content-Type', '')
+            if 'multiplexed' in content_type:
+                stream.tty = False
+            else:
+                stream.undecided += data
+                if len(stream.undecided) < 4:
+                    return
+                data = bytes(stream.undecided)
+                stream.undecided = bytearray()
+                stream.tty = not (data[0] in (0, 1, 2) and
+                                  data[1:4] == b'\0\0\0')
+        elif stream.undecided:
+            data = bytes(stream.undecided) + bytes(data)
+            stream.undecided = bytearray()
+        if stream.tty:
+            self._split(stream, STDOUT, data, lines)
+            return
+        if stream.demuxer is None:
+            stream.demuxer = FrameDemuxer()
+        stream.demuxer.feed(data)
+        for stream_type, frame in stream.demuxer.frames():
+            self._split(stream, stream_type, frame, lines)
+
+    def _split(self, stream, stream_type, data, lines):
+        partial = stream.partial.get(stream_type)
+        data = bytes(data)
+        if partial:
+            data = bytes(partial) + data
+        parts = data.split(b'\n')
+        last = parts.pop()
+        for part in parts:
+            lines.append(self._line(stream, stream_type, part))
+        stream.partial[stream_type] = bytearray(last)
+
+    def _line(self, stream, stream_type, data):
+        timestamp = None
+        if self.timestamps:
+            ts, sep, rest = data.partition(b' ')
+            timestamp = self._parse_timestamp(ts)
+            if timestamp is not None:
+                data = rest
+        return LogLine(stream.container, stream_type, data, timestamp)
+
+    def _parse_timestamp(self, ts):
+        # Parse RFC 3339 timestamp (fx. 2016-08-30T11:02:04.123456789Z),
+        # caching the conversion of the date and time part.
+        seconds, _, frac = ts.rstrip(b'Z').partition(b'.')
+        cached_seconds, cached_value = self._ts_cache
+        if seconds == cached_seconds:
+            value = cached_value
+        else:
+            try:
+                value = calendar.timegm(time.strptime(
+                    seconds.decode('ascii'), '%Y-%m-%dT%H:%M:%S'))
+            except ValueError:
+                return None
+            self._ts_cache = (seconds, value)
+        if frac.isdigit():
+            value += int(frac) / 10 ** len(frac)
+        return value
+
+    def _read_events(self):
+        body = self._recv(self._events)
+        if body is None or self._events.parser.done:
+            log.warning('Docker events stream closed')
+            self._selector.unregister(self._events.sock)
+            self._events.close()
+            self._events = None
+            return
+        data = self._events.partial + b''.join(body)
+        parts = data.split(b'\n')
+        self._events.partial = parts.pop()
+        for part in parts:
+            if not part.strip():
+                continue
+            event = json.loads(part.decode('utf-8'))
+            self._handle_event(event)
+
+    def _handle_event(self, event):
+        action = event.get('Action') or event.get('status')
+        if action != 'start' or event.get('Type', 'container') != 'container':
+            return
+        if callable(self._watch) and not self._watch(event):
+            return
+        actor = event.get('Actor', {})
+        container = actor.get('Attributes', {}).get('name') or \
+            event.get('id') or actor.get('ID')
+        self.add(container, since=event.get('time'), tail='all')
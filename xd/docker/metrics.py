@@ -0,0 +1,494 @@
+"""Module containing metrics registry and DockerClient metrics observer."""
+
+import re
+import math
+import bisect
+import weakref
+import threading
+import collections
+
+from typing import Optional, Sequence, Tuple, Dict, Iterator
+
+from xd.docker.observer import Observer, OperationInfo, RequestInfo
+
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+__all__ = ['Counter', 'Gauge', 'Histogram', 'MetricsRegistry',
+           'MetricsObserver', 'CONTENT_TYPE', 'DEFAULT_BUCKETS']
+
+
+# Content type of Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Default histogram buckets (in seconds).  Pulls and builds can take
+# minutes, so buckets go well beyond the usual 10 seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_NAME_RE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*$')
+_LABEL_RE = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
+
+
+class _Owner(object):
+    # Object only referenced from a thread-local, so it is freed when the
+    # thread exits
+    __slots__ = ('__weakref__',)
+
+
+class _Metric(object):
+    # Base class for metrics.
+    #
+    # Values are kept in per-thread shards (dicts mapping label values to
+    # value), so updates need no locking: each shard is only written by the
+    # thread owning it.  Shards are summed when collecting.  When a thread
+    # exits, its shard is merged into the retired shard.
+
+    type = None
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str]=()):
+        if not _NAME_RE.match(name):
+            raise ValueError('invalid metric name: {}'.format(name))
+        for label in labelnames:
+            if not _LABEL_RE.match(label) or label.startswith('__'):
+                raise ValueError('invalid label name: {}'.format(label))
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            pass
+        shard = {}
+        owner = _Owner()
+        with self._lock:
+            self._shards.append(shard)
+        weakref.finalize(owner, self._retire, shard)
+        self._local.shard = shard
+        self._local.owner = owner
+        return shard
+
+    def _retire(self, shard):
+        with self._lock:
+            self._shards = [s for s in self._shards if s is not shard]
+            self._merge(self._retired, shard)
+
+    def _check_labels(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError('{} expects labels {}, got {!r}'.format(
+                self.name, self.labelnames, labels))
+
+    def _merge(self, total, shard):
+        for labels, value in shard.copy().items():
+            total[labels] = total.get(labels, 0) + value
+
+    def collect(self) -> Dict[Tuple[str, ...], object]:
+        """Get current values of metric.
+
+        Returns:
+          Dictionary mapping label values to value.
+        """
+        with self._lock:
+            shards = list(self._shards)
+            total = {}
+            self._merge(total, self._retired)
+        for shard in shards:
+            self._merge(total, shard)
+        return total
+
+    def value(self, labels: Tuple[str, ...]=()):
+        """Get current value of metric for given label values."""
+        return self.collect().get(tuple(labels), 0)
+
+    def _samples(self):
+        for labels, value in sorted(self.collect().items()):
+            yield self.name, self._labels(labels), value
+
+    def _labels(self, labels, extra=()):
+        pairs = list(zip(self.labelnames, labels)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(name, _escape_label(value))
+                              for name, value in pairs) + '}'
+
+    def exposition(self) -> str:
+        """Get metric in Prometheus text exposition format."""
+        lines = ['# HELP {} {}'.format(self.name, _escape_help(self.help)),
+                 '# TYPE {} {}'.format(self.name, self.type)]
+        for name, labels, value in self._samples():
+            lines.append('{}{} {}'.format(name, labels, _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter.
+
+    Arguments:
+      name: Metric name.
+      help: Metric description.
+      labelnames: Names of labels.
+
+    :Example:
+
+    >>> requests = Counter('requests_total', 'Requests', ('method',))
+    >>> requests.inc(('GET',))
+    """
+
+    type = 'counter'
+
+    def inc(self, labels: Tuple[str, ...]=(), amount: float=1) -> None:
+        """Increment counter.
+
+        Arguments:
+          labels: Label values.
+          amount: Amount to increment with (must not be negative).
+        """
+        if amount < 0:
+            raise ValueError('counter can only be incremented')
+        shard = self._shard()
+        try:
+            shard[labels] += amount
+        except KeyError:
+            self._check_labels(labels)
+            shard[labels] = amount
+
+
+class Gauge(_Metric):
+    """Gauge, for values going up and down (fx. number of calls in flight).
+
+    Arguments:
+      name: Metric name.
+      help: Metric description.
+      labelnames: Names of labels.
+    """
+
+    type = 'gauge'
+
+    def inc(self, labels: Tuple[str, ...]=(), amount: float=1) -> None:
+        """Increment gauge.
+
+        Arguments:
+          labels: Label values.
+          amount: Amount to increment with.
+        """
+        shard = self._shard()
+        try:
+            shard[labels] += amount
+        except KeyError:
+            self._check_labels(labels)
+            shard[labels] = amount
+
+    def dec(self, labels: Tuple[str, ...]=(), amount: float=1) -> None:
+        """Decrement gauge.
+
+        Arguments:
+          labels: Label values.
+          amount: Amount to decrement with.
+        """
+        self.inc(labels, -amount)
+
+
+class Histogram(_Metric):
+    """Histogram, counting observed values in buckets.
+
+    Arguments:
+      name: Metric name.
+      help: Metric description.
+      labelnames: Names of labels.
+      buckets: Upper bounds of buckets (an infinite bucket is added).
+
+    :Example:
+
+    >>> latency = Histogram('latency_seconds', 'Latency', ('method',))
+    >>> latency.observe(0.042, ('GET',))
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str]=(),
+                 buckets: Sequence[float]=DEFAULT_BUCKETS):
+        if 'le' in labelnames:
+            raise ValueError('"le" is reserved for histogram buckets')
+        super(Histogram, self).__init__(name, help, labelnames)
+        buckets = sorted(float(b) for b in buckets)
+        if buckets and buckets[-1] == math.inf:
+            buckets.pop()
+        if not buckets:
+            raise ValueError('histogram must have at least one bucket')
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, labels: Tuple[str, ...]=()) -> None:
+        """Observe a value.
+
+        Arguments:
+          value: Value to observe.
+          labels: Label values.
+        """
+        shard = self._shard()
+        try:
+            counts = shard[labels]
+        except KeyError:
+            self._check_labels(labels)
+            # Count of each bucket (including infinite bucket), and sum
+            counts = shard[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def _merge(self, total, shard):
+        for labels, counts in shard.copy().items():
+            counts = list(counts)
+            current = total.get(labels)
+            if current is None:
+                total[labels] = counts
+            else:
+                total[labels] = [a + b for a, b in zip(current, counts)]
+
+    def value(self, labels: Tuple[str, ...]=()) -> Tuple[int, float]:
+        """Get count and sum of observed values for given label values."""
+        counts = self.collect().get(tuple(labels))
+        if counts is None:
+            return 0, 0.0
+        return sum(counts[:-1]), counts[-1]
+
+    def _samples(self):
+        bounds = self.buckets + (math.inf,)
+        for labels, counts in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield (self.name + '_bucket',
+                       self._labels(labels, (('le', _format_value(bound)),)),
+                       cumulative)
+            yield self.name + '_sum', self._labels(labels), counts[-1]
+            yield self.name + '_count', self._labels(labels), cumulative
+
+
+class MetricsRegistry(object):
+    """Registry of metrics.
+
+    Metrics are created with the `counter`, `gauge` and `histogram`
+    methods, returning the existing metric if one with the same name is
+    already registered.  Updating metrics is cheap and safe from any
+    thread.
+
+    :Example:
+
+    >>> registry = MetricsRegistry()
+    >>> errors = registry.counter('errors_total', 'Errors', ('code',))
+    >>> errors.inc(('404',))
+    >>> print(registry.exposition())
+    """
+
+    def __init__(self):
+        self._metrics = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, help, labelnames, **kwargs)
+                self._metrics[name] = metric
+            elif type(metric) is not cls or \
+                    metric.labelnames != tuple(labelnames):
+                raise ValueError('metric {} already registered as {}'.format(
+                    name, metric.type))
+            return metric
+
+    def counter(self, name: str, help: str,
+                labelnames: Sequence[str]=()) -> Counter:
+        """Get or create a counter.
+
+        Arguments:
+          name: Metric name.
+          help: Metric description.
+          labelnames: Names of labels.
+
+        Raises:
+          ValueError: Another kind of metric is registered with name.
+        """
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str,
+              labelnames: Sequence[str]=()) -> Gauge:
+        """Get or create a gauge.
+
+        Arguments:
+          name: Metric name.
+          help: Metric description.
+          labelnames: Names of labels.
+
+        Raises:
+          ValueError: Another kind of metric is registered with name.
+        """
+        return self._register(Gauge, name, help, labelnames)
+
+    def histogram(self, name: str, help: str,
+                  labelnames: Sequence[str]=(),
+                  buckets: Sequence[float]=DEFAULT_BUCKETS) -> Histogram:
+        """Get or create a histogram.
+
+        Arguments:
+          name: Metric name.
+          help: Metric description.
+          labelnames: Names of labels.
+          buckets: Upper bounds of buckets.
+
+        Raises:
+          ValueError: Another kind of metric is registered with name.
+        """
+        return self._register(Histogram, name, help, labelnames,
+                              buckets=buckets)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        """Get metric by name (or None if not registered)."""
+        return self._metrics.get(name)
+
+    def __iter__(self) -> Iterator[_Metric]:
+        with self._lock:
+            return iter(list(self._metrics.values()))
+
+    def exposition(self) -> str:
+        """Get all metrics in Prometheus text exposition format.
+
+        Returns:
+          Text to serve with content type `CONTENT_TYPE`.
+        """
+        return ''.join(metric.exposition() for metric in self)
+
+
+class MetricsObserver(Observer):
+    """DockerClient observer recording operation and request metrics.
+
+    The following metrics are registered:
+
+    - xd_docker_operations_total{operation}
+    - xd_docker_operation_errors_total{operation,error,code}
+    - xd_docker_operation_duration_seconds{operation} (histogram)
+    - xd_docker_operations_in_flight{operation}
+    - xd_docker_requests_total{method,endpoint,code}
+    - xd_docker_request_duration_seconds{method,endpoint} (histogram)
+    - xd_docker_requests_in_flight
+    - xd_docker_request_retries_total{method,endpoint}
+    - xd_docker_request_bytes_total{operation}
+    - xd_docker_response_bytes_total{operation}
+
+    Errors are labeled with the exception class name (fx. ClientError) and
+    the HTTP status code (if any).  Nested operations (fx. `image_pull`
+    called from `container_create`) are counted on their own too.  Bytes
+    are attributed to the operation making the request, so fx. the size of
+    build contexts sent and progress output received while pulling are
+    found with operation="image_build" and operation="image_pull".
+
+    Arguments:
+      registry: Registry to register metrics in (a new registry is created
+        if not given).
+      buckets: Histogram buckets (in seconds).
+
+    :Example:
+
+    >>> metrics = MetricsObserver()
+    >>> docker = DockerClient(observers=[metrics])
+    >>> print(metrics.registry.exposition())
+    """
+
+    def __init__(self, registry: Optional[MetricsRegistry]=None,
+                 buckets: Sequence[float]=DEFAULT_BUCKETS):
+        if registry is None:
+            registry = MetricsRegistry()
+        self.registry = registry
+        self.operations = registry.counter(
+            'xd_docker_operations_total',
+            'DockerClient operations completed.', ('operation',))
+        self.operation_errors = registry.counter(
+            'xd_docker_operation_errors_total',
+            'DockerClient operations failed.',
+            ('operation', 'error', 'code'))
+        self.operation_duration = registry.histogram(
+            'xd_docker_operation_duration_seconds',
+            'DockerClient operation duration.', ('operation',),
+            buckets=buckets)
+        self.operations_in_flight = registry.gauge(
+            'xd_docker_operations_in_flight',
+            'DockerClient operations in flight.', ('operation',))
+        self.requests = registry.counter(
+            'xd_docker_requests_total',
+            'Requests to Docker daemon completed.',
+            ('method', 'endpoint', 'code'))
+        self.request_duration = registry.histogram(
+            'xd_docker_request_duration_seconds',
+            'Request duration (until response body was read).',
+            ('method', 'endpoint'), buckets=buckets)
+        self.requests_in_flight = registry.gauge(
+            'xd_docker_requests_in_flight',
+            'Requests to Docker daemon in flight.')
+        self.request_retries = registry.counter(
+            'xd_docker_request_retries_total',
+            'Requests to Docker daemon retried.', ('method', 'endpoint'))
+        self.request_bytes = registry.counter(
+            'xd_docker_request_bytes_total',
+            'Bytes of request bodies sent.', ('operation',))
+        self.response_bytes = registry.counter(
+            'xd_docker_response_bytes_total',
+            'Bytes of response bodies received.', ('operation',))
+
+    def operation_start(self, info: OperationInfo) -> None:
+        self.operations_in_flight.inc((info.name,))
+
+    def operation_end(self, info: OperationInfo) -> None:
+        labels = (info.name,)
+        self.operations_in_flight.dec(labels)
+        self.operations.inc(labels)
+        self.operation_duration.observe(info.duration, labels)
+        if info.exception is not None:
+            code = getattr(info.exception, 'code', None)
+            self.operation_errors.inc((
+                info.name, type(info.exception).__name__,
+                str(code) if isinstance(code, int) else ''))
+
+    def request_start(self, info: RequestInfo) -> None:
+        self.requests_in_flight.inc()
+        if info.attempt > 1:
+            self.request_retries.inc((info.method, info.endpoint))
+
+    def request_end(self, info: RequestInfo) -> None:
+        self.requests_in_flight.dec()
+        code = '' if info.status_code is None else str(info.status_code)
+        self.requests.inc((info.method, info.endpoint, code))
+        if info.total_time is not None:
+            self.request_duration.observe(info.total_time,
+                                          (info.method, info.endpoint))
+        operation = (info.operation.name if info.operation else '',)
+        if info.request_bytes:
+            self.request_bytes.inc(operation, info.request_bytes)
+        if info.response_bytes:
+            self.response_bytes.inc(operation, info.response_bytes)
+
+
+def _format_value(value):
+    if isinstance(value, int):
+        return str(value)
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if value != value:
+        return 'NaN'
+    return repr(float(value))
+
+
+def _escape_help(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace(
+        '"', '\\"').replace('\n', '\\n')
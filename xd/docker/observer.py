@@ -0,0 +1,431 @@
+"""Module containing the DockerClient request observer interface."""
+
+import os
+import time
+import threading
+import functools
+import contextlib
+import collections.abc
+
+from typing import Optional, Dict
+
+from xd.docker.connection import is_regular_file
+
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+__all__ = ['Observer', 'RequestInfo', 'OperationInfo', 'PhaseInfo',
+           'current_operation']
+
+
+# Current operation (and priority class, see xd.docker.scheduler.priority)
+# of each thread
+_context = threading.local()
+
+
+def current_operation() -> Optional['OperationInfo']:
+    """Get the operation currently running on this thread.
+
+    Operations are only tracked while a DockerClient has observers.
+
+    Returns:
+      OperationInfo of innermost running operation, or None.
+    """
+    return getattr(_context, 'operation', None)
+
+
+class OperationInfo(object):
+    """Information about a DockerClient operation.
+
+    An operation is a call to a public DockerClient method (fx.
+    `container_create` or `image_pull`), making one or more requests to
+    Docker daemon.  Operations calling other operations (fx.
+    `container_create` pulling the image) are nested.
+
+    Attributes:
+      name (str): Operation name (the DockerClient method name).
+      parent (OperationInfo): Operation this operation is called from (or
+        None).
+      start (float): UNIX timestamp of the start of the operation.
+      duration (float): Seconds until the operation returned (None while
+        running).  Streams returned by the operation are not included.
+      exception (Exception): Exception raised by the operation (or None).
+    """
+
+    __slots__ = ('name', 'parent', 'start', 'duration', 'exception',
+                 '_start')
+
+    def __init__(self, name: str, parent: Optional['OperationInfo']=None):
+        self.name = name
+        self.parent = parent
+        self.start = time.time()
+        self.duration = None
+        self.exception = None
+        self._start = time.monotonic()
+
+    def elapsed(self) -> float:
+        """Seconds since start of operation."""
+        return time.monotonic() - self._start
+
+    def __repr__(self):
+        return '<OperationInfo {}>'.format(self.name)
+
+
+class PhaseInfo(object):
+    """Information about a local phase of a DockerClient operation.
+
+    Phases are work done locally as part of an operation: building a tar
+    archive of a build context ('tar'), extracting a downloaded tar archive
+    ('untar'), compressing data on the fly ('compress') and reading and
+    decoding streamed JSON output ('decode').
+
+    Attributes:
+      name (str): Phase name.
+      operation (OperationInfo): Operation the phase is part of (or None).
+      start (float): UNIX timestamp of the start of the phase.
+      duration (float): Seconds from start to end of the phase (None while
+        running).
+      busy_time (float): Seconds spent working in the phase.  For phases
+        producing data on the fly while a request body is sent (fx.
+        'compress'), this excludes time spent waiting for the data to be
+        sent.  Otherwise, it equals duration.
+      exception (Exception): Exception raised in the phase (or None).
+    """
+
+    __slots__ = ('name', 'operation', 'start', 'duration', 'busy_time',
+                 'exception', '_start')
+
+    def __init__(self, name: str, operation: Optional[OperationInfo]=None):
+        self.name = name
+        self.operation = operation
+        self.start = time.time()
+        self.duration = None
+        self.busy_time = None
+        self.exception = None
+        self._start = time.monotonic()
+
+    def elapsed(self) -> float:
+        """Seconds since start of phase."""
+        return time.monotonic() - self._start
+
+    def __repr__(self):
+        return '<PhaseInfo {}>'.format(self.name)
+
+
+class RequestInfo(object):
+    """Information about a request to Docker daemon.
+
+    A RequestInfo instance is passed to observers when the request is
+    started, and again (updated) when it has ended.
+
+    Attributes:
+      method (str): HTTP method.
+      endpoint (str): Endpoint template (fx. '/containers/{id}/start').
+      path (dict): Values of the endpoint template fields.
+      url (str): Request path (fx. '/containers/foo/start').
+      params (dict): Query parameters.
+      headers (dict): Request headers (may include credentials).
+      stream (bool): Response body is streamed.
+      start (float): UNIX timestamp of the start of the request.
+      status_code (int): HTTP status code (None if no response).
+      request_bytes (int): Size of request body (None if unknown).
+      response_bytes (int): Size of response body read (None if unknown).
+      connect_time (float): Seconds until connected (None if unknown).
+      first_byte_time (float): Seconds until response head was received.
+      total_time (float): Seconds until response body was read.  For
+        streamed responses, that is when the body has been read to the end,
+        or the response is closed.
+      exception (Exception): Exception raised by the request (or None).
+      operation (OperationInfo): Operation making the request (or None).
+      attempt (int): Attempt number (1 for the first, greater for retries,
+        see `xd.docker.retry.RetryPolicy`).
+    """
+
+    __slots__ = ('method', 'endpoint', 'path', 'url', 'params', 'headers',
+                 'stream', 'start', 'status_code', 'request_bytes',
+                 'response_bytes', 'connect_time', 'first_byte_time',
+                 'total_time', 'exception', 'operation', 'attempt',
+                 '_start')
+
+    def __init__(self, method: str, endpoint: str, url: str,
+                 path: Optional[Dict[str, str]]=None,
+                 params: Optional[Dict]=None,
+                 stream: bool=False,
+                 headers: Optional[Dict]=None):
+        self.method = method
+        self.endpoint = endpoint
+        self.path = path or {}
+        self.url = url
+        self.params = params
+        self.headers = headers
+        self.stream = stream
+        self.start = time.time()
+        self.status_code = None
+        self.request_bytes = None
+        self.response_bytes = None
+        self.connect_time = None
+        self.first_byte_time = None
+        self.total_time = None
+        self.exception = None
+        self.operation = current_operation()
+        self.attempt = 1
+        self._start = time.monotonic()
+
+    def elapsed(self) -> float:
+        """Seconds since start of request."""
+        return time.monotonic() - self._start
+
+    def __repr__(self):
+        return '<RequestInfo {} {} {}>'.format(
+            self.method, self.endpoint, self.status_code)
+
+
+class Observer(object):
+    """Base class for DockerClient request observers.
+
+    Observers are registered with `DockerClient.add_observer`, and are
+    called around every operation (public DockerClient method call) and
+    every request made to Docker daemon.  Subclasses override the methods
+    for the events they are interested in.
+
+    Observers are called synchronously on the thread making the request, so
+    they should be fast.  Exceptions raised by observers are logged and
+    otherwise ignored.
+    """
+
+    def operation_start(self, info: OperationInfo) -> None:
+        """Called when an operation is started.
+
+        Arguments:
+          info: Operation information (duration not set).
+        """
+        pass
+
+    def operation_end(self, info: OperationInfo) -> None:
+        """Called when an operation has returned (or raised an exception).
+
+        Arguments:
+          info: Operation information.
+        """
+        pass
+
+    def phase_start(self, info: PhaseInfo) -> None:
+        """Called when a local phase of an operation is started.
+
+        Arguments:
+          info: Phase information (duration not set).
+        """
+        pass
+
+    def phase_end(self, info: PhaseInfo) -> None:
+        """Called when a local phase of an operation has ended.
+
+        Arguments:
+          info: Phase information.
+        """
+        pass
+
+    def request_start(self, info: RequestInfo) -> None:
+        """Called before a request is sent.
+
+        Arguments:
+          info: Request information (timings and response fields not set).
+        """
+        pass
+
+    def request_end(self, info: RequestInfo) -> None:
+        """Called when a request has ended (successfully or not).
+
+        Arguments:
+          info: Request information.
+        """
+        pass
+
+
+def _operation(func):
+    # Decorator for public DockerClient methods, notifying observers of
+    # operation start and end, and tracking the current operation.
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        observers = self._observers
+        if not observers:
+            return func(self, *args, **kwargs)
+        info = OperationInfo(name, getattr(_context, 'operation', None))
+        _context.operation = info
+        self._notify('operation_start', info, observers)
+        try:
+            return func(self, *args, **kwargs)
+        except Exception as e:
+            info.exception = e
+            raise
+        finally:
+            _context.operation = info.parent
+            info.duration = info.elapsed()
+            self._notify('operation_end', info, observers)
+
+    return wrapper
+
+
+def _bind_operation(func):
+    # Bind func to the current operation and priority class (set with
+    # xd.docker.scheduler.priority), so operations and requests made by func
+    # when called on another thread are nested in it, and scheduled in the
+    # same class.
+    operation = current_operation()
+    priority = getattr(_context, 'priority', None)
+    if operation is None and priority is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        saved = (getattr(_context, 'operation', None),
+                 getattr(_context, 'priority', None))
+        _context.operation = operation
+        _context.priority = priority
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _context.operation, _context.priority = saved
+
+    return wrapper
+
+
+@contextlib.contextmanager
+def _phase(client, name):
+    # Context manager notifying observers of client about a local phase
+    observers = client._observers
+    if not observers:
+        yield
+        return
+    info = PhaseInfo(name, current_operation())
+    client._notify('phase_start', info, observers)
+    try:
+        yield
+    except Exception as e:
+        info.exception = e
+        raise
+    finally:
+        info.duration = info.busy_time = info.elapsed()
+        client._notify('phase_end', info, observers)
+
+
+def _phase_chunks(client, name, chunks):
+    # Wrap iterator producing chunks on the fly (fx. compressing them) as a
+    # local phase, from first chunk requested until the iterator is done.
+    if not client._observers:
+        return chunks
+    return _iter_phase_chunks(client, PhaseInfo(name, current_operation()),
+                              iter(chunks))
+
+
+def _iter_phase_chunks(client, info, chunks):
+    busy = 0.0
+    started = False
+    try:
+        while True:
+            t = time.monotonic()
+            if not started:
+                started = True
+                info.start = time.time()
+                info._start = t
+                client._notify('phase_start', info)
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                busy += time.monotonic() - t
+                break
+            busy += time.monotonic() - t
+            yield chunk
+    except Exception as e:
+        info.exception = e
+        raise
+    finally:
+        if started:
+            info.duration = info.elapsed()
+            info.busy_time = busy
+            client._notify('phase_end', info)
+
+
+def _observe_body(data, info):
+    # Set request_bytes of info from request body data.  Iterators (sent
+    # with chunked transfer encoding) are wrapped to count the bytes sent.
+    if data is None:
+        info.request_bytes = 0
+    elif isinstance(data, (bytes, bytearray, str)):
+        info.request_bytes = len(data)
+    elif isinstance(data, memoryview):
+        info.request_bytes = data.nbytes
+    elif is_regular_file(data):
+        info.request_bytes = os.fstat(data.fileno()).st_size - data.tell()
+    elif hasattr(data, 'read'):
+        # File object of unknown size
+        pass
+    elif isinstance(data, collections.abc.Iterator):
+        info.request_bytes = 0
+        return _count_chunks(data, info)
+    return data
+
+
+def _count_chunks(chunks, info):
+    for chunk in chunks:
+        info.request_bytes += len(chunk)
+        yield chunk
+
+
+def _observe_response(r, info, notify):
+    # Count bytes read from body of streamed response r, and notify
+    # observers of request end when the body has been read to the end, or
+    # the response is closed.
+    info.response_bytes = 0
+    ended = []
+
+    def end(exception=None):
+        if ended:
+            return
+        ended.append(True)
+        if exception is not None:
+            info.exception = exception
+        info.total_time = info.elapsed()
+        notify('request_end', info)
+
+    iter_content = r.iter_content
+
+    def observed_iter_content(*args, **kwargs):
+        try:
+            for chunk in iter_content(*args, **kwargs):
+                info.response_bytes += len(chunk)
+                yield chunk
+        except Exception as e:
+            end(e)
+            raise
+        end()
+
+    r.iter_content = observed_iter_content
+
+    readinto = getattr(r, 'readinto', None)
+    if readinto is not None:
+        def observed_readinto(buf):
+            try:
+                size = readinto(buf)
+            except Exception as e:
+                end(e)
+                raise
+            if size:
+                info.response_bytes += size
+            else:
+                end()
+            return size
+
+        r.readinto = observed_readinto
+
+    close = r.close
+
+    def observed_close():
+        close()
+        end()
+
+    r.close = observed_close
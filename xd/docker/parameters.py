@@ -1,17 +1,23 @@
 """Module containing helper classes and functions for handling Docker Remote
 API parameters."""
 
-import collections
+import collections.abc
 import re
+import sys
 
-from typing import Any, Optional, Union, Mapping, Sequence, Tuple, Dict, List
-import ipaddress
+from typing import Any, Optional, Union, Mapping, Sequence, Tuple, Dict, \
+    List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import ipaddress
 
 import logging
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
 
-IPAddress = Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+# The ipaddress module is imported when needed, to keep import of this
+# module fast.
+IPAddress = Union['ipaddress.IPv4Address', 'ipaddress.IPv6Address']
 Command = Union[str, Sequence[str]]
 Signal = Union[int, str]
 ApiVersion = Tuple[int, int]
@@ -31,6 +37,37 @@ __all__ = ['IPAddress', 'Command', 'Signal', 'ApiVersion',
            'ContainerConfig', 'HostConfig']
 
 
+class _LazyPattern(object):
+    # Regular expression compiled on first use (instead of on import)
+
+    __slots__ = ('pattern', 'flags', '_regex')
+
+    def __init__(self, pattern: str, flags: int=0):
+        self.pattern = pattern
+        self.flags = flags
+        self._regex = None
+
+    def _compile(self):
+        regex = self._regex
+        if regex is None:
+            regex = self._regex = re.compile(self.pattern, self.flags)
+        return regex
+
+    def match(self, string: str, *args):
+        return self._compile().match(string, *args)
+
+    def __getattr__(self, name):
+        return getattr(self._compile(), name)
+
+
+def _is_ip_address(value) -> bool:
+    # Check if value is an ipaddress IPv4Address or IPv6Address, without
+    # importing ipaddress if it has not been imported
+    ipaddress = sys.modules.get('ipaddress')
+    return ipaddress is not None and isinstance(value,
+                                                ipaddress._IPAddressBase)
+
+
 def json_update(obj: Dict[str, Any], values: Dict[str, Any],
                 json_fields: Sequence[Tuple[str, Tuple[int, int], str]],
                 api_version: Optional[ApiVersion]=None):
@@ -56,10 +93,10 @@ def json_update(obj: Dict[str, Any], values: Dict[str, Any],
             pass
         elif isinstance(value, Parameter):
             value = value.json(api_version)
-        elif isinstance(value, collections.Sequence):
+        elif isinstance(value, collections.abc.Sequence):
             value = [v.json()
                      if isinstance(v, Parameter)
-                     else str(v) if isinstance(v, ipaddress._IPAddressBase)
+                     else str(v) if _is_ip_address(v)
                      else v
                      for v in value]
         if value is None:
@@ -104,7 +141,7 @@ class Hostname(Parameter):
       hostname (str): Hostname.
     """
 
-    HOSTNAME_RE = re.compile(r'[a-z0-9](?:[a-z0-9-]*[a-z0-9])?$')
+    HOSTNAME_RE = _LazyPattern(r'[a-z0-9](?:[a-z0-9-]*[a-z0-9])?$')
 
     def __init__(self, hostname: str):
         if not self.HOSTNAME_RE.match(hostname):
@@ -127,7 +164,7 @@ class Domainname(Hostname):
       domainname (str): Domain name.
     """
 
-    DOMAINNAME_RE = re.compile(r'%s(?:\.%s)*$' % (
+    DOMAINNAME_RE = _LazyPattern(r'%s(?:\.%s)*$' % (
         Hostname.HOSTNAME_RE.pattern[:-1], Hostname.HOSTNAME_RE.pattern[:-1]))
 
     def __init__(self, domainname: str):
@@ -151,7 +188,7 @@ class MacAddress(Parameter):
       addr (str): MAC address (fx. '01:02:03:04:05:06').
     """
 
-    MACADDRESS_RE = re.compile('[0-9a-fA-F]{2}(:[0-9a-fA-F]{2}){5}$')
+    MACADDRESS_RE = _LazyPattern('[0-9a-fA-F]{2}(:[0-9a-fA-F]{2}){5}$')
 
     def __init__(self, addr: str):
         if not self.MACADDRESS_RE.match(addr):
@@ -174,7 +211,7 @@ class Username(Parameter):
       username (str): User name.
     """
 
-    USERNAME_RE = re.compile(r'[a-z0-9][a-z0-9_-]*$')
+    USERNAME_RE = _LazyPattern(r'[a-z0-9][a-z0-9_-]*$')
 
     def __init__(self, username: str):
         if not self.USERNAME_RE.match(username):
@@ -198,11 +235,11 @@ class Repository(Parameter):
       name (str): Repository name.
       tag (Optional[str]): Repository tag.
     """
-    NAME_RE = re.compile(
+    NAME_RE = _LazyPattern(
         r'(?:(?:%s:\d+/)?|/)?' % (Domainname.DOMAINNAME_RE.pattern[:-1]) +
         r'[a-z0-9-_\.]+(?:(?:/[a-z0-9-_\.]+)+)?$')
-    TAG_RE = re.compile(r'[a-zA-Z0-9-_.]+$')
-    NAME_AND_TAG_RE = re.compile(r'(%s):(%s)?$' % (
+    TAG_RE = _LazyPattern(r'[a-zA-Z0-9-_.]+$')
+    NAME_AND_TAG_RE = _LazyPattern(r'(%s):(%s)?$' % (
         NAME_RE.pattern[:-1], TAG_RE.pattern[:-1]))
 
     def __init__(self, repo: str):
@@ -257,7 +294,7 @@ class ContainerName(Parameter):
       name (str): Container name.
     """
 
-    NAME_RE = re.compile(r'/?[a-zA-Z0-9_-]+$')
+    NAME_RE = _LazyPattern(r'/?[a-zA-Z0-9_-]+$')
 
     def __init__(self, name: str):
         if self.NAME_RE.match(name):
@@ -282,7 +319,7 @@ class Env(Parameter):
       env (Mapping[str, str]): Environment variables, name/value pairs.
     """
 
-    KEY_RE = re.compile(r'[a-zA-Z_][a-zA-Z0-9_]*$')
+    KEY_RE = _LazyPattern(r'[a-zA-Z_][a-zA-Z0-9_]*$')
 
     def __init__(self, env: Optional[Mapping[str, str]]=None):
         self.env = env
@@ -487,7 +524,7 @@ class Cpuset(Parameter):
     .. _cpuset(7): http://man7.org/linux/man-pages/man7/cpuset.7.html
     """
 
-    CPUSET_LIST_RE = re.compile(r'(\d|[1-9]\d+)([,-](\d|[1-9]\d+))*$')
+    CPUSET_LIST_RE = _LazyPattern(r'(\d|[1-9]\d+)([,-](\d|[1-9]\d+))*$')
 
     def __init__(self, cpuset: str):
         if not self.CPUSET_LIST_RE.match(cpuset):
@@ -519,9 +556,10 @@ class HostnameIPMapping(Parameter):
             self.hostname = hostname
         else:
             self.hostname = Domainname(hostname)
-        if isinstance(ip, ipaddress._IPAddressBase):
+        if _is_ip_address(ip):
             self.ip = ip
         else:
+            import ipaddress
             self.ip = ipaddress.ip_address(ip)
 
     def json(self, api_version: Optional[ApiVersion]=None):
@@ -874,7 +912,7 @@ class ContainerConfig(Parameter):
         self.tty = tty
         self.open_stdin = open_stdin
         self.stdin_once = stdin_once
-        if isinstance(env, collections.Mapping):
+        if isinstance(env, collections.abc.Mapping):
             env = Env(env)
         self.env = env
         self.labels = labels
@@ -1085,6 +1123,7 @@ class HostConfig(Parameter):
         self.privileged = privileged
         self.read_only_rootfs = read_only_rootfs
         if dns is not None:
+            import ipaddress
             dns = [ipaddress.ip_address(ip)
                    if isinstance(ip, str) else ip
                    for ip in dns]
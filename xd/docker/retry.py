@@ -0,0 +1,189 @@
+"""Module containing retry policy for DockerClient requests."""
+
+import random
+import threading
+
+from typing import Optional, Sequence, Tuple
+
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+__all__ = ['RetryPolicy', 'RetryBudget']
+
+
+class RetryBudget(object):
+    """Budget limiting retries to a fraction of requests.
+
+    The budget is a token bucket: each request (first attempt) deposits
+    ratio tokens, and each retry withdraws one token.  The bucket holds at
+    most burst tokens, and starts full.  So over time, at most ratio
+    retries are made per request, and a burst of failures (fx. a restarting
+    daemon) cannot multiply the load on Docker daemon.
+
+    Arguments:
+      ratio: Retries allowed per request.
+      burst: Maximum number of tokens.
+    """
+
+    def __init__(self, ratio: float=0.1, burst: float=10.0):
+        if ratio < 0 or burst < 1:
+            raise ValueError('invalid retry budget: {}, {}'.format(ratio,
+                                                                   burst))
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = float(burst)
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self) -> float:
+        """Number of tokens available."""
+        return self._tokens
+
+    def deposit(self) -> None:
+        """Deposit tokens for a request."""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Withdraw token for a retry.
+
+        Returns:
+          True if a token was withdrawn, False if the budget is exhausted.
+        """
+        with self._lock:
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+
+class RetryPolicy(object):
+    """Retry policy for DockerClient requests.
+
+    Idempotent requests (GET and HEAD, fx. inspect and list calls, ping and
+    version) failing with a connection error or timeout (OSError), or with
+    one of the given HTTP status codes, are retried.  Requests with bodies
+    that cannot be sent again (file objects and iterators) and hijacked
+    connections are never retried.  Only sending the request and receiving
+    the response head is retried, not reading a streamed response body.
+
+    Optionally, container stop, kill and remove are retried too.  As the
+    failed attempt may have succeeded, a retried attempt finding the
+    container already stopped (304), not running (409) or removed (404)
+    counts as success.
+
+    Before each retry, the policy waits a random time between 0 and
+    backoff * 2 ** (retry - 1) seconds (exponential backoff with full
+    jitter, so clients failing together do not retry together), capped at
+    max_backoff.  Retries are limited by a `RetryBudget`.
+
+    Arguments:
+      attempts: Maximum number of attempts (including the first).
+      backoff: Base backoff delay in seconds.
+      max_backoff: Maximum backoff delay in seconds.
+      status_codes: HTTP status codes to retry on.
+      container_changes: Also retry container stop, kill and remove.
+      budget: Retry budget (default is a `RetryBudget` allowing 10% of
+        requests to be retried).  Can be shared by several policies.
+
+    :Example:
+
+    >>> docker = DockerClient(timeout=(3.0, 60.0),
+    ...                       retry=RetryPolicy(attempts=5))
+    """
+
+    # Methods of idempotent requests
+    IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD'))
+
+    # Container changes retried with container_changes, as (method,
+    # endpoint) pairs, with status codes counting as success when retried
+    CONTAINER_CHANGES = {
+        ('POST', '/containers/{id}/stop'): (304,),
+        ('POST', '/containers/{id}/kill'): (409,),
+        ('DELETE', '/containers/{id}'): (404,),
+    }
+
+    def __init__(self, attempts: int=3, backoff: float=0.1,
+                 max_backoff: float=2.0,
+                 status_codes: Sequence[int]=(500, 502, 503, 504),
+                 container_changes: bool=False,
+                 budget: Optional[RetryBudget]=None):
+        if attempts < 1:
+            raise ValueError('invalid attempts: {}'.format(attempts))
+        if budget is None:
+            budget = RetryBudget()
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.status_codes = frozenset(status_codes)
+        self.container_changes = container_changes
+        self.budget = budget
+
+    def retryable(self, method: str, endpoint: str, data=None) -> bool:
+        """Check if request may be retried.
+
+        Arguments:
+          method: HTTP method.
+          endpoint: Endpoint (fx. '/containers/{id}/json').
+          data: Request body.
+
+        Returns:
+          True if request may be retried.
+        """
+        if not (data is None or isinstance(
+                data, (bytes, bytearray, memoryview, str))):
+            return False
+        if method in self.IDEMPOTENT_METHODS:
+            return True
+        return self.container_changes and \
+            (method, endpoint) in self.CONTAINER_CHANGES
+
+    def done_status_codes(self, method: str, endpoint: str) -> Tuple[int]:
+        """Get status codes counting as success when retrying request.
+
+        Arguments:
+          method: HTTP method.
+          endpoint: Endpoint (fx. '/containers/{id}').
+
+        Returns:
+          Status codes.
+        """
+        if not self.container_changes:
+            return ()
+        return self.CONTAINER_CHANGES.get((method, endpoint), ())
+
+    def should_retry(self, exception: Exception, attempt: int) -> bool:
+        """Check if a failed attempt should be retried.
+
+        Withdraws from the retry budget when retrying.
+
+        Arguments:
+          exception: Exception raised by attempt.
+          attempt: Number of attempt (1 for the first).
+
+        Returns:
+          True if the request should be retried.
+        """
+        if attempt >= self.attempts:
+            return False
+        if not (isinstance(exception, OSError) or
+                getattr(exception, 'code', None) in self.status_codes):
+            return False
+        if not self.budget.withdraw():
+            log.debug('Retry budget exhausted')
+            return False
+        return True
+
+    def delay(self, attempt: int) -> float:
+        """Get backoff delay before retrying.
+
+        Arguments:
+          attempt: Number of the failed attempt (1 for the first).
+
+        Returns:
+          Delay in seconds.
+        """
+        return random.uniform(
+            0.0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
@@ -0,0 +1,311 @@
+"""Module containing priority request scheduler."""
+
+import bisect
+import contextlib
+import itertools
+import threading
+import time
+
+from typing import Optional, Sequence, Dict, Iterator
+
+from xd.docker.observer import Observer, RequestInfo, _context
+from xd.docker.limiter import ConcurrencyLimiter
+from xd.docker.metrics import MetricsRegistry, DEFAULT_BUCKETS
+
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+__all__ = ['PriorityScheduler', 'PriorityClass', 'priority',
+           'INTERACTIVE', 'NORMAL', 'BULK']
+
+
+# Default priority classes
+INTERACTIVE = 'interactive'
+NORMAL = 'normal'
+BULK = 'bulk'
+
+
+# Priority class set with priority() is kept in the thread-local context of
+# the current operation, so it is passed on to worker threads with it
+
+
+@contextlib.contextmanager
+def priority(name: str) -> Iterator[None]:
+    """Context manager setting priority class of requests.
+
+    Requests made by the current thread while the block runs (also on
+    worker threads of exec_many, DockerCluster and StatsSampler) are
+    scheduled in the given priority class, instead of the class of the
+    operation making them.
+
+    Arguments:
+      name: Priority class name (fx. INTERACTIVE or BULK).
+
+    :Example:
+
+    >>> with priority(BULK):
+    ...     docker.image_remove('busybox')
+    """
+    saved = getattr(_context, 'priority', None)
+    _context.priority = name
+    try:
+        yield
+    finally:
+        _context.priority = saved
+
+
+class PriorityClass(object):
+    """Priority class of a PriorityScheduler.
+
+    Arguments:
+      name: Class name.
+      priority: Priority (lower values are scheduled first).
+      limit: Maximum number of concurrent requests of the class (None for
+        no other limit than the scheduler limit).
+    """
+
+    __slots__ = ('name', 'priority', 'limit')
+
+    def __init__(self, name: str, priority: int, limit: Optional[int]=None):
+        if limit is not None and limit < 1:
+            raise ValueError('invalid limit: {}'.format(limit))
+        self.name = name
+        self.priority = priority
+        self.limit = limit
+
+    def __repr__(self):
+        return '<PriorityClass {} {} {}>'.format(self.name, self.priority,
+                                                 self.limit)
+
+
+class PriorityScheduler(Observer):
+    """Priority scheduler for DockerClient requests.
+
+    Limits the number of concurrent requests, and schedules waiting
+    requests by priority class, so latency critical calls (fx.
+    `container_start` and inspect calls) are not queued behind bulk work
+    (fx. pulls and removes) sharing the same client.  Requests waiting for
+    a slot are served in order of class priority, and in FIFO order within
+    a class.  A class can be limited to fewer concurrent requests than the
+    scheduler, which keeps slots free for the other classes.  A class at
+    its limit does not hold back other classes.
+
+    The class of a request is set with the `priority` context manager, or
+    taken from the (outermost) operation making it, using
+    OPERATION_CLASSES.  Other requests are in the default class.  Requests
+    waiting for containers are not scheduled (see
+    `xd.docker.limiter.ConcurrencyLimiter`), and a streamed response holds
+    its slot until it has been read to the end, or closed.
+
+    The following metrics are registered:
+
+    - xd_docker_scheduler_queue_wait_seconds{class} (histogram)
+    - xd_docker_scheduler_queued{class}
+    - xd_docker_scheduler_in_flight{class}
+
+    The scheduler is a request observer, and is normally enabled with the
+    scheduler argument of DockerClient.  When combined with a
+    ConcurrencyLimiter, the scheduler decides the order in which requests
+    are passed on to the limiter.
+
+    Arguments:
+      limit: Maximum number of concurrent requests.
+      classes: Priority classes (default: INTERACTIVE with priority 0,
+        NORMAL with priority 1, and BULK with priority 2 limited to 4
+        concurrent requests).
+      default: Name of class of requests not otherwise classified.
+      operation_classes: Class names of operations, overriding
+        OPERATION_CLASSES.
+      metrics: Registry to register metrics in (a new registry is created
+        if not given).
+
+    Raises:
+      ValueError: Invalid limit, or unknown class name.
+
+    :Example:
+
+    >>> docker = DockerClient(scheduler=True)
+    >>> docker.image_pull('busybox')  # in BULK class
+    >>> docker.container_start('web1')  # in INTERACTIVE class
+    >>> print(docker.scheduler.metrics.exposition())
+    """
+
+    # Default classes of operations (by DockerClient method name)
+    OPERATION_CLASSES = {
+        'version': INTERACTIVE,
+        'ping': INTERACTIVE,
+        'containers': INTERACTIVE,
+        'images': INTERACTIVE,
+        'image_inspect': INTERACTIVE,
+        'image_inspect_raw': INTERACTIVE,
+        'container_start': INTERACTIVE,
+        'container_kill': INTERACTIVE,
+        'container_path_stat': INTERACTIVE,
+        'exec_inspect': INTERACTIVE,
+        'image_build': BULK,
+        'image_pull': BULK,
+        'image_remove': BULK,
+        'image_save': BULK,
+        'image_load': BULK,
+        'container_remove': BULK,
+        'container_upload': BULK,
+        'container_download': BULK,
+        'commit': BULK,
+    }
+
+    def __init__(self, limit: int=16,
+                 classes: Optional[Sequence[PriorityClass]]=None,
+                 default: str=NORMAL,
+                 operation_classes: Optional[Dict[str, str]]=None,
+                 metrics: Optional[MetricsRegistry]=None):
+        if limit < 1:
+            raise ValueError('invalid limit: {}'.format(limit))
+        if classes is None:
+            classes = (PriorityClass(INTERACTIVE, 0),
+                       PriorityClass(NORMAL, 1),
+                       PriorityClass(BULK, 2, limit=4))
+        self.limit = limit
+        self.classes = {c.name: c for c in classes}
+        self.operation_classes = dict(self.OPERATION_CLASSES)
+        if operation_classes:
+            self.operation_classes.update(operation_classes)
+        self.operation_classes = {
+            operation: name
+            for operation, name in self.operation_classes.items()
+            if name in self.classes}
+        if default not in self.classes:
+            raise ValueError('unknown class: {}'.format(default))
+        self.default = default
+        if metrics is None:
+            metrics = MetricsRegistry()
+        self.metrics = metrics
+        self.queue_wait = metrics.histogram(
+            'xd_docker_scheduler_queue_wait_seconds',
+            'Time requests waited for a scheduler slot.', ('class',),
+            buckets=(0.001, 0.0025) + DEFAULT_BUCKETS)
+        self.queued = metrics.gauge(
+            'xd_docker_scheduler_queued',
+            'Requests waiting for a scheduler slot.', ('class',))
+        self.scheduled = metrics.gauge(
+            'xd_docker_scheduler_in_flight',
+            'Requests holding a scheduler slot.', ('class',))
+        self._cond = threading.Condition(threading.Lock())
+        self._total = 0
+        self._in_flight = {name: 0 for name in self.classes}
+        self._waiters = []
+        self._seq = itertools.count()
+        self._slots = {}
+
+    @property
+    def in_flight(self) -> Dict[str, int]:
+        """Number of requests holding a slot, by class name."""
+        with self._cond:
+            return dict(self._in_flight)
+
+    @property
+    def waiting(self) -> Dict[str, int]:
+        """Number of requests waiting for a slot, by class name."""
+        with self._cond:
+            waiting = {name: 0 for name in self.classes}
+            for _, _, name in self._waiters:
+                waiting[name] += 1
+            return waiting
+
+    def classify(self, info: RequestInfo) -> Optional[str]:
+        """Get priority class of request.
+
+        Arguments:
+          info: Request information.
+
+        Returns:
+          Class name, or None if the request is not scheduled.
+        """
+        if (info.method, info.endpoint) in \
+                ConcurrencyLimiter.UNLIMITED_ENDPOINTS:
+            return None
+        name = getattr(_context, 'priority', None)
+        if name is None:
+            operation = info.operation
+            while operation is not None and operation.parent is not None:
+                operation = operation.parent
+            if operation is not None:
+                name = self.operation_classes.get(operation.name)
+        elif name not in self.classes:
+            log.warning('Unknown priority class %r, using %r', name,
+                        self.default)
+            name = None
+        if name is None:
+            name = self.default
+        return name
+
+    def _has_room(self, name):
+        limit = self.classes[name].limit
+        return limit is None or self._in_flight[name] < limit
+
+    def _is_next(self, entry):
+        # Check if waiting entry is the first waiter of a class with room
+        if self._total >= self.limit:
+            return False
+        for waiter in self._waiters:
+            if self._has_room(waiter[2]):
+                return waiter is entry
+        return False
+
+    def acquire(self, name: str) -> float:
+        """Acquire a slot, waiting for one to become available.
+
+        Arguments:
+          name: Class name.
+
+        Returns:
+          Seconds waited.
+        """
+        start = time.monotonic()
+        with self._cond:
+            if not self._waiters and self._total < self.limit and \
+                    self._has_room(name):
+                self._total += 1
+                self._in_flight[name] += 1
+            else:
+                entry = (self.classes[name].priority, next(self._seq), name)
+                bisect.insort(self._waiters, entry)
+                self.queued.inc((name,))
+                try:
+                    while not self._is_next(entry):
+                        self._cond.wait()
+                    self._total += 1
+                    self._in_flight[name] += 1
+                finally:
+                    self._waiters.remove(entry)
+                    self.queued.dec((name,))
+                    self._cond.notify_all()
+        wait = time.monotonic() - start
+        self.queue_wait.observe(wait, (name,))
+        self.scheduled.inc((name,))
+        return wait
+
+    def release(self, name: str) -> None:
+        """Release a slot.
+
+        Arguments:
+          name: Class name.
+        """
+        self.scheduled.dec((name,))
+        with self._cond:
+            self._total -= 1
+            self._in_flight[name] -= 1
+            self._cond.notify_all()
+
+    def request_start(self, info: RequestInfo) -> None:
+        name = self.classify(info)
+        if name is None:
+            return
+        self.acquire(name)
+        self._slots[id(info)] = name
+
+    def request_end(self, info: RequestInfo) -> None:
+        name = self._slots.pop(id(info), None)
+        if name is not None:
+            self.release(name)
@@ -0,0 +1,475 @@
+"""Module containing container resource usage statistics classes."""
+
+import array
+import calendar
+import time
+import collections
+
+from typing import Optional, Union, Dict, List, Sequence, Iterable, Iterator
+
+from xd.docker.container import Container
+from xd.docker.parameters import ContainerName
+from xd.docker.limiter import AdaptiveLimiter
+from xd.docker.observer import _bind_operation
+
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+__all__ = ['Stats', 'StatsCollector', 'StatsSampler', 'StatsSweep']
+
+
+_numpy = None
+
+
+def _import_numpy():
+    # Import NumPy on first use, as importing it is slow (and xd.docker.client
+    # imports this module).  Returns None if NumPy is not installed.
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
+
+
+def _timestamp(date_string):
+    # Convert RFC 3339 timestamp (fx. 2016-08-30T11:02:04.123456789Z) to
+    # UNIX timestamp
+    if not date_string or date_string.startswith('0001-01-01'):
+        return None
+    seconds, _, frac = date_string.rstrip('Z').partition('.')
+    value = calendar.timegm(time.strptime(seconds[:19], '%Y-%m-%dT%H:%M:%S'))
+    digits = frac[:9]
+    end = len(digits) - len(digits.lstrip('0123456789'))
+    if end:
+        value += int(digits[:end]) / 10 ** end
+    return float(value)
+
+
+class Stats(object):
+    """Resource usage statistics sample for a container.
+
+    Arguments:
+      stats: JSON object from the /containers/(id)/stats endpoint.
+
+    Attributes:
+      time (float): UNIX timestamp of the sample.
+      cpu_percent (float): CPU usage since the previous sample, in percent
+        of a single CPU (fx. 200.0 for 2 fully used CPUs).
+      memory_usage (int): Memory usage in bytes (excluding page cache).
+      memory_limit (int): Memory limit in bytes.
+      network_rx (int): Bytes received on all network interfaces.
+      network_tx (int): Bytes transmitted on all network interfaces.
+      block_read (int): Bytes read from block devices.
+      block_write (int): Bytes written to block devices.
+    """
+
+    FIELDS = ('time', 'cpu_percent', 'memory_usage', 'memory_limit',
+              'network_rx', 'network_tx', 'block_read', 'block_write')
+
+    __slots__ = FIELDS
+
+    def __init__(self, stats: Dict):
+        self.time = _timestamp(stats.get('read'))
+        self.cpu_percent = self._cpu_percent(stats)
+        memory = stats.get('memory_stats') or {}
+        usage = memory.get('usage', 0)
+        mstats = memory.get('stats') or {}
+        for cache in ('total_inactive_file', 'inactive_file', 'cache'):
+            if cache in mstats:
+                usage -= mstats[cache]
+                break
+        self.memory_usage = max(usage, 0)
+        self.memory_limit = memory.get('limit', 0)
+        networks = stats.get('networks')
+        if networks is None:
+            # Remote API < 1.21 has a single network object
+            networks = {'eth0': stats.get('network') or {}}
+        self.network_rx = sum(n.get('rx_bytes', 0) for n in networks.values())
+        self.network_tx = sum(n.get('tx_bytes', 0) for n in networks.values())
+        self.block_read = self.block_write = 0
+        blkio = (stats.get('blkio_stats') or {}).get(
+            'io_service_bytes_recursive') or ()
+        for entry in blkio:
+            op = entry.get('op', '').lower()
+            if op == 'read':
+                self.block_read += entry.get('value', 0)
+            elif op == 'write':
+                self.block_write += entry.get('value', 0)
+
+    @staticmethod
+    def _cpu_percent(stats):
+        cpu = stats.get('cpu_stats') or {}
+        precpu = stats.get('precpu_stats') or {}
+        usage = cpu.get('cpu_usage') or {}
+        cpu_delta = (usage.get('total_usage', 0) -
+                     (precpu.get('cpu_usage') or {}).get('total_usage', 0))
+        system_delta = (cpu.get('system_cpu_usage', 0) -
+                        precpu.get('system_cpu_usage', 0))
+        if cpu_delta <= 0 or system_delta <= 0 or \
+                not precpu.get('system_cpu_usage'):
+            return 0.0
+        online = cpu.get('online_cpus') or \
+            len(usage.get('percpu_usage') or ()) or 1
+        return cpu_delta / system_delta * online * 100.0
+
+    def __repr__(self):
+        return 'Stats({})'.format(', '.join(
+            '{}={!r}'.format(name, getattr(self, name))
+            for name in self.FIELDS))
+
+
+class _Ring(object):
+    # Fixed-size ring buffer of samples, one column per Stats field
+
+    def __init__(self, size, use_numpy):
+        self.size = size
+        self.count = 0
+        self.next = 0
+        if use_numpy:
+            self.columns = _import_numpy().zeros((len(Stats.FIELDS), size))
+        else:
+            self.columns = [array.array('d', bytes(8 * size))
+                            for _ in Stats.FIELDS]
+
+    def add(self, stats):
+        i = self.next
+        for column, name in zip(self.columns, Stats.FIELDS):
+            value = getattr(stats, name)
+            column[i] = value if value is not None else float('nan')
+        self.next = (i + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+    def window(self, column, n):
+        # Return the last n values of column, oldest first
+        n = self.count if n is None else min(n, self.count)
+        start = (self.next - n) % self.size
+        column = self.columns[column]
+        if start + n <= self.size:
+            return column[start:start + n]
+        if not isinstance(column, array.array):
+            return _import_numpy().concatenate((column[start:],
+                                                column[:self.next]))
+        return column[start:] + column[:self.next]
+
+
+class StatsCollector(object):
+    """Collect container statistics samples in fixed-size ring buffers.
+
+    Samples are stored per container in preallocated buffers holding the
+    last size samples, so adding samples does not allocate memory.
+    Windowed averages and percentiles are computed over the buffers.
+
+    Arguments:
+      size: Number of samples to keep per container.
+      use_numpy: Use NumPy arrays for the buffers (default: if NumPy is
+        installed), otherwise `array.array` is used.
+
+    :Example:
+
+    >>> collector = StatsCollector(size=60)
+    >>> for stats in docker.container_stats('web1'):
+    ...     collector.add('web1', stats)
+    ...     print(collector.mean('web1', 'cpu_percent', 10))
+    """
+
+    def __init__(self, size: int=60, use_numpy: Optional[bool]=None):
+        if size < 1:
+            raise ValueError('size must be positive')
+        if use_numpy is None:
+            use_numpy = _import_numpy() is not None
+        elif use_numpy and _import_numpy() is None:
+            raise ValueError('NumPy is not installed')
+        self.size = size
+        self.use_numpy = use_numpy
+        self._rings = {}
+
+    @property
+    def containers(self) -> List[str]:
+        """Containers with samples."""
+        return list(self._rings)
+
+    def add(self, container: str, stats: Stats) -> None:
+        """Add a sample.
+
+        Arguments:
+          container: Container (id or name) the sample is for.
+          stats: The sample.
+        """
+        ring = self._rings.get(container)
+        if ring is None:
+            ring = self._rings[container] = _Ring(self.size, self.use_numpy)
+        ring.add(stats)
+
+    def remove(self, container: str) -> None:
+        """Remove all samples for a container.
+
+        Arguments:
+          container: Container (id or name) to remove samples for.
+        """
+        self._rings.pop(container, None)
+
+    def count(self, container: str) -> int:
+        """Get number of samples held for a container.
+
+        Arguments:
+          container: Container (id or name).
+        """
+        ring = self._rings.get(container)
+        return ring.count if ring else 0
+
+    def values(self, container: str, field: str,
+               window: Optional[int]=None) -> Sequence[float]:
+        """Get the latest values of a field, oldest first.
+
+        Arguments:
+          container: Container (id or name).
+          field: Name of `Stats` field (fx. 'cpu_percent').
+          window: Number of latest samples to return (default: all).
+
+        Raises:
+          KeyError: No samples for container.
+          ValueError: Invalid field name.
+
+        Returns:
+          Array of values (`numpy.ndarray` or `array.array`).
+        """
+        try:
+            column = Stats.FIELDS.index(field)
+        except ValueError:
+            raise ValueError('invalid field: {}'.format(field))
+        return self._rings[container].window(column, window)
+
+    def mean(self, container: str, field: str,
+             window: Optional[int]=None) -> Optional[float]:
+        """Get average value of a field.
+
+        Arguments:
+          container: Container (id or name).
+          field: Name of `Stats` field (fx. 'cpu_percent').
+          window: Number of latest samples to average (default: all).
+
+        Returns:
+          Average value, or None if there are no samples.
+        """
+        values = self.values(container, field, window)
+        if not len(values):
+            return None
+        if self.use_numpy:
+            return float(values.mean())
+        return sum(values) / len(values)
+
+    def percentile(self, container: str, field: str, percent: float,
+                   window: Optional[int]=None) -> Optional[float]:
+        """Get percentile of the values of a field.
+
+        The percentile is linearly interpolated between the closest ranks.
+
+        Arguments:
+          container: Container (id or name).
+          field: Name of `Stats` field (fx. 'memory_usage').
+          percent: Percentile to get (0 to 100).
+          window: Number of latest samples to use (default: all).
+
+        Returns:
+          Percentile value, or None if there are no samples.
+        """
+        if not 0 <= percent <= 100:
+            raise ValueError('percent must be between 0 and 100')
+        values = self.values(container, field, window)
+        if not len(values):
+            return None
+        if self.use_numpy:
+            return float(_import_numpy().percentile(values, percent))
+        values = sorted(values)
+        rank = (len(values) - 1) * percent / 100.0
+        low = int(rank)
+        high = min(low + 1, len(values) - 1)
+        return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def _zeros(size, use_numpy):
+    if use_numpy:
+        return _import_numpy().zeros(size)
+    return array.array('d', bytes(8 * size))
+
+
+class StatsSweep(object):
+    """Statistics samples of many containers, taken at the same time.
+
+    The samples are stored in columnar form, with a column per `Stats`
+    field, and a row per container.
+
+    Attributes:
+      ids (List[str]): Container (id or name) of each row.
+      columns (Dict[str, Sequence[float]]): Column (`numpy.ndarray` or
+        `array.array`) of values for each `Stats` field.
+      errors (Dict[str, Exception]): Containers that could not be sampled.
+      started (float): UNIX timestamp of the start of the sweep.
+      duration (float): Time in seconds the sweep took.
+    """
+
+    def __init__(self, ids: List[str], samples: List[Stats],
+                 errors: Dict[str, Exception], started: float,
+                 duration: float, use_numpy: bool=False):
+        self.ids = ids
+        self.errors = errors
+        self.started = started
+        self.duration = duration
+        self.columns = {}
+        for name in Stats.FIELDS:
+            column = self.columns[name] = _zeros(len(samples), use_numpy)
+            for row, stats in enumerate(samples):
+                value = getattr(stats, name)
+                column[row] = value if value is not None else float('nan')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row(self, container: str) -> Dict[str, float]:
+        """Get values of all fields for a container.
+
+        Arguments:
+          container: Container (id or name).
+
+        Raises:
+          KeyError: Container not in sweep.
+        """
+        try:
+            row = self.ids.index(container)
+        except ValueError:
+            raise KeyError(container)
+        return {name: column[row] for name, column in self.columns.items()}
+
+
+class StatsSampler(object):
+    """Sample statistics of many containers concurrently.
+
+    Each sweep takes a single (non-streaming) statistics sample of every
+    container, using a bounded pool of worker threads.  The number of
+    concurrent requests to Docker daemon is adapted to the daemon latency
+    by an `xd.docker.limiter.AdaptiveLimiter`.
+
+    Arguments:
+      client: DockerClient instance.
+      max_workers: Maximum number of concurrent requests.
+      limiter: Concurrency limiter to use (default: an AdaptiveLimiter with
+        max_workers as maximum).
+      history: Number of sweep durations to keep in `durations`.
+      use_numpy: Use NumPy arrays for sweep columns (default: if NumPy is
+        installed), otherwise `array.array` is used.
+
+    Attributes:
+      durations (Deque[float]): Time in seconds taken by latest sweeps.
+
+    :Example:
+
+    >>> with StatsSampler(docker) as sampler:
+    ...     for sweep in sampler.sweeps(interval=10.0):
+    ...         print(sweep.duration, max(sweep.columns['cpu_percent']))
+    """
+
+    def __init__(self, client, max_workers: int=16,
+                 limiter: Optional[AdaptiveLimiter]=None,
+                 history: int=360,
+                 use_numpy: Optional[bool]=None):
+        if use_numpy is None:
+            use_numpy = _import_numpy() is not None
+        elif use_numpy and _import_numpy() is None:
+            raise ValueError('NumPy is not installed')
+        if limiter is None:
+            limiter = AdaptiveLimiter(initial=min(4, max_workers),
+                                      maximum=max_workers)
+        self.client = client
+        self.limiter = limiter
+        self.use_numpy = use_numpy
+        self.durations = collections.deque(maxlen=history)
+        import concurrent.futures
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        """Stop the worker threads."""
+        self._executor.shutdown()
+
+    def _sample(self, container):
+        with self.limiter.slot():
+            return self.client.container_stats(container, stream=False)
+
+    def sample(self, containers: Optional[Iterable[
+            Union[Container, ContainerName, str]]]=None) -> StatsSweep:
+        """Take a statistics sample of all containers.
+
+        Arguments:
+          containers: Containers (id or name) to sample (default: all
+            running containers).
+
+        Returns:
+          StatsSweep instance.
+        """
+        started = time.time()
+        start = time.monotonic()
+        if containers is None:
+            containers = self.client.containers()
+        futures = []
+        sample = _bind_operation(self._sample)
+        for container in containers:
+
+            # Handle convenience argument types
+            if isinstance(container, str):
+                id_or_name = container
+            elif isinstance(container, ContainerName):
+                id_or_name = container.name
+            else:
+                id_or_name = container.id or container.name
+
+            futures.append((id_or_name, self._executor.submit(
+                sample, id_or_name)))
+        ids, samples, errors = [], [], {}
+        for id_or_name, future in futures:
+            try:
+                samples.append(future.result())
+            except Exception as e:
+                log.debug('Failed to sample %s: %s', id_or_name, e)
+                errors[id_or_name] = e
+            else:
+                ids.append(id_or_name)
+        duration = time.monotonic() - start
+        self.durations.append(duration)
+        return StatsSweep(ids, samples, errors, started, duration,
+                          self.use_numpy)
+
+    def sweeps(self, interval: float=10.0,
+               count: Optional[int]=None) -> Iterator[StatsSweep]:
+        """Take a sweep of samples of all running containers periodically.
+
+        If a sweep takes longer than interval, the next sweep is started
+        at the next multiple of interval.
+
+        Arguments:
+          interval: Time in seconds between start of sweeps.
+          count: Number of sweeps to take (default: no limit).
+        """
+        next_start = time.monotonic()
+        while count is None or count > 0:
+            yield self.sample()
+            if count is not None:
+                count -= 1
+                if not count:
+                    return
+            now = time.monotonic()
+            next_start += interval
+            if next_start < now:
+                next_start += (now - next_start) // interval * interval + \
+                    interval
+            time.sleep(next_start - now)
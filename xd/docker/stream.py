@@ -0,0 +1,241 @@
+"""Module containing helpers for handling streamed Docker Remote API data."""
+
+import io
+import zlib
+import struct
+
+from typing import Iterable, Iterator, Callable, Tuple
+
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+__all__ = ['CHUNK_SIZE', 'IterStream',
+           'iter_chunks', 'gzip_chunks', 'progress_chunks',
+           'STDIN', 'STDOUT', 'STDERR', 'FrameDemuxer', 'demux_frames',
+           'raw_frames']
+
+
+CHUNK_SIZE = 64 * 1024
+
+# Stream types used in multiplexed streams
+STDIN = 0
+STDOUT = 1
+STDERR = 2
+
+
+class IterStream(io.RawIOBase):
+    """Read-only file-like object on top of an iterator of bytes.
+
+    An IterStream instance is used to present a streamed HTTP response body
+    (fx. from `requests.Response.iter_content`) as a file object, so that it
+    can be given to `tarfile.open` and friends.  Only a single chunk is held
+    in memory at any time.
+
+    Arguments:
+      chunks: Iterator of bytes objects.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._chunk = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        while not self._chunk:
+            try:
+                self._chunk = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        size = min(len(buf), len(self._chunk))
+        buf[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+
+def iter_chunks(fileobj, chunk_size: int=CHUNK_SIZE) -> Iterator[bytes]:
+    """Iterate over the content of a binary file object.
+
+    Arguments:
+      fileobj: Binary file object to read from.
+      chunk_size: Maximum size of chunks.
+    """
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int=6) -> Iterator[bytes]:
+    """Compress an iterator of bytes to gzip format on the fly.
+
+    Arguments:
+      chunks: Iterator of bytes objects to compress.
+      level: Compression level (1-9).
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+def progress_chunks(chunks: Iterable[bytes],
+                    callback: Callable[[int], None]) -> Iterator[bytes]:
+    """Pass through an iterator of bytes, reporting progress.
+
+    Arguments:
+      chunks: Iterator of bytes objects.
+      callback: Function called with the total number of bytes passed
+        through so far, after each chunk.
+    """
+    total = 0
+    for chunk in chunks:
+        total += len(chunk)
+        yield chunk
+        callback(total)
+
+
+class FrameDemuxer(object):
+    """Incremental parser for multiplexed stdout/stderr streams.
+
+    When a container is not using a TTY, Docker daemon multiplexes stdout and
+    stderr on a single stream, with each frame prefixed by an 8 byte header
+    with stream type and frame size.
+
+    Data is read (or fed) into a reusable buffer, and frames are returned as
+    memoryview slices of that buffer, so no bytes objects are created per
+    frame.  The buffer grows when a single frame does not fit.
+
+    Arguments:
+      buffer_size: Initial buffer size.
+    """
+
+    HEADER = struct.Struct('>BxxxL')
+
+    def __init__(self, buffer_size: int=CHUNK_SIZE):
+        self._buffer = bytearray(max(buffer_size, self.HEADER.size))
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+
+    def space(self) -> memoryview:
+        """Get writable buffer space for more input data.
+
+        Frames returned by `frames` before calling this are invalidated.
+        After writing to the returned buffer, `written` must be called.
+        """
+        pending = self._end - self._start
+        if not pending:
+            self._start = self._end = 0
+        needed = self.HEADER.size
+        if pending >= needed:
+            needed += self.HEADER.unpack_from(self._buffer, self._start)[1]
+        if needed > len(self._buffer):
+            # Allocate a new buffer, as resizing is not allowed while
+            # memoryview slices of the old buffer may still exist.
+            buffer = bytearray(max(needed, 2 * len(self._buffer)))
+            buffer[:pending] = self._view[self._start:self._end]
+            self._buffer = buffer
+            self._view = memoryview(buffer)
+            self._start, self._end = 0, pending
+        elif self._start and len(self._buffer) - self._start < needed:
+            self._view[:pending] = self._view[self._start:self._end]
+            self._start, self._end = 0, pending
+        return self._view[self._end:]
+
+    def written(self, size: int) -> None:
+        """Mark size bytes of buffer space as filled with input data."""
+        self._end += size
+
+    def feed(self, data: bytes) -> None:
+        """Copy input data into buffer.
+
+        Arguments:
+          data: Input data (bytes-like object).
+        """
+        data = memoryview(data)
+        while data:
+            space = self.space()
+            size = min(len(space), len(data))
+            space[:size] = data[:size]
+            self.written(size)
+            data = data[size:]
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered bytes not yet returned as frames."""
+        return self._end - self._start
+
+    def frames(self) -> Iterator[Tuple[int, memoryview]]:
+        """Iterate over complete frames in buffer.
+
+        Returns:
+          Iterator of (stream type, frame data) tuples.  Frame data is only
+          valid until the next call to `space` or `feed`.
+        """
+        header = self.HEADER
+        view = self._view
+        while self._end - self._start >= header.size:
+            stream, size = header.unpack_from(self._buffer, self._start)
+            start = self._start + header.size
+            if self._end - start < size:
+                return
+            self._start = start + size
+            yield stream, view[start:self._start]
+
+
+def demux_frames(readinto: Callable[[memoryview], int],
+                 buffer_size: int=CHUNK_SIZE,
+                 copy: bool=True) -> Iterator[Tuple[int, bytes]]:
+    """Iterate over frames in a multiplexed stdout/stderr stream.
+
+    Arguments:
+      readinto: Function reading data into a buffer, returning the number of
+        bytes read, and 0 at end of stream (fx. `IterStream.readinto`).
+      buffer_size: Initial buffer size.
+      copy: Return frame data as bytes.  If False, frame data is returned as
+        memoryview, only valid until next frame is requested.
+
+    Returns:
+      Iterator of (stream type, frame data) tuples.
+    """
+    demuxer = FrameDemuxer(buffer_size)
+    while True:
+        for stream, frame in demuxer.frames():
+            yield stream, bytes(frame) if copy else frame
+        size = readinto(demuxer.space())
+        if not size:
+            break
+        demuxer.written(size)
+    if demuxer.pending:
+        log.warning('Discarding %d bytes of incomplete frame',
+                    demuxer.pending)
+
+
+def raw_frames(readinto: Callable[[memoryview], int],
+               buffer_size: int=CHUNK_SIZE,
+               copy: bool=True) -> Iterator[Tuple[int, bytes]]:
+    """Iterate over a raw (TTY) stream as stdout frames.
+
+    Arguments:
+      readinto: Function reading data into a buffer, returning the number of
+        bytes read, and 0 at end of stream.
+      buffer_size: Buffer size.
+      copy: Return frame data as bytes.  If False, frame data is returned as
+        memoryview, only valid until next frame is requested.
+
+    Returns:
+      Iterator of (STDOUT, data) tuples.
+    """
+    view = memoryview(bytearray(buffer_size))
+    while True:
+        size = readinto(view)
+        if not size:
+            return
+        yield STDOUT, bytes(view[:size]) if copy else view[:size]
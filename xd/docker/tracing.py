@@ -0,0 +1,218 @@
+"""Module containing tracing spans for DockerClient operations."""
+
+import random
+import threading
+
+from typing import Optional, List
+
+from xd.docker.observer import Observer, OperationInfo, PhaseInfo, \
+    RequestInfo
+
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+__all__ = ['Span', 'SpanExporter', 'InMemoryExporter', 'TracingObserver']
+
+
+class Span(object):
+    """Timed span of work, part of a trace.
+
+    Spans are created for operations (public DockerClient method calls),
+    with child spans for the requests made and the local phases (fx. tar
+    archive building or compression) of the operation.  Nested operations
+    (fx. `image_pull` called from `container_create`) are child spans of
+    the calling operation.
+
+    Attributes:
+      name (str): Span name (operation name, phase name or request method
+        and endpoint template, fx. 'POST /containers/{id}/start').
+      kind (str): 'operation', 'request' or 'phase'.
+      trace_id (str): Trace id (32 hex digits), shared by all spans of a
+        trace.
+      span_id (str): Span id (16 hex digits).
+      parent_id (str): Span id of parent span (None for root spans).
+      start (float): UNIX timestamp of start of span.
+      end (float): UNIX timestamp of end of span (None while running).
+      attributes (dict): Span attributes.
+      exception (Exception): Exception ending the span (or None).
+    """
+
+    __slots__ = ('name', 'kind', 'trace_id', 'span_id', 'parent_id',
+                 'start', 'end', 'attributes', 'exception')
+
+    def __init__(self, name: str, kind: str, start: float,
+                 parent: Optional['Span']=None):
+        self.name = name
+        self.kind = kind
+        self.span_id = '{:016x}'.format(random.getrandbits(64))
+        if parent is None:
+            self.trace_id = '{:032x}'.format(random.getrandbits(128))
+            self.parent_id = None
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+        self.start = start
+        self.end = None
+        self.attributes = {}
+        self.exception = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        """Duration of span in seconds (None while running)."""
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+    @property
+    def ok(self) -> bool:
+        """Span ended without an exception."""
+        return self.exception is None
+
+    def __repr__(self):
+        return '<Span {} {} {}>'.format(self.kind, self.name, self.span_id)
+
+
+class SpanExporter(object):
+    """Base class for span exporters.
+
+    Exporters receive spans from `TracingObserver` when they have ended.
+    They are called synchronously on the thread ending the span, so
+    exporters sending spans elsewhere should queue them.
+    """
+
+    def export(self, span: Span) -> None:
+        """Export an ended span.
+
+        Arguments:
+          span: Span to export.
+        """
+        raise NotImplementedError()
+
+    def shutdown(self) -> None:
+        """Flush and release resources of exporter."""
+        pass
+
+
+class InMemoryExporter(SpanExporter):
+    """Span exporter keeping spans in memory, fx. for tests.
+
+    Arguments:
+      max_spans: Maximum number of spans to keep (oldest are dropped).
+
+    :Example:
+
+    >>> exporter = InMemoryExporter()
+    >>> docker = DockerClient(tracing=exporter)
+    >>> docker.container_create(config, 'web1')
+    >>> [span.name for span in exporter.spans]
+    """
+
+    def __init__(self, max_spans: Optional[int]=None):
+        self.max_spans = max_spans
+        self._spans = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self._spans.append(span)
+            if self.max_spans is not None and \
+                    len(self._spans) > self.max_spans:
+                del self._spans[0]
+
+    @property
+    def spans(self) -> List[Span]:
+        """Exported spans, in order of their end."""
+        with self._lock:
+            return list(self._spans)
+
+    def find(self, name: str) -> List[Span]:
+        """Get exported spans with given name."""
+        return [span for span in self.spans if span.name == name]
+
+    def children(self, span: Span) -> List[Span]:
+        """Get exported child spans of span, in order of their start."""
+        return sorted((s for s in self.spans if s.parent_id == span.span_id),
+                      key=lambda s: s.start)
+
+    def clear(self) -> None:
+        """Drop all exported spans."""
+        with self._lock:
+            del self._spans[:]
+
+
+class TracingObserver(Observer):
+    """DockerClient observer recording tracing spans.
+
+    Arguments:
+      exporter: Exporter to send ended spans to.
+
+    :Example:
+
+    >>> tracing = TracingObserver(InMemoryExporter())
+    >>> docker = DockerClient(observers=[tracing])
+    """
+
+    def __init__(self, exporter: SpanExporter):
+        self.exporter = exporter
+        # Spans of running operations, by id of OperationInfo
+        self._operations = {}
+        # Spans of running requests and phases, by id of info object
+        self._spans = {}
+
+    def _parent(self, operation):
+        if operation is None:
+            return None
+        return self._operations.get(id(operation))
+
+    def _end(self, span, end, exception):
+        span.end = end
+        span.exception = exception
+        if exception is not None:
+            span.attributes['error'] = type(exception).__name__
+        self.exporter.export(span)
+
+    def operation_start(self, info: OperationInfo) -> None:
+        span = Span(info.name, 'operation', info.start,
+                    self._parent(info.parent))
+        self._operations[id(info)] = span
+
+    def operation_end(self, info: OperationInfo) -> None:
+        span = self._operations.pop(id(info), None)
+        if span is not None:
+            self._end(span, info.start + info.duration, info.exception)
+
+    def phase_start(self, info: PhaseInfo) -> None:
+        span = Span(info.name, 'phase', info.start,
+                    self._parent(info.operation))
+        self._spans[id(info)] = span
+
+    def phase_end(self, info: PhaseInfo) -> None:
+        span = self._spans.pop(id(info), None)
+        if span is not None:
+            span.attributes['busy_time'] = info.busy_time
+            self._end(span, info.start + info.duration, info.exception)
+
+    def request_start(self, info: RequestInfo) -> None:
+        span = Span('{} {}'.format(info.method, info.endpoint), 'request',
+                    info.start, self._parent(info.operation))
+        span.attributes['http.method'] = info.method
+        span.attributes['http.target'] = info.url
+        if info.attempt > 1:
+            span.attributes['attempt'] = info.attempt
+        self._spans[id(info)] = span
+
+    def request_end(self, info: RequestInfo) -> None:
+        span = self._spans.pop(id(info), None)
+        if span is None:
+            return
+        attributes = span.attributes
+        if info.status_code is not None:
+            attributes['http.status_code'] = info.status_code
+        for name in ('request_bytes', 'response_bytes', 'connect_time',
+                     'first_byte_time'):
+            value = getattr(info, name)
+            if value is not None:
+                attributes[name] = value
+        self._end(span, info.start + info.total_time, info.exception)
@@ -0,0 +1,373 @@
+"""Module containing DockerClient transports."""
+
+import collections
+import socket
+import threading
+
+from typing import Optional, Dict, Tuple, Union
+
+from xd.docker.connection import Connection, is_regular_file
+from xd.docker.retry import RetryPolicy
+
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+_requests = None
+_requests_lock = threading.Lock()
+
+
+def _import_requests():
+    # Import requests on first use, as importing it (and monkeypatching it
+    # with requests_unixsocket to support http+unix URLs) is slow.
+    global _requests
+    if _requests is None:
+        with _requests_lock:
+            if _requests is None:
+                import requests
+                import requests_unixsocket
+                requests_unixsocket.monkeypatch()
+                _requests = requests
+    return _requests
+
+
+__all__ = ['Transport', 'RequestsTransport', 'SocketTransport',
+           'TRANSPORTS', 'DEFAULT_POOL_SIZE', 'Timeout', 'parse_timeout']
+
+
+# Timeout in seconds, either for both connecting and reading, or as a
+# (connect, read) tuple (like for the requests library).  None is no
+# timeout.
+Timeout = Union[float, Tuple[Optional[float], Optional[float]]]
+
+
+def parse_timeout(timeout: Optional[Timeout]) \
+        -> Optional[Tuple[Optional[float], Optional[float]]]:
+    """Parse timeout.
+
+    Arguments:
+      timeout: Timeout in seconds, or (connect, read) tuple.
+
+    Raises:
+      ValueError: Invalid timeout.
+
+    Returns:
+      (connect, read) tuple, or None for no timeout.
+    """
+    if timeout is None:
+        return None
+    if isinstance(timeout, (int, float)):
+        timeouts = (timeout, timeout)
+    else:
+        try:
+            connect, read = timeout
+        except (TypeError, ValueError):
+            raise ValueError('invalid timeout: {!r}'.format(timeout))
+        timeouts = (connect, read)
+    for value in timeouts:
+        if value is not None and (not isinstance(value, (int, float)) or
+                                  value <= 0):
+            raise ValueError('invalid timeout: {!r}'.format(timeout))
+    if timeouts == (None, None):
+        return None
+    return timeouts
+
+
+# Default maximum number of idle connections kept by SocketTransport.  This
+# is the maximum default number of workers of ThreadPoolExecutor, so a client
+# shared by such an executor (or by up to 32 threads) keeps a connection per
+# worker, also on machines with few CPUs.  Idle connections are cheap.
+DEFAULT_POOL_SIZE = 32
+
+
+class Transport(object):
+    """Base class for DockerClient transports.
+
+    A transport sends requests to Docker daemon, and returns responses
+    providing the subset of the `requests.Response` API used by
+    DockerClient (status_code, reason, headers, content, text, json(),
+    iter_content(), iter_lines() and close(), and optionally readinto()).
+
+    A transport is bound to the DockerClient using it, which sets
+    `base_url` and `sendfile`.
+
+    Attributes:
+      base_url (str): DockerClient base URL (fx.
+        'http+unix://%2Fvar%2Frun%2Fdocker.sock').
+      sendfile (bool): Send request bodies from regular files using
+        sendfile(2).
+    """
+
+    def __init__(self):
+        self.base_url = None
+        self.sendfile = True
+
+    def bind(self, base_url: str, sendfile: bool=True) -> None:
+        """Bind transport to a DockerClient.
+
+        Arguments:
+          base_url: DockerClient base URL.
+          sendfile: Send request bodies from regular files using
+            sendfile(2).
+        """
+        self.base_url = base_url
+        self.sendfile = sendfile
+
+    def send(self, method: str, url: str,
+             params: Optional[Dict]=None,
+             headers: Optional[Dict]=None,
+             data=None, stream: bool=False, hijack: bool=False,
+             info=None, timeout=None):
+        """Send request.
+
+        Arguments:
+          method: HTTP method.
+          url: Request path (without query string).
+          params: Query parameters.
+          headers: Request headers.
+          data: Request body (bytes, str, file object or iterator of
+            bytes).
+          stream: Read response body lazily.
+          hijack: Take over the connection (returning a HijackedSocket).
+          info: RequestInfo to set connect_time of (or None).
+          timeout: (connect, read) timeout tuple (see `parse_timeout`), or
+            None for the transport default.  The read timeout applies to
+            each read from the socket.  For hijacked connections, it only
+            applies until the response head has been received.
+
+        Returns:
+          Response (or HijackedSocket).
+        """
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        """Release resources held by transport."""
+        pass
+
+
+class RequestsTransport(Transport):
+    """Transport using the requests library.
+
+    The requests library is imported (and monkeypatched for UNIX domain
+    socket support using requests_unixsocket) when the first request is
+    sent.
+
+    Requests with bodies from regular files (when sendfile is enabled) and
+    hijacked requests are sent directly on a socket, using
+    `xd.docker.connection.Connection`.
+    """
+
+    def send(self, method, url, params=None, headers=None, data=None,
+             stream=False, hijack=False, info=None, timeout=None):
+        if hijack or (self.sendfile and is_regular_file(data)):
+            return self._connection_request(method, url, params=params,
+                                            headers=headers, data=data,
+                                            hijack=hijack, info=info,
+                                            timeout=timeout)
+        func = getattr(_import_requests(), method.lower())
+        kwargs = {'params': params, 'stream': stream}
+        if headers is not None:
+            kwargs['headers'] = headers
+        if data is not None:
+            kwargs['data'] = data
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        return func(self.base_url + url, **kwargs)
+
+    def _connect(self, info=None, timeout=None):
+        conn = Connection(self.base_url, timeout and timeout[0])
+        if info is not None or timeout is not None:
+            conn.connect()
+            if info is not None:
+                info.connect_time = info.elapsed()
+            if timeout is not None:
+                conn.settimeout(timeout[1])
+        return conn
+
+    def _connection_request(self, method, url, params=None, headers=None,
+                            data=None, hijack=False, info=None,
+                            timeout=None):
+        # Send request directly on a socket, for sending data with
+        # sendfile(2) and for hijacking the connection.
+        conn = self._connect(info, timeout)
+        try:
+            if hijack:
+                hijacked = conn.hijack(method, url, params=params,
+                                       headers=headers, data=data)
+                conn.settimeout(None)
+                return hijacked
+            conn.request(method, url, params=params, headers=headers,
+                         data=data)
+            return conn.getresponse(method)
+        except BaseException:
+            conn.close()
+            raise
+
+
+class SocketTransport(Transport):
+    """Transport using a minimal built-in HTTP/1.1 client.
+
+    Requests are sent directly on sockets (UNIX domain or TCP) using
+    `xd.docker.connection.Connection`, bypassing the requests library.
+    Connections are kept alive and reused, from a pool of idle
+    connections.  A request failing because the daemon closed a reused
+    connection is sent again on a new connection, but only if the daemon
+    cannot have acted on it.  Request bodies of unknown size (iterators
+    and file objects other than regular files) are sent with chunked
+    transfer encoding.
+
+    A connection is returned to the pool when the response body has been
+    read to the end.  Responses to requests that are not streamed are read
+    before returning.
+
+    The transport is thread-safe.  Concurrent requests each use their own
+    connection, so the number of open connections follows the number of
+    concurrent requests, and pool_size should be at least the number of
+    threads sharing the client to avoid reconnecting.
+
+    Arguments:
+      pool_size: Maximum number of idle connections kept for reuse
+        (default is `DEFAULT_POOL_SIZE`).
+      timeout: Default socket timeout in seconds (None for no timeout),
+        used for requests sent without timeout.
+
+    :Example:
+
+    >>> docker = DockerClient(transport=SocketTransport())
+
+    or simply
+
+    >>> docker = DockerClient(transport='socket')
+    """
+
+    # Errors indicating that an idle connection was closed by the daemon
+    # (including http.client.RemoteDisconnected, a ConnectionResetError)
+    STALE_CONNECTION_ERRORS = (BrokenPipeError, ConnectionResetError)
+
+    def __init__(self, pool_size: Optional[int]=None,
+                 timeout: Optional[float]=None):
+        super(SocketTransport, self).__init__()
+        if pool_size is None:
+            pool_size = DEFAULT_POOL_SIZE
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+
+    def _connect(self, info=None, timeout=None):
+        if timeout is None:
+            conn = Connection(self.base_url, self.timeout)
+            conn.connect()
+        else:
+            conn = Connection(self.base_url, timeout[0])
+            conn.connect()
+            conn.settimeout(timeout[1])
+        if info is not None:
+            info.connect_time = info.elapsed()
+        return conn
+
+    def _checkout(self):
+        # Get idle connection from pool (or None if there is none).  As
+        # deque.pop() is atomic, this does not need the lock.
+        while True:
+            try:
+                conn = self._idle.pop()
+            except IndexError:
+                return None
+            if self._is_alive(conn):
+                return conn
+            conn.close()
+
+    @staticmethod
+    def _is_alive(conn):
+        # An idle connection is readable only if the daemon has closed it
+        # (or sent unexpected data).  The socket is made non-blocking, as
+        # recv() otherwise waits for the socket timeout (if any) before
+        # trying; send() sets the timeout again.
+        conn.sock.settimeout(0.0)
+        try:
+            conn.sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            return True
+        except OSError:
+            pass
+        return False
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def send(self, method, url, params=None, headers=None, data=None,
+             stream=False, hijack=False, info=None, timeout=None):
+        if hijack:
+            conn = self._connect(info, timeout)
+            try:
+                hijacked = conn.hijack(method, url, params=params,
+                                       headers=headers, data=data)
+            except BaseException:
+                conn.close()
+                raise
+            conn.settimeout(self.timeout)
+            return hijacked
+        conn = self._checkout()
+        if conn is not None:
+            conn.settimeout(self.timeout if timeout is None else timeout[1])
+            r = self._send(conn, method, url, params, headers, data, stream,
+                           reused=True)
+            if r is not None:
+                return r
+            log.debug('Retrying %s %s on new connection', method, url)
+        return self._send(self._connect(info, timeout), method, url, params,
+                          headers, data, stream)
+
+    def _send(self, conn, method, url, params, headers, data, stream,
+              reused=False):
+        # Send request on connection.  If a reused connection turns out to
+        # have been closed by the daemon, None is returned when the request
+        # can be sent again on a new connection: when failing while sending
+        # the request, or while waiting for the response to an idempotent
+        # request, as the daemon cannot have acted on it.  A request body
+        # that cannot be sent again is never resent.
+        sent = False
+        try:
+            conn.request(method, url, params=params, headers=headers,
+                         data=data)
+            sent = True
+            r = conn.getresponse(method, release=self._release)
+        except self.STALE_CONNECTION_ERRORS:
+            conn.close()
+            if reused and (data is None or isinstance(
+                    data, (bytes, bytearray, memoryview, str))) and \
+                    (not sent or method in RetryPolicy.IDEMPOTENT_METHODS):
+                return None
+            raise
+        except BaseException:
+            conn.close()
+            raise
+        if not stream:
+            try:
+                r.content
+            except BaseException:
+                conn.close()
+                raise
+        return r
+
+    def close(self) -> None:
+        """Close idle connections."""
+        while True:
+            try:
+                conn = self._idle.pop()
+            except IndexError:
+                return
+            conn.close()
+
+
+# Transports by name, for the transport argument of DockerClient
+TRANSPORTS = {
+    'requests': RequestsTransport,
+    'socket': SocketTransport,
+}
@@ -0,0 +1,191 @@
+"""Module containing on-disk cache of Docker Remote API versions."""
+
+import os
+import json
+import time
+import socket
+import threading
+import urllib.parse
+
+from typing import Optional, Union, Dict
+
+from xd.docker.parameters import ApiVersion
+
+import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+__all__ = ['VersionCache', 'daemon_key', 'parse_api_version',
+           'DEFAULT_TTL']
+
+
+# Default time to live of cache entries in seconds
+DEFAULT_TTL = 3600.0
+
+
+def parse_api_version(version: Union[ApiVersion, str]) -> ApiVersion:
+    """Parse Docker Remote API version.
+
+    Arguments:
+      version: API version, either as string (fx. '1.22') or as (major,
+        minor) tuple.
+
+    Raises:
+      ValueError: Invalid version.
+
+    Returns:
+      API version as (major, minor) tuple.
+    """
+    if isinstance(version, str):
+        parts = version.split('.')
+    else:
+        parts = list(version)
+    if len(parts) != 2:
+        raise ValueError('invalid API version: {}'.format(version))
+    return tuple(int(i) for i in parts)
+
+
+def daemon_key(base_url: str) -> Optional[str]:
+    """Get cache key identifying the Docker daemon at base_url.
+
+    For UNIX domain sockets, the key includes the host name, and the device,
+    inode and modification time of the socket file, so a restarted (and
+    possibly upgraded) daemon gets a new key.  For TCP sockets, the key is
+    the URL, so DockerClient negotiates again when a cached version is
+    rejected by the daemon.
+
+    Arguments:
+      base_url: DockerClient base URL (fx. 'http+unix://%2Fvar%2Frun%2F...'
+        or 'http://127.0.0.1:2375').
+
+    Returns:
+      Cache key, or None if the socket file does not exist.
+    """
+    url = urllib.parse.urlsplit(base_url)
+    if url.scheme != 'http+unix':
+        return base_url
+    path = urllib.parse.unquote_plus(url.netloc)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return 'unix://{}{}:{}:{}:{}'.format(socket.gethostname(), path,
+                                         st.st_dev, st.st_ino,
+                                         st.st_mtime_ns)
+
+
+def _default_path():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'xd-docker', 'api-versions.json')
+
+
+class VersionCache(object):
+    """Cache of Docker Remote API versions negotiated with Docker daemons.
+
+    The cache is stored as a small JSON file, so new DockerClient instances
+    (also in other processes) can skip the /version request to a daemon
+    they have talked to recently.  Entries expire after ttl seconds.
+
+    Errors reading or writing the cache file are logged and otherwise
+    ignored, so a missing or broken cache only costs a /version request.
+
+    Arguments:
+      path: Path of cache file (default is
+        $XDG_CACHE_HOME/xd-docker/api-versions.json).
+      ttl: Time to live of cache entries in seconds.
+
+    :Example:
+
+    >>> docker = DockerClient(version_cache=VersionCache(ttl=600))
+    """
+
+    def __init__(self, path: Optional[str]=None, ttl: float=DEFAULT_TTL):
+        if path is None:
+            path = _default_path()
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            log.warning('Cannot read API version cache %s: %s', self.path, e)
+            return {}
+        if not isinstance(entries, dict):
+            return {}
+        return entries
+
+    def _store(self, entries):
+        now = time.time()
+        entries = {key: entry for key, entry in entries.items()
+                   if self._valid(entry, now)}
+        tmp = '{}.{}.tmp'.format(self.path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, 'w') as f:
+                json.dump(entries, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            log.warning('Cannot write API version cache %s: %s',
+                        self.path, e)
+
+    def _valid(self, entry, now):
+        try:
+            return 0 <= now - entry['time'] < self.ttl
+        except (TypeError, KeyError):
+            return False
+
+    def get(self, key: str) -> Optional[ApiVersion]:
+        """Get cached API version.
+
+        Arguments:
+          key: Daemon key (see `daemon_key`).
+
+        Returns:
+          API version, or None if not cached (or expired).
+        """
+        with self._lock:
+            entry = self._load().get(key)
+        if entry is None or not self._valid(entry, time.time()):
+            return None
+        try:
+            return parse_api_version(entry['api_version'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def set(self, key: str, api_version: ApiVersion,
+            version: Optional[Dict]=None) -> None:
+        """Store API version in cache.
+
+        Arguments:
+          key: Daemon key (see `daemon_key`).
+          api_version: API version.
+          version: Response of /version request, for identification of the
+            daemon in the cache file.
+        """
+        entry = {'api_version': '{}.{}'.format(*api_version),
+                 'time': time.time()}
+        for name in ('Version', 'GitCommit', 'Os', 'Arch'):
+            if version and name in version:
+                entry[name] = version[name]
+        with self._lock:
+            entries = self._load()
+            entries[key] = entry
+            self._store(entries)
+
+    def invalidate(self, key: str) -> None:
+        """Remove API version from cache.
+
+        Arguments:
+          key: Daemon key (see `daemon_key`).
+        """
+        with self._lock:
+            entries = self._load()
+            if entries.pop(key, None) is not None:
+                self._store(entries)